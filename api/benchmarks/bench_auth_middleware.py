@@ -0,0 +1,87 @@
+"""
+Benchmark for the auth context middleware
+
+Reports the per-request time of GET /v1/status for an app without middleware,
+with the former @app.middleware("http") implementation (BaseHTTPMiddleware,
+without its print), and with AuthContextMiddleware. Requests are sent straight
+to the ASGI app, so only the app and middleware overhead is measured.
+
+    PYTHONPATH=src EPA_JWT_SECRET=secret python benchmarks/bench_auth_middleware.py --requests 20000
+"""
+
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+
+from epa_api.apis.system_api import router as SystemApiRouter
+from epa_api.api_implementation.utils.context import AuthContextMiddleware, current_token_data
+from epa_api.api_implementation.utils.token import TokenUtils
+from epa_api.models.extra_models import TokenModel
+
+
+def build_app(middleware: str) -> FastAPI:
+    app = FastAPI()
+    if middleware == "http":
+        @app.middleware("http")
+        async def persist_auth_context(request: Request, call_next):
+            auth_header = request.headers.get("Authorization")
+            if auth_header and auth_header.lower().startswith("bearer "):
+                try:
+                    current_token_data.set(TokenModel(sub=auth_header.split(" ")[1]))
+                except Exception:
+                    pass
+            return await call_next(request)
+    elif middleware == "asgi":
+        app.add_middleware(AuthContextMiddleware)
+    app.include_router(SystemApiRouter)
+    return app
+
+
+async def run(name: str, app: FastAPI, total: int, headers):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/v1/status",
+        "raw_path": b"/v1/status",
+        "root_path": "",
+        "query_string": b"",
+        "headers": headers,
+        "client": ("127.0.0.1", 1234),
+        "server": ("127.0.0.1", 8080),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    # Warm up routing and caches
+    for _ in range(100):
+        await app(dict(scope), receive, send)
+
+    start = time.perf_counter()
+    for _ in range(total):
+        await app(dict(scope), receive, send)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {elapsed / total * 1e6:8.1f} us/request, {total / elapsed:10,.0f} req/s")
+
+
+async def main(total: int):
+    token = TokenUtils.get_token({"user_id": "1", "typ": "access"}, exp_date=datetime.now() + timedelta(minutes=30))
+    for label, headers in [("no token", []), ("bearer token", [(b"authorization", f"Bearer {token}".encode())])]:
+        for middleware in ["none", "http", "asgi"]:
+            await run(f"{middleware} ({label})", build_app(middleware), total, headers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,50 @@
+"""
+Benchmark for MongoDB connection handling in the API
+
+Compares the requests per second of a connect-per-request client
+(MongoUtils.get_mongodb_database_connection) against the process-wide
+pooled client (MongoUtils.get_pooled_database) for a login-like lookup.
+
+Requires a running MongoDB and the EPA_MONGODB_* environment variables, e.g:
+    PYTHONPATH=src python benchmarks/bench_mongo_pool.py --requests 2000 --concurrency 32
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import time
+
+from epa_api.api_implementation.utils.mongo import MongoUtils
+
+
+def connect_per_request(email: str):
+    client, db = MongoUtils.get_mongodb_database_connection()
+    try:
+        MongoUtils.get_user_collection(db).find_one({"email": email})
+    finally:
+        client.close()
+
+
+def pooled(email: str):
+    MongoUtils.get_user_collection(MongoUtils.get_pooled_database()).find_one({"email": email})
+
+
+def run(name: str, request, total: int, concurrency: int):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(request, (f"bench{i}@epa.local" for i in range(total))))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<20} {total} requests in {elapsed:.2f}s -> {total / elapsed:,.0f} req/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    # Warm up the pool so that the first handshakes are not measured
+    MongoUtils.get_pooled_database().command("ping")
+
+    run("connect-per-request", connect_per_request, args.requests, args.concurrency)
+    run("pooled", pooled, args.requests, args.concurrency)
+    MongoUtils.close_pooled_client()
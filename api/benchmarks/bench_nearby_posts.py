@@ -0,0 +1,92 @@
+"""
+Benchmark for the nearby posts query
+
+Loads synthetic posts spread around a city into a scratch collection with the indexes of database/config.json,
+then reports the latency of the first page and of the pages after a cursor (PostUtils.get_nearby_posts)
+for several radii, sorted by distance and by recency. The scratch collection is dropped afterwards.
+
+Requires a running MongoDB and the EPA_MONGODB_* and EPA_JWT_SECRET environment variables, e.g:
+    PYTHONPATH=src python benchmarks/bench_nearby_posts.py --posts 1000000 --queries 200
+"""
+
+from datetime import datetime, timedelta, timezone
+import argparse
+import random
+import statistics
+import time
+
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE
+
+from epa_api.api_implementation.utils.mongo import MongoUtils
+from epa_api.api_implementation.utils.post import PostUtils
+
+# Posts within ~25 km of New York City
+CENTER = (40.7128, -74.0060)
+SPREAD = 0.25
+CATEGORIES = ["traffic", "weather", "crime", "fire", "event"]
+
+
+def load_posts(collection, total: int, batch_size: int = 10000):
+    now = datetime.now(timezone.utc)
+    for start in range(0, total, batch_size):
+        collection.insert_many([
+            {
+                "_id": f"bench:0:{i}",
+                "user_id": str(i % 1000),
+                "title": f"Post {i}",
+                "category": CATEGORIES[i % len(CATEGORIES)],
+                "tags": [],
+                "location": {"type": "Point", "coordinates": [CENTER[1] + random.uniform(-SPREAD, SPREAD), CENTER[0] + random.uniform(-SPREAD, SPREAD)]},
+                "created_at": now - timedelta(seconds=random.randint(0, 30 * 24 * 3600)),
+                "source": {"topic": "bench", "partition": 0, "offset": i},
+            }
+            for i in range(start, min(start + batch_size, total))
+        ], ordered=False)
+    collection.create_index([("location", GEOSPHERE)])
+    collection.create_index([("created_at", DESCENDING), ("_id", DESCENDING)])
+    collection.create_index([("created_at", ASCENDING)])
+
+
+def run(collection, radius: int, sort: str, queries: int, limit: int, pages: int):
+    first, next_pages = [], []
+    for _ in range(queries):
+        lat = CENTER[0] + random.uniform(-SPREAD / 2, SPREAD / 2)
+        lng = CENTER[1] + random.uniform(-SPREAD / 2, SPREAD / 2)
+        cursor = None
+        for page in range(pages):
+            start = time.perf_counter()
+            _, cursor = PostUtils.get_nearby_posts(collection, lat, lng, radius, sort, limit, cursor)
+            (first if page == 0 else next_pages).append((time.perf_counter() - start) * 1000)
+            if cursor is None:
+                break
+
+    def percentiles(latencies):
+        if len(latencies) < 2:
+            return "n/a"
+        cuts = statistics.quantiles(latencies, n=100)
+        return f"p50 {cuts[49]:7.2f} ms  p99 {cuts[98]:7.2f} ms"
+
+    print(f"{sort:<8} radius {radius:>6} m  first page {percentiles(first)}  next pages {percentiles(next_pages)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=5, help="Pages fetched per query, following the cursors")
+    parser.add_argument("--radii", type=int, nargs="+", default=[500, 2000, 5000, 20000])
+    args = parser.parse_args()
+
+    collection = MongoUtils.get_pooled_database()["bench_nearby_posts"]
+    collection.drop()
+    try:
+        start = time.perf_counter()
+        load_posts(collection, args.posts)
+        print(f"Loaded {args.posts} posts in {time.perf_counter() - start:.1f}s")
+        for sort in ["distance", "recent"]:
+            for radius in args.radii:
+                run(collection, radius, sort, args.queries, args.limit, args.pages)
+    finally:
+        collection.drop()
+        MongoUtils.close_pooled_client()
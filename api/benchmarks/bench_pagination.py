@@ -0,0 +1,82 @@
+"""
+Benchmark for deep pages of the post listings
+
+Loads synthetic posts into a scratch collection with the (created_at, _id) index of database/config.json,
+then reports the latency of fetching the page at several depths with skip/limit pagination
+and with keyset pagination (PaginationUtils.find_page). The scratch collection is dropped afterwards.
+
+Requires a running MongoDB and the EPA_MONGODB_* and EPA_JWT_SECRET environment variables, e.g:
+    PYTHONPATH=src python benchmarks/bench_pagination.py --posts 1000000 --depths 1 100 1000 10000
+"""
+
+from datetime import datetime, timedelta, timezone
+import argparse
+import random
+import statistics
+import time
+
+from pymongo import DESCENDING
+
+from epa_api.api_implementation.utils.mongo import MongoUtils
+from epa_api.api_implementation.utils.pagination import PaginationUtils
+
+
+def load_posts(collection, total: int, batch_size: int = 10000):
+    now = datetime.now(timezone.utc)
+    for start in range(0, total, batch_size):
+        collection.insert_many([
+            {
+                "_id": f"bench:0:{i}",
+                "user_id": str(i % 1000),
+                "title": f"Post {i}",
+                "category": "traffic",
+                "created_at": now - timedelta(seconds=random.randint(0, 30 * 24 * 3600)),
+            }
+            for i in range(start, min(start + batch_size, total))
+        ], ordered=False)
+    collection.create_index([("created_at", DESCENDING), ("_id", DESCENDING)])
+
+
+def skip_page(collection, depth: int, page_size: int):
+    return list(collection.find({}).sort(PaginationUtils.KEYSET_SORT).skip(depth * page_size).limit(page_size))
+
+
+def get_cursor(collection, depth: int, page_size: int) -> str | None:
+    # The cursor a client holds after reading depth pages
+    if depth == 0:
+        return None
+    last = collection.find({}, {"created_at": 1}).sort(PaginationUtils.KEYSET_SORT).skip(depth * page_size - 1).limit(1).next()
+    return PaginationUtils.encode_keyset_cursor("bench", last)
+
+
+def measure(fetch, repeats: int) -> str:
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fetch()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return f"median {statistics.median(latencies):8.2f} ms"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=1000000)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 10, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    collection = MongoUtils.get_pooled_database()["bench_pagination"]
+    collection.drop()
+    try:
+        load_posts(collection, args.posts)
+        for depth in args.depths:
+            if depth * args.page_size >= args.posts:
+                continue
+            cursor = get_cursor(collection, depth, args.page_size)
+            skip = measure(lambda: skip_page(collection, depth, args.page_size), args.repeats)
+            keyset = measure(lambda: PaginationUtils.find_page(collection, "bench", {}, args.page_size, cursor), args.repeats)
+            print(f"page {depth:>6}  skip/limit {skip}  keyset {keyset}")
+    finally:
+        collection.drop()
+        MongoUtils.close_pooled_client()
@@ -0,0 +1,39 @@
+"""
+Benchmark for the password hashing cost
+
+Reports how many password verifications (logins) one core can do per second
+for each algorithm and iteration count, to help choose EPA_PASSWORD_HASH_ITERATIONS.
+
+    PYTHONPATH=src python benchmarks/bench_password_hashing.py --iterations 100000 260000 600000
+"""
+
+import argparse
+import time
+
+from pydantic import SecretStr
+
+from epa_api.api_implementation.utils.user import UserUtils
+
+
+def run(algorithm: str, iterations: int, logins: int):
+    password = SecretStr("correct horse battery staple")
+    record = UserUtils.hash_password(password, algorithm, iterations)
+
+    start = time.perf_counter()
+    for _ in range(logins):
+        UserUtils.verify_password(password, record)
+    elapsed = time.perf_counter() - start
+
+    print(f"{algorithm:<15} {iterations:>9,} iterations -> {elapsed / logins * 1000:8.1f} ms/login, {logins / elapsed:6.1f} logins/s/core")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, nargs="+", default=[100000, 260000, 600000])
+    parser.add_argument("--algorithms", nargs="+", default=list(UserUtils.PASSWORD_HASH_ALGORITHMS))
+    parser.add_argument("--logins", type=int, default=20)
+    args = parser.parse_args()
+
+    for algorithm in args.algorithms:
+        for iterations in args.iterations:
+            run(algorithm, iterations, args.logins)
@@ -0,0 +1,91 @@
+"""
+Load test for user registration
+
+Compares registrations per second of the former check-then-insert flow
+(is_email_taken, is_username_taken, then insert_one) against a single insert
+relying on the unique indexes of the users collection. Every --duplicates-th
+registration reuses an email, and the number of duplicate accounts each flow
+let through is reported. Password hashing is left out, it is the same in both flows.
+
+The test runs against a scratch collection that is dropped afterwards.
+Requires a running MongoDB and the EPA_MONGODB_* environment variables, e.g:
+    PYTHONPATH=src python benchmarks/bench_registration.py --registrations 5000 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import time
+
+from pydantic import SecretStr
+
+from epa_api.api_implementation.utils.mongo import AsyncMongoUtils
+from epa_api.api_implementation.utils.user import AsyncUserUtils, UserTakenError, UserUtils
+from epa_api.models.user_registration import UserRegistration
+
+PASSWORD_RECORD = UserUtils.hash_password(SecretStr("correct horse battery"), iterations=1)
+
+
+async def check_then_insert(registration: UserRegistration, user_collection) -> bool:
+    if await AsyncUserUtils.is_email_taken(registration.email, user_collection):
+        return False
+    if await AsyncUserUtils.is_username_taken(registration.username, user_collection):
+        return False
+    await user_collection.insert_one(UserUtils.build_standard_user(registration, PASSWORD_RECORD))
+    return True
+
+
+async def single_insert(registration: UserRegistration, user_collection) -> bool:
+    try:
+        await AsyncUserUtils.create_standard_user(registration, PASSWORD_RECORD, user_collection)
+    except UserTakenError:
+        return False
+    return True
+
+
+async def run(name: str, register, user_collection, total: int, concurrency: int, duplicates: int, unique: bool):
+    await user_collection.drop()
+    for field in ["email", "username"]:
+        await user_collection.create_index(field, unique=unique)
+
+    registrations = [
+        UserRegistration(
+            username=f"{name}{i if i % duplicates else 0}",
+            email=f"{name}{i if i % duplicates else 0}@epa.local",
+            password=SecretStr("correct horse battery")
+        )
+        for i in range(total)
+    ]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(registration: UserRegistration) -> bool:
+        async with semaphore:
+            return await register(registration, user_collection)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[limited(registration) for registration in registrations])
+    elapsed = time.perf_counter() - start
+
+    accounts = await user_collection.count_documents({})
+    emails = len(await user_collection.distinct("email"))
+    print(f"{name:<18} {total} registrations in {elapsed:.2f}s -> {total / elapsed:,.0f} req/s, {accounts - emails} duplicate accounts")
+
+
+async def main(args):
+    AsyncMongoUtils.open_pooled_client()
+    user_collection = AsyncMongoUtils.get_pooled_database()["bench_registration"]
+    try:
+        # The former flow ran without unique indexes on email and username
+        await run("check-then-insert", check_then_insert, user_collection, args.registrations, args.concurrency, args.duplicates, unique=False)
+        await run("single-insert", single_insert, user_collection, args.registrations, args.concurrency, args.duplicates, unique=True)
+    finally:
+        await user_collection.drop()
+        await AsyncMongoUtils.close_pooled_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--registrations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duplicates", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,89 @@
+"""
+Microbenchmark for the serialization of the models
+
+For every model in the `models` package, compares the former and current way to:
+    - render a response: the JSON-mode dump FastAPI makes of the response model,
+      rendered by the standard library json (JSONResponse) against orjson (ORJSONResponse)
+    - to_json: json.dumps(to_dict()) against to_json()
+    - from_json: from_dict(json.loads()) against from_json()
+Each model is filled with sample values built from its field types.
+
+    PYTHONPATH=src python benchmarks/bench_serialization.py --loops 20000
+"""
+
+from datetime import datetime
+from typing import Annotated, Any, List, Union, get_args, get_origin
+import argparse
+import importlib
+import inspect
+import json
+import pkgutil
+import timeit
+import types
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import BaseModel, SecretStr
+
+import epa_api.models
+
+
+def sample_value(annotation: Any) -> Any:
+    origin = get_origin(annotation)
+    args = get_args(annotation)
+    if origin is Annotated:
+        return sample_value(args[0])
+    if origin in (Union, types.UnionType):
+        return sample_value(next(arg for arg in args if arg is not type(None)))
+    if origin in (list, List):
+        return [sample_value(args[0])]
+    if origin is dict:
+        return {"key": "value"}
+    if inspect.isclass(annotation) and issubclass(annotation, BaseModel):
+        return sample_model(annotation)
+    samples = {str: "value", int: 1, float: 1.5, bool: True, SecretStr: SecretStr("value"), datetime: datetime.now()}
+    return samples.get(annotation, "value")
+
+
+def sample_model(model: type) -> BaseModel:
+    return model(**{name: sample_value(field.annotation) for name, field in model.model_fields.items()})
+
+
+def get_models() -> List[type]:
+    models = []
+    for _, name, _ in pkgutil.iter_modules(epa_api.models.__path__, epa_api.models.__name__ + "."):
+        module = importlib.import_module(name)
+        for _, member in inspect.getmembers(module, inspect.isclass):
+            if member.__module__ == name and issubclass(member, BaseModel) and hasattr(member, "to_json"):
+                models.append(member)
+    return models
+
+
+def report(name: str, former, current, loops: int):
+    former_us = timeit.timeit(former, number=loops) / loops * 1e6
+    current_us = timeit.timeit(current, number=loops) / loops * 1e6
+    print(f"  {name:<10} {former_us:8.2f} us -> {current_us:8.2f} us ({former_us / current_us:4.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--loops", type=int, default=10000)
+    args = parser.parse_args()
+
+    for model in get_models():
+        instance = sample_model(model)
+        # SecretStr values cannot be rendered by the standard library json
+        has_secrets = any(isinstance(getattr(instance, name), SecretStr) for name in model.model_fields)
+        json_str = instance.model_dump_json(by_alias=True, exclude_none=True)
+        if has_secrets:
+            json_str = json.dumps({name: "value" for name in model.model_fields})
+
+        print(model.__name__)
+        report(
+            "response",
+            lambda: JSONResponse(instance.model_dump(mode="json", by_alias=True)).body,
+            lambda: ORJSONResponse(instance.model_dump(mode="json", by_alias=True)).body,
+            args.loops,
+        )
+        if not has_secrets:
+            report("to_json", lambda: json.dumps(instance.to_dict()), instance.to_json, args.loops)
+        report("from_json", lambda: model.from_dict(json.loads(json_str)), lambda: model.from_json(json_str), args.loops)
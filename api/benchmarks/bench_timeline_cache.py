@@ -0,0 +1,100 @@
+"""
+Benchmark for the user timeline cache
+
+Loads synthetic users and posts into scratch collections, then reads the first page of user timelines,
+the users drawn from a Zipf-like distribution, directly from the posts collection and through the Redis cache
+(AsyncTimelineUtils.get_timeline). Reports the hit ratio and the latency of both. The scratch data is dropped afterwards.
+
+Requires a running MongoDB and Redis and the EPA_MONGODB_*, EPA_JWT_SECRET and EPA_REDIS_URL environment variables, e.g:
+    PYTHONPATH=src python benchmarks/bench_timeline_cache.py --users 10000 --reads 20000 --concurrency 32
+"""
+
+from datetime import datetime, timedelta, timezone
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from pymongo import ASCENDING, DESCENDING
+
+from epa_api.api_implementation.utils.mongo import AsyncMongoUtils
+from epa_api.api_implementation.utils.timeline import AsyncTimelineUtils, TimelineUtils
+
+CATEGORIES = ["traffic", "weather", "crime", "fire", "event", "health", "outage", "protest"]
+
+
+async def load(users, posts, total_users: int, total_posts: int):
+    now = datetime.now(timezone.utc)
+    for start in range(0, total_posts, 10000):
+        await posts.insert_many([
+            {"_id": f"bench:0:{i}", "user_id": "0", "title": f"Post {i}", "category": random.choice(CATEGORIES), "tags": [],
+             "created_at": now - timedelta(seconds=random.randint(0, 7 * 24 * 3600))}
+            for i in range(start, min(start + 10000, total_posts))
+        ])
+    await posts.create_index([("category", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+    await users.insert_many([
+        {"user_id": f"bench-{i}", "subscriptions": [{"category": c} for c in random.sample(CATEGORIES, 2)]}
+        for i in range(total_users)
+    ])
+    await users.create_index("user_id", unique=True)
+
+
+async def run(name: str, read, user_ids, concurrency: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(user_id):
+        async with semaphore:
+            start = time.perf_counter()
+            await read(user_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(timed(user_id) for user_id in user_ids))
+    elapsed = time.perf_counter() - start
+    cuts = statistics.quantiles(latencies, n=100)
+    print(f"{name:<12} {len(user_ids) / elapsed:8,.0f} reads/s  p50 {cuts[49]:7.2f} ms  p99 {cuts[98]:7.2f} ms")
+
+
+async def main(args):
+    db = AsyncMongoUtils.get_pooled_database()
+    users, posts = db["bench_timeline_users"], db["bench_timeline_posts"]
+    client = AsyncTimelineUtils.open_client()
+    await users.drop()
+    await posts.drop()
+    try:
+        await load(users, posts, args.users, args.posts)
+        # A few users read their timeline much more often than the others
+        weights = [1 / (rank + 1) for rank in range(args.users)]
+        user_ids = [f"bench-{i}" for i in random.choices(range(args.users), weights=weights, k=args.reads)]
+
+        async def uncached(user_id):
+            user = await users.find_one({"user_id": user_id}, {"subscriptions": 1})
+            await posts.find(TimelineUtils.build_timeline_query(user)).sort([("created_at", -1), ("_id", -1)]).limit(21).to_list(length=21)
+
+        async def cached(user_id):
+            await AsyncTimelineUtils.get_timeline(user_id, 20, None, users, posts)
+
+        await run("mongodb", uncached, user_ids, args.concurrency)
+        await run("cache-aside", cached, user_ids, args.concurrency)
+        metrics = AsyncTimelineUtils.get_metrics()
+        print(f"hit ratio {metrics['hit_ratio']:.2%}, {metrics['misses']} misses, {metrics['coalesced_misses']} coalesced")
+    finally:
+        await users.drop()
+        await posts.drop()
+        if client is not None:
+            keys = [key async for key in client.scan_iter(match=TimelineUtils.KEY_PREFIX + "bench-*")]
+            for start in range(0, len(keys), 1000):
+                await client.delete(*keys[start:start + 1000])
+        await AsyncTimelineUtils.close_client()
+        await AsyncMongoUtils.close_pooled_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--posts", type=int, default=200000)
+    parser.add_argument("--reads", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,53 @@
+"""
+Benchmark for token validation
+
+Compares validations per second of the in-process revocation check
+(bloom filter plus exact set) against a `find_one` per token, the way
+TokenUtils.is_access_token_in_db checks tokens.
+
+The find_one path requires a running MongoDB and the EPA_MONGODB_* environment variables:
+    PYTHONPATH=src python benchmarks/bench_token_revocation.py --revoked 100000 --checks 20000
+Use --skip-mongo to only measure the in-process path.
+"""
+
+from datetime import datetime, timedelta
+import argparse
+import time
+import uuid
+
+from epa_api.api_implementation.utils.mongo import MongoUtils
+from epa_api.api_implementation.utils.revocation import RevocationUtils
+
+
+def report(name: str, checks: int, elapsed: float):
+    print(f"{name:<12} {checks} validations in {elapsed:.3f}s -> {checks / elapsed:,.0f} validations/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--revoked", type=int, default=100000)
+    parser.add_argument("--checks", type=int, default=20000)
+    parser.add_argument("--skip-mongo", action="store_true")
+    args = parser.parse_args()
+
+    expires_at = datetime.now() + timedelta(minutes=30)
+    revoked = [uuid.uuid4().hex for _ in range(args.revoked)]
+    for jti in revoked:
+        RevocationUtils.add(jti, expires_at)
+
+    # Mostly valid tokens with a few revoked ones, like real traffic
+    checks = [revoked[i] if i % 100 == 0 else uuid.uuid4().hex for i in range(args.checks)]
+
+    start = time.perf_counter()
+    for jti in checks:
+        RevocationUtils.is_revoked(jti)
+    report("in-process", len(checks), time.perf_counter() - start)
+
+    if not args.skip_mongo:
+        client, db = MongoUtils.get_mongodb_database_connection()
+        user_collection = MongoUtils.get_user_collection(db)
+        start = time.perf_counter()
+        for jti in checks:
+            user_collection.find_one({"access_token": jti})
+        report("find_one", len(checks), time.perf_counter() - start)
+        client.close()
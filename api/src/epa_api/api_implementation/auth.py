@@ -5,9 +5,11 @@ Functions are called here if their name is specified as
 an operationId in the OpenAPI specification.
 """
 
-from typing import Optional
-from pydantic import StrictStr
+from typing import Any, ClassVar, Dict, Optional, Set
+from pydantic import SecretStr, StrictStr
 
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
 from fastapi.exceptions import HTTPException
 from starlette.status import HTTP_400_BAD_REQUEST, HTTP_500_INTERNAL_SERVER_ERROR
 from epa_api.apis.authentication_api_base import BaseAuthenticationApi
@@ -15,16 +17,36 @@ from epa_api.models.user_registration import UserRegistration
 from epa_api.models.user_created import UserCreated
 from epa_api.models.login_request import LoginRequest
 from epa_api.models.auth_token import AuthToken
-from epa_api.api_implementation.utils.mongo import MongoUtils
-from epa_api.api_implementation.utils.user import UserUtils
-from epa_api.api_implementation.utils.token import TokenUtils
-from epa_api.api_implementation.utils.google import GoogleUtils
+from epa_api.api_implementation.utils.mongo import AsyncMongoUtils
+from epa_api.api_implementation.utils.user import AsyncUserUtils, UserTakenError, UserUtils
+from epa_api.api_implementation.utils.token import AsyncTokenUtils, TokenUtils
+from epa_api.api_implementation.utils.google import AsyncGoogleUtils, GoogleAuthError, GoogleUnavailableError, GoogleUtils
+from epa_api.api_implementation.utils.hashing import HashingSaturatedError, HashingUtils
 from epa_api.api_implementation.utils.context import current_token_data
 from fastapi.responses import RedirectResponse
 from fastapi import status
 import urllib.parse
+import asyncio
 
 class AuthAPIImplementation(BaseAuthenticationApi):
+    # Keeps a reference to fire-and-forget tasks (e.g. password rehashes) until they finish
+    _background_tasks: ClassVar[Set[asyncio.Task]] = set()
+    
+    def __init__(self, db: AsyncDatabase | None = None):
+        # The database is borrowed from the pooled client opened in the API lifespan,
+        # a different database can be injected (e.g. for tests)
+        self._db = db
+        
+    @property
+    def db(self) -> AsyncDatabase:
+        if self._db is None:
+            self._db = AsyncMongoUtils.get_pooled_database()
+        return self._db
+        
+    @staticmethod
+    def get_taken_detail(error: UserTakenError) -> str:
+        return {"email": "Email already taken", "username": "Username already taken"}.get(error.field, "User already exists")
+        
     async def register_new_user(self, user_registration: UserRegistration) -> UserCreated:
         
         # Verify that payload is valid for user registration
@@ -39,24 +61,24 @@ class AuthAPIImplementation(BaseAuthenticationApi):
         if len(user_registration.password) < 12:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Password must be at least 12 characters")
             
-        # Connect to the database
-        client, db = MongoUtils.get_mongodb_database_connection()
-        user_collection = MongoUtils.get_user_collection(db)
-        
-        # Check that the creds are not taken
-        if UserUtils.is_email_taken(user_registration.email, user_collection):
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email already taken")
+        user_collection = AsyncMongoUtils.get_user_collection(self.db)
+        
+        # Hash the password off the event loop, shedding load when the hashing queue is full
+        try:
+            password_record = await HashingUtils.hash_password(user_registration.password)
+        except HashingSaturatedError:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, try again later", headers={"Retry-After": "1"})
+        
+        # Create the user, the unique indexes on email and username reject taken creds
+        try:
+            user_id = await AsyncUserUtils.create_standard_user(
+                user_registration,
+                password_record,
+                user_collection
+            )
+        except UserTakenError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=AuthAPIImplementation.get_taken_detail(e))
         
-        if UserUtils.is_username_taken(user_registration.username, user_collection):
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Username already taken")
-        
-        # Create the user
-        user_id = UserUtils.create_standard_user(
-            user_registration,
-            user_collection
-        )
-        
-        client.close()
         return UserCreated(user_id=user_id)
         
     async def login_with_password(self, login_request: LoginRequest) -> AuthToken:
@@ -68,16 +90,30 @@ class AuthAPIImplementation(BaseAuthenticationApi):
         email = login_request.email
         password = login_request.password
         
-        client, db = MongoUtils.get_mongodb_database_connection()
-        user_collection = MongoUtils.get_user_collection(db)
+        user_collection = AsyncMongoUtils.get_user_collection(self.db)
         
-        user = UserUtils.get_user_from_email(email, user_collection)
-        if not user or not UserUtils.verify_password(password, user["password"], user["salt"]):
+        user = await AsyncUserUtils.get_user_from_email(email, user_collection)
+        password_record = UserUtils.get_password_record(user) if user else None
+        if not password_record:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
             
-        new_access_token = TokenUtils.generate_new_access_token(user, user_collection)
-        new_session_token = TokenUtils.generate_new_session_token(user, MongoUtils.get_session_tokens_collection(db))
-        client.close()
+        # Verify the password off the event loop, shedding load when the hashing queue is full
+        try:
+            is_password_valid = await HashingUtils.verify_password(password, password_record)
+        except HashingSaturatedError:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, try again later", headers={"Retry-After": "1"})
+        if not is_password_valid:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+            
+        # Upgrade the hash in the background when it was made with an older policy
+        if UserUtils.needs_rehash(password_record):
+            task = asyncio.create_task(self._rehash_password(user, password, user_collection))
+            AuthAPIImplementation._background_tasks.add(task)
+            task.add_done_callback(AuthAPIImplementation._background_tasks.discard)
+            
+        revoked_token_collection = AsyncMongoUtils.get_revoked_tokens_collection(self.db)
+        new_access_token = await AsyncTokenUtils.generate_new_access_token(user, user_collection, revoked_token_collection)
+        new_session_token = await AsyncTokenUtils.generate_new_session_token(user, AsyncMongoUtils.get_session_tokens_collection(self.db), revoked_token_collection)
         
         return AuthToken(
             access_token=new_access_token,
@@ -86,6 +122,16 @@ class AuthAPIImplementation(BaseAuthenticationApi):
             access_expires_in=TokenUtils.get_ttl_in_seconds(TokenUtils.get_expire_date(new_access_token))
         )
         
+    async def _rehash_password(self, user: Dict[Any, Any], password: SecretStr, user_collection: AsyncCollection):
+        """Hash a verified password with the current policy and store the new record."""
+        
+        try:
+            password_record = await HashingUtils.hash_password(password)
+        except HashingSaturatedError:
+            # The upgrade is retried on the next login
+            return
+        await AsyncUserUtils.update_password_record(user, password_record, user_collection)
+        
     async def renew_session_token(self) -> AuthToken:
         
         token = current_token_data.get()
@@ -94,19 +140,24 @@ class AuthAPIImplementation(BaseAuthenticationApi):
         if not token:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Token lost")
             
-        # Make sure this session token was not invalidated early
-        client, db = MongoUtils.get_mongodb_database_connection()
-        session_token_collection = MongoUtils.get_session_tokens_collection(db)
-        if not TokenUtils.is_session_token_in_db(token.sub, session_token_collection):
+        # Revoked tokens were already rejected by the BearerAuth dependency,
+        # make sure this is a session token and not an access token (tokens issued before the typ claim have none)
+        if token.claims.get("typ", "session") != "session":
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid Session")
             
-        user_collection = MongoUtils.get_user_collection(db)
-        user = UserUtils.get_user_from_user_id(TokenUtils.get_user_id(token.sub), user_collection)
+        # The in-memory revocations of this process can lag behind a logout or an eviction made by another one
+        # (see RevocationUtils.refresh), renewals are rare enough to also check the session store
+        session_token_collection = AsyncMongoUtils.get_session_tokens_collection(self.db)
+        if not await AsyncTokenUtils.is_session_token_in_db(token.sub, session_token_collection):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid Session")
+            
+        user_collection = AsyncMongoUtils.get_user_collection(self.db)
+        user = await AsyncUserUtils.get_user_from_user_id(token.claims.get("user_id"), user_collection)
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
             
-        new_access_token = TokenUtils.generate_new_access_token(user, user_collection)
-        client.close()
+        revoked_token_collection = AsyncMongoUtils.get_revoked_tokens_collection(self.db)
+        new_access_token = await AsyncTokenUtils.generate_new_access_token(user, user_collection, revoked_token_collection)
         
         return AuthToken(
             access_token=new_access_token,
@@ -126,27 +177,35 @@ class AuthAPIImplementation(BaseAuthenticationApi):
         if not code:
             raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Termination code missing")
     
-        # Get the user's information
-        token_data = GoogleUtils.exchange_code_for_token(code)
-        user_info = GoogleUtils.get_google_user_info(token_data["access_token"])
-        
-        
-        # Connect to the database
-        client, db = MongoUtils.get_mongodb_database_connection()
-        user_collection = MongoUtils.get_user_collection(db)
+        # Get the user's information, from the verified id token when Google sends one
+        try:
+            token_data = await AsyncGoogleUtils.exchange_code_for_token(code)
+            user_info = await AsyncGoogleUtils.get_google_user_info(token_data)
+        except GoogleAuthError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication failed with Google")
+        except GoogleUnavailableError:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Google is unavailable, try again later", headers={"Retry-After": "1"})
+        
+        user_collection = AsyncMongoUtils.get_user_collection(self.db)
                 
         # Get the user's information on EPA, creating the user if they do not exist
-        user_object = UserUtils.get_user_from_google_id(user_info["id"], user_collection)
+        user_object = await AsyncUserUtils.get_user_from_google_id(user_info["id"], user_collection)
         if not user_object:
-            user_id = UserUtils.create_google_user(user_info, user_collection)
-            user_object = UserUtils.get_user_from_user_id(user_id, user_collection)
+            try:
+                user_id = await AsyncUserUtils.create_google_user(user_info, user_collection)
+                user_object = await AsyncUserUtils.get_user_from_user_id(user_id, user_collection)
+            except UserTakenError as e:
+                if e.field != "google_id":
+                    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=AuthAPIImplementation.get_taken_detail(e))
+                # Another callback of the same user created them first
+                user_object = await AsyncUserUtils.get_user_from_google_id(user_info["id"], user_collection)
         if user_object is None:
             raise HTTPException(status_code=HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve user after creation.")
             
         # Authorize the user with a session token
-        new_access_token = TokenUtils.generate_new_access_token(user_object, user_collection)
-        new_session_token = TokenUtils.generate_new_session_token(user_object, MongoUtils.get_session_tokens_collection(db))
-        client.close()
+        revoked_token_collection = AsyncMongoUtils.get_revoked_tokens_collection(self.db)
+        new_access_token = await AsyncTokenUtils.generate_new_access_token(user_object, user_collection, revoked_token_collection)
+        new_session_token = await AsyncTokenUtils.generate_new_session_token(user_object, AsyncMongoUtils.get_session_tokens_collection(self.db), revoked_token_collection)
         
         return AuthToken(
             access_token=new_access_token,
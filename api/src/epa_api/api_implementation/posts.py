@@ -0,0 +1,52 @@
+"""
+Service Methods for API Posts Endpoints
+
+Functions are called here if their name is specified as
+an operationId in the OpenAPI specification.
+"""
+
+from pymongo.asynchronous.database import AsyncDatabase
+from fastapi.exceptions import HTTPException
+from fastapi import status
+from epa_api.apis.posts_api_base import BasePostsApi
+from epa_api.models.post_page import PostPage
+from epa_api.api_implementation.utils.mongo import AsyncMongoUtils
+from epa_api.api_implementation.utils.pagination import InvalidCursorError
+from epa_api.api_implementation.utils.post import AsyncPostUtils, PostUtils
+
+class PostsAPIImplementation(BasePostsApi):
+
+    def __init__(self, db: AsyncDatabase | None = None):
+        # The database is borrowed from the pooled client opened in the API lifespan,
+        # a different database can be injected (e.g. for tests)
+        self._db = db
+
+    @property
+    def db(self) -> AsyncDatabase:
+        if self._db is None:
+            self._db = AsyncMongoUtils.get_pooled_database()
+        return self._db
+
+    async def list_posts(self, category: str | None, limit: int, cursor: str | None) -> PostPage:
+
+        posts_collection = AsyncMongoUtils.get_posts_collection(self.db)
+
+        # Pages continue from the signed cursor of the previous page along the (category, created_at, _id) index
+        try:
+            documents, next_cursor = await AsyncPostUtils.list_posts(posts_collection, category, limit, cursor)
+        except InvalidCursorError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+        return PostPage(posts=[PostUtils.to_post(document) for document in documents], next_cursor=next_cursor)
+
+    async def get_nearby_posts(self, lat: float, lng: float, radius: int, sort: str, limit: int, cursor: str | None) -> PostPage:
+
+        posts_collection = AsyncMongoUtils.get_posts_collection(self.db)
+
+        # Pages continue from the cursor of the previous page, along the 2dsphere index or the (created_at, _id) index
+        try:
+            documents, next_cursor = await AsyncPostUtils.get_nearby_posts(posts_collection, lat, lng, radius, sort, limit, cursor)
+        except InvalidCursorError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+        return PostPage(posts=[PostUtils.to_post(document) for document in documents], next_cursor=next_cursor)
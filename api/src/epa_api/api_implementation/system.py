@@ -6,8 +6,19 @@ an operationId in the OpenAPI specification.
 """
 
 from epa_api.apis.system_api_base import BaseSystemApi
+from epa_api.models.metrics import Metrics
+from epa_api.models.hashing_metrics import HashingMetrics
+from epa_api.models.timeline_cache_metrics import TimelineCacheMetrics
 from epa_api.models.status import Status
+from epa_api.api_implementation.utils.hashing import HashingUtils
+from epa_api.api_implementation.utils.timeline import AsyncTimelineUtils
 
 class SystemAPIImplementation(BaseSystemApi):
     async def get_api_status(self) -> Status:
-        return Status(status="OK", version="1.0.0")
\ No newline at end of file
+        return Status(status="OK", version="1.0.0")
+        
+    async def get_api_metrics(self) -> Metrics:
+        return Metrics(
+            password_hashing=HashingMetrics(**HashingUtils.get_metrics()),
+            timeline_cache=TimelineCacheMetrics(**AsyncTimelineUtils.get_metrics()),
+        )
@@ -0,0 +1,50 @@
+"""
+Service Methods for API Timeline Endpoints
+
+Functions are called here if their name is specified as
+an operationId in the OpenAPI specification.
+"""
+
+from pymongo.asynchronous.database import AsyncDatabase
+from fastapi.exceptions import HTTPException
+from fastapi import status
+from epa_api.apis.timeline_api_base import BaseTimelineApi
+from epa_api.models.post_page import PostPage
+from epa_api.api_implementation.utils.mongo import AsyncMongoUtils
+from epa_api.api_implementation.utils.pagination import InvalidCursorError
+from epa_api.api_implementation.utils.timeline import AsyncTimelineUtils
+from epa_api.api_implementation.utils.context import current_token_data
+
+class TimelineAPIImplementation(BaseTimelineApi):
+
+    def __init__(self, db: AsyncDatabase | None = None):
+        # The database is borrowed from the pooled client opened in the API lifespan,
+        # a different database can be injected (e.g. for tests)
+        self._db = db
+
+    @property
+    def db(self) -> AsyncDatabase:
+        if self._db is None:
+            self._db = AsyncMongoUtils.get_pooled_database()
+        return self._db
+
+    async def get_user_timeline(self, limit: int, cursor: str | None) -> PostPage:
+
+        token = current_token_data.get()
+        user_id = token.claims.get("user_id") if token else None
+        if not user_id:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Token lost")
+
+        # Read from the Redis timeline of the user, the posts collection is only read on a miss
+        try:
+            posts, next_cursor = await AsyncTimelineUtils.get_timeline(
+                user_id,
+                limit,
+                cursor,
+                AsyncMongoUtils.get_user_collection(self.db),
+                AsyncMongoUtils.get_posts_collection(self.db),
+            )
+        except InvalidCursorError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+        return PostPage(posts=posts, next_cursor=next_cursor)
@@ -1,5 +1,54 @@
 from contextvars import ContextVar
-from typing import Optional
+from starlette.types import ASGIApp, Receive, Scope, Send
 from epa_api.models.extra_models import TokenModel
+from epa_api.api_implementation.utils.token import TokenUtils
+from epa_api.api_implementation.utils.revocation import RevocationUtils
 
 current_token_data: ContextVar[TokenModel | None] = ContextVar("current_token_data", default=None)
+
+
+class AuthContextMiddleware:
+    """
+    A pure ASGI middleware storing the verified bearer token of each request in `current_token_data`.
+
+    The Authorization header is parsed once and the token is verified once (see TokenUtils.verify_token),
+    the BearerAuth dependency then reuses the result. Requests are never rejected here,
+    rejecting a missing or invalid token is left to the BearerAuth dependency of protected routes.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    @staticmethod
+    def get_token_data(scope: Scope) -> TokenModel | None:
+        """
+        Get the verified bearer token of a request.
+
+        :param scope: The ASGI scope of the request
+        :type scope: Scope
+        :return: The token and its claims, None if there is no valid, unrevoked bearer token
+        :rtype: TokenModel | None
+        """
+
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() != "bearer" or not token:
+                    return None
+                token = token.strip()
+                claims = TokenUtils.verify_token(token)
+                if claims is None or RevocationUtils.is_revoked(claims.get("jti")):
+                    return None
+                return TokenModel(sub=token, claims=claims)
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        reset_token = current_token_data.set(AuthContextMiddleware.get_token_data(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_token_data.reset(reset_token)
@@ -1,10 +1,39 @@
-from typing import Dict, Any
+from typing import Any, ClassVar, Dict, List
+from epa_api.api_implementation.utils.settings import GoogleSettings, SettingsUtils
 import requests
-import os
+import httpx
+import asyncio
+import time
+import jwt
+import re
+
+
+class GoogleAuthError(Exception):
+    """Raised when Google rejects the authorization code or returns an invalid id token"""
+
+
+class GoogleUnavailableError(Exception):
+    """Raised when Google cannot be reached, after retries"""
+
 
 class GoogleUtils:
     """A class with helpful methods to interact with a user via Google OAuth"""
     
+    @staticmethod
+    def get_settings() -> GoogleSettings:
+        """
+        Get the Google OAuth settings.
+        
+        :raises ValueError if Google OAuth is not configured
+        :return: The Google OAuth settings
+        :rtype: GoogleSettings
+        """
+        
+        settings = SettingsUtils.get(GoogleSettings)
+        if not settings.enabled:
+            raise ValueError("Environment variables for Google OAuth {EPA_GOOGLE_WEB_CLIENT_ID, EPA_GOOGLE_WEB_CLIENT_SECRET, EPA_GOOGLE_WEB_REDIRECT_URI} not set")
+        return settings
+    
     @staticmethod
     def get_auth_endpoint() -> str:
         return "https://accounts.google.com/o/oauth2/v2/auth"
@@ -17,13 +46,20 @@ class GoogleUtils:
     def get_userinfo_endpoint() -> str:
         return "https://www.googleapis.com/oauth2/v2/userinfo"
         
+    @staticmethod
+    def get_jwks_endpoint() -> str:
+        return "https://www.googleapis.com/oauth2/v3/certs"
+        
+    @staticmethod
+    def get_issuers() -> List[str]:
+        return ["https://accounts.google.com", "accounts.google.com"]
+        
     @staticmethod
     def get_query_params_web_request() -> Dict[Any, Any]:
         
-        client_id = os.getenv("EPA_GOOGLE_WEB_CLIENT_ID", None)
-        redirect_url = os.getenv("EPA_GOOGLE_WEB_REDIRECT_URI", None)
-        if not client_id or not redirect_url:
-            raise ValueError("Environment variables for Google OAuth {EPA_GOOGLE_WEB_CLIENT_ID, EPA_GOOGLE_WEB_REDIRECT_URI} not set")
+        settings = GoogleUtils.get_settings()
+        client_id = settings.web_client_id
+        redirect_url = settings.web_redirect_uri
             
         response_type = "code"
         scope = "openid email profile"
@@ -42,12 +78,13 @@ class GoogleUtils:
     @staticmethod
     def exchange_code_for_token(code: str) -> Dict[str, Any]:
         token_url = GoogleUtils.get_token_endpoint()
+        settings = GoogleUtils.get_settings()
         
         payload = {
             "code": code,
-            "client_id": os.getenv("EPA_GOOGLE_WEB_CLIENT_ID"),
-            "client_secret": os.getenv("EPA_GOOGLE_WEB_CLIENT_SECRET"),
-            "redirect_uri": os.getenv("EPA_GOOGLE_WEB_REDIRECT_URI"),
+            "client_id": settings.web_client_id,
+            "client_secret": settings.web_client_secret,
+            "redirect_uri": settings.web_redirect_uri,
             "grant_type": "authorization_code",
         }
     
@@ -70,5 +107,221 @@ class GoogleUtils:
             raise Exception(f"Failed to fetch user info: {response.text}")
             
         return response.json()
-        
-        
\ No newline at end of file
+
+
+class AsyncGoogleUtils:
+    """
+    A class with helpful methods to interact with a user via Google OAuth without blocking the event loop.
+
+    Every call to Google goes through one pooled HTTP client, so connections (and their TLS sessions)
+    are kept alive between logins. Calls have strict timeouts, and calls that are safe to repeat are retried.
+    The `id_token` returned with the access token is verified locally against Google's signing keys (JWKS),
+    which are cached for as long as Google allows, so the userinfo round trip is skipped.
+    """
+
+    _client: ClassVar[httpx.AsyncClient | None] = None
+    _jwks: ClassVar[Dict[str, jwt.PyJWK]] = {}
+    _jwks_expires_at: ClassVar[float] = 0.0
+    _jwks_lock: ClassVar[asyncio.Lock | None] = None
+
+    # Seconds the signing keys are cached when Google does not send a max-age
+    DEFAULT_JWKS_MAX_AGE: ClassVar[int] = 3600
+
+    @staticmethod
+    def open_client() -> httpx.AsyncClient:
+        """
+        Open the process-wide HTTP client used to call Google. This is called once when the API starts.
+        Calling this when the client is already open returns the open client.
+
+        :return: The HTTP client
+        :rtype: httpx.AsyncClient
+        """
+
+        if AsyncGoogleUtils._client is not None:
+            return AsyncGoogleUtils._client
+
+        settings = SettingsUtils.get(GoogleSettings)
+        AsyncGoogleUtils._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.http_timeout_ms / 1000),
+            limits=httpx.Limits(max_connections=settings.http_max_connections, max_keepalive_connections=settings.http_max_connections),
+            # Connection failures are only retried here, the request was not sent yet (see request)
+            transport=httpx.AsyncHTTPTransport(retries=settings.http_retries),
+        )
+        return AsyncGoogleUtils._client
+
+    @staticmethod
+    async def close_client():
+        """
+        Close the process-wide HTTP client, if it is open. This is called once when the API shuts down.
+        """
+
+        if AsyncGoogleUtils._client is not None:
+            client = AsyncGoogleUtils._client
+            AsyncGoogleUtils._client = None
+            await client.aclose()
+
+    @staticmethod
+    async def request(method: str, url: str, idempotent: bool, **kwargs: Any) -> httpx.Response:
+        """
+        Send a request to Google. Connection failures are retried by the transport of the client, for every request.
+        Idempotent requests are also retried, with a backoff, on the other transport errors (e.g. timeouts) and 5xx responses.
+
+        :raises GoogleUnavailableError if Google cannot be reached
+        :param method: The HTTP method
+        :type method: str
+        :param url: The URL to call
+        :type url: str
+        :param idempotent: True if the request can be sent more than once
+        :type idempotent: bool
+        :return: The response
+        :rtype: httpx.Response
+        """
+
+        client = AsyncGoogleUtils.open_client()
+        attempts = 1 + (SettingsUtils.get(GoogleSettings).http_retries if idempotent else 0)
+        for attempt in range(attempts):
+            if attempt:
+                await asyncio.sleep(0.1 * 2 ** (attempt - 1))
+            try:
+                response = await client.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # The transport already retried the connection
+                error = e
+                break
+            except httpx.TransportError as e:
+                error = e
+                continue
+            if response.status_code < 500:
+                return response
+            error = httpx.HTTPStatusError(f"Google answered {response.status_code}", request=response.request, response=response)
+
+        raise GoogleUnavailableError(f"Failed to call {url}: {error}") from error
+
+    @staticmethod
+    async def exchange_code_for_token(code: str) -> Dict[str, Any]:
+        """
+        Exchange an authorization code for Google tokens. The code can only be used once,
+        so the exchange is not retried once it was sent.
+
+        :raises GoogleAuthError if Google rejects the code
+        :raises GoogleUnavailableError if Google cannot be reached
+        :param code: The authorization code
+        :type code: str
+        :return: The token response, with `access_token` and `id_token`
+        :rtype: Dict[str, Any]
+        """
+
+        settings = GoogleUtils.get_settings()
+        payload = {
+            "code": code,
+            "client_id": settings.web_client_id,
+            "client_secret": settings.web_client_secret,
+            "redirect_uri": settings.web_redirect_uri,
+            "grant_type": "authorization_code",
+        }
+
+        response = await AsyncGoogleUtils.request("POST", GoogleUtils.get_token_endpoint(), idempotent=False, data=payload)
+        if not response.is_success:
+            raise GoogleAuthError(f"Google Token Exchange failed: {response.text}")
+        return response.json()
+
+    @staticmethod
+    def get_jwks_max_age(response: httpx.Response) -> int:
+        match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+        return int(match.group(1)) if match else AsyncGoogleUtils.DEFAULT_JWKS_MAX_AGE
+
+    @staticmethod
+    async def get_signing_key(kid: str) -> jwt.PyJWK:
+        """
+        Get one of Google's signing keys. The keys are fetched again when they expire or when
+        a token is signed with a key that is not known yet (Google rotates its keys).
+        Concurrent logins share a single fetch.
+
+        :raises GoogleAuthError if no key has this id
+        :raises GoogleUnavailableError if the keys cannot be fetched
+        :param kid: The id of the key, from the token header
+        :type kid: str
+        :return: The signing key
+        :rtype: jwt.PyJWK
+        """
+
+        if time.monotonic() < AsyncGoogleUtils._jwks_expires_at and kid in AsyncGoogleUtils._jwks:
+            return AsyncGoogleUtils._jwks[kid]
+
+        if AsyncGoogleUtils._jwks_lock is None:
+            AsyncGoogleUtils._jwks_lock = asyncio.Lock()
+        async with AsyncGoogleUtils._jwks_lock:
+            # Another login may have fetched the keys while this one waited
+            if time.monotonic() >= AsyncGoogleUtils._jwks_expires_at or kid not in AsyncGoogleUtils._jwks:
+                response = await AsyncGoogleUtils.request("GET", GoogleUtils.get_jwks_endpoint(), idempotent=True)
+                if not response.is_success:
+                    raise GoogleUnavailableError(f"Failed to fetch Google signing keys: {response.text}")
+                keys = jwt.PyJWKSet.from_dict(response.json())
+                AsyncGoogleUtils._jwks = {key.key_id: key for key in keys.keys}
+                AsyncGoogleUtils._jwks_expires_at = time.monotonic() + AsyncGoogleUtils.get_jwks_max_age(response)
+
+        if kid not in AsyncGoogleUtils._jwks:
+            raise GoogleAuthError(f"Unknown Google signing key {kid}")
+        return AsyncGoogleUtils._jwks[kid]
+
+    @staticmethod
+    async def verify_id_token(id_token: str) -> Dict[str, Any]:
+        """
+        Verify a Google id token locally: signature, expiry, audience (our client id) and issuer.
+
+        :raises GoogleAuthError if the token is not valid
+        :raises GoogleUnavailableError if the signing keys cannot be fetched
+        :param id_token: The id token
+        :type id_token: str
+        :return: The claims of the token
+        :rtype: Dict[str, Any]
+        """
+
+        try:
+            kid = jwt.get_unverified_header(id_token).get("kid", "")
+            key = await AsyncGoogleUtils.get_signing_key(kid)
+            return jwt.decode(
+                id_token,
+                key,
+                algorithms=["RS256"],
+                audience=GoogleUtils.get_settings().web_client_id,
+                issuer=GoogleUtils.get_issuers(),
+            )
+        except jwt.InvalidTokenError as e:
+            raise GoogleAuthError(f"Invalid Google id token: {e}") from e
+
+    @staticmethod
+    async def get_google_user_info(token_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Get the information of the user who authorized us, in the format of the userinfo endpoint.
+        The verified id token is used when there is one, otherwise the userinfo endpoint is called.
+
+        :raises GoogleAuthError if the tokens are not valid
+        :raises GoogleUnavailableError if Google cannot be reached
+        :param token_data: The token response, see exchange_code_for_token
+        :type token_data: Dict[str, Any]
+        :return: The user information, with at least `id` and `email`
+        :rtype: Dict[str, Any]
+        """
+
+        if token_data.get("id_token"):
+            claims = await AsyncGoogleUtils.verify_id_token(token_data["id_token"])
+            return {
+                "id": claims["sub"],
+                "email": claims.get("email"),
+                "verified_email": claims.get("email_verified", False),
+                "name": claims.get("name"),
+                "picture": claims.get("picture"),
+            }
+
+        headers = {"Authorization": f"Bearer {token_data['access_token']}"}
+        response = await AsyncGoogleUtils.request("GET", GoogleUtils.get_userinfo_endpoint(), idempotent=True, headers=headers)
+        if not response.is_success:
+            raise GoogleAuthError(f"Failed to fetch user info: {response.text}")
+        return response.json()
+
+    @staticmethod
+    def clear_signing_keys():
+        AsyncGoogleUtils._jwks = {}
+        AsyncGoogleUtils._jwks_expires_at = 0.0
+        AsyncGoogleUtils._jwks_lock = None
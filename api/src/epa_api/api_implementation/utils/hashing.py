@@ -0,0 +1,156 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from typing import Any, Callable, ClassVar, Deque, Dict, Tuple
+from pydantic.types import SecretStr
+from epa_api.api_implementation.utils.user import UserUtils
+from epa_api.api_implementation.utils.settings import HashingSettings, SettingsUtils
+import asyncio
+import time
+
+
+class HashingSaturatedError(Exception):
+    """Raised when the password hashing executor cannot accept more work"""
+
+
+class HashingUtils:
+    """
+    A class with helpful methods to hash passwords without blocking the event loop.
+
+    Hashing runs in a process pool sized to the available cores. At most `max_queue` hashes
+    can wait for a free worker, any more are rejected with HashingSaturatedError
+    so that callers can answer 503 instead of piling up requests.
+    """
+
+    _executor: ClassVar[ProcessPoolExecutor | None] = None
+    _workers: ClassVar[int] = 0
+    _max_queue: ClassVar[int] = 0
+    _pending: ClassVar[int] = 0
+    _completed: ClassVar[int] = 0
+    _rejected: ClassVar[int] = 0
+    _latencies: ClassVar[Deque[float]] = deque(maxlen=1000)
+
+    @staticmethod
+    def get_hashing_env_variables() -> Tuple[int, int]:
+        """
+        Get the hashing executor env variables, using defaults when they are not set:
+            - EPA_HASHING_WORKERS (default the number of available cores)
+            - EPA_HASHING_MAX_QUEUE (default 4 times the number of workers)
+
+        :raises ValueError if one of the env variables is not a positive integer
+        :return: The number of workers and the maximum queue size
+        :rtype: Tuple[int, int]
+        """
+
+        settings = SettingsUtils.get(HashingSettings)
+        return settings.workers, settings.max_queue
+
+    @staticmethod
+    def open_executor(workers: int | None = None, max_queue: int | None = None) -> ProcessPoolExecutor:
+        """
+        Open the process-wide password hashing executor. This is called once when the API starts.
+        Calling this when the executor is already open returns the open executor.
+
+        :param workers: The number of hashing processes, defaults to EPA_HASHING_WORKERS
+        :type workers: int | None
+        :param max_queue: The number of hashes allowed to wait for a worker, defaults to EPA_HASHING_MAX_QUEUE
+        :type max_queue: int | None
+        :return: The hashing executor
+        :rtype: concurrent.futures.ProcessPoolExecutor
+        """
+
+        if HashingUtils._executor is not None:
+            return HashingUtils._executor
+
+        default_workers, default_max_queue = HashingUtils.get_hashing_env_variables()
+        HashingUtils._workers = workers or default_workers
+        HashingUtils._max_queue = max_queue if max_queue is not None else default_max_queue
+        HashingUtils._executor = ProcessPoolExecutor(max_workers=HashingUtils._workers)
+        return HashingUtils._executor
+
+    @staticmethod
+    def shutdown_executor():
+        """
+        Shutdown the process-wide password hashing executor, if it is open.
+        This is called once when the API shuts down.
+        """
+
+        if HashingUtils._executor is not None:
+            HashingUtils._executor.shutdown(wait=True, cancel_futures=True)
+            HashingUtils._executor = None
+
+    @staticmethod
+    async def run(func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run a hashing function on the executor, opening it if the API lifespan has not done so yet.
+
+        :raises HashingSaturatedError if every worker is busy and the queue is full
+        :param func: A picklable function to run
+        :type func: Callable[..., Any]
+        :return: The result of the function
+        :rtype: Any
+        """
+
+        executor = HashingUtils.open_executor()
+        if HashingUtils._pending >= HashingUtils._workers + HashingUtils._max_queue:
+            HashingUtils._rejected += 1
+            raise HashingSaturatedError("Password hashing queue is full")
+
+        HashingUtils._pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+        finally:
+            HashingUtils._pending -= 1
+            HashingUtils._completed += 1
+            HashingUtils._latencies.append(time.perf_counter() - start)
+
+    @staticmethod
+    async def hash_password(password: SecretStr) -> Dict[str, Any]:
+        """
+        Hash a password on the executor with the current policy, see UserUtils.hash_password.
+
+        :raises HashingSaturatedError if every worker is busy and the queue is full
+        :param password: The password to hash
+        :type password: SecretStr
+        :return: The password hash record
+        :rtype: Dict[str, Any]
+        """
+
+        algorithm, iterations = UserUtils.get_password_hash_policy()
+        return await HashingUtils.run(UserUtils.hash_password, password, algorithm, iterations)
+
+    @staticmethod
+    async def verify_password(unhashed_password: SecretStr, password_record: Dict[str, Any]) -> bool:
+        """
+        Verify a password on the executor, see UserUtils.verify_password.
+
+        :raises HashingSaturatedError if every worker is busy and the queue is full
+        :return: True if and only if the unhashed_password is the same has the hashed password
+        :rtype: bool
+        """
+
+        return await HashingUtils.run(UserUtils.verify_password, unhashed_password, password_record)
+
+    @staticmethod
+    def get_metrics() -> Dict[str, Any]:
+        """
+        Get the metrics of the password hashing executor.
+        Latencies include the time spent waiting in the queue and cover the last 1000 hashes.
+
+        :return: The metrics, matching the HashingMetrics model
+        :rtype: Dict[str, Any]
+        """
+
+        latencies = sorted(HashingUtils._latencies)
+        in_flight = min(HashingUtils._pending, HashingUtils._workers)
+        return {
+            "workers": HashingUtils._workers,
+            "max_queue": HashingUtils._max_queue,
+            "in_flight": in_flight,
+            "queue_depth": HashingUtils._pending - in_flight,
+            "completed": HashingUtils._completed,
+            "rejected": HashingUtils._rejected,
+            "latency_avg_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            "latency_p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 3) if latencies else 0.0,
+            "latency_max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        }
@@ -1,16 +1,25 @@
-from typing import List, Tuple
-from pymongo import MongoClient
+from typing import ClassVar, Dict, List, Tuple
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
 from pymongo.database import Database
 from pymongo.collection import Collection
-import os
+from epa_api.api_implementation.utils.settings import MongoSettings, SettingsUtils
 
 class MongoUtils:
     """A class with helpful methods to interact with MongoDB"""
     
+    # The process-wide pooled client used by the API, see open_pooled_client()
+    _pooled_client: ClassVar[MongoClient | None] = None
+    
+    # Handles of the pooled client resolved once, see get_collection()
+    _pooled_database: ClassVar[Database | None] = None
+    _pooled_collections: ClassVar[Dict[str, Collection]] = {}
+    
     @staticmethod
     def get_mongodb_env_variables() -> Tuple[str, int, str, str, List[str]]:
         """
-        Get MongoDB env variables.
+        Get MongoDB env variables, see MongoSettings.
     
         :raises ValueError if one of the expected env variables are not set
         :return: A tupe containing the values of the env variables as such:
@@ -22,35 +31,14 @@ class MongoUtils:
         :rtype: Tuple[str, int, str, str, List[str]]
         """
         
-        output = []
-        collection_output = []
-        
-        env_vars = [
-            "EPA_MONGODB_HOSTNAME",
-            "EPA_MONGODB_PORT",
-            "EPA_MONGODB_USERNAME",
-            "EPA_MONGODB_PASSWORD",
-        ]
-        
-        env_collection_vars = [
-            "EPA_MONGODB_USER_COLLECTION",
-            "EPA_MONGODB_SESSION_TOKEN_COLLECTION"
-        ]
-        
-        for var in env_vars:
-            val = os.getenv(var)
-            if not val:
-                raise ValueError(f"Expected environment variable {var} not set")
-            output.append(val)
-    
-        for var in env_collection_vars:
-            val = os.getenv(var)
-            if not val:
-                raise ValueError(f"Expected environment variable {var} not set") 
-            collection_output.append(val)
-            
-        output.append(collection_output)
-        return tuple(output)
+        settings = SettingsUtils.get(MongoSettings)
+        return (
+            settings.hostname,
+            settings.port,
+            settings.username,
+            settings.password,
+            [settings.user_collection, settings.session_token_collection]
+        )
         
     @staticmethod        
     def get_mongodb_database_connection() -> Tuple[MongoClient, Database]:
@@ -62,14 +50,98 @@ class MongoUtils:
         :rtype: Tuple[pymongo.MongoClient, pymongo.database.Database]
         """
         
-        hostname, port, username, password, _ = MongoUtils.get_mongodb_env_variables()
-        uri = f"mongodb://{username}:{password}@{hostname}:{port}/"
-        client = MongoClient(uri, timeoutMS=5000)
+        client = MongoClient(SettingsUtils.get(MongoSettings).uri, timeoutMS=5000)
         try:
             db = client["epa_database"]
             return client, db
         except Exception:
             raise ValueError("Expected database epa_database does not exist")
+            
+    @staticmethod
+    def get_mongodb_pool_options() -> Dict[str, int]:
+        """
+        Get the connection pool options for the pooled MongoDB client.
+        Each option can be set with an env variable, otherwise a default is used:
+            - EPA_MONGODB_MAX_POOL_SIZE (default 100)
+            - EPA_MONGODB_MIN_POOL_SIZE (default 0)
+            - EPA_MONGODB_WAIT_QUEUE_TIMEOUT_MS (default 2000)
+            - EPA_MONGODB_MAX_IDLE_TIME_MS (default 60000)
+    
+        :raises ValueError if one of the env variables is not a non-negative integer
+        :return: The keyword arguments to pass to pymongo.MongoClient
+        :rtype: Dict[str, int]
+        """
+        
+        return SettingsUtils.get(MongoSettings).pool_options
+        
+    @staticmethod
+    def open_pooled_client() -> MongoClient:
+        """
+        Open the process-wide pooled MongoDB client. This is called once when the API starts,
+        every request then borrows connections from this client's pool.
+        Calling this when the client is already open returns the open client.
+    
+        :raises ValueError if one of the expected env variables are not set.
+        :return: The pooled MongoDB client
+        :rtype: pymongo.MongoClient
+        """
+        
+        if MongoUtils._pooled_client is not None:
+            return MongoUtils._pooled_client
+            
+        settings = SettingsUtils.get(MongoSettings)
+        MongoUtils._pooled_client = MongoClient(settings.uri, timeoutMS=5000, **settings.pool_options)
+        return MongoUtils._pooled_client
+        
+    @staticmethod
+    def close_pooled_client():
+        """
+        Close the process-wide pooled MongoDB client, if it is open.
+        This is called once when the API shuts down.
+        """
+        
+        if MongoUtils._pooled_client is not None:
+            MongoUtils._pooled_client.close()
+            MongoUtils._pooled_client = None
+            MongoUtils._pooled_database = None
+            MongoUtils._pooled_collections = {}
+            
+    @staticmethod
+    def get_pooled_database() -> Database:
+        """
+        Get the EPA database from the process-wide pooled MongoDB client,
+        opening the client if the API lifespan has not done so yet.
+    
+        :raises ValueError if one of the expected env variables are not set.
+        :return: The EPA MongoDB database
+        :rtype: pymongo.database.Database
+        """
+        
+        if MongoUtils._pooled_database is None:
+            MongoUtils._pooled_database = MongoUtils.open_pooled_client()["epa_database"]
+        return MongoUtils._pooled_database
+    
+    @staticmethod
+    def get_collection(db: Database | AsyncDatabase, name: str) -> Collection | AsyncCollection:
+        """
+        Get a collection in the MongoDB database. Collections of the pooled databases are
+        resolved once and reused by every request.
+    
+        :param db: The MongoDB Database
+        :type db: pymongo.database.Database | pymongo.asynchronous.database.AsyncDatabase
+        :param name: The name of the collection
+        :type name: str
+        :return: A collection from the MongoDB database
+        :rtype: pymongo.collection.Collection | pymongo.asynchronous.collection.AsyncCollection
+        """
+        
+        for pool in (MongoUtils, AsyncMongoUtils):
+            if db is pool._pooled_database:
+                collection = pool._pooled_collections.get(name)
+                if collection is None:
+                    collection = pool._pooled_collections[name] = db[name]
+                return collection
+        return db[name]
     
     @staticmethod               
     def get_user_collection(db: Database) -> Collection:
@@ -82,10 +154,7 @@ class MongoUtils:
         :rtype: pymongo.collection.Collection
         """
         
-        collections_index = -1
-        user_collection_index = 0
-        user_collection_name =  MongoUtils.get_mongodb_env_variables()[collections_index][user_collection_index]
-        return db[user_collection_name]
+        return MongoUtils.get_collection(db, SettingsUtils.get(MongoSettings).user_collection)
  
     @staticmethod       
     def get_session_tokens_collection(db: Database) -> Collection:
@@ -98,11 +167,131 @@ class MongoUtils:
         :rtype: pymongo.collection.Collection
         """
         
-        collections_index = -1
-        session_token_collection_index = 1
-        session_token_collection_name =  MongoUtils.get_mongodb_env_variables()[collections_index][session_token_collection_index]
-        return db[session_token_collection_name]      
+        return MongoUtils.get_collection(db, SettingsUtils.get(MongoSettings).session_token_collection)
+
+    @staticmethod
+    def get_posts_collection(db: Database) -> Collection:
+        """
+        Get the posts collection in the MongoDB database, the posts are written by the post ingestor.
+        
+        :param db: The MongoDB Database
+        :type db: pymongo.database.Database
+        :return: A collection from the MongoDB database
+        :rtype: pymongo.collection.Collection
+        """
         
+        return MongoUtils.get_collection(db, SettingsUtils.get(MongoSettings).post_collection)
+
 
+class AsyncMongoUtils:
+    """
+    A class with helpful methods to interact with MongoDB without blocking the event loop.
+    The API uses this class, scripts can keep using MongoUtils.
+    """
+    
+    # The process-wide pooled client used by the API, see open_pooled_client()
+    _pooled_client: ClassVar[AsyncMongoClient | None] = None
+    
+    # Handles of the pooled client resolved once, see MongoUtils.get_collection()
+    _pooled_database: ClassVar[AsyncDatabase | None] = None
+    _pooled_collections: ClassVar[Dict[str, AsyncCollection]] = {}
+    
+    @staticmethod
+    def open_pooled_client() -> AsyncMongoClient:
+        """
+        Open the process-wide pooled async MongoDB client. This is called once when the API starts,
+        every request then borrows connections from this client's pool.
+        Calling this when the client is already open returns the open client.
+    
+        :raises ValueError if one of the expected env variables are not set.
+        :return: The pooled async MongoDB client
+        :rtype: pymongo.AsyncMongoClient
+        """
+        
+        if AsyncMongoUtils._pooled_client is not None:
+            return AsyncMongoUtils._pooled_client
+            
+        settings = SettingsUtils.get(MongoSettings)
+        AsyncMongoUtils._pooled_client = AsyncMongoClient(settings.uri, timeoutMS=5000, **settings.pool_options)
+        return AsyncMongoUtils._pooled_client
+        
+    @staticmethod
+    async def close_pooled_client():
+        """
+        Close the process-wide pooled async MongoDB client, if it is open.
+        This is called once when the API shuts down.
+        """
+        
+        if AsyncMongoUtils._pooled_client is not None:
+            client = AsyncMongoUtils._pooled_client
+            AsyncMongoUtils._pooled_client = None
+            AsyncMongoUtils._pooled_database = None
+            AsyncMongoUtils._pooled_collections = {}
+            await client.close()
+            
+    @staticmethod
+    def get_pooled_database() -> AsyncDatabase:
+        """
+        Get the EPA database from the process-wide pooled async MongoDB client,
+        opening the client if the API lifespan has not done so yet.
     
-    
\ No newline at end of file
+        :raises ValueError if one of the expected env variables are not set.
+        :return: The EPA MongoDB database
+        :rtype: pymongo.asynchronous.database.AsyncDatabase
+        """
+        
+        if AsyncMongoUtils._pooled_database is None:
+            AsyncMongoUtils._pooled_database = AsyncMongoUtils.open_pooled_client()["epa_database"]
+        return AsyncMongoUtils._pooled_database
+        
+    @staticmethod
+    def get_user_collection(db: AsyncDatabase) -> AsyncCollection:
+        """
+        Get the user collection in the MongoDB database.
+    
+        :param db: The MongoDB Database
+        :type db: pymongo.asynchronous.database.AsyncDatabase
+        :return: A collection from the MongoDB database
+        :rtype: pymongo.asynchronous.collection.AsyncCollection
+        """
+        
+        return MongoUtils.get_user_collection(db)
+        
+    @staticmethod
+    def get_session_tokens_collection(db: AsyncDatabase) -> AsyncCollection:
+        """
+        Get the session token collection in the MongoDB database.
+    
+        :param db: The MongoDB Database
+        :type db: pymongo.asynchronous.database.AsyncDatabase
+        :return: A collection from the MongoDB database
+        :rtype: pymongo.asynchronous.collection.AsyncCollection
+        """
+        
+        return MongoUtils.get_session_tokens_collection(db)
+        
+    @staticmethod
+    def get_revoked_tokens_collection(db: AsyncDatabase) -> AsyncCollection:
+        """
+        Get the revoked token collection in the MongoDB database, see RevocationUtils.
+    
+        :param db: The MongoDB Database
+        :type db: pymongo.asynchronous.database.AsyncDatabase
+        :return: A collection from the MongoDB database
+        :rtype: pymongo.asynchronous.collection.AsyncCollection
+        """
+        
+        return MongoUtils.get_collection(db, SettingsUtils.get(MongoSettings).revoked_token_collection)
+        
+    @staticmethod
+    def get_posts_collection(db: AsyncDatabase) -> AsyncCollection:
+        """
+        Get the posts collection in the MongoDB database, the posts are written by the post ingestor.
+    
+        :param db: The MongoDB Database
+        :type db: pymongo.asynchronous.database.AsyncDatabase
+        :return: A collection from the MongoDB database
+        :rtype: pymongo.asynchronous.collection.AsyncCollection
+        """
+        
+        return MongoUtils.get_posts_collection(db)
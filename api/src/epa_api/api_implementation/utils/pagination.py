@@ -0,0 +1,225 @@
+from datetime import datetime
+from typing import Any, ClassVar, Dict, List, Tuple
+from pymongo.collection import Collection
+from pymongo.asynchronous.collection import AsyncCollection
+from epa_api.api_implementation.utils.settings import PaginationSettings, SettingsUtils
+import base64
+import binascii
+import hashlib
+import hmac
+import orjson
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor was not issued by this API for the same listing"""
+
+
+class PaginationUtils:
+    """
+    A class with helpful methods to paginate listings with keyset (cursor) pagination.
+
+    A page is fetched with a filter on the sort key of the last document of the previous page,
+    along an index with the same sort (e.g. {created_at: -1, _id: -1}), instead of skipping the documents of the previous pages.
+    Fetching any page then reads the same number of index entries, however deep the page is.
+    Cursors are opaque to clients: the sort key is signed with the cursor secret and bound to the listing
+    (the scope, e.g. the endpoint and its filters), so a forged or reused cursor is refused.
+    """
+
+    DEFAULT_PAGE_SIZE: ClassVar[int] = 20
+    # The keyset of the listings, _id breaks the ties between documents created at the same time
+    KEYSET_SORT: ClassVar[List[Tuple[str, int]]] = [("created_at", -1), ("_id", -1)]
+    SIGNATURE_BYTES: ClassVar[int] = 16
+
+    # Derived once from the settings by get_cursor_key()
+    _cursor_key: ClassVar[bytes | None] = None
+
+    @staticmethod
+    def get_cursor_key() -> bytes:
+        """
+        Get the key signing the cursors, derived from the cursor secret on the first call only.
+        The key is derived so that a secret shared with the JWTs signs different bytes for each.
+
+        :raises ValueError if the pagination settings are not valid
+        :return: The key
+        :rtype: bytes
+        """
+
+        if PaginationUtils._cursor_key is None:
+            secret = SettingsUtils.get(PaginationSettings).cursor_secret
+            PaginationUtils._cursor_key = hashlib.sha256(b"epa-cursor:" + secret.encode()).digest()
+        return PaginationUtils._cursor_key
+
+    @staticmethod
+    def clear():
+        PaginationUtils._cursor_key = None
+
+    @staticmethod
+    def get_page_size(limit: int | None) -> int:
+        """
+        Get the size of a page, bounded by EPA_MAX_PAGE_SIZE.
+
+        :param limit: The page size requested, None for the default
+        :type limit: int | None
+        :return: The page size
+        :rtype: int
+        """
+
+        max_page_size = SettingsUtils.get(PaginationSettings).max_page_size
+        return max(1, min(limit or PaginationUtils.DEFAULT_PAGE_SIZE, max_page_size))
+
+    @staticmethod
+    def _sign(scope: str, payload: bytes) -> bytes:
+        message = scope.encode() + b"\x00" + payload
+        return hmac.new(PaginationUtils.get_cursor_key(), message, hashlib.sha256).digest()[:PaginationUtils.SIGNATURE_BYTES]
+
+    @staticmethod
+    def sign_cursor(scope: str, values: Dict[str, Any]) -> str:
+        """
+        Build an opaque cursor from values.
+
+        :param scope: The listing the cursor continues, a cursor is only accepted by the same scope
+        :type scope: str
+        :param values: The JSON values of the cursor, e.g. the sort key of the last document of a page
+        :type values: Dict[str, Any]
+        :return: The cursor
+        :rtype: str
+        """
+
+        payload = orjson.dumps(values)
+        return base64.urlsafe_b64encode(PaginationUtils._sign(scope, payload) + payload).decode().rstrip("=")
+
+    @staticmethod
+    def verify_cursor(scope: str, cursor: str) -> Dict[str, Any]:
+        """
+        Get the values of a cursor built by sign_cursor.
+
+        :param scope: The listing the cursor must continue
+        :type scope: str
+        :param cursor: The cursor
+        :type cursor: str
+        :raises InvalidCursorError if the cursor is malformed, forged or of another scope
+        :return: The values of the cursor
+        :rtype: Dict[str, Any]
+        """
+
+        try:
+            data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        except (binascii.Error, ValueError):
+            raise InvalidCursorError("Invalid cursor")
+        signature, payload = data[:PaginationUtils.SIGNATURE_BYTES], data[PaginationUtils.SIGNATURE_BYTES:]
+        if not hmac.compare_digest(signature, PaginationUtils._sign(scope, payload)):
+            raise InvalidCursorError("Invalid cursor")
+        try:
+            values = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            raise InvalidCursorError("Invalid cursor")
+        if not isinstance(values, dict):
+            raise InvalidCursorError("Invalid cursor")
+        return values
+
+    @staticmethod
+    def encode_keyset_cursor(scope: str, document: Dict[str, Any]) -> str:
+        """
+        Build the cursor of the page after document, see KEYSET_SORT.
+
+        :param document: The last document of a page
+        :type document: Dict[str, Any]
+        :return: The cursor
+        :rtype: str
+        """
+
+        return PaginationUtils.sign_cursor(scope, {"created_at": document["created_at"].isoformat(), "id": document["_id"]})
+
+    @staticmethod
+    def decode_keyset_cursor(scope: str, cursor: str) -> Tuple[datetime, Any]:
+        """
+        Get the sort key of a cursor built by encode_keyset_cursor.
+
+        :raises InvalidCursorError if the cursor is not valid
+        :return: The (created_at, _id) of the last document of the previous page
+        :rtype: Tuple[datetime, Any]
+        """
+
+        values = PaginationUtils.verify_cursor(scope, cursor)
+        try:
+            return datetime.fromisoformat(values["created_at"]), values["id"]
+        except (KeyError, TypeError, ValueError):
+            raise InvalidCursorError("Invalid cursor")
+
+    @staticmethod
+    def build_keyset_query(query: Dict[str, Any], after: Tuple[datetime, Any] | None) -> Dict[str, Any]:
+        """
+        Add the keyset condition of the page after a sort key to a filter.
+
+        :param query: The filter of the listing
+        :type query: Dict[str, Any]
+        :param after: The sort key of the cursor, None for the first page
+        :type after: Tuple[datetime, Any] | None
+        :return: The filter of the page
+        :rtype: Dict[str, Any]
+        """
+
+        if after is None:
+            return query
+        created_at, _id = after
+        keyset = {"$or": [{"created_at": {"$lt": created_at}}, {"created_at": created_at, "_id": {"$lt": _id}}]}
+        return {"$and": [query, keyset]} if query else keyset
+
+    @staticmethod
+    def get_page(scope: str, documents: List[Dict[str, Any]], page_size: int) -> Tuple[List[Dict[str, Any]], str | None]:
+        """
+        Split the documents fetched for a page (page_size + 1, see find_page) into the page and the cursor of the next one.
+
+        :return: The documents of the page and the cursor of the next page, None if it is the last page
+        :rtype: Tuple[List[Dict[str, Any]], str | None]
+        """
+
+        if len(documents) <= page_size:
+            return documents, None
+        documents = documents[:page_size]
+        return documents, PaginationUtils.encode_keyset_cursor(scope, documents[-1])
+
+    @staticmethod
+    def find_page(collection: Collection, scope: str, query: Dict[str, Any], limit: int | None, cursor: str | None, projection: Dict[str, Any] | None = None) -> Tuple[List[Dict[str, Any]], str | None]:
+        """
+        Get a page of a listing sorted by KEYSET_SORT.
+
+        :param collection: The collection, with an index on the equality fields of query followed by KEYSET_SORT
+        :type collection: Collection
+        :param scope: The listing, including its filters (e.g. posts:category=traffic)
+        :type scope: str
+        :param query: The filter of the listing
+        :type query: Dict[str, Any]
+        :param limit: The page size requested, see get_page_size
+        :type limit: int | None
+        :param cursor: The cursor returned with the previous page, None for the first page
+        :type cursor: str | None
+        :raises InvalidCursorError if the cursor is not valid
+        :return: The documents of the page and the cursor of the next page
+        :rtype: Tuple[List[Dict[str, Any]], str | None]
+        """
+
+        page_size = PaginationUtils.get_page_size(limit)
+        after = PaginationUtils.decode_keyset_cursor(scope, cursor) if cursor else None
+        # One more document than the page tells whether there is a next page
+        documents = list(collection.find(PaginationUtils.build_keyset_query(query, after), projection).sort(PaginationUtils.KEYSET_SORT).limit(page_size + 1))
+        return PaginationUtils.get_page(scope, documents, page_size)
+
+
+class AsyncPaginationUtils:
+    """A class with helpful methods to paginate listings without blocking the event loop, see PaginationUtils"""
+
+    @staticmethod
+    async def find_page(collection: AsyncCollection, scope: str, query: Dict[str, Any], limit: int | None, cursor: str | None, projection: Dict[str, Any] | None = None) -> Tuple[List[Dict[str, Any]], str | None]:
+        """
+        Get a page of a listing sorted by KEYSET_SORT, see PaginationUtils.find_page.
+
+        :raises InvalidCursorError if the cursor is not valid
+        :return: The documents of the page and the cursor of the next page
+        :rtype: Tuple[List[Dict[str, Any]], str | None]
+        """
+
+        page_size = PaginationUtils.get_page_size(limit)
+        after = PaginationUtils.decode_keyset_cursor(scope, cursor) if cursor else None
+        documents = await collection.find(PaginationUtils.build_keyset_query(query, after), projection).sort(PaginationUtils.KEYSET_SORT).limit(page_size + 1).to_list(length=page_size + 1)
+        return PaginationUtils.get_page(scope, documents, page_size)
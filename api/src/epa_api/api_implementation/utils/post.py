@@ -0,0 +1,200 @@
+from typing import Any, ClassVar, Dict, List, Tuple
+from pymongo.collection import Collection
+from pymongo.asynchronous.collection import AsyncCollection
+from epa_api.models.location import Location
+from epa_api.models.post import Post
+from epa_api.api_implementation.utils.pagination import AsyncPaginationUtils, InvalidCursorError, PaginationUtils
+
+
+class PostUtils:
+    """
+    A class with helpful methods to query posts.
+
+    Posts are written by the post ingestor with a GeoJSON point location, nearby posts are found
+    with the 2dsphere index on location (see database/config.json):
+        - sorted by distance with a $geoNear aggregation, which returns the nearest posts first
+        - sorted by recency with a $geoWithin filter along the (created_at, _id) index
+    Every listing is paginated with a signed cursor holding the sort key of the last post of the page instead of an offset
+    (see PaginationUtils), so fetching a page never scans the posts of the previous pages.
+    """
+
+    # Mean radius of the Earth in meters, as used by MongoDB for spherical queries
+    EARTH_RADIUS_M: ClassVar[float] = 6378100.0
+    PROJECTION: ClassVar[Dict[str, int]] = {"source": 0}
+
+    @staticmethod
+    def get_nearby_scope(lat: float, lng: float, radius: int, sort: str) -> str:
+        # A cursor only continues the pages of the same search
+        return f"posts:nearby:{sort}:{lat}:{lng}:{radius}"
+
+    @staticmethod
+    def get_list_scope(category: str | None) -> str:
+        return f"posts:list:{category or ''}"
+
+    @staticmethod
+    def decode_distance_cursor(scope: str, cursor: str) -> Dict[str, Any]:
+        """
+        Decode a cursor returned with a page of the nearest posts.
+
+        :raises InvalidCursorError if the cursor is not valid
+        :return: The distance of the last post of the previous page, and the ids of the posts already returned at that distance
+        :rtype: Dict[str, Any]
+        """
+
+        values = PaginationUtils.verify_cursor(scope, cursor)
+        try:
+            return {"distance": float(values["distance"]), "ids": [str(i) for i in values["ids"]]}
+        except (KeyError, TypeError, ValueError):
+            raise InvalidCursorError("Invalid cursor")
+
+    @staticmethod
+    def build_nearby_pipeline(lat: float, lng: float, radius: int, limit: int, after: Dict[str, Any] | None = None) -> List[Dict[str, Any]]:
+        """
+        Build the aggregation pipeline of the posts within radius meters, nearest first.
+        A page after a cursor starts at the distance of the cursor, without the posts already returned at that distance.
+
+        :return: The pipeline, returning one post more than limit to know if there is a next page
+        :rtype: List[Dict[str, Any]]
+        """
+
+        geo_near = {
+            "near": {"type": "Point", "coordinates": [lng, lat]},
+            "distanceField": "distance_m",
+            "maxDistance": radius,
+            "spherical": True,
+            "key": "location",
+        }
+        if after is not None:
+            geo_near["minDistance"] = after["distance"]
+            geo_near["query"] = {"_id": {"$nin": after["ids"]}}
+        return [{"$geoNear": geo_near}, {"$limit": limit + 1}, {"$project": PostUtils.PROJECTION}]
+
+    @staticmethod
+    def build_within_query(lat: float, lng: float, radius: int) -> Dict[str, Any]:
+        """
+        Build the filter of the posts within radius meters, to be sorted along the (created_at, _id) index.
+
+        :return: The filter
+        :rtype: Dict[str, Any]
+        """
+
+        return {"location": {"$geoWithin": {"$centerSphere": [[lng, lat], radius / PostUtils.EARTH_RADIUS_M]}}}
+
+    @staticmethod
+    def build_list_query(category: str | None) -> Dict[str, Any]:
+        return {"category": category} if category else {}
+
+    @staticmethod
+    def get_distance_page(scope: str, documents: List[Dict[str, Any]], limit: int, after: Dict[str, Any] | None = None) -> Tuple[List[Dict[str, Any]], str | None]:
+        """
+        Split the nearest posts fetched for a page (up to limit + 1) into the page and the cursor of the next one.
+
+        :return: The post documents of the page and the cursor of the next page, None if it is the last page
+        :rtype: Tuple[List[Dict[str, Any]], str | None]
+        """
+
+        if len(documents) <= limit:
+            return documents, None
+        documents = documents[:limit]
+        last = documents[-1]
+        # Posts at the same distance are not ordered, the cursor skips all those already returned
+        ids = [d["_id"] for d in documents if d["distance_m"] == last["distance_m"]]
+        if after is not None and after["distance"] == last["distance_m"]:
+            ids = after["ids"] + ids
+        return documents, PaginationUtils.sign_cursor(scope, {"distance": last["distance_m"], "ids": ids})
+
+    @staticmethod
+    def to_post(document: Dict[str, Any]) -> Post:
+        """
+        Convert a post document to a Post model.
+
+        :param document: The post document
+        :type document: Dict[str, Any]
+        :return: The post
+        :rtype: Post
+        """
+
+        location = document.get("location")
+        return Post(
+            post_id=str(document["_id"]),
+            user_id=document.get("user_id"),
+            title=document.get("title"),
+            description=document.get("description"),
+            category=document.get("category"),
+            tags=document.get("tags"),
+            location=Location(lng=location["coordinates"][0], lat=location["coordinates"][1]) if location else None,
+            created_at=document.get("created_at"),
+            distance_m=document.get("distance_m"),
+        )
+
+    @staticmethod
+    def get_nearby_posts(posts_collection: Collection, lat: float, lng: float, radius: int, sort: str, limit: int, cursor: str | None = None) -> Tuple[List[Dict[str, Any]], str | None]:
+        """
+        Get a page of the posts within radius meters of a location.
+
+        :param posts_collection: The posts collection
+        :type posts_collection: Collection
+        :param sort: distance to get the nearest posts first, recent to get the most recent posts first
+        :type sort: str
+        :param limit: The page size requested, see PaginationUtils.get_page_size
+        :type limit: int
+        :param cursor: The cursor returned with the previous page, None for the first page
+        :type cursor: str | None
+        :raises InvalidCursorError if the cursor is not valid
+        :return: The post documents of the page and the cursor of the next page
+        :rtype: Tuple[List[Dict[str, Any]], str | None]
+        """
+
+        scope = PostUtils.get_nearby_scope(lat, lng, radius, sort)
+        if sort != "distance":
+            return PaginationUtils.find_page(posts_collection, scope, PostUtils.build_within_query(lat, lng, radius), limit, cursor, PostUtils.PROJECTION)
+        limit = PaginationUtils.get_page_size(limit)
+        after = PostUtils.decode_distance_cursor(scope, cursor) if cursor else None
+        documents = list(posts_collection.aggregate(PostUtils.build_nearby_pipeline(lat, lng, radius, limit, after)))
+        return PostUtils.get_distance_page(scope, documents, limit, after)
+
+    @staticmethod
+    def list_posts(posts_collection: Collection, category: str | None, limit: int, cursor: str | None = None) -> Tuple[List[Dict[str, Any]], str | None]:
+        """
+        Get a page of the most recent posts, along the (created_at, _id) or (category, created_at, _id) index.
+
+        :raises InvalidCursorError if the cursor is not valid
+        :return: The post documents of the page and the cursor of the next page
+        :rtype: Tuple[List[Dict[str, Any]], str | None]
+        """
+
+        return PaginationUtils.find_page(posts_collection, PostUtils.get_list_scope(category), PostUtils.build_list_query(category), limit, cursor, PostUtils.PROJECTION)
+
+
+class AsyncPostUtils:
+    """A class with helpful methods to query posts without blocking the event loop, see PostUtils"""
+
+    @staticmethod
+    async def get_nearby_posts(posts_collection: AsyncCollection, lat: float, lng: float, radius: int, sort: str, limit: int, cursor: str | None = None) -> Tuple[List[Dict[str, Any]], str | None]:
+        """
+        Get a page of the posts within radius meters of a location, see PostUtils.get_nearby_posts.
+
+        :raises InvalidCursorError if the cursor is not valid
+        :return: The post documents of the page and the cursor of the next page
+        :rtype: Tuple[List[Dict[str, Any]], str | None]
+        """
+
+        scope = PostUtils.get_nearby_scope(lat, lng, radius, sort)
+        if sort != "distance":
+            return await AsyncPaginationUtils.find_page(posts_collection, scope, PostUtils.build_within_query(lat, lng, radius), limit, cursor, PostUtils.PROJECTION)
+        limit = PaginationUtils.get_page_size(limit)
+        after = PostUtils.decode_distance_cursor(scope, cursor) if cursor else None
+        documents = await (await posts_collection.aggregate(PostUtils.build_nearby_pipeline(lat, lng, radius, limit, after))).to_list(length=limit + 1)
+        return PostUtils.get_distance_page(scope, documents, limit, after)
+
+    @staticmethod
+    async def list_posts(posts_collection: AsyncCollection, category: str | None, limit: int, cursor: str | None = None) -> Tuple[List[Dict[str, Any]], str | None]:
+        """
+        Get a page of the most recent posts, see PostUtils.list_posts.
+
+        :raises InvalidCursorError if the cursor is not valid
+        :return: The post documents of the page and the cursor of the next page
+        :rtype: Tuple[List[Dict[str, Any]], str | None]
+        """
+
+        return await AsyncPaginationUtils.find_page(posts_collection, PostUtils.get_list_scope(category), PostUtils.build_list_query(category), limit, cursor, PostUtils.PROJECTION)
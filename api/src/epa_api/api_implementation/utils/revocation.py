@@ -0,0 +1,256 @@
+from datetime import datetime, timedelta
+from typing import Any, ClassVar, Dict, Iterable
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.collection import Collection
+from epa_api.api_implementation.utils.settings import RevocationSettings, SettingsUtils
+import asyncio
+import hashlib
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    A compact set of strings that can answer "definitely not in the set" without false negatives.
+    Positives must be confirmed against an exact set since they can be false positives.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str) -> Iterable[int]:
+        # Double hashing: k positions derived from two 64-bit halves of one digest
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class RevocationUtils:
+    """
+    A class with helpful methods to revoke tokens and check revocations without a database round trip.
+
+    Revoked token ids (`jti` claims) are stored in the revoked tokens collection and mirrored in memory
+    as a bloom filter plus an exact set. Most tokens are not revoked, so most checks stop at the bloom filter.
+    The in-memory set is refreshed incrementally from MongoDB so that revocations made by other
+    processes are seen within EPA_REVOCATION_REFRESH_SECONDS.
+    """
+
+    _revoked: ClassVar[Dict[str, datetime]] = {}
+    _bloom: ClassVar[BloomFilter] = BloomFilter(100000)
+    _watermark: ClassVar[datetime | None] = None
+    _refresher: ClassVar[asyncio.Task | None] = None
+
+    @staticmethod
+    def get_refresh_seconds() -> int:
+        """
+        Get the number of seconds between refreshes from EPA_REVOCATION_REFRESH_SECONDS (default 5).
+
+        :raises ValueError if EPA_REVOCATION_REFRESH_SECONDS is not a positive integer
+        :return: The refresh interval in seconds
+        :rtype: int
+        """
+
+        return SettingsUtils.get(RevocationSettings).refresh_seconds
+
+    @staticmethod
+    def is_revoked(jti: str | None) -> bool:
+        """
+        Check if a token id was revoked. Tokens issued before token ids were added have no `jti`, they cannot be
+        revoked individually and are accepted until they expire (see the README).
+
+        :param jti: The `jti` claim of the token
+        :type jti: str | None
+        :return: True if the token must not be accepted
+        :rtype: bool
+        """
+
+        if not jti:
+            return False
+        if jti not in RevocationUtils._bloom:
+            return False
+        return jti in RevocationUtils._revoked
+
+    @staticmethod
+    def add(jti: str, expires_at: datetime):
+        """
+        Add a revoked token id to the in-memory set.
+
+        :param jti: The `jti` claim of the token
+        :type jti: str
+        :param expires_at: When the token expires, after which it no longer needs to be remembered
+        :type expires_at: datetime
+        """
+
+        if jti in RevocationUtils._revoked:
+            return
+        RevocationUtils._revoked[jti] = expires_at
+        if len(RevocationUtils._revoked) > RevocationUtils._bloom.capacity:
+            RevocationUtils.rebuild(RevocationUtils._bloom.capacity * 2)
+        else:
+            RevocationUtils._bloom.add(jti)
+
+    @staticmethod
+    def rebuild(capacity: int | None = None):
+        """
+        Drop expired token ids and rebuild the bloom filter from the exact set.
+
+        :param capacity: The capacity of the new bloom filter, defaults to the current one
+        :type capacity: int | None
+        """
+
+        now = datetime.now()
+        RevocationUtils._revoked = {jti: exp for jti, exp in RevocationUtils._revoked.items() if exp > now}
+        bloom = BloomFilter(capacity or RevocationUtils._bloom.capacity)
+        for jti in RevocationUtils._revoked:
+            bloom.add(jti)
+        RevocationUtils._bloom = bloom
+
+    @staticmethod
+    def prune():
+        """
+        Rebuild the bloom filter once a quarter of the remembered token ids have expired,
+        expired ids cannot be removed from a bloom filter one by one.
+        """
+
+        now = datetime.now()
+        expired = sum(1 for exp in RevocationUtils._revoked.values() if exp <= now)
+        if expired and expired * 4 >= len(RevocationUtils._revoked):
+            RevocationUtils.rebuild()
+
+    @staticmethod
+    def clear():
+        RevocationUtils._revoked = {}
+        RevocationUtils._bloom = BloomFilter(RevocationUtils._bloom.capacity)
+        RevocationUtils._watermark = None
+
+    @staticmethod
+    def build_revocation(claims: Dict[str, Any]) -> Dict[str, Any] | None:
+        """
+        Build the revocation object of a token, or None if the token has no id.
+
+        :param claims: The claims of the token to revoke
+        :type claims: Dict[str, Any]
+        :return: The revocation object to store
+        :rtype: Dict[str, Any] | None
+        """
+
+        if not claims.get("jti"):
+            return None
+        return {"jti": claims["jti"], "expires_at": datetime.fromtimestamp(claims["exp"]), "revoked_at": datetime.now()}
+
+    @staticmethod
+    async def revoke(claims: Dict[str, Any], revoked_token_collection: AsyncCollection):
+        """
+        Revoke a token for every process. The token is revoked locally right away.
+
+        :param claims: The claims of the token to revoke
+        :type claims: Dict[str, Any]
+        :param revoked_token_collection: The collection of revoked tokens
+        :type revoked_token_collection: pymongo.asynchronous.collection.AsyncCollection
+        """
+
+        revocation = RevocationUtils.build_revocation(claims)
+        if revocation is None:
+            return
+        RevocationUtils.add(revocation["jti"], revocation["expires_at"])
+        await revoked_token_collection.update_one({"jti": revocation["jti"]}, {"$setOnInsert": revocation}, upsert=True)
+
+    @staticmethod
+    def revoke_sync(claims: Dict[str, Any], revoked_token_collection: Collection):
+        """
+        Revoke a token for every process from a script, see revoke().
+
+        :param claims: The claims of the token to revoke
+        :type claims: Dict[str, Any]
+        :param revoked_token_collection: The collection of revoked tokens
+        :type revoked_token_collection: pymongo.collection.Collection
+        """
+
+        revocation = RevocationUtils.build_revocation(claims)
+        if revocation is None:
+            return
+        RevocationUtils.add(revocation["jti"], revocation["expires_at"])
+        revoked_token_collection.update_one({"jti": revocation["jti"]}, {"$setOnInsert": revocation}, upsert=True)
+
+    @staticmethod
+    async def refresh(revoked_token_collection: AsyncCollection) -> int:
+        """
+        Load the revocations made since the last refresh. The first refresh loads every unexpired revocation.
+
+        :param revoked_token_collection: The collection of revoked tokens
+        :type revoked_token_collection: pymongo.asynchronous.collection.AsyncCollection
+        :return: The number of revocations read
+        :rtype: int
+        """
+
+        now = datetime.now()
+        if RevocationUtils._watermark is None:
+            query = {"expires_at": {"$gt": now}}
+        else:
+            # Overlap the previous window a little so that slow writers are not missed, adding twice is harmless
+            query = {"revoked_at": {"$gte": RevocationUtils._watermark - timedelta(seconds=1)}}
+
+        count = 0
+        async for revocation in revoked_token_collection.find(query, {"_id": 0, "jti": 1, "expires_at": 1}):
+            RevocationUtils.add(revocation["jti"], revocation["expires_at"])
+            count += 1
+
+        RevocationUtils._watermark = now
+        return count
+
+    @staticmethod
+    async def start_refresher(revoked_token_collection: AsyncCollection, interval: int | None = None):
+        """
+        Load every unexpired revocation, then keep refreshing them in the background. This is called once when the API
+        starts, before it serves requests: a failure of the first load is raised, so the API never starts with revoked
+        tokens that it does not know about.
+
+        :param revoked_token_collection: The collection of revoked tokens
+        :type revoked_token_collection: pymongo.asynchronous.collection.AsyncCollection
+        :param interval: Seconds between refreshes, defaults to EPA_REVOCATION_REFRESH_SECONDS
+        :type interval: int | None
+        """
+
+        if RevocationUtils._refresher is not None:
+            return
+        interval = interval or RevocationUtils.get_refresh_seconds()
+        await RevocationUtils.refresh(revoked_token_collection)
+
+        async def refresh_forever():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await RevocationUtils.refresh(revoked_token_collection)
+                    RevocationUtils.prune()
+                except Exception:
+                    logger.exception("Failed to refresh token revocations")
+
+        RevocationUtils._refresher = asyncio.create_task(refresh_forever())
+
+    @staticmethod
+    async def stop_refresher():
+        """
+        Stop refreshing the in-memory revocations. This is called once when the API shuts down.
+        """
+
+        if RevocationUtils._refresher is not None:
+            RevocationUtils._refresher.cancel()
+            try:
+                await RevocationUtils._refresher
+            except asyncio.CancelledError:
+                pass
+            RevocationUtils._refresher = None
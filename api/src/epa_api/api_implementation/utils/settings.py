@@ -0,0 +1,369 @@
+from dataclasses import dataclass
+from typing import Any, ClassVar, Dict, Type, TypeVar
+import os
+
+SettingsSection = TypeVar("SettingsSection")
+
+
+@dataclass(frozen=True)
+class MongoSettings:
+    """MongoDB connection, collection and pool settings"""
+
+    hostname: str
+    port: int
+    username: str
+    password: str
+    user_collection: str
+    session_token_collection: str
+    revoked_token_collection: str
+    post_collection: str
+    max_pool_size: int
+    min_pool_size: int
+    wait_queue_timeout_ms: int
+    max_idle_time_ms: int
+
+    @staticmethod
+    def from_env() -> "MongoSettings":
+        """
+        Read the MongoDB settings from the environment:
+            - EPA_MONGODB_HOSTNAME, EPA_MONGODB_PORT, EPA_MONGODB_USERNAME, EPA_MONGODB_PASSWORD (required)
+            - EPA_MONGODB_USER_COLLECTION, EPA_MONGODB_SESSION_TOKEN_COLLECTION (required)
+            - EPA_MONGODB_REVOKED_TOKEN_COLLECTION (default revoked_tokens)
+            - EPA_MONGODB_POST_COLLECTION (default posts)
+            - EPA_MONGODB_MAX_POOL_SIZE (default 100)
+            - EPA_MONGODB_MIN_POOL_SIZE (default 0)
+            - EPA_MONGODB_WAIT_QUEUE_TIMEOUT_MS (default 2000)
+            - EPA_MONGODB_MAX_IDLE_TIME_MS (default 60000)
+
+        :raises ValueError if one of the env variables is not set or not valid
+        :return: The MongoDB settings
+        :rtype: MongoSettings
+        """
+
+        settings = MongoSettings(
+            hostname=SettingsUtils.get_required("EPA_MONGODB_HOSTNAME"),
+            port=SettingsUtils.get_int("EPA_MONGODB_PORT", None, minimum=1),
+            username=SettingsUtils.get_required("EPA_MONGODB_USERNAME"),
+            password=SettingsUtils.get_required("EPA_MONGODB_PASSWORD"),
+            user_collection=SettingsUtils.get_required("EPA_MONGODB_USER_COLLECTION"),
+            session_token_collection=SettingsUtils.get_required("EPA_MONGODB_SESSION_TOKEN_COLLECTION"),
+            revoked_token_collection=os.getenv("EPA_MONGODB_REVOKED_TOKEN_COLLECTION") or "revoked_tokens",
+            post_collection=os.getenv("EPA_MONGODB_POST_COLLECTION") or "posts",
+            max_pool_size=SettingsUtils.get_int("EPA_MONGODB_MAX_POOL_SIZE", 100),
+            min_pool_size=SettingsUtils.get_int("EPA_MONGODB_MIN_POOL_SIZE", 0),
+            wait_queue_timeout_ms=SettingsUtils.get_int("EPA_MONGODB_WAIT_QUEUE_TIMEOUT_MS", 2000),
+            max_idle_time_ms=SettingsUtils.get_int("EPA_MONGODB_MAX_IDLE_TIME_MS", 60000),
+        )
+        if settings.min_pool_size > settings.max_pool_size:
+            raise ValueError("EPA_MONGODB_MIN_POOL_SIZE cannot be greater than EPA_MONGODB_MAX_POOL_SIZE")
+        return settings
+
+    @property
+    def uri(self) -> str:
+        return f"mongodb://{self.username}:{self.password}@{self.hostname}:{self.port}/"
+
+    @property
+    def pool_options(self) -> Dict[str, int]:
+        return {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "waitQueueTimeoutMS": self.wait_queue_timeout_ms,
+            "maxIdleTimeMS": self.max_idle_time_ms,
+        }
+
+
+@dataclass(frozen=True)
+class JwtSettings:
+    """JWT signing and verified token cache settings"""
+
+    secret: str
+    token_cache_size: int
+    token_cache_max_ttl: int
+
+    @staticmethod
+    def from_env() -> "JwtSettings":
+        """
+        Read the JWT settings from the environment:
+            - EPA_JWT_SECRET (required)
+            - EPA_TOKEN_CACHE_SIZE (default 10000)
+            - EPA_TOKEN_CACHE_MAX_TTL (default 300)
+
+        :raises ValueError if one of the env variables is not set or not valid
+        :return: The JWT settings
+        :rtype: JwtSettings
+        """
+
+        return JwtSettings(
+            secret=SettingsUtils.get_required("EPA_JWT_SECRET"),
+            token_cache_size=SettingsUtils.get_int("EPA_TOKEN_CACHE_SIZE", 10000),
+            token_cache_max_ttl=SettingsUtils.get_int("EPA_TOKEN_CACHE_MAX_TTL", 300),
+        )
+
+
+@dataclass(frozen=True)
+class GoogleSettings:
+    """Google OAuth settings, Google sign in is disabled when they are not set"""
+
+    web_client_id: str | None
+    web_client_secret: str | None
+    web_redirect_uri: str | None
+    http_timeout_ms: int
+    http_retries: int
+    http_max_connections: int
+
+    @staticmethod
+    def from_env() -> "GoogleSettings":
+        """
+        Read the Google OAuth settings from the environment. The credentials are optional but must be set together:
+            - EPA_GOOGLE_WEB_CLIENT_ID
+            - EPA_GOOGLE_WEB_CLIENT_SECRET
+            - EPA_GOOGLE_WEB_REDIRECT_URI
+        The HTTP client used to call Google can be tuned with:
+            - EPA_GOOGLE_HTTP_TIMEOUT_MS (default 5000)
+            - EPA_GOOGLE_HTTP_RETRIES (default 2)
+            - EPA_GOOGLE_HTTP_MAX_CONNECTIONS (default 20)
+
+        :raises ValueError if only some of the credentials are set or a value is not valid
+        :return: The Google OAuth settings
+        :rtype: GoogleSettings
+        """
+
+        env_vars = ["EPA_GOOGLE_WEB_CLIENT_ID", "EPA_GOOGLE_WEB_CLIENT_SECRET", "EPA_GOOGLE_WEB_REDIRECT_URI"]
+        values = [os.getenv(var) or None for var in env_vars]
+        if any(values) and not all(values):
+            missing = [var for var, val in zip(env_vars, values) if not val]
+            raise ValueError(f"Environment variables for Google OAuth {missing} not set")
+        return GoogleSettings(
+            *values,
+            http_timeout_ms=SettingsUtils.get_int("EPA_GOOGLE_HTTP_TIMEOUT_MS", 5000, minimum=1),
+            http_retries=SettingsUtils.get_int("EPA_GOOGLE_HTTP_RETRIES", 2),
+            http_max_connections=SettingsUtils.get_int("EPA_GOOGLE_HTTP_MAX_CONNECTIONS", 20, minimum=1),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.web_client_id is not None
+
+
+@dataclass(frozen=True)
+class HashingSettings:
+    """Password hashing policy and executor settings"""
+
+    # Supported password hashing algorithms and the hashlib digest each one uses
+    ALGORITHMS: ClassVar[Dict[str, str]] = {
+        "pbkdf2_sha256": "sha256",
+        "pbkdf2_sha512": "sha512",
+    }
+
+    workers: int
+    max_queue: int
+    password_hash_algorithm: str
+    password_hash_iterations: int
+
+    @staticmethod
+    def from_env() -> "HashingSettings":
+        """
+        Read the password hashing settings from the environment:
+            - EPA_HASHING_WORKERS (default the number of available cores)
+            - EPA_HASHING_MAX_QUEUE (default 4 times the number of workers)
+            - EPA_PASSWORD_HASH_ALGORITHM (default pbkdf2_sha256)
+            - EPA_PASSWORD_HASH_ITERATIONS (default 260000)
+
+        :raises ValueError if one of the env variables is not valid
+        :return: The password hashing settings
+        :rtype: HashingSettings
+        """
+
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+        workers = SettingsUtils.get_int("EPA_HASHING_WORKERS", cores, minimum=1)
+
+        algorithm = os.getenv("EPA_PASSWORD_HASH_ALGORITHM") or "pbkdf2_sha256"
+        if algorithm not in HashingSettings.ALGORITHMS:
+            raise ValueError(f"Environment variable EPA_PASSWORD_HASH_ALGORITHM must be one of {list(HashingSettings.ALGORITHMS)}")
+
+        return HashingSettings(
+            workers=workers,
+            max_queue=SettingsUtils.get_int("EPA_HASHING_MAX_QUEUE", workers * 4, minimum=1),
+            password_hash_algorithm=algorithm,
+            password_hash_iterations=SettingsUtils.get_int("EPA_PASSWORD_HASH_ITERATIONS", 260000, minimum=1),
+        )
+
+
+@dataclass(frozen=True)
+class RevocationSettings:
+    """Token revocation settings"""
+
+    refresh_seconds: int
+
+    @staticmethod
+    def from_env() -> "RevocationSettings":
+        """
+        Read the token revocation settings from the environment:
+            - EPA_REVOCATION_REFRESH_SECONDS (default 5)
+
+        :raises ValueError if the env variable is not valid
+        :return: The token revocation settings
+        :rtype: RevocationSettings
+        """
+
+        return RevocationSettings(refresh_seconds=SettingsUtils.get_int("EPA_REVOCATION_REFRESH_SECONDS", 5, minimum=1))
+
+
+@dataclass(frozen=True)
+class PaginationSettings:
+    """Pagination settings of the list endpoints"""
+
+    cursor_secret: str
+    max_page_size: int
+
+    @staticmethod
+    def from_env() -> "PaginationSettings":
+        """
+        Read the pagination settings from the environment:
+            - EPA_CURSOR_SECRET (default EPA_JWT_SECRET)
+            - EPA_MAX_PAGE_SIZE (default 100)
+
+        :raises ValueError if one of the env variables is not valid
+        :return: The pagination settings
+        :rtype: PaginationSettings
+        """
+
+        return PaginationSettings(
+            cursor_secret=os.getenv("EPA_CURSOR_SECRET") or SettingsUtils.get_required("EPA_JWT_SECRET"),
+            max_page_size=SettingsUtils.get_int("EPA_MAX_PAGE_SIZE", 100, minimum=1),
+        )
+
+
+@dataclass(frozen=True)
+class TimelineSettings:
+    """User timeline cache settings"""
+
+    redis_url: str | None
+    redis_timeout_ms: int
+    redis_max_connections: int
+    max_length: int
+    ttl_seconds: int
+    local_cache_size: int
+    local_ttl_seconds: int
+
+    @staticmethod
+    def from_env() -> "TimelineSettings":
+        """
+        Read the user timeline cache settings from the environment:
+            - EPA_REDIS_URL (optional, without it timelines are only cached in process)
+            - EPA_REDIS_TIMEOUT_MS (default 200)
+            - EPA_REDIS_MAX_CONNECTIONS (default 50)
+            - EPA_TIMELINE_MAX_LENGTH (default 500)
+            - EPA_TIMELINE_TTL_SECONDS (default 3600)
+            - EPA_TIMELINE_LOCAL_CACHE_SIZE (default 100)
+            - EPA_TIMELINE_LOCAL_TTL_SECONDS (default 10)
+
+        :raises ValueError if one of the env variables is not valid
+        :return: The user timeline cache settings
+        :rtype: TimelineSettings
+        """
+
+        return TimelineSettings(
+            redis_url=os.getenv("EPA_REDIS_URL") or None,
+            redis_timeout_ms=SettingsUtils.get_int("EPA_REDIS_TIMEOUT_MS", 200, minimum=1),
+            redis_max_connections=SettingsUtils.get_int("EPA_REDIS_MAX_CONNECTIONS", 50, minimum=1),
+            max_length=SettingsUtils.get_int("EPA_TIMELINE_MAX_LENGTH", 500, minimum=1),
+            ttl_seconds=SettingsUtils.get_int("EPA_TIMELINE_TTL_SECONDS", 3600, minimum=1),
+            local_cache_size=SettingsUtils.get_int("EPA_TIMELINE_LOCAL_CACHE_SIZE", 100),
+            local_ttl_seconds=SettingsUtils.get_int("EPA_TIMELINE_LOCAL_TTL_SECONDS", 10, minimum=1),
+        )
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Every setting of the API"""
+
+    mongo: MongoSettings
+    jwt: JwtSettings
+    google: GoogleSettings
+    hashing: HashingSettings
+    revocation: RevocationSettings
+    pagination: PaginationSettings
+    timeline: TimelineSettings
+
+
+class SettingsUtils:
+    """
+    A class with helpful methods to read the API settings.
+
+    The settings are read from the environment and validated once, then kept for the life of the process.
+    The API loads every section when it starts (see load_settings) so that a misconfiguration stops it from booting.
+    Scripts can read the sections they need with get(), e.g SettingsUtils.get(MongoSettings).
+    """
+
+    _sections: ClassVar[Dict[type, Any]] = {}
+
+    @staticmethod
+    def get_required(var: str) -> str:
+        val = os.getenv(var)
+        if not val:
+            raise ValueError(f"Expected environment variable {var} not set")
+        return val
+
+    @staticmethod
+    def get_int(var: str, default: int | None, minimum: int = 0) -> int:
+        val = os.getenv(var)
+        if not val:
+            if default is None:
+                raise ValueError(f"Expected environment variable {var} not set")
+            return default
+        if not val.isdigit() or int(val) < minimum:
+            raise ValueError(f"Environment variable {var} must be a {'positive' if minimum > 0 else 'non-negative'} integer")
+        return int(val)
+
+    @staticmethod
+    def load_settings() -> Settings:
+        """
+        Read and validate every section of the settings. This is called once when the API starts.
+
+        :raises ValueError listing every invalid setting
+        :return: The settings
+        :rtype: Settings
+        """
+
+        sections = {}
+        errors = []
+        for section in [MongoSettings, JwtSettings, GoogleSettings, HashingSettings, RevocationSettings, PaginationSettings, TimelineSettings]:
+            try:
+                sections[section] = section.from_env()
+            except ValueError as e:
+                errors.append(str(e))
+        if errors:
+            raise ValueError("Invalid API configuration: " + "; ".join(errors))
+
+        SettingsUtils._sections = sections
+        return Settings(
+            mongo=sections[MongoSettings],
+            jwt=sections[JwtSettings],
+            google=sections[GoogleSettings],
+            hashing=sections[HashingSettings],
+            revocation=sections[RevocationSettings],
+            pagination=sections[PaginationSettings],
+            timeline=sections[TimelineSettings],
+        )
+
+    @staticmethod
+    def get(section: Type[SettingsSection]) -> SettingsSection:
+        """
+        Get a section of the settings, reading it from the environment on the first call only.
+
+        :param section: The class of the section, e.g MongoSettings
+        :type section: Type[SettingsSection]
+        :raises ValueError if the section is not valid
+        :return: The section of the settings
+        :rtype: SettingsSection
+        """
+
+        settings = SettingsUtils._sections.get(section)
+        if settings is None:
+            settings = SettingsUtils._sections[section] = section.from_env()
+        return settings
+
+    @staticmethod
+    def clear():
+        SettingsUtils._sections = {}
@@ -0,0 +1,460 @@
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, ClassVar, Deque, Dict, List, Set, Tuple
+from pymongo.asynchronous.collection import AsyncCollection
+from redis.exceptions import RedisError
+from epa_api.models.post import Post
+from epa_api.api_implementation.utils.pagination import PaginationUtils
+from epa_api.api_implementation.utils.post import PostUtils
+from epa_api.api_implementation.utils.settings import SettingsUtils, TimelineSettings
+import redis.asyncio as redis
+import threading
+import asyncio
+import json
+import time
+
+
+class LocalTimelineCache:
+    """
+    A size-bounded LRU cache of user timelines kept in process, used when Redis cannot be reached.
+    Entries live for at most `ttl` seconds, so a timeline served from it is at most that stale.
+    """
+
+    def __init__(self, max_size: int = 100, ttl: float = 10):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, Tuple[float, List[Post]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> List[Post] | None:
+        """
+        Get the cached timeline of a user, or None if it is not cached or its entry expired.
+
+        :param user_id: The id of the user
+        :type user_id: str
+        :return: The posts of the timeline, most recent first
+        :rtype: List[Post] | None
+        """
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, timeline = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return timeline
+
+    def put(self, user_id: str, timeline: List[Post]):
+        if self.max_size < 1:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, timeline)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TimelineUtils:
+    """
+    A class with helpful methods for the user timeline cache.
+
+    The timeline of a user is a Redis sorted set (timeline:<user_id>) of the most recent posts of the user's subscriptions:
+        - each member is the JSON of a post (see Post.to_json, post_id first), scored by its created_at in epoch milliseconds
+        - the set holds at most EPA_TIMELINE_MAX_LENGTH posts and expires after EPA_TIMELINE_TTL_SECONDS
+        - the lowest member, scored -inf, holds the subscriptions of the user. It marks a timeline loaded from the posts collection,
+          a set without it (e.g. written by the timeline loader while the timeline was expiring) is a miss
+    Members with the same score are ordered by post_id, the same order as the (created_at, _id) index of the posts collection.
+
+    New posts are added to the cached timelines by the timeline loader (post_ingestor/timeline_loader.py), except the posts
+    of the categories with too many subscribers, which are read from the posts collection when a timeline is read instead
+    (fan-out-on-read). These categories are the members of the timeline_celebrity_categories sorted set scored after now,
+    scored +inf while the loader does not add their posts, then until every timeline cached meanwhile has expired.
+    """
+
+    KEY_PREFIX: ClassVar[str] = "timeline:"
+    SUBSCRIPTIONS_PREFIX: ClassVar[bytes] = b"subscriptions:"
+    CELEBRITY_CATEGORIES_KEY: ClassVar[str] = "timeline_celebrity_categories"
+
+    @staticmethod
+    def get_key(user_id: str) -> str:
+        return TimelineUtils.KEY_PREFIX + user_id
+
+    @staticmethod
+    def get_scope(user_id: str) -> str:
+        # Cursors of a timeline are only accepted for the same user
+        return f"timeline:{user_id}"
+
+    @staticmethod
+    def get_score(created_at: datetime) -> int:
+        # Dates are read from MongoDB as naive UTC datetimes
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        return round(created_at.timestamp() * 1000)
+
+    @staticmethod
+    def get_sort_key(post: Post) -> Tuple[datetime, str]:
+        created_at = post.created_at
+        if created_at.tzinfo is not None:
+            created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+        return created_at, post.post_id
+
+    @staticmethod
+    def to_member(post: Post) -> bytes:
+        return post.to_json().encode()
+
+    @staticmethod
+    def from_members(members: List[bytes]) -> List[Post]:
+        return [Post.from_json(member) for member in members if not member.startswith(TimelineUtils.SUBSCRIPTIONS_PREFIX)]
+
+    @staticmethod
+    def to_marker(user: Dict[str, Any] | None) -> bytes:
+        subscriptions = (user or {}).get("subscriptions") or []
+        return TimelineUtils.SUBSCRIPTIONS_PREFIX + json.dumps(subscriptions, separators=(",", ":")).encode()
+
+    @staticmethod
+    def from_marker(member: bytes) -> List[Dict[str, Any]] | None:
+        if not member.startswith(TimelineUtils.SUBSCRIPTIONS_PREFIX):
+            return None
+        return json.loads(member[len(TimelineUtils.SUBSCRIPTIONS_PREFIX):])
+
+    @staticmethod
+    def build_timeline_query(user: Dict[str, Any] | None) -> Dict[str, Any] | None:
+        """
+        Build the filter of the posts of a user's timeline, the posts of the categories and tags they subscribe to.
+
+        :param user: The user document, with its subscriptions, e.g. [{"category": "traffic", "tags": ["accident"]}]
+            A subscription without tags covers every post of the category
+        :type user: Dict[str, Any] | None
+        :return: The filter, None if the user has no subscriptions
+        :rtype: Dict[str, Any] | None
+        """
+
+        subscriptions = (user or {}).get("subscriptions") or []
+        branches = []
+        for subscription in subscriptions:
+            if subscription.get("tags"):
+                branches.append({"category": subscription["category"], "tags": {"$in": subscription["tags"]}})
+            else:
+                branches.append({"category": subscription["category"]})
+        if not branches:
+            return None
+        # Each branch follows the (category, created_at, _id) index, the branches are merged in the sort order
+        return branches[0] if len(branches) == 1 else {"$or": branches}
+
+    @staticmethod
+    def build_fan_out_on_read_query(subscriptions: List[Dict[str, Any]], celebrity_categories: Set[str]) -> Dict[str, Any] | None:
+        """
+        Build the filter of the posts of a user's timeline that the timeline loader does not add to the cached timeline.
+
+        :param subscriptions: The subscriptions of the user
+        :type subscriptions: List[Dict[str, Any]]
+        :param celebrity_categories: The categories read from the posts collection (fan-out-on-read)
+        :type celebrity_categories: Set[str]
+        :return: The filter, None if the user subscribes to none of these categories
+        :rtype: Dict[str, Any] | None
+        """
+
+        subscriptions = [subscription for subscription in subscriptions if subscription.get("category") in celebrity_categories]
+        return TimelineUtils.build_timeline_query({"subscriptions": subscriptions})
+
+    @staticmethod
+    def merge_page(posts: List[Post], after: Tuple[datetime, str] | None, size: int) -> List[Post]:
+        """
+        Get the first size posts after a sort key, most recent first, without duplicates.
+
+        :param posts: Posts sorted by their sort key, most recent first
+        :type posts: List[Post]
+        :param after: The sort key of the cursor, None for the first page
+        :type after: Tuple[datetime, str] | None
+        :rtype: List[Post]
+        """
+
+        page, seen = [], set()
+        for post in posts:
+            if post.post_id in seen or (after is not None and TimelineUtils.get_sort_key(post) >= after):
+                continue
+            seen.add(post.post_id)
+            page.append(post)
+            if len(page) >= size:
+                break
+        return page
+
+    @staticmethod
+    def get_page(scope: str, posts: List[Post], page_size: int) -> Tuple[List[Post], str | None]:
+        """
+        Split the posts fetched for a page (up to page_size + 1) into the page and the cursor of the next one.
+
+        :rtype: Tuple[List[Post], str | None]
+        """
+
+        if len(posts) <= page_size:
+            return posts, None
+        posts = posts[:page_size]
+        created_at, post_id = TimelineUtils.get_sort_key(posts[-1])
+        return posts, PaginationUtils.encode_keyset_cursor(scope, {"created_at": created_at, "_id": post_id})
+
+
+class AsyncTimelineUtils:
+    """
+    A class with helpful methods to read user timelines with cache-aside, see TimelineUtils.
+
+    A page is read from the user's sorted set in one round trip. On a miss the timeline is loaded from the posts collection
+    and written back to Redis, concurrent misses of the same user in this process share that load (single-flight).
+    Pages past the cached posts are read from the posts collection, and so are the posts of the fan-out-on-read categories
+    the user subscribes to, merged into the cached pages. When Redis cannot be reached, or is not configured,
+    timelines are cached in process instead (LocalTimelineCache), so a Redis outage costs freshness, not availability.
+    """
+
+    # Opened by open_client() when EPA_REDIS_URL is set
+    _client: ClassVar[redis.Redis | None] = None
+    _local_cache: ClassVar[LocalTimelineCache] = LocalTimelineCache()
+    # The timeline loads in flight, by user id
+    _loads: ClassVar[Dict[str, asyncio.Future]] = {}
+
+    _hits: ClassVar[int] = 0
+    _misses: ClassVar[int] = 0
+    _coalesced_misses: ClassVar[int] = 0
+    _redis_errors: ClassVar[int] = 0
+    _latencies: ClassVar[Deque[float]] = deque(maxlen=1000)
+
+    @staticmethod
+    def open_client() -> redis.Redis | None:
+        """
+        Open the process-wide Redis client of the timeline cache. This is called once when the API starts.
+        Calling this when the client is already open returns the open client.
+
+        :return: The Redis client, None if EPA_REDIS_URL is not set
+        :rtype: redis.asyncio.Redis | None
+        """
+
+        settings = SettingsUtils.get(TimelineSettings)
+        AsyncTimelineUtils._local_cache = LocalTimelineCache(max_size=settings.local_cache_size, ttl=settings.local_ttl_seconds)
+        if AsyncTimelineUtils._client is None and settings.redis_url:
+            AsyncTimelineUtils._client = redis.Redis.from_url(
+                settings.redis_url,
+                socket_timeout=settings.redis_timeout_ms / 1000,
+                socket_connect_timeout=settings.redis_timeout_ms / 1000,
+                max_connections=settings.redis_max_connections,
+            )
+        return AsyncTimelineUtils._client
+
+    @staticmethod
+    async def close_client():
+        """
+        Close the process-wide Redis client, if it is open. This is called once when the API shuts down.
+        """
+
+        if AsyncTimelineUtils._client is not None:
+            client = AsyncTimelineUtils._client
+            AsyncTimelineUtils._client = None
+            await client.aclose()
+
+    @staticmethod
+    def clear():
+        AsyncTimelineUtils._client = None
+        AsyncTimelineUtils._local_cache = LocalTimelineCache()
+        AsyncTimelineUtils._loads = {}
+        AsyncTimelineUtils._hits = AsyncTimelineUtils._misses = AsyncTimelineUtils._coalesced_misses = AsyncTimelineUtils._redis_errors = 0
+        AsyncTimelineUtils._latencies = deque(maxlen=1000)
+
+    @staticmethod
+    async def get_timeline(user_id: str, limit: int | None, cursor: str | None, user_collection: AsyncCollection, posts_collection: AsyncCollection) -> Tuple[List[Post], str | None]:
+        """
+        Get a page of a user's timeline, most recent posts first.
+
+        :param user_id: The id of the user
+        :type user_id: str
+        :param limit: The page size requested, see PaginationUtils.get_page_size
+        :type limit: int | None
+        :param cursor: The cursor returned with the previous page, None for the first page
+        :type cursor: str | None
+        :param user_collection: The user collection, the subscriptions of the user are read from it on a miss
+        :type user_collection: AsyncCollection
+        :param posts_collection: The posts collection
+        :type posts_collection: AsyncCollection
+        :raises InvalidCursorError if the cursor is not valid
+        :return: The posts of the page and the cursor of the next page
+        :rtype: Tuple[List[Post], str | None]
+        """
+
+        start = time.perf_counter()
+        settings = SettingsUtils.get(TimelineSettings)
+        scope = TimelineUtils.get_scope(user_id)
+        page_size = PaginationUtils.get_page_size(limit)
+        after = PaginationUtils.decode_keyset_cursor(scope, cursor) if cursor else None
+
+        cached = await AsyncTimelineUtils._read_cached_page(user_id, after, page_size + 1)
+        if cached is not None:
+            AsyncTimelineUtils._hits += 1
+            posts, cached_length, query = cached
+            if query is not None:
+                posts = await AsyncTimelineUtils._merge_fan_out_on_read(posts, query, after, page_size + 1, cached_length >= settings.max_length, posts_collection)
+        else:
+            AsyncTimelineUtils._misses += 1
+            timeline = await AsyncTimelineUtils._load_once(user_id, user_collection, posts_collection)
+            posts, cached_length = TimelineUtils.merge_page(timeline, after, page_size + 1), len(timeline)
+
+        # The cache only holds the most recent posts, older pages continue from the posts collection
+        if len(posts) <= page_size and cached_length >= settings.max_length:
+            last = TimelineUtils.get_sort_key(posts[-1]) if posts else after
+            posts += await AsyncTimelineUtils._read_posts(user_id, last, page_size + 1 - len(posts), user_collection, posts_collection)
+
+        AsyncTimelineUtils._latencies.append(time.perf_counter() - start)
+        return TimelineUtils.get_page(scope, posts, page_size)
+
+    @staticmethod
+    async def _read_cached_page(user_id: str, after: Tuple[datetime, str] | None, size: int) -> Tuple[List[Post], int, Dict[str, Any] | None] | None:
+        """
+        Read up to size posts after a sort key from the cached timeline.
+
+        :return: The posts, the number of cached posts and the filter of the fan-out-on-read posts of the user, None on a miss
+        :rtype: Tuple[List[Post], int, Dict[str, Any] | None] | None
+        """
+
+        client = AsyncTimelineUtils._client
+        if client is not None:
+            key = TimelineUtils.get_key(user_id)
+            try:
+                async with client.pipeline(transaction=False) as pipe:
+                    pipe.zrange(key, 0, 0)
+                    if after is None:
+                        pipe.zrevrange(key, 0, size - 1)
+                    else:
+                        # The posts created in the same millisecond as the cursor, then the older ones
+                        score = TimelineUtils.get_score(after[0])
+                        pipe.zrevrangebyscore(key, score, score)
+                        pipe.zrevrangebyscore(key, f"({score}", "-inf", start=0, num=size)
+                    pipe.zcard(key)
+                    pipe.zrangebyscore(TimelineUtils.CELEBRITY_CATEGORIES_KEY, time.time(), "+inf")
+                    lowest, *results, length, celebrity_categories = await pipe.execute()
+            except RedisError:
+                AsyncTimelineUtils._redis_errors += 1
+            else:
+                subscriptions = TimelineUtils.from_marker(lowest[0]) if lowest else None
+                if subscriptions is None:
+                    return None
+                posts = [post for members in results for post in TimelineUtils.from_members(members)]
+                if after is not None:
+                    posts.sort(key=TimelineUtils.get_sort_key, reverse=True)
+                query = TimelineUtils.build_fan_out_on_read_query(subscriptions, {category.decode() for category in celebrity_categories})
+                return TimelineUtils.merge_page(posts, after, size), length - 1, query
+
+        timeline = AsyncTimelineUtils._local_cache.get(user_id)
+        if timeline is None:
+            return None
+        return TimelineUtils.merge_page(timeline, after, size), len(timeline), None
+
+    @staticmethod
+    async def _merge_fan_out_on_read(posts: List[Post], query: Dict[str, Any], after: Tuple[datetime, str] | None, size: int, window_full: bool, posts_collection: AsyncCollection) -> List[Post]:
+        """Merge the posts of the fan-out-on-read categories into up to size posts read from the cached timeline."""
+
+        others = await AsyncTimelineUtils._find_posts(query, after, size, posts_collection)
+        if window_full and len(posts) < size:
+            # The cached posts end within the page, the older posts of every subscription are read from the posts collection
+            if not posts:
+                return posts
+            end = TimelineUtils.get_sort_key(posts[-1])
+            others = [post for post in others if TimelineUtils.get_sort_key(post) >= end]
+        posts = sorted(posts + others, key=TimelineUtils.get_sort_key, reverse=True)
+        return TimelineUtils.merge_page(posts, after, size)
+
+    @staticmethod
+    async def _load_once(user_id: str, user_collection: AsyncCollection, posts_collection: AsyncCollection) -> List[Post]:
+        """Load a user's timeline, or wait for the load of another request of the same user."""
+
+        loading = AsyncTimelineUtils._loads.get(user_id)
+        if loading is not None:
+            AsyncTimelineUtils._coalesced_misses += 1
+            return await asyncio.shield(loading)
+
+        loading = AsyncTimelineUtils._loads[user_id] = asyncio.get_running_loop().create_future()
+        try:
+            timeline = await AsyncTimelineUtils._load(user_id, user_collection, posts_collection)
+        except asyncio.CancelledError:
+            loading.cancel()
+            raise
+        except Exception as e:
+            loading.set_exception(e)
+            # Retrieved so that a load without waiters is not reported as unhandled
+            loading.exception()
+            raise
+        else:
+            loading.set_result(timeline)
+            return timeline
+        finally:
+            AsyncTimelineUtils._loads.pop(user_id, None)
+
+    @staticmethod
+    async def _load(user_id: str, user_collection: AsyncCollection, posts_collection: AsyncCollection) -> List[Post]:
+        """Load a user's timeline from the posts collection and cache it."""
+
+        settings = SettingsUtils.get(TimelineSettings)
+        user = await user_collection.find_one({"user_id": user_id}, {"subscriptions": 1})
+        timeline = await AsyncTimelineUtils._find_posts(TimelineUtils.build_timeline_query(user), None, settings.max_length, posts_collection)
+
+        client = AsyncTimelineUtils._client
+        if client is not None:
+            key = TimelineUtils.get_key(user_id)
+            members = {TimelineUtils.to_member(post): TimelineUtils.get_score(post.created_at) for post in timeline}
+            members[TimelineUtils.to_marker(user)] = float("-inf")
+            try:
+                # Written at once, a concurrent reader never sees a partial timeline
+                async with client.pipeline(transaction=True) as pipe:
+                    pipe.delete(key)
+                    pipe.zadd(key, members)
+                    pipe.expire(key, settings.ttl_seconds)
+                    await pipe.execute()
+                return timeline
+            except RedisError:
+                AsyncTimelineUtils._redis_errors += 1
+        AsyncTimelineUtils._local_cache.put(user_id, timeline)
+        return timeline
+
+    @staticmethod
+    async def _read_posts(user_id: str, after: Tuple[datetime, str] | None, size: int, user_collection: AsyncCollection, posts_collection: AsyncCollection) -> List[Post]:
+        """Read up to size posts of a user's timeline after a sort key from the posts collection."""
+
+        user = await user_collection.find_one({"user_id": user_id}, {"subscriptions": 1})
+        return await AsyncTimelineUtils._find_posts(TimelineUtils.build_timeline_query(user), after, size, posts_collection)
+
+    @staticmethod
+    async def _find_posts(query: Dict[str, Any] | None, after: Tuple[datetime, str] | None, size: int, posts_collection: AsyncCollection) -> List[Post]:
+        """Read up to size posts matching a timeline filter after a sort key from the posts collection."""
+
+        if query is None or size < 1:
+            return []
+        query = PaginationUtils.build_keyset_query(query, after)
+        documents = await posts_collection.find(query, PostUtils.PROJECTION).sort(PaginationUtils.KEYSET_SORT).limit(size).to_list(length=size)
+        return [PostUtils.to_post(document) for document in documents]
+
+    @staticmethod
+    def get_metrics() -> Dict[str, Any]:
+        """
+        Get the metrics of the timeline cache. Latencies cover the last 1000 timeline reads.
+
+        :return: The metrics, matching the TimelineCacheMetrics model
+        :rtype: Dict[str, Any]
+        """
+
+        latencies = sorted(AsyncTimelineUtils._latencies)
+        reads = AsyncTimelineUtils._hits + AsyncTimelineUtils._misses
+        return {
+            "hits": AsyncTimelineUtils._hits,
+            "misses": AsyncTimelineUtils._misses,
+            "hit_ratio": round(AsyncTimelineUtils._hits / reads, 4) if reads else 0.0,
+            "coalesced_misses": AsyncTimelineUtils._coalesced_misses,
+            "redis_errors": AsyncTimelineUtils._redis_errors,
+            "latency_avg_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            "latency_p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 3) if latencies else 0.0,
+            "latency_max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        }
@@ -1,13 +1,28 @@
 from operator import le
 from pydantic_core.core_schema import int_schema
 from pymongo.collection import Collection
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from pymongo.asynchronous.collection import AsyncCollection
 from datetime import datetime, timedelta
-from typing import Dict, Any, List
+from typing import ClassVar, Dict, Any, List, Tuple
+from epa_api.api_implementation.utils.token_cache import VerifiedTokenCache
+from epa_api.api_implementation.utils.revocation import RevocationUtils
+from epa_api.api_implementation.utils.settings import JwtSettings, SettingsUtils
 import jwt
-import os
+import uuid
 
 class TokenUtils:
     """A class with helpful methods to interact with API JWT Tokens"""
+    
+    # Resolved once by load_jwt_secret()
+    _jwt_secret: ClassVar[str | None] = None
+    
+    # The number of sessions a user can have open, the oldest session is revoked past this
+    MAX_SESSIONS_PER_USER: ClassVar[int] = 5
+    
+    # Claims of tokens that were already verified, see verify_token(). Sized by load_jwt_secret()
+    _token_cache: ClassVar[VerifiedTokenCache] = VerifiedTokenCache()
             
     @staticmethod
     def is_access_token_in_db(token: str, user_collection: Collection) -> bool:
@@ -43,15 +58,14 @@ class TokenUtils:
         :rtype: bool       
         """
         
-        if session_token_collection.find_one({"session_token": token}):
-            return True
-        else:
-            return False
+        return session_token_collection.find_one({"sessions.session_token": token}, {"_id": 1}) is not None
             
     @staticmethod       
     def get_user_session_tokens(user_id: str, session_token_collection: Collection) -> List[Dict[Any, Any]]:
         """
-        Get the session tokens of a user
+        Get the session tokens of a user, oldest first.
+        Each user has one document in the session token collection holding their sessions:
+            {"user_id": "...", "expires_at": <latest expiry>, "sessions": [{"session_token": "...", "jti": "...", "expires_at": ...}]}
         
         :param user_id: The id of the user
         :type user_id: str
@@ -61,13 +75,8 @@ class TokenUtils:
         :rtype: List[Dict[Any, Any]]
         """
    
-        query = {"user_id": user_id}
-        cursor = session_token_collection.find(query)
-        output = []
-        for token_obj in cursor:
-            output.append(token_obj)
-            
-        return output
+        user_sessions = session_token_collection.find_one({"user_id": user_id}, {"_id": 0, "sessions": 1})
+        return user_sessions.get("sessions", []) if user_sessions else []
         
     @staticmethod       
     def get_user_session_token_count(user_id: str, session_token_collection: Collection) -> int:
@@ -82,8 +91,7 @@ class TokenUtils:
         :rtype: int
         """
    
-        query = {"user_id": user_id}
-        return session_token_collection.count_documents(query)
+        return len(TokenUtils.get_user_session_tokens(user_id, session_token_collection))
         
     @staticmethod
     def get_session_token_with_least_ttl(tokens: List[Dict[Any, Any]]) -> Dict[Any, Any] | None:
@@ -95,104 +103,207 @@ class TokenUtils:
         :return: The session token object with the least time to live (ttl)
         :rtype: List[Dict[Any, Any]]
         """        
-        output = None
-        least_ttl = None
-        for t in tokens:
-            actual_token = t["session_token"]
-            ttl = TokenUtils.get_ttl_in_seconds(TokenUtils.get_expire_date(actual_token))
-            if not least_ttl:
-                least_ttl = ttl
-                output = t
-            elif ttl < least_ttl:
-                least_ttl = ttl
-                output = t
-                
-        return output
+        
+        # The expiry is stored next to each token, there is no need to decode them
+        return min(tokens, key=lambda t: t["expires_at"], default=None)
             
     @staticmethod    
-    def generate_new_session_token(user: Dict[Any, Any], session_token_collection: Collection) -> str:
+    def generate_new_session_token(user: Dict[Any, Any], session_token_collection: Collection, revoked_token_collection: Collection) -> str:
         """
-        Gets a new session token.
+        Gets a new session token, revoking the user's oldest sessions past MAX_SESSIONS_PER_USER.
+        See AsyncTokenUtils.generate_new_session_token.
     
         :param user: A user object
         :type user: Dict[Any, Any]
         :param session_token_collection: The collection of session tokens
         :type session_token_collection: pymongo.collection.Collection
+        :param revoked_token_collection: The collection of revoked tokens
+        :type revoked_token_collection: pymongo.collection.Collection
         :return: A JWT token
         :rtype: str
         """
         
-        # Avoid overloading of session tokens
-        token_count = TokenUtils.get_user_session_token_count(user["user_id"], session_token_collection)
-        if token_count > 4:
-            user_session_tokens = TokenUtils.get_user_session_tokens(user["user_id"], session_token_collection)
-            token_to_remove = TokenUtils.get_session_token_with_least_ttl(user_session_tokens)
-            if token_to_remove:
-                TokenUtils.remove_session_token(token_to_remove["session_token"], session_token_collection)
+        session = TokenUtils.build_session_token(user)
+        query, update, options = TokenUtils.build_session_token_update(user, session)
+        try:
+            previous = session_token_collection.find_one_and_update(query, update, **options)
+        except DuplicateKeyError:
+            # Another login created the user's document first, the update now applies to it
+            previous = session_token_collection.find_one_and_update(query, update, **options)
             
-        new_session_token = TokenUtils.get_token({"user_id": user["user_id"]}, exp_date=(datetime.now() + timedelta(days=7)))
-        session_token_collection.insert_one({
-            "session_token": new_session_token,
-            "user_id": user["user_id"],
-            "expires_at": (datetime.now() + timedelta(days=7))
-        })
-        return new_session_token
+        for evicted in TokenUtils.get_evicted_sessions(previous, session):
+            RevocationUtils.revoke_sync(TokenUtils.get_session_claims(evicted), revoked_token_collection)
+        return session["session_token"]
+        
+    @staticmethod
+    def build_session_token(user: Dict[Any, Any]) -> Dict[Any, Any]:
+        """
+        Build the object of a new session token for a user.
+    
+        :param user: A user object
+        :type user: Dict[Any, Any]
+        :return: The session token object to store
+        :rtype: Dict[Any, Any]
+        """
+        
+        expires_at = datetime.now() + timedelta(days=7)
+        claims = {"user_id": user["user_id"], "typ": "session"}
+        session_token = TokenUtils.get_token(claims, exp_date=expires_at)
+        return {
+            "session_token": session_token,
+            "jti": claims["jti"],
+            "expires_at": expires_at
+        }
+        
+    @staticmethod
+    def build_session_token_update(user: Dict[Any, Any], session: Dict[Any, Any]) -> Tuple[Dict[Any, Any], Dict[Any, Any], Dict[str, Any]]:
+        """
+        Build the arguments of the find_one_and_update that stores a new session.
+        The session is pushed onto the user's session array which is kept sorted by expiry and sliced
+        to the newest MAX_SESSIONS_PER_USER, so the cap is enforced by one atomic server-side operation.
+        The document from before the update is returned so that the evicted sessions can be revoked.
+    
+        :param user: A user object
+        :type user: Dict[Any, Any]
+        :param session: The session token object, see build_session_token
+        :type session: Dict[Any, Any]
+        :return: The filter, the update and the keyword arguments
+        :rtype: Tuple[Dict[Any, Any], Dict[Any, Any], Dict[str, Any]]
+        """
+        
+        return (
+            {"user_id": user["user_id"]},
+            {
+                "$push": {"sessions": {
+                    "$each": [session],
+                    "$sort": {"expires_at": 1},
+                    "$slice": -TokenUtils.MAX_SESSIONS_PER_USER
+                }},
+                "$max": {"expires_at": session["expires_at"]}
+            },
+            {"projection": {"_id": 0, "sessions": 1}, "upsert": True, "return_document": ReturnDocument.BEFORE}
+        )
+        
+    @staticmethod
+    def get_evicted_sessions(previous: Dict[Any, Any] | None, session: Dict[Any, Any]) -> List[Dict[Any, Any]]:
+        """
+        Get the unexpired sessions that were sliced off the user's session array when a session was added.
+    
+        :param previous: The user's session document before the update, None if there was none
+        :type previous: Dict[Any, Any] | None
+        :param session: The session token object that was added
+        :type session: Dict[Any, Any]
+        :return: The evicted session token objects
+        :rtype: List[Dict[Any, Any]]
+        """
+        
+        sessions = sorted((previous or {}).get("sessions", []) + [session], key=lambda s: s["expires_at"])
+        now = datetime.now()
+        return [s for s in sessions[:-TokenUtils.MAX_SESSIONS_PER_USER] if s["expires_at"] > now]
+        
+    @staticmethod
+    def get_session_claims(session: Dict[Any, Any]) -> Dict[str, Any]:
+        """
+        Get the claims needed to revoke a stored session without decoding its token.
+    
+        :param session: A session token object
+        :type session: Dict[Any, Any]
+        :return: The `jti` and `exp` claims of the session token
+        :rtype: Dict[str, Any]
+        """
+        
+        return {"jti": session.get("jti"), "exp": session["expires_at"].timestamp()}
         
     @staticmethod    
-    def remove_session_token(token: str, session_token_collection: Collection):
+    def remove_session_token(token: str, session_token_collection: Collection, revoked_token_collection: Collection):
         """
-        Remove a session token.
+        Remove a session token and revoke it. See AsyncTokenUtils.remove_session_token.
     
         :param token: The session token to remove
         :type token: str
         :param session_token_collection: The collection of session tokens
         :type session_token_collection: pymongo.collection.Collection
+        :param revoked_token_collection: The collection of revoked tokens
+        :type revoked_token_collection: pymongo.collection.Collection
         """
         
-        result = session_token_collection.delete_one({
-            "session_token": token
-        })
+        result = session_token_collection.update_one(
+            {"sessions.session_token": token},
+            {"$pull": {"sessions": {"session_token": token}}}
+        )
         
-        if result.deleted_count == 0:
+        if result.modified_count == 0:
             raise ValueError(f"Session token {token} does not exist")
+            
+        claims = TokenUtils.verify_token(token)
+        if claims:
+            RevocationUtils.revoke_sync(claims, revoked_token_collection)
         
     @staticmethod            
-    def generate_new_access_token(user: Dict[Any, Any], user_collection: Collection) -> str:
+    def generate_new_access_token(user: Dict[Any, Any], user_collection: Collection, revoked_token_collection: Collection) -> str:
         """
-        Gets a new access token, invalidating the old one.
+        Gets a new access token, revoking the old one. See AsyncTokenUtils.generate_new_access_token.
     
         :param user: A user object
         :type user: Dict[Any, Any]
         :param user_collection: The collection of users
         :type user_collection: pymongo.collection.Collection
+        :param revoked_token_collection: The collection of revoked tokens
+        :type revoked_token_collection: pymongo.collection.Collection
         :return: A JWT token
         :rtype: str
         """
-        new_access_token = TokenUtils.get_token({"user_id": user["user_id"]}, exp_date=(datetime.now() + timedelta(minutes=30)))
-        user_collection.update_one(user, {"$set": {"access_token": new_access_token} })
+        new_access_token = TokenUtils.get_token({"user_id": user["user_id"], "typ": "access"}, exp_date=(datetime.now() + timedelta(minutes=30)))
+        previous_user = user_collection.find_one_and_update(
+            {"user_id": user["user_id"]},
+            {"$set": {"access_token": new_access_token}},
+            projection={"_id": 0, "access_token": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        
+        # Tokens that already expired do not need to be revoked
+        previous_claims = TokenUtils.verify_token(previous_user["access_token"]) if previous_user and previous_user.get("access_token") else None
+        if previous_claims:
+            RevocationUtils.revoke_sync(previous_claims, revoked_token_collection)
         return new_access_token
 
+    @staticmethod    
+    def load_jwt_secret() -> str:
+        """
+        Read the JWT Secret for this API from the settings and keep it for later calls.
+        This is called once when the API starts, the token cache is sized from the settings too.
+    
+        :raises ValueError if the expected env variable is not set
+        :return: The JWT secret
+        :rtype: str
+        """
+        settings = SettingsUtils.get(JwtSettings)
+        TokenUtils._jwt_secret = settings.secret
+        TokenUtils._token_cache = VerifiedTokenCache(max_size=settings.token_cache_size, max_ttl=settings.token_cache_max_ttl)
+        return settings.secret
+        
     @staticmethod    
     def get_jwt_secret() -> str:
         """
-        Get the JWT Secret for this API
+        Get the JWT Secret for this API, reading it from the environment on the first call only.
     
         :raises ValueError if the expected env variable is not set
         :return: The JWT secret
         :rtype: str
         """
-        env_var = "EPA_JWT_SECRET"
-        val = os.getenv(env_var)
-        if not val:
-            raise ValueError("Environmnet variable EPA_JWT_SECRET not set.")
-        else:
-            return val
+        if TokenUtils._jwt_secret is None:
+            return TokenUtils.load_jwt_secret()
+        return TokenUtils._jwt_secret
  
     @staticmethod               
     def get_token(data: Dict[Any, Any], exp_date: datetime) -> str:
         secret = TokenUtils.get_jwt_secret()
         data["exp"] = exp_date.timestamp()
+        # Every token gets an id so that it can be revoked on its own, see RevocationUtils
+        data.setdefault("jti", uuid.uuid4().hex)
         token = jwt.encode(data, secret, algorithm="HS256")
+        # The claims of a token we just signed are known, no need to decode it later
+        TokenUtils._token_cache.put(token, dict(data))
         return token
     
     @staticmethod        
@@ -215,17 +326,182 @@ class TokenUtils:
    
     @staticmethod         
     def is_token_valid(token: str) -> bool:
+        return TokenUtils.verify_token(token) is not None
+        
+    @staticmethod
+    def verify_token(token: str) -> Dict[Any, Any] | None:
+        """
+        Verify a token and get its claims. Verified claims are cached until the token expires,
+        so a token is only decoded once per process no matter how many times it is used.
+    
+        :param token: The JWT to verify
+        :type token: str
+        :return: The claims of the token or None if the token is invalid or expired
+        :rtype: Dict[Any, Any] | None
+        """
         try:
-            TokenUtils.get_token_payload(token)
-            return True
-        except jwt.DecodeError:
-            return False
+            return TokenUtils.get_token_payload(token)
+        except jwt.InvalidTokenError:
+            return None
   
     @staticmethod              
     def get_token_payload(token: str) -> Dict[Any, Any]:
+        payload = TokenUtils._token_cache.get(token)
+        if payload is not None:
+            return payload
+            
         secret = TokenUtils.get_jwt_secret()
+        payload = jwt.decode(token, secret, algorithms=["HS256"])
+        TokenUtils._token_cache.put(token, payload)
+        return payload
+
+class AsyncTokenUtils:
+    """
+    A class with helpful methods to interact with API JWT Tokens through async MongoDB collections.
+    Methods that do not touch the database live on TokenUtils.
+    """
+    
+    @staticmethod
+    async def is_access_token_in_db(token: str, user_collection: AsyncCollection) -> bool:
+        """
+        Checks if the current access token is in the database.
+        This is used to handle if a user creates a new access token, invalidating previous ones.
+        
+        :param token: The access token to look for.
+        :type token: str
+        :param user_collection: The collection of users
+        :type user_collection: pymongo.asynchronous.collection.AsyncCollection
+        :return: True if and only if the access token is in the database
+        :rtype: bool
+        """
+        
+        return await user_collection.find_one({"access_token": token}, {"_id": 1}) is not None
+        
+    @staticmethod
+    async def is_session_token_in_db(token: str, session_token_collection: AsyncCollection) -> bool:
+        """
+        Checks if the current session token is in the database.
+        This is used to handle if a user opens mutiple session tokens, invalidating previous ones.
+        
+        :param token: The session token to look for
+        :type token: str
+        :param session_token_collection: The collection of session tokens
+        :type session_token_collection: pymongo.asynchronous.collection.AsyncCollection
+        :return: True if and only if the session token is in the database
+        :rtype: bool
+        """
+        
+        return await session_token_collection.find_one({"sessions.session_token": token}, {"_id": 1}) is not None
+        
+    @staticmethod
+    async def get_user_session_tokens(user_id: str, session_token_collection: AsyncCollection) -> List[Dict[Any, Any]]:
+        """
+        Get the session tokens of a user, oldest first. See TokenUtils.get_user_session_tokens.
+        
+        :param user_id: The id of the user
+        :type user_id: str
+        :param session_token_collection: The collection of session tokens
+        :type session_token_collection: pymongo.asynchronous.collection.AsyncCollection
+        :return: A list of session token objects
+        :rtype: List[Dict[Any, Any]]
+        """
+        
+        user_sessions = await session_token_collection.find_one({"user_id": user_id}, {"_id": 0, "sessions": 1})
+        return user_sessions.get("sessions", []) if user_sessions else []
+        
+    @staticmethod
+    async def get_user_session_token_count(user_id: str, session_token_collection: AsyncCollection) -> int:
+        """
+        Get the number of session tokens the user has
+        
+        :param user_id: The id of the user
+        :type user_id: str
+        :param session_token_collection: The collection of session tokens
+        :type session_token_collection: pymongo.asynchronous.collection.AsyncCollection
+        :return: The number of session tokens
+        :rtype: int
+        """
+        
+        return len(await AsyncTokenUtils.get_user_session_tokens(user_id, session_token_collection))
+        
+    @staticmethod
+    async def generate_new_session_token(user: Dict[Any, Any], session_token_collection: AsyncCollection, revoked_token_collection: AsyncCollection) -> str:
+        """
+        Gets a new session token. The session is stored and the user's sessions are capped to
+        MAX_SESSIONS_PER_USER in one atomic round trip (see TokenUtils.build_session_token_update),
+        so concurrent logins of the same user cannot exceed the cap. Evicted sessions are then revoked.
+    
+        :param user: A user object
+        :type user: Dict[Any, Any]
+        :param session_token_collection: The collection of session tokens
+        :type session_token_collection: pymongo.asynchronous.collection.AsyncCollection
+        :param revoked_token_collection: The collection of revoked tokens
+        :type revoked_token_collection: pymongo.asynchronous.collection.AsyncCollection
+        :return: A JWT token
+        :rtype: str
+        """
+        
+        session = TokenUtils.build_session_token(user)
+        query, update, options = TokenUtils.build_session_token_update(user, session)
         try:
-            payload = jwt.decode(token, secret, algorithms=["HS256"])
-            return payload
-        except jwt.DecodeError as e:
-            raise e
\ No newline at end of file
+            previous = await session_token_collection.find_one_and_update(query, update, **options)
+        except DuplicateKeyError:
+            # Another login created the user's document first, the update now applies to it
+            previous = await session_token_collection.find_one_and_update(query, update, **options)
+            
+        for evicted in TokenUtils.get_evicted_sessions(previous, session):
+            await RevocationUtils.revoke(TokenUtils.get_session_claims(evicted), revoked_token_collection)
+        return session["session_token"]
+        
+    @staticmethod
+    async def remove_session_token(token: str, session_token_collection: AsyncCollection, revoked_token_collection: AsyncCollection):
+        """
+        Remove a session token and revoke it.
+    
+        :param token: The session token to remove
+        :type token: str
+        :param session_token_collection: The collection of session tokens
+        :type session_token_collection: pymongo.asynchronous.collection.AsyncCollection
+        :param revoked_token_collection: The collection of revoked tokens
+        :type revoked_token_collection: pymongo.asynchronous.collection.AsyncCollection
+        """
+        
+        result = await session_token_collection.update_one(
+            {"sessions.session_token": token},
+            {"$pull": {"sessions": {"session_token": token}}}
+        )
+        
+        if result.modified_count == 0:
+            raise ValueError(f"Session token {token} does not exist")
+            
+        claims = TokenUtils.verify_token(token)
+        if claims:
+            await RevocationUtils.revoke(claims, revoked_token_collection)
+            
+    @staticmethod
+    async def generate_new_access_token(user: Dict[Any, Any], user_collection: AsyncCollection, revoked_token_collection: AsyncCollection) -> str:
+        """
+        Gets a new access token, revoking the old one.
+    
+        :param user: A user object
+        :type user: Dict[Any, Any]
+        :param user_collection: The collection of users
+        :type user_collection: pymongo.asynchronous.collection.AsyncCollection
+        :param revoked_token_collection: The collection of revoked tokens
+        :type revoked_token_collection: pymongo.asynchronous.collection.AsyncCollection
+        :return: A JWT token
+        :rtype: str
+        """
+        new_access_token = TokenUtils.get_token({"user_id": user["user_id"], "typ": "access"}, exp_date=(datetime.now() + timedelta(minutes=30)))
+        previous_user = await user_collection.find_one_and_update(
+            {"user_id": user["user_id"]},
+            {"$set": {"access_token": new_access_token}},
+            projection={"_id": 0, "access_token": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        
+        # Tokens that already expired do not need to be revoked
+        previous_claims = TokenUtils.verify_token(previous_user["access_token"]) if previous_user and previous_user.get("access_token") else None
+        if previous_claims:
+            await RevocationUtils.revoke(previous_claims, revoked_token_collection)
+        return new_access_token
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+import threading
+import hashlib
+import time
+
+
+class VerifiedTokenCache:
+    """
+    A size-bounded LRU cache of verified JWT claims, keyed by the SHA-256 digest of the token.
+
+    An entry lives until the token expires (its `exp` claim) or for at most `max_ttl` seconds,
+    whichever comes first, so a cached token is never accepted after it would have failed to decode.
+    Claims are copied in and out, a caller that changes its dict does not change the cached entry.
+    """
+
+    def __init__(self, max_size: int = 10000, max_ttl: float = 300):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, Tuple[float, Dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Dict[str, Any] | None:
+        """
+        Get the verified claims of a token, or None if the token is not cached or its entry expired.
+
+        :param token: The JWT
+        :type token: str
+        :return: A copy of the claims of the token
+        :rtype: Dict[str, Any] | None
+        """
+
+        key = VerifiedTokenCache.get_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, claims = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(claims)
+
+    def put(self, token: str, claims: Dict[str, Any]):
+        """
+        Cache the verified claims of a token, evicting the least recently used entry when full.
+
+        :param token: The JWT
+        :type token: str
+        :param claims: The claims of the token, they must have been verified
+        :type claims: Dict[str, Any]
+        """
+
+        now = time.time()
+        expires_at = min(float(claims.get("exp", now)), now + self.max_ttl)
+        if expires_at <= now or self.max_size < 1:
+            return
+
+        key = VerifiedTokenCache.get_key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, dict(claims))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
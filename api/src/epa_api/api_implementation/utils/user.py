@@ -1,68 +1,216 @@
-from typing import Tuple, Dict, Any
+from typing import ClassVar, Tuple, Dict, Any
 from pydantic.types import SecretStr
 from pymongo.collection import Collection
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import DuplicateKeyError
 from epa_api.models.user_registration import UserRegistration
+from epa_api.api_implementation.utils.settings import HashingSettings, SettingsUtils
 import hashlib
 import uuid
 import os
 import binascii
 import hmac
+import re
+
+class UserTakenError(Exception):
+    """Raised when a new user has the email, username or google id of an existing user"""
+
+    def __init__(self, field: str):
+        super().__init__(f"{field} already taken")
+        self.field = field
+
 
 class UserUtils:
     """A class with helpful methods to interact with a user"""
 
+    # Supported password hashing algorithms and the hashlib digest each one uses
+    PASSWORD_HASH_ALGORITHMS: ClassVar[Dict[str, str]] = HashingSettings.ALGORITHMS
+    
+    # Parameters of password hashes stored before hash records carried their own parameters
+    LEGACY_PASSWORD_HASH_ALGORITHM: ClassVar[str] = "pbkdf2_sha256"
+    LEGACY_PASSWORD_HASH_ITERATIONS: ClassVar[int] = 260000
+    
+    @staticmethod
+    def get_password_hash_policy() -> Tuple[str, int]:
+        """
+        Get the policy new password hashes are created with.
+        The policy can be set with env variables, otherwise a default is used:
+            - EPA_PASSWORD_HASH_ALGORITHM (default pbkdf2_sha256)
+            - EPA_PASSWORD_HASH_ITERATIONS (default 260000)
+    
+        :raises ValueError if one of the env variables is not valid
+        :return: The algorithm and the number of iterations
+        :rtype: Tuple[str, int]
+        """
+        
+        settings = SettingsUtils.get(HashingSettings)
+        return settings.password_hash_algorithm, settings.password_hash_iterations
+
     @staticmethod       
-    def hash_password(password: SecretStr) -> Tuple[str, str]:
+    def hash_password(password: SecretStr, algorithm: str | None = None, iterations: int | None = None) -> Dict[str, Any]:
         """
-        Hash a password with a random salt and PBKDF2-HMAC-SHA256.
+        Hash a password with a random salt and PBKDF2-HMAC.
+        The result is a self-describing hash record, so it can still be verified after the policy changes:
+            {"algorithm": "pbkdf2_sha256", "iterations": 260000, "salt": "<hex>", "hash": "<hex>"}
+            
         :param password: The password to hash
         :type password: SecretStr
-        :return: The salt used to hash the password along with the hashed password
-        :rtype: Tuple[str, str]
+        :param algorithm: The algorithm to use, defaults to the current policy
+        :type algorithm: str | None
+        :param iterations: The number of iterations to use, defaults to the current policy
+        :type iterations: int | None
+        :return: The password hash record
+        :rtype: Dict[str, Any]
         """
         
+        if algorithm is None or iterations is None:
+            policy_algorithm, policy_iterations = UserUtils.get_password_hash_policy()
+            algorithm = algorithm or policy_algorithm
+            iterations = iterations or policy_iterations
+        
         # Generate a random salt
         salt = os.urandom(16)
-        iterations = 260000
         
         # Hash the password and the salt
         hashed_password_bytes = hashlib.pbkdf2_hmac(
-            'sha256',
+            UserUtils.PASSWORD_HASH_ALGORITHMS[algorithm],
             password.get_secret_value().encode('utf-8'),
             salt,
             iterations,
             dklen=32
         )
         
-        return binascii.hexlify(salt).decode('ascii'), binascii.hexlify(hashed_password_bytes).decode('ascii')
+        return {
+            "algorithm": algorithm,
+            "iterations": iterations,
+            "salt": binascii.hexlify(salt).decode('ascii'),
+            "hash": binascii.hexlify(hashed_password_bytes).decode('ascii'),
+        }
 
     @staticmethod          
-    def verify_password(unhashed_password: SecretStr, hashed_password: str, hashed_password_salt: str) -> bool:
+    def verify_password(unhashed_password: SecretStr, password_record: Dict[str, Any]) -> bool:
         """
-        Compares an unhashed password with a hashed password to see if they are the same.
+        Compares an unhashed password with a password hash record to see if they are the same.
+        The password is hashed with the parameters stored in the record, not the current policy.
         :param unhashed_password: The password to test
         :type unhashed_password: SecretStr
-        :param hashed_password: The password to compare against the unhashed password
-        :type hashed_password: str
-        :param hashed_password_salt: The password salt that was used on the original hashed password
-        :type hashed_password_salt: str
+        :param password_record: The password hash record to compare against, see get_password_record
+        :type password_record: Dict[str, Any]
         :return: True if and only if the unhashed_password is the same has the hashed password
         :rtype: bool
         """
-        iterations = 260000
-        salt_bytes = binascii.unhexlify(hashed_password_salt)
+        
+        digest = UserUtils.PASSWORD_HASH_ALGORITHMS.get(password_record["algorithm"])
+        if digest is None:
+            return False
         
         # Hash the provided password with the stored salt
         new_hashed_password = hashlib.pbkdf2_hmac(
-            'sha256',
+            digest,
             unhashed_password.get_secret_value().encode('utf-8'),
-            salt_bytes,
-            iterations,
+            binascii.unhexlify(password_record["salt"]),
+            password_record["iterations"],
             dklen=32
         )
         
         # Compare the generated hash with the stored hash
-        return hmac.compare_digest(binascii.hexlify(new_hashed_password).decode('ascii'), hashed_password)
+        return hmac.compare_digest(binascii.hexlify(new_hashed_password).decode('ascii'), password_record["hash"])
+        
+    @staticmethod
+    def get_password_record(user: Dict[Any, Any]) -> Dict[str, Any] | None:
+        """
+        Get the password hash record of a user. Users created before hash records
+        stored the hash and salt as separate strings, those are converted to a record.
+        
+        :param user: A user object
+        :type user: Dict[Any, Any]
+        :return: The password hash record or None if the user has no password (e.g Google users)
+        :rtype: Dict[str, Any] | None
+        """
+        
+        password = user.get("password")
+        if isinstance(password, dict):
+            return password
+        if isinstance(password, str) and user.get("salt"):
+            return {
+                "algorithm": UserUtils.LEGACY_PASSWORD_HASH_ALGORITHM,
+                "iterations": UserUtils.LEGACY_PASSWORD_HASH_ITERATIONS,
+                "salt": user["salt"],
+                "hash": password,
+            }
+        return None
+        
+    @staticmethod
+    def needs_rehash(password_record: Dict[str, Any]) -> bool:
+        """
+        Check if a password hash record was created with a different policy than the current one.
+        
+        :param password_record: The password hash record
+        :type password_record: Dict[str, Any]
+        :return: True if the password should be hashed again with the current policy
+        :rtype: bool
+        """
+        
+        algorithm, iterations = UserUtils.get_password_hash_policy()
+        return password_record["algorithm"] != algorithm or password_record["iterations"] != iterations
+ 
+    @staticmethod
+    def build_standard_user(user_registration: UserRegistration, password_record: Dict[str, Any]) -> Dict[Any, Any]:
+        """
+        Build the object of a new standard user.
+    
+        :param user_registration: The registration of the user
+        :type user_registration: UserRegistration
+        :param password_record: The password hash record of the user, see hash_password
+        :type password_record: Dict[str, Any]
+        :return: The object representing the user
+        :rtype: Dict[Any, Any]
+        """
+        
+        return {
+            "user_id": str(uuid.uuid4()),
+            "username": user_registration.username,
+            "email": user_registration.email,
+            "password": password_record,
+        }
+        
+    @staticmethod
+    def build_google_user(user_info: Dict[Any, Any]) -> Dict[Any, Any]:
+        """
+        Build the object of a new google user.
+    
+        :param user_info: The user information given by Google
+        :type user_info: Dict[Any, Any]
+        :return: The object representing the user
+        :rtype: Dict[Any, Any]
+        """
+        
+        return {
+            "user_id": str(uuid.uuid4()),
+            "username": user_info["email"],
+            "email": user_info["email"],
+            "google_id": user_info["id"]
+        }
+ 
+    @staticmethod
+    def get_taken_field(error: DuplicateKeyError) -> str:
+        """
+        Get the user field that made an insert violate a unique index.
+        The users collection has unique indexes on user_id, email, username and google_id (see database/config.json).
+    
+        :param error: The error raised by the insert
+        :type error: pymongo.errors.DuplicateKeyError
+        :return: The name of the field, "user" if it cannot be found
+        :rtype: str
+        """
+        
+        details = error.details or {}
+        for field in details.get("keyPattern") or details.get("keyValue") or {}:
+            return field
+        
+        # Older servers only name the index in the message, e.g. "index: email_1 dup key"
+        match = re.search(r"index: (\w+?)_-?1\b", str(error))
+        return match.group(1) if match else "user"
  
     @staticmethod              
     def create_standard_user(user_registration: UserRegistration, user_collection: Collection) -> str:
@@ -70,21 +218,17 @@ class UserUtils:
         Create a new standard user.
     
         :raises ValueError if one of the expected env variables are not set
+        :raises UserTakenError if the email or username belongs to another user
         :return: The UUID of the user
         """
         
-        salt, hashed_password = UserUtils.hash_password(user_registration.password)
-        user_id = str(uuid.uuid4())
-        user_object = {
-            "user_id": user_id,
-            "username": user_registration.username,
-            "email": user_registration.email,
-            "password": hashed_password,
-            "salt": salt,
-        }
-        
-        user_collection.insert_one(user_object)
-        return user_id
+        password_record = UserUtils.hash_password(user_registration.password)
+        user_object = UserUtils.build_standard_user(user_registration, password_record)
+        try:
+            user_collection.insert_one(user_object)
+        except DuplicateKeyError as e:
+            raise UserTakenError(UserUtils.get_taken_field(e)) from e
+        return user_object["user_id"]
         
     @staticmethod
     def create_google_user(user_info: Dict[Any, Any], user_collection: Collection) -> str:
@@ -92,19 +236,16 @@ class UserUtils:
         Create a new google user. This user can only be logged in by Google.
     
         :raises ValueError if one of the expected env variables are not set
+        :raises UserTakenError if the email or google id belongs to another user
         :return: The UUID of the user
         """
         
-        user_id = str(uuid.uuid4())
-        user_object = {
-            "user_id": user_id,
-            "username": user_info["email"],
-            "email": user_info["email"],
-            "google_id": user_info["id"]
-        }
-        
-        user_collection.insert_one(user_object)
-        return user_id
+        user_object = UserUtils.build_google_user(user_info)
+        try:
+            user_collection.insert_one(user_object)
+        except DuplicateKeyError as e:
+            raise UserTakenError(UserUtils.get_taken_field(e)) from e
+        return user_object["user_id"]
  
     @staticmethod          
     def get_user_from_email(email: str, user_collection: Collection) -> Dict[Any, Any] | None:
@@ -185,4 +326,142 @@ class UserUtils:
         :rtype: Dict[Any, Any] | None
         """    
      
-        return user_collection.find_one({"google_id": google_id})
\ No newline at end of file
+        return user_collection.find_one({"google_id": google_id})
+
+
+class AsyncUserUtils:
+    """
+    A class with helpful methods to interact with a user through an async MongoDB collection.
+    Methods that do not touch the database live on UserUtils.
+    """
+    
+    @staticmethod
+    async def create_standard_user(user_registration: UserRegistration, password_record: Dict[str, Any], user_collection: AsyncCollection) -> str:
+        """
+        Create a new standard user. The password is hashed by the caller (see HashingUtils)
+        so that hashing does not block the event loop.
+        Uniqueness is enforced by the unique indexes of the collection, in the same round trip as the insert.
+    
+        :raises UserTakenError if the email or username belongs to another user
+        :return: The UUID of the user
+        """
+        
+        user_object = UserUtils.build_standard_user(user_registration, password_record)
+        try:
+            await user_collection.insert_one(user_object)
+        except DuplicateKeyError as e:
+            raise UserTakenError(UserUtils.get_taken_field(e)) from e
+        return user_object["user_id"]
+        
+    @staticmethod
+    async def create_google_user(user_info: Dict[Any, Any], user_collection: AsyncCollection) -> str:
+        """
+        Create a new google user. This user can only be logged in by Google.
+    
+        :raises UserTakenError if the email or google id belongs to another user
+        :return: The UUID of the user
+        """
+        
+        user_object = UserUtils.build_google_user(user_info)
+        try:
+            await user_collection.insert_one(user_object)
+        except DuplicateKeyError as e:
+            raise UserTakenError(UserUtils.get_taken_field(e)) from e
+        return user_object["user_id"]
+        
+    @staticmethod
+    async def get_user_from_email(email: str, user_collection: AsyncCollection) -> Dict[Any, Any] | None:
+        """
+        Get user from a given email. If the user does not exist, None is return.
+    
+        :param email: The email of a possible user
+        :type email: str
+        :param user_collection: A Collection of users
+        :type user_collection: pymongo.asynchronous.collection.AsyncCollection
+        :return: The object representing the user
+        :rtype: Dict[Any, Any] | None
+        """
+        
+        return await user_collection.find_one({"email": email})
+        
+    @staticmethod
+    async def get_user_from_user_id(user_id: str, user_collection: AsyncCollection) -> Dict[Any, Any] | None:
+        """
+        Get user from a given user id. If the user does not exist, None is return.
+    
+        :param user_id: The user id of a possible user
+        :type user_id: str
+        :param user_collection: A Collection of users
+        :type user_collection: pymongo.asynchronous.collection.AsyncCollection
+        :return: The object representing the user
+        :rtype: Dict[Any, Any] | None
+        """
+        
+        return await user_collection.find_one({"user_id": user_id})
+        
+    @staticmethod
+    async def is_email_taken(email: str, user_collection: AsyncCollection) -> bool:
+        """
+        Check if the email belongs to a user.
+    
+        :param email: The email of a possible user
+        :type email: str
+        :param user_collection: A Collection of users
+        :type user_collection: pymongo.asynchronous.collection.AsyncCollection
+        :return: True if the email is used by a user.
+        :rtype: bool
+        """
+        
+        return await user_collection.find_one({"email": email}, {"_id": 1}) is not None
+        
+    @staticmethod
+    async def is_username_taken(username: str, user_collection: AsyncCollection) -> bool:
+        """
+        Check if the username belongs to a user.
+    
+        :param username: The username of a possible user
+        :type username: str
+        :param user_collection: A Collection of users
+        :type user_collection: pymongo.asynchronous.collection.AsyncCollection
+        :return: True if the username is used by a user.
+        :rtype: bool
+        """
+        
+        return await user_collection.find_one({"username": username}, {"_id": 1}) is not None
+        
+    @staticmethod
+    async def get_user_from_google_id(google_id: str, user_collection: AsyncCollection) -> Dict[Any, Any] | None:
+        """
+        Get user from a given google id. If the user does not exist, None is return.
+    
+        :param google_id: The google id of a possible user
+        :type google_id: str
+        :param user_collection: A Collection of users
+        :type user_collection: pymongo.asynchronous.collection.AsyncCollection
+        :return: The object representing the user
+        :rtype: Dict[Any, Any] | None
+        """
+        
+        return await user_collection.find_one({"google_id": google_id})
+        
+    @staticmethod
+    async def update_password_record(user: Dict[Any, Any], password_record: Dict[str, Any], user_collection: AsyncCollection) -> bool:
+        """
+        Replace the password hash record of a user. The update only applies if the stored
+        password is still the one in the given user object, so a concurrent password change is never overwritten.
+    
+        :param user: The user object the new record was computed from
+        :type user: Dict[Any, Any]
+        :param password_record: The new password hash record
+        :type password_record: Dict[str, Any]
+        :param user_collection: A Collection of users
+        :type user_collection: pymongo.asynchronous.collection.AsyncCollection
+        :return: True if the record was replaced
+        :rtype: bool
+        """
+        
+        result = await user_collection.update_one(
+            {"user_id": user["user_id"], "password": user["password"]},
+            {"$set": {"password": password_record}, "$unset": {"salt": ""}}
+        )
+        return result.modified_count == 1
@@ -44,6 +44,7 @@ for _, name, _ in pkgutil.iter_modules(ns_pkg.__path__, ns_pkg.__name__ + "."):
     "/v1/auth/register",
     responses={
         200: {"model": UserCreated, "description": "User created successfully"},
+        503: {"description": "The server is too busy to hash the password, retry later."},
     },
     tags=["Authentication"],
     summary="Register a new user",
@@ -62,6 +63,7 @@ async def register_new_user(
     "/v1/auth/login",
     responses={
         200: {"model": AuthToken, "description": "Successful authentication returns access and a session token."},
+        503: {"description": "The server is too busy to verify the password, retry later."},
     },
     tags=["Authentication"],
     summary="Login with email/password",
@@ -99,6 +101,7 @@ async def authenticate_with_google_web(
         200: {"model": AuthToken, "description": "Authorize the user"},
         400: {"description": "Invalid code or state mismatch."},
         401: {"description": "Authentication failed with Google."},
+        503: {"description": "Google could not be reached, retry later."},
     },
     tags=["Authentication"],
     summary="Google OAuth2 Callback",
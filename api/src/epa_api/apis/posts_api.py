@@ -0,0 +1,87 @@
+# coding: utf-8
+
+from typing import Dict, List  # noqa: F401
+import importlib
+import pkgutil
+
+from epa_api.apis.posts_api_base import BasePostsApi
+import epa_api.api_implementation
+
+from fastapi import (  # noqa: F401
+    APIRouter,
+    Body,
+    Cookie,
+    Depends,
+    Form,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Response,
+    Security,
+    status,
+)
+
+from epa_api.models.extra_models import TokenModel  # noqa: F401
+from pydantic import Field, StrictStr
+from typing import Any, Literal, Optional
+from typing_extensions import Annotated
+from epa_api.models.post_page import PostPage
+from epa_api.security_api import get_token_BearerAuth
+
+router = APIRouter()
+
+ns_pkg = epa_api.api_implementation
+for _, name, _ in pkgutil.iter_modules(ns_pkg.__path__, ns_pkg.__name__ + "."):
+    importlib.import_module(name)
+
+
+@router.get(
+    "/v1/posts",
+    responses={
+        200: {"model": PostPage, "description": "A page of posts"},
+        400: {"description": "Invalid cursor."},
+    },
+    tags=["Posts"],
+    summary="List recent posts",
+    response_model_by_alias=True,
+)
+async def list_posts(
+    category: Annotated[Optional[StrictStr], Field(description="Category of the posts.")] = Query(None, description="Category of the posts.", alias="category"),
+    limit: Annotated[Optional[Annotated[int, Field(le=100, ge=1)]], Field(description="Maximum number of posts in the page.")] = Query(20, description="Maximum number of posts in the page.", alias="limit", ge=1, le=100),
+    cursor: Annotated[Optional[StrictStr], Field(description="The next_cursor of the previous page.")] = Query(None, description="The next_cursor of the previous page.", alias="cursor"),
+    token_BearerAuth: TokenModel = Security(
+        get_token_BearerAuth
+    ),
+) -> PostPage:
+    """Returns the most recent posts, optionally of one category. Pages hold at most limit posts, the next page is requested with the next_cursor of the previous one."""
+    if not BasePostsApi.subclasses:
+        raise HTTPException(status_code=500, detail="Not implemented")
+    return await BasePostsApi.subclasses[0]().list_posts(category, limit, cursor)
+
+
+@router.get(
+    "/v1/posts/nearby",
+    responses={
+        200: {"model": PostPage, "description": "A page of nearby posts"},
+        400: {"description": "Invalid cursor."},
+    },
+    tags=["Posts"],
+    summary="List nearby posts",
+    response_model_by_alias=True,
+)
+async def get_nearby_posts(
+    lat: Annotated[float, Field(le=90, ge=-90, description="Latitude of the location.")] = Query(..., description="Latitude of the location.", alias="lat", le=90, ge=-90),
+    lng: Annotated[float, Field(le=180, ge=-180, description="Longitude of the location.")] = Query(..., description="Longitude of the location.", alias="lng", le=180, ge=-180),
+    radius: Annotated[Optional[Annotated[int, Field(le=100000, ge=1)]], Field(description="Search radius in meters.")] = Query(5000, description="Search radius in meters.", alias="radius", ge=1, le=100000),
+    sort: Annotated[Optional[Literal["distance", "recent"]], Field(description="Order of the posts, nearest or most recent first.")] = Query("distance", description="Order of the posts, nearest or most recent first.", alias="sort"),
+    limit: Annotated[Optional[Annotated[int, Field(le=100, ge=1)]], Field(description="Maximum number of posts in the page.")] = Query(20, description="Maximum number of posts in the page.", alias="limit", ge=1, le=100),
+    cursor: Annotated[Optional[StrictStr], Field(description="The next_cursor of the previous page.")] = Query(None, description="The next_cursor of the previous page.", alias="cursor"),
+    token_BearerAuth: TokenModel = Security(
+        get_token_BearerAuth
+    ),
+) -> PostPage:
+    """Returns the posts within radius meters of a location, sorted by distance or by recency. Pages hold at most limit posts, the next page is requested with the next_cursor of the previous one."""
+    if not BasePostsApi.subclasses:
+        raise HTTPException(status_code=500, detail="Not implemented")
+    return await BasePostsApi.subclasses[0]().get_nearby_posts(lat, lng, radius, sort, limit, cursor)
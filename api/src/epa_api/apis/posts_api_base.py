@@ -0,0 +1,37 @@
+# coding: utf-8
+
+from typing import ClassVar, Dict, List, Tuple  # noqa: F401
+
+from pydantic import Field, StrictStr
+from typing import Any, Literal, Optional
+from typing_extensions import Annotated
+from epa_api.models.post_page import PostPage
+from epa_api.security_api import get_token_BearerAuth
+
+class BasePostsApi:
+    subclasses: ClassVar[Tuple] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        BasePostsApi.subclasses = BasePostsApi.subclasses + (cls,)
+    async def list_posts(
+        self,
+        category: Annotated[Optional[StrictStr], Field(description="Category of the posts.")],
+        limit: Annotated[Optional[Annotated[int, Field(le=100, ge=1)]], Field(description="Maximum number of posts in the page.")],
+        cursor: Annotated[Optional[StrictStr], Field(description="The next_cursor of the previous page.")],
+    ) -> PostPage:
+        """Returns the most recent posts, optionally of one category. Pages hold at most limit posts, the next page is requested with the next_cursor of the previous one."""
+        ...
+
+
+    async def get_nearby_posts(
+        self,
+        lat: Annotated[float, Field(le=90, ge=-90, description="Latitude of the location.")],
+        lng: Annotated[float, Field(le=180, ge=-180, description="Longitude of the location.")],
+        radius: Annotated[Optional[Annotated[int, Field(le=100000, ge=1)]], Field(description="Search radius in meters.")],
+        sort: Annotated[Optional[Literal["distance", "recent"]], Field(description="Order of the posts, nearest or most recent first.")],
+        limit: Annotated[Optional[Annotated[int, Field(le=100, ge=1)]], Field(description="Maximum number of posts in the page.")],
+        cursor: Annotated[Optional[StrictStr], Field(description="The next_cursor of the previous page.")],
+    ) -> PostPage:
+        """Returns the posts within radius meters of a location, sorted by distance or by recency. Pages hold at most limit posts, the next page is requested with the next_cursor of the previous one."""
+        ...
@@ -23,7 +23,9 @@ from fastapi import (  # noqa: F401
 )
 
 from epa_api.models.extra_models import TokenModel  # noqa: F401
+from epa_api.models.metrics import Metrics
 from epa_api.models.status import Status
+from epa_api.security_api import get_token_BearerAuth
 
 
 router = APIRouter()
@@ -47,3 +49,24 @@ async def get_api_status(
     if not BaseSystemApi.subclasses:
         raise HTTPException(status_code=500, detail="Not implemented")
     return await BaseSystemApi.subclasses[0]().get_api_status()
+
+
+@router.get(
+    "/v1/metrics",
+    responses={
+        200: {"model": Metrics, "description": "Current API metrics"},
+        401: {"description": "The token is missing, invalid or revoked."},
+    },
+    tags=["System"],
+    summary="Get API metrics",
+    response_model_by_alias=True,
+)
+async def get_api_metrics(
+    token_BearerAuth: TokenModel = Security(
+        get_token_BearerAuth
+    ),
+) -> Metrics:
+    """Returns runtime metrics of the API such as the password hashing queue depth and latency, and the timeline cache hit ratio."""
+    if not BaseSystemApi.subclasses:
+        raise HTTPException(status_code=500, detail="Not implemented")
+    return await BaseSystemApi.subclasses[0]().get_api_metrics()
@@ -2,7 +2,9 @@
 
 from typing import ClassVar, Dict, List, Tuple  # noqa: F401
 
+from epa_api.models.metrics import Metrics
 from epa_api.models.status import Status
+from epa_api.security_api import get_token_BearerAuth
 
 
 class BaseSystemApi:
@@ -15,3 +17,10 @@ class BaseSystemApi:
         self,
     ) -> Status:
         ...
+
+
+    async def get_api_metrics(
+        self,
+    ) -> Metrics:
+        """Returns runtime metrics of the API such as the password hashing queue depth and latency, and the timeline cache hit ratio."""
+        ...
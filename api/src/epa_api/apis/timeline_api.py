@@ -0,0 +1,60 @@
+# coding: utf-8
+
+from typing import Dict, List  # noqa: F401
+import importlib
+import pkgutil
+
+from epa_api.apis.timeline_api_base import BaseTimelineApi
+import epa_api.api_implementation
+
+from fastapi import (  # noqa: F401
+    APIRouter,
+    Body,
+    Cookie,
+    Depends,
+    Form,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Response,
+    Security,
+    status,
+)
+
+from epa_api.models.extra_models import TokenModel  # noqa: F401
+from pydantic import Field, StrictStr
+from typing import Any, Optional
+from typing_extensions import Annotated
+from epa_api.models.post_page import PostPage
+from epa_api.security_api import get_token_BearerAuth
+
+router = APIRouter()
+
+ns_pkg = epa_api.api_implementation
+for _, name, _ in pkgutil.iter_modules(ns_pkg.__path__, ns_pkg.__name__ + "."):
+    importlib.import_module(name)
+
+
+@router.get(
+    "/v1/timeline",
+    responses={
+        200: {"model": PostPage, "description": "A page of the timeline of the user"},
+        400: {"description": "Invalid cursor."},
+        401: {"description": "The user of the token is unknown."},
+    },
+    tags=["Timeline"],
+    summary="Get the timeline of the user",
+    response_model_by_alias=True,
+)
+async def get_user_timeline(
+    limit: Annotated[Optional[Annotated[int, Field(le=100, ge=1)]], Field(description="Maximum number of posts in the page.")] = Query(20, description="Maximum number of posts in the page.", alias="limit", ge=1, le=100),
+    cursor: Annotated[Optional[StrictStr], Field(description="The next_cursor of the previous page.")] = Query(None, description="The next_cursor of the previous page.", alias="cursor"),
+    token_BearerAuth: TokenModel = Security(
+        get_token_BearerAuth
+    ),
+) -> PostPage:
+    """Returns the most recent posts of the categories and tags the user subscribes to. Pages hold at most limit posts, the next page is requested with the next_cursor of the previous one."""
+    if not BaseTimelineApi.subclasses:
+        raise HTTPException(status_code=500, detail="Not implemented")
+    return await BaseTimelineApi.subclasses[0]().get_user_timeline(limit, cursor)
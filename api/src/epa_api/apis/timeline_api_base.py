@@ -0,0 +1,23 @@
+# coding: utf-8
+
+from typing import ClassVar, Dict, List, Tuple  # noqa: F401
+
+from pydantic import Field, StrictStr
+from typing import Any, Optional
+from typing_extensions import Annotated
+from epa_api.models.post_page import PostPage
+from epa_api.security_api import get_token_BearerAuth
+
+class BaseTimelineApi:
+    subclasses: ClassVar[Tuple] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        BaseTimelineApi.subclasses = BaseTimelineApi.subclasses + (cls,)
+    async def get_user_timeline(
+        self,
+        limit: Annotated[Optional[Annotated[int, Field(le=100, ge=1)]], Field(description="Maximum number of posts in the page.")],
+        cursor: Annotated[Optional[StrictStr], Field(description="The next_cursor of the previous page.")],
+    ) -> PostPage:
+        """Returns the most recent posts of the categories and tags the user subscribes to. Pages hold at most limit posts, the next page is requested with the next_cursor of the previous one."""
+        ...
@@ -12,37 +12,59 @@
 """  # noqa: E501
 
 
-from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 
 from epa_api.apis.authentication_api import router as AuthenticationApiRouter
+from epa_api.apis.posts_api import router as PostsApiRouter
 from epa_api.apis.system_api import router as SystemApiRouter
-from epa_api.api_implementation.utils.context import current_token_data
-from epa_api.models.extra_models import TokenModel
+from epa_api.apis.timeline_api import router as TimelineApiRouter
+from epa_api.api_implementation.utils.context import AuthContextMiddleware
+from epa_api.api_implementation.utils.mongo import AsyncMongoUtils
+from epa_api.api_implementation.utils.hashing import HashingUtils
+from epa_api.api_implementation.utils.google import AsyncGoogleUtils
+from epa_api.api_implementation.utils.token import TokenUtils
+from epa_api.api_implementation.utils.revocation import RevocationUtils
+from epa_api.api_implementation.utils.settings import SettingsUtils
+from epa_api.api_implementation.utils.timeline import AsyncTimelineUtils
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Settings are read and validated once, a misconfiguration stops the API from starting
+    SettingsUtils.load_settings()
+    TokenUtils.load_jwt_secret()
+    # One pooled MongoDB client is shared by every request for the life of the process
+    AsyncMongoUtils.open_pooled_client()
+    # Revoked tokens are mirrored in memory so that token checks never wait on the database,
+    # they are loaded before the first request and the API does not start if they cannot be
+    await RevocationUtils.start_refresher(AsyncMongoUtils.get_revoked_tokens_collection(AsyncMongoUtils.get_pooled_database()))
+    # Password hashing runs in its own process pool so that it never blocks the event loop
+    HashingUtils.open_executor()
+    # Calls to Google share one pooled HTTP client
+    AsyncGoogleUtils.open_client()
+    # User timelines are cached in Redis, or in process when EPA_REDIS_URL is not set
+    AsyncTimelineUtils.open_client()
+    yield
+    await AsyncTimelineUtils.close_client()
+    await AsyncGoogleUtils.close_client()
+    HashingUtils.shutdown_executor()
+    await RevocationUtils.stop_refresher()
+    await AsyncMongoUtils.close_pooled_client()
 
 app = FastAPI(
     title="EPA (Event Posting App) API",
     description="API for a mobile safety application that allows users to post and subscribe to local safety concerns. ",
     version="1.0.0",
+    lifespan=lifespan,
+    # Responses of every router are rendered by orjson instead of the standard library json
+    default_response_class=ORJSONResponse,
 )
 
-@app.middleware("http")
-async def persist_auth_context(request: Request, call_next):
-    
-    print("tmp")
-    auth_header = request.headers.get("Authorization")
-    
-    if auth_header and auth_header.lower().startswith("bearer "):
-        try:
-            token_str = auth_header.split(" ")[1]
-            token_model = TokenModel(sub=token_str)
-            current_token_data.set(token_model)
-        except Exception:
-             # Let the Security dependency handle formal errors
-            pass
-            
-    # Proceed to the Router -> Security Dependency -> Implementation
-    response = await call_next(request)
-    return response
-    
+# Verifies the bearer token of each request once and stores it in the request context
+app.add_middleware(AuthContextMiddleware)
+
 app.include_router(AuthenticationApiRouter)
+app.include_router(PostsApiRouter)
 app.include_router(SystemApiRouter)
+app.include_router(TimelineApiRouter)
@@ -1,8 +1,10 @@
 # coding: utf-8
 
-from pydantic import BaseModel
+from typing import Any, Dict
+from pydantic import BaseModel, Field
 
 class TokenModel(BaseModel):
     """Defines a token model."""
 
     sub: str
+    claims: Dict[str, Any] = Field(default_factory=dict)
@@ -0,0 +1,104 @@
+# coding: utf-8
+
+"""
+    EPA (Event Posting App) API
+
+    API for a mobile safety application that allows users to post and subscribe to local safety concerns. 
+
+    The version of the OpenAPI document: 1.0.0
+    Generated by OpenAPI Generator (https://openapi-generator.tech)
+
+    Do not edit the class manually.
+"""  # noqa: E501
+
+
+from __future__ import annotations
+import pprint
+import re  # noqa: F401
+
+
+
+
+from pydantic import BaseModel, ConfigDict, StrictFloat, StrictInt
+from typing import Any, ClassVar, Dict, List, Optional, Union
+try:
+    from typing import Self
+except ImportError:
+    from typing_extensions import Self
+
+class HashingMetrics(BaseModel):
+    """
+    HashingMetrics
+    """ # noqa: E501
+    workers: Optional[StrictInt] = None
+    max_queue: Optional[StrictInt] = None
+    in_flight: Optional[StrictInt] = None
+    queue_depth: Optional[StrictInt] = None
+    completed: Optional[StrictInt] = None
+    rejected: Optional[StrictInt] = None
+    latency_avg_ms: Optional[Union[StrictFloat, StrictInt]] = None
+    latency_p95_ms: Optional[Union[StrictFloat, StrictInt]] = None
+    latency_max_ms: Optional[Union[StrictFloat, StrictInt]] = None
+    __properties: ClassVar[List[str]] = ["workers", "max_queue", "in_flight", "queue_depth", "completed", "rejected", "latency_avg_ms", "latency_p95_ms", "latency_max_ms"]
+
+    model_config = {
+        "populate_by_name": True,
+        "validate_assignment": True,
+        "protected_namespaces": (),
+    }
+
+
+    def to_str(self) -> str:
+        """Returns the string representation of the model using alias"""
+        return pprint.pformat(self.model_dump(by_alias=True))
+
+    def to_json(self) -> str:
+        """Returns the JSON representation of the model using alias"""
+        return self.model_dump_json(by_alias=True, exclude_none=True)
+
+    @classmethod
+    def from_json(cls, json_str: str) -> Self:
+        """Create an instance of HashingMetrics from a JSON string"""
+        return cls.model_validate_json(json_str)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the dictionary representation of the model using alias.
+
+        This has the following differences from calling pydantic's
+        `self.model_dump(by_alias=True)`:
+
+        * `None` is only added to the output dict for nullable fields that
+          were set at model initialization. Other fields with value `None`
+          are ignored.
+        """
+        _dict = self.model_dump(
+            by_alias=True,
+            exclude={
+            },
+            exclude_none=True,
+        )
+        return _dict
+
+    @classmethod
+    def from_dict(cls, obj: Dict) -> Self:
+        """Create an instance of HashingMetrics from a dict"""
+        if obj is None:
+            return None
+
+        if not isinstance(obj, dict):
+            return cls.model_validate(obj)
+
+        _obj = cls.model_validate({
+            "workers": obj.get("workers"),
+            "max_queue": obj.get("max_queue"),
+            "in_flight": obj.get("in_flight"),
+            "queue_depth": obj.get("queue_depth"),
+            "completed": obj.get("completed"),
+            "rejected": obj.get("rejected"),
+            "latency_avg_ms": obj.get("latency_avg_ms"),
+            "latency_p95_ms": obj.get("latency_p95_ms"),
+            "latency_max_ms": obj.get("latency_max_ms")
+        })
+        return _obj
+
+
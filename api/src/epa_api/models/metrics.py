@@ -0,0 +1,98 @@
+# coding: utf-8
+
+"""
+    EPA (Event Posting App) API
+
+    API for a mobile safety application that allows users to post and subscribe to local safety concerns. 
+
+    The version of the OpenAPI document: 1.0.0
+    Generated by OpenAPI Generator (https://openapi-generator.tech)
+
+    Do not edit the class manually.
+"""  # noqa: E501
+
+
+from __future__ import annotations
+import pprint
+import re  # noqa: F401
+
+
+
+
+from pydantic import BaseModel, ConfigDict
+from typing import Any, ClassVar, Dict, List, Optional
+from epa_api.models.hashing_metrics import HashingMetrics
+from epa_api.models.timeline_cache_metrics import TimelineCacheMetrics
+try:
+    from typing import Self
+except ImportError:
+    from typing_extensions import Self
+
+class Metrics(BaseModel):
+    """
+    Metrics
+    """ # noqa: E501
+    password_hashing: Optional[HashingMetrics] = None
+    timeline_cache: Optional[TimelineCacheMetrics] = None
+    __properties: ClassVar[List[str]] = ["password_hashing", "timeline_cache"]
+
+    model_config = {
+        "populate_by_name": True,
+        "validate_assignment": True,
+        "protected_namespaces": (),
+    }
+
+
+    def to_str(self) -> str:
+        """Returns the string representation of the model using alias"""
+        return pprint.pformat(self.model_dump(by_alias=True))
+
+    def to_json(self) -> str:
+        """Returns the JSON representation of the model using alias"""
+        return self.model_dump_json(by_alias=True, exclude_none=True)
+
+    @classmethod
+    def from_json(cls, json_str: str) -> Self:
+        """Create an instance of Metrics from a JSON string"""
+        return cls.model_validate_json(json_str)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the dictionary representation of the model using alias.
+
+        This has the following differences from calling pydantic's
+        `self.model_dump(by_alias=True)`:
+
+        * `None` is only added to the output dict for nullable fields that
+          were set at model initialization. Other fields with value `None`
+          are ignored.
+        """
+        _dict = self.model_dump(
+            by_alias=True,
+            exclude={
+            },
+            exclude_none=True,
+        )
+        # override the default output from pydantic by calling `to_dict()` of password_hashing
+        if self.password_hashing:
+            _dict['password_hashing'] = self.password_hashing.to_dict()
+        # override the default output from pydantic by calling `to_dict()` of timeline_cache
+        if self.timeline_cache:
+            _dict['timeline_cache'] = self.timeline_cache.to_dict()
+        return _dict
+
+    @classmethod
+    def from_dict(cls, obj: Dict) -> Self:
+        """Create an instance of Metrics from a dict"""
+        if obj is None:
+            return None
+
+        if not isinstance(obj, dict):
+            return cls.model_validate(obj)
+
+        _obj = cls.model_validate({
+            "password_hashing": HashingMetrics.from_dict(obj.get("password_hashing")) if obj.get("password_hashing") is not None else None,
+            "timeline_cache": TimelineCacheMetrics.from_dict(obj.get("timeline_cache")) if obj.get("timeline_cache") is not None else None
+        })
+        return _obj
+
+
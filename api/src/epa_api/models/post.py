@@ -0,0 +1,108 @@
+# coding: utf-8
+
+"""
+    EPA (Event Posting App) API
+
+    API for a mobile safety application that allows users to post and subscribe to local safety concerns. 
+
+    The version of the OpenAPI document: 1.0.0
+    Generated by OpenAPI Generator (https://openapi-generator.tech)
+
+    Do not edit the class manually.
+"""  # noqa: E501
+
+
+from __future__ import annotations
+import pprint
+import re  # noqa: F401
+
+
+
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field, StrictFloat, StrictInt, StrictStr
+from typing import Any, ClassVar, Dict, List, Optional, Union
+from epa_api.models.location import Location
+try:
+    from typing import Self
+except ImportError:
+    from typing_extensions import Self
+
+class Post(BaseModel):
+    """
+    Post
+    """ # noqa: E501
+    post_id: Optional[StrictStr] = None
+    user_id: Optional[StrictStr] = None
+    title: Optional[StrictStr] = None
+    description: Optional[StrictStr] = None
+    category: Optional[StrictStr] = None
+    tags: Optional[List[StrictStr]] = None
+    location: Optional[Location] = None
+    created_at: Optional[datetime] = None
+    distance_m: Optional[Union[StrictFloat, StrictInt]] = Field(default=None, description="Distance to the requested location in meters.")
+    __properties: ClassVar[List[str]] = ["post_id", "user_id", "title", "description", "category", "tags", "location", "created_at", "distance_m"]
+
+    model_config = {
+        "populate_by_name": True,
+        "validate_assignment": True,
+        "protected_namespaces": (),
+    }
+
+
+    def to_str(self) -> str:
+        """Returns the string representation of the model using alias"""
+        return pprint.pformat(self.model_dump(by_alias=True))
+
+    def to_json(self) -> str:
+        """Returns the JSON representation of the model using alias"""
+        return self.model_dump_json(by_alias=True, exclude_none=True)
+
+    @classmethod
+    def from_json(cls, json_str: str) -> Self:
+        """Create an instance of Post from a JSON string"""
+        return cls.model_validate_json(json_str)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the dictionary representation of the model using alias.
+
+        This has the following differences from calling pydantic's
+        `self.model_dump(by_alias=True)`:
+
+        * `None` is only added to the output dict for nullable fields that
+          were set at model initialization. Other fields with value `None`
+          are ignored.
+        """
+        _dict = self.model_dump(
+            by_alias=True,
+            exclude={
+            },
+            exclude_none=True,
+        )
+        # override the default output from pydantic by calling `to_dict()` of location
+        if self.location:
+            _dict['location'] = self.location.to_dict()
+        return _dict
+
+    @classmethod
+    def from_dict(cls, obj: Dict) -> Self:
+        """Create an instance of Post from a dict"""
+        if obj is None:
+            return None
+
+        if not isinstance(obj, dict):
+            return cls.model_validate(obj)
+
+        _obj = cls.model_validate({
+            "post_id": obj.get("post_id"),
+            "user_id": obj.get("user_id"),
+            "title": obj.get("title"),
+            "description": obj.get("description"),
+            "category": obj.get("category"),
+            "tags": obj.get("tags"),
+            "location": Location.from_dict(obj.get("location")) if obj.get("location") is not None else None,
+            "created_at": obj.get("created_at"),
+            "distance_m": obj.get("distance_m")
+        })
+        return _obj
+
+
@@ -15,12 +15,16 @@ from fastapi.security import (  # noqa: F401
 from fastapi.security.api_key import APIKeyCookie, APIKeyHeader, APIKeyQuery  # noqa: F401
 from epa_api.models.extra_models import TokenModel
 from epa_api.api_implementation.utils.token import TokenUtils
+from epa_api.api_implementation.utils.context import current_token_data
+from epa_api.api_implementation.utils.revocation import RevocationUtils
 
 bearer_auth = HTTPBearer()
 
-def get_token_BearerAuth(credentials: HTTPAuthorizationCredentials = Depends(bearer_auth)) -> TokenModel:
+async def get_token_BearerAuth(credentials: HTTPAuthorizationCredentials = Depends(bearer_auth)) -> TokenModel:
     """
     Check and retrieve authentication information from custom bearer token.
+    The token was already verified by AuthContextMiddleware and stored in the request context,
+    the stored result is reused so that the token is decoded once per request.
 
     :param credentials Credentials provided by Authorization header
     :type credentials: HTTPAuthorizationCredentials
@@ -28,9 +32,16 @@ def get_token_BearerAuth(credentials: HTTPAuthorizationCredentials = Depends(bea
     :rtype: TokenMode
     """
 
-    if TokenUtils.is_token_valid(credentials.credentials):
-        output = TokenModel(sub=credentials.credentials)
+    output = current_token_data.get()
+    if output is not None and output.sub == credentials.credentials:
         return output
-    
-    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
+    # The middleware found no valid token in the header, or is not installed (e.g. the dependency is called directly).
+    # Signature, expiry and revocation are all checked in-process, without a database round trip
+    claims = TokenUtils.verify_token(credentials.credentials)
+    if claims is None or RevocationUtils.is_revoked(claims.get("jti")):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        
+    output = TokenModel(sub=credentials.credentials, claims=claims)
+    current_token_data.set(output)
+    return output
@@ -3,6 +3,16 @@ from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
 from epa_api.main import app as application
+from epa_api.api_implementation.utils.mongo import MongoUtils
+from epa_api.api_implementation.utils.settings import SettingsUtils
+
+
+@pytest.fixture(autouse=True)
+def settings():
+    # Settings are cached for the life of the process, each test reads its own environment
+    SettingsUtils.clear()
+    yield
+    SettingsUtils.clear()
 
 
 @pytest.fixture
@@ -15,3 +25,15 @@ def app() -> FastAPI:
 @pytest.fixture
 def client(app) -> TestClient:
     return TestClient(app)
+
+
+@pytest.fixture
+def mongo_env(monkeypatch):
+    monkeypatch.setenv("EPA_MONGODB_HOSTNAME", "localhost")
+    monkeypatch.setenv("EPA_MONGODB_PORT", "27017")
+    monkeypatch.setenv("EPA_MONGODB_USERNAME", "user")
+    monkeypatch.setenv("EPA_MONGODB_PASSWORD", "password")
+    monkeypatch.setenv("EPA_MONGODB_USER_COLLECTION", "users")
+    monkeypatch.setenv("EPA_MONGODB_SESSION_TOKEN_COLLECTION", "session_tokens")
+    yield
+    MongoUtils.close_pooled_client()
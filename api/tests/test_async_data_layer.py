@@ -0,0 +1,77 @@
+# coding: utf-8
+
+import asyncio
+
+from fastapi.exceptions import HTTPException
+
+from epa_api.api_implementation.auth import AuthAPIImplementation
+from epa_api.api_implementation.utils.mongo import AsyncMongoUtils
+from epa_api.models.login_request import LoginRequest
+
+
+class SlowCollection:
+    """An async collection whose queries take `delay` seconds without blocking the event loop."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def find_one(self, *args, **kwargs):
+        await asyncio.sleep(self.delay)
+        return None
+
+
+class SlowDatabase:
+    def __init__(self, delay: float):
+        self.collection = SlowCollection(delay)
+
+    def __getitem__(self, name: str) -> SlowCollection:
+        return self.collection
+
+
+def test_slow_queries_do_not_block_event_loop(mongo_env):
+    delay = 0.2
+    logins = 10
+    implementation = AuthAPIImplementation(db=SlowDatabase(delay))
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker_task = asyncio.create_task(ticker())
+        start = asyncio.get_running_loop().time()
+        results = await asyncio.gather(
+            *(
+                implementation.login_with_password(LoginRequest(email=f"user{i}@epa.local", password="password123456"))
+                for i in range(logins)
+            ),
+            return_exceptions=True,
+        )
+        elapsed = asyncio.get_running_loop().time() - start
+        ticker_task.cancel()
+        return results, elapsed, ticks
+
+    results, elapsed, ticks = asyncio.run(main())
+
+    assert all(isinstance(r, HTTPException) and r.status_code == 404 for r in results)
+    # The lookups overlap instead of running one after the other
+    assert elapsed < delay * 2
+    # And other tasks kept running while the lookups were in flight
+    assert ticks >= (delay / 0.01) / 2
+
+
+def test_async_pooled_client_is_shared(mongo_env):
+    async def main():
+        client = AsyncMongoUtils.open_pooled_client()
+        try:
+            assert AsyncMongoUtils.open_pooled_client() is client
+            assert AsyncMongoUtils.get_pooled_database().client is client
+        finally:
+            await AsyncMongoUtils.close_pooled_client()
+        assert AsyncMongoUtils._pooled_client is None
+
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+# coding: utf-8
+
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from epa_api.api_implementation.utils.context import current_token_data
+from epa_api.api_implementation.utils.revocation import RevocationUtils
+from epa_api.api_implementation.utils.token import TokenUtils
+
+
+@pytest.fixture(autouse=True)
+def jwt_secret(monkeypatch):
+    monkeypatch.setenv("EPA_JWT_SECRET", "secret")
+    TokenUtils.load_jwt_secret()
+    RevocationUtils.clear()
+    yield
+    RevocationUtils.clear()
+    TokenUtils._jwt_secret = None
+
+
+def test_token_is_verified_once_per_request(client: TestClient, monkeypatch):
+    token = TokenUtils.get_token({"user_id": "1", "typ": "access"}, exp_date=datetime.now() + timedelta(minutes=5))
+    verify_token = TokenUtils.verify_token
+    calls = []
+
+    def counting_verify_token(token):
+        calls.append(token)
+        return verify_token(token)
+
+    monkeypatch.setattr(TokenUtils, "verify_token", staticmethod(counting_verify_token))
+
+    # The middleware verifies the token and the BearerAuth dependency reuses it,
+    # the access token is then refused by the session renewal
+    response = client.post("/v1/auth/session", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+    assert calls == [token]
+
+    # The context does not leak out of the request
+    assert current_token_data.get() is None
+
+
+def test_invalid_tokens_are_left_to_the_dependency(client: TestClient):
+    response = client.post("/v1/auth/session", headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 401
+
+    # Public routes are not affected by the header
+    response = client.get("/v1/status", headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 200
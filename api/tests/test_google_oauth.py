@@ -0,0 +1,167 @@
+# coding: utf-8
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from epa_api.api_implementation.utils.google import AsyncGoogleUtils, GoogleAuthError, GoogleUnavailableError, GoogleUtils
+
+CLIENT_ID = "client-id"
+PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+class StubGoogle(BaseHTTPRequestHandler):
+    """A local OAuth server answering like Google's token, JWKS and userinfo endpoints."""
+
+    protocol_version = "HTTP/1.1"
+    calls = {}
+    connections = set()
+    failures = {}
+    audience = CLIENT_ID
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def handle_call(self):
+        StubGoogle.calls[self.path] = StubGoogle.calls.get(self.path, 0) + 1
+        StubGoogle.connections.add(self.client_address)
+        if StubGoogle.failures.get(self.path, 0) > 0:
+            StubGoogle.failures[self.path] -= 1
+            self.reply(503, {"error": "unavailable"})
+            return False
+        return True
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        if not self.handle_call():
+            return
+        if form["code"] != ["good-code"]:
+            self.reply(400, {"error": "invalid_grant"})
+            return
+        claims = {
+            "iss": "https://accounts.google.com",
+            "aud": StubGoogle.audience,
+            "sub": "google-user",
+            "email": "user@gmail.com",
+            "email_verified": True,
+            "exp": time.time() + 3600,
+        }
+        id_token = jwt.encode(claims, PRIVATE_KEY, algorithm="RS256", headers={"kid": "key-1"})
+        self.reply(200, {"access_token": "google-access-token", "id_token": id_token})
+
+    def do_GET(self):
+        if not self.handle_call():
+            return
+        if self.path == "/certs":
+            jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(PRIVATE_KEY.public_key()))
+            jwk.update({"kid": "key-1", "alg": "RS256", "use": "sig"})
+            self.reply(200, {"keys": [jwk]}, {"Cache-Control": "public, max-age=600"})
+        else:
+            self.reply(200, {"id": "google-user", "email": "user@gmail.com"})
+
+
+@pytest.fixture
+def google(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGoogle)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    monkeypatch.setenv("EPA_GOOGLE_WEB_CLIENT_ID", CLIENT_ID)
+    monkeypatch.setenv("EPA_GOOGLE_WEB_CLIENT_SECRET", "client-secret")
+    monkeypatch.setenv("EPA_GOOGLE_WEB_REDIRECT_URI", "http://localhost/callback")
+    monkeypatch.setattr(GoogleUtils, "get_token_endpoint", staticmethod(lambda: f"{base_url}/token"))
+    monkeypatch.setattr(GoogleUtils, "get_jwks_endpoint", staticmethod(lambda: f"{base_url}/certs"))
+    monkeypatch.setattr(GoogleUtils, "get_userinfo_endpoint", staticmethod(lambda: f"{base_url}/userinfo"))
+    StubGoogle.calls = {}
+    StubGoogle.connections = set()
+    StubGoogle.failures = {}
+    StubGoogle.audience = CLIENT_ID
+    AsyncGoogleUtils.clear_signing_keys()
+    yield StubGoogle
+    AsyncGoogleUtils.clear_signing_keys()
+    server.shutdown()
+    server.server_close()
+
+
+def run(coroutine):
+    async def with_client():
+        try:
+            return await coroutine
+        finally:
+            await AsyncGoogleUtils.close_client()
+
+    return asyncio.run(with_client())
+
+
+async def login(code="good-code"):
+    token_data = await AsyncGoogleUtils.exchange_code_for_token(code)
+    return await AsyncGoogleUtils.get_google_user_info(token_data)
+
+
+def test_logins_reuse_connection_and_signing_keys(google):
+    async def logins():
+        return [await login() for _ in range(3)]
+
+    users = run(logins())
+    assert all(user["id"] == "google-user" and user["email"] == "user@gmail.com" for user in users)
+
+    # The id token is verified locally, the keys are fetched once and userinfo is never called
+    assert google.calls == {"/token": 3, "/certs": 1}
+    # Every call went over the same kept-alive connection
+    assert len(google.connections) == 1
+
+
+def test_signing_keys_are_retried(google):
+    google.failures["/certs"] = 2
+    assert run(login())["id"] == "google-user"
+    assert google.calls["/certs"] == 3
+
+
+def test_code_exchange_is_not_retried(google):
+    google.failures["/token"] = 1
+    with pytest.raises(GoogleUnavailableError):
+        run(login())
+    assert google.calls["/token"] == 1
+
+
+def test_connection_failures_are_only_retried_by_the_transport(google, monkeypatch):
+    # The transport retries the connection, the request loop does not retry it again
+    class UnreachableClient:
+        requests = 0
+
+        async def request(self, method, url, **kwargs):
+            UnreachableClient.requests += 1
+            raise httpx.ConnectError("connection refused")
+
+    monkeypatch.setattr(AsyncGoogleUtils, "_client", UnreachableClient())
+    with pytest.raises(GoogleUnavailableError):
+        asyncio.run(AsyncGoogleUtils.request("GET", GoogleUtils.get_jwks_endpoint(), idempotent=True))
+    assert UnreachableClient.requests == 1
+
+
+def test_invalid_tokens_are_rejected(google):
+    with pytest.raises(GoogleAuthError):
+        run(login("bad-code"))
+
+    google.audience = "another-client"
+    with pytest.raises(GoogleAuthError):
+        run(login())
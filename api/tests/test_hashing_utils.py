@@ -0,0 +1,68 @@
+# coding: utf-8
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import SecretStr
+
+from epa_api.api_implementation.utils.hashing import HashingSaturatedError, HashingUtils
+from epa_api.api_implementation.utils.revocation import RevocationUtils
+from epa_api.api_implementation.utils.token import TokenUtils
+from epa_api.api_implementation.utils.user import UserUtils
+
+
+@pytest.fixture
+def executor():
+    HashingUtils.shutdown_executor()
+    yield HashingUtils.open_executor(workers=1, max_queue=1)
+    HashingUtils.shutdown_executor()
+
+
+def test_hash_and_verify_on_executor(executor):
+    async def main():
+        password_record = await HashingUtils.hash_password(SecretStr("correct horse battery"))
+        assert await HashingUtils.verify_password(SecretStr("correct horse battery"), password_record)
+        assert not await HashingUtils.verify_password(SecretStr("wrong horse battery"), password_record)
+        # The executor produces the same hashes as the inline implementation
+        assert UserUtils.verify_password(SecretStr("correct horse battery"), password_record)
+
+    asyncio.run(main())
+
+
+def test_saturated_executor_rejects(executor):
+    before = HashingUtils.get_metrics()
+
+    async def main():
+        return await asyncio.gather(
+            *(HashingUtils.hash_password(SecretStr("correct horse battery")) for _ in range(3)),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(main())
+
+    # One hash runs, one waits in the queue, the last one is rejected
+    assert sum(isinstance(r, HashingSaturatedError) for r in results) == 1
+    after = HashingUtils.get_metrics()
+    assert after["rejected"] == before["rejected"] + 1
+    assert after["completed"] == before["completed"] + 2
+    assert after["queue_depth"] == 0
+    assert after["latency_max_ms"] > 0
+
+
+def test_get_api_metrics(client: TestClient, executor, monkeypatch):
+    monkeypatch.setenv("EPA_JWT_SECRET", "secret")
+    TokenUtils.load_jwt_secret()
+    RevocationUtils.clear()
+    token = TokenUtils.get_token({"user_id": "1", "typ": "access"}, exp_date=datetime.now() + timedelta(minutes=5))
+
+    try:
+        # The queue saturation is not exposed to anonymous clients
+        assert client.get("/v1/metrics").status_code in (401, 403)
+        response = client.get("/v1/metrics", headers={"Authorization": f"Bearer {token}"})
+    finally:
+        TokenUtils._jwt_secret = None
+    assert response.status_code == 200
+    assert response.json()["password_hashing"]["workers"] == 1
+    assert response.json()["password_hashing"]["max_queue"] == 1
@@ -0,0 +1,47 @@
+# coding: utf-8
+
+import pytest
+
+from epa_api.api_implementation.utils.mongo import MongoUtils
+
+
+def test_pool_options_defaults(mongo_env):
+    options = MongoUtils.get_mongodb_pool_options()
+    assert options == {
+        "maxPoolSize": 100,
+        "minPoolSize": 0,
+        "waitQueueTimeoutMS": 2000,
+        "maxIdleTimeMS": 60000,
+    }
+
+
+def test_pool_options_from_env(mongo_env, monkeypatch):
+    monkeypatch.setenv("EPA_MONGODB_MAX_POOL_SIZE", "20")
+    monkeypatch.setenv("EPA_MONGODB_MIN_POOL_SIZE", "5")
+    monkeypatch.setenv("EPA_MONGODB_WAIT_QUEUE_TIMEOUT_MS", "250")
+    options = MongoUtils.get_mongodb_pool_options()
+    assert options["maxPoolSize"] == 20
+    assert options["minPoolSize"] == 5
+    assert options["waitQueueTimeoutMS"] == 250
+
+
+def test_pool_options_invalid(mongo_env, monkeypatch):
+    monkeypatch.setenv("EPA_MONGODB_MAX_POOL_SIZE", "lots")
+    with pytest.raises(ValueError):
+        MongoUtils.get_mongodb_pool_options()
+
+    monkeypatch.setenv("EPA_MONGODB_MAX_POOL_SIZE", "1")
+    monkeypatch.setenv("EPA_MONGODB_MIN_POOL_SIZE", "2")
+    with pytest.raises(ValueError):
+        MongoUtils.get_mongodb_pool_options()
+
+
+def test_pooled_client_is_shared(mongo_env, monkeypatch):
+    monkeypatch.setenv("EPA_MONGODB_MAX_POOL_SIZE", "7")
+    client = MongoUtils.open_pooled_client()
+    assert MongoUtils.open_pooled_client() is client
+    assert MongoUtils.get_pooled_database().client is client
+    assert client.options.pool_options.max_pool_size == 7
+
+    MongoUtils.close_pooled_client()
+    assert MongoUtils.open_pooled_client() is not client
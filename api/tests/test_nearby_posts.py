@@ -0,0 +1,212 @@
+# coding: utf-8
+
+import asyncio
+import math
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from epa_api.api_implementation.utils.mongo import AsyncMongoUtils
+from epa_api.api_implementation.utils.pagination import InvalidCursorError, PaginationUtils
+from epa_api.api_implementation.utils.post import AsyncPostUtils, PostUtils
+from epa_api.models.extra_models import TokenModel
+from epa_api.security_api import get_token_BearerAuth
+
+
+def get_distance(location, lng, lat):
+    """Haversine distance in meters, as computed by MongoDB for spherical queries."""
+    lng1, lat1 = map(math.radians, location["coordinates"])
+    lng2, lat2 = math.radians(lng), math.radians(lat)
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * PostUtils.EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def matches(document, query):
+    """Evaluates the filters built by PostUtils and PaginationUtils."""
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(matches(document, q) for q in condition):
+                return False
+        elif field == "$or":
+            if not any(matches(document, q) for q in condition):
+                return False
+        elif field == "location":
+            (lng, lat), radians = condition["$geoWithin"]["$centerSphere"]
+            if get_distance(document["location"], lng, lat) > radians * PostUtils.EARTH_RADIUS_M:
+                return False
+        elif isinstance(condition, dict) and "$in" in condition:
+            if not set(document.get(field) or []) & set(condition["$in"]):
+                return False
+        elif isinstance(condition, dict):
+            if not document[field] < condition["$lt"]:
+                return False
+        elif document[field] != condition:
+            return False
+    return True
+
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.documents.sort(key=lambda d: d[field], reverse=direction < 0)
+        return self
+
+    def limit(self, limit):
+        self.documents = self.documents[:limit]
+        return self
+
+    async def to_list(self, length=None):
+        return self.documents[:length]
+
+
+class PostCollection:
+    """An async posts collection answering the $geoNear and $geoWithin queries built by PostUtils."""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.queries = []
+
+    async def aggregate(self, pipeline):
+        self.queries.append(pipeline)
+        geo_near = pipeline[0]["$geoNear"]
+        lng, lat = geo_near["near"]["coordinates"]
+        excluded = geo_near.get("query", {}).get("_id", {}).get("$nin", [])
+        documents = []
+        for document in self.documents:
+            distance = get_distance(document["location"], lng, lat)
+            if geo_near.get("minDistance", 0) <= distance <= geo_near["maxDistance"] and document["_id"] not in excluded:
+                documents.append({**document, "distance_m": distance})
+        documents.sort(key=lambda d: d["distance_m"])
+        return Cursor(documents[:pipeline[1]["$limit"]])
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return Cursor([d for d in self.documents if matches(d, query)])
+
+
+class Database:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getitem__(self, name):
+        return self.collection
+
+
+def post(i: int, lng: float, lat: float, created_at: datetime) -> dict:
+    return {
+        "_id": f"posts:0:{i}",
+        "user_id": "1",
+        "title": f"Post {i}",
+        "category": "traffic",
+        "tags": [],
+        "location": {"type": "Point", "coordinates": [lng, lat]},
+        "created_at": created_at,
+        "source": {"topic": "posts", "partition": 0, "offset": i},
+    }
+
+
+@pytest.fixture(autouse=True)
+def cursor_secret(monkeypatch):
+    monkeypatch.setenv("EPA_JWT_SECRET", "secret")
+    PaginationUtils.clear()
+    yield
+    PaginationUtils.clear()
+
+
+@pytest.fixture
+def posts():
+    now = datetime(2026, 1, 1, 12, 0, 0)
+    # Posts every ~110 m north of (0, 0), some at the same place and time, and one far away
+    documents = [post(i, 0.0, 0.001 * (i // 2), now - timedelta(minutes=i // 3)) for i in range(30)]
+    documents.append(post(30, 10.0, 10.0, now))
+    return documents
+
+
+def get_all_pages(collection, sort, limit, radius=100000):
+    async def main():
+        pages, cursor = [], None
+        while True:
+            documents, cursor = await AsyncPostUtils.get_nearby_posts(collection, 0.0, 0.0, radius, sort, limit, cursor)
+            pages.append(documents)
+            if cursor is None:
+                return pages
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("limit", [1, 4, 7, 30])
+def test_nearest_posts_are_paginated_without_gaps(posts, limit):
+    pages = get_all_pages(PostCollection(posts), "distance", limit)
+
+    ids = [d["_id"] for page in pages for d in page]
+    distances = [d["distance_m"] for page in pages for d in page]
+    # Every post within the radius exactly once, even those at the same distance split across pages
+    assert sorted(ids) == sorted(d["_id"] for d in posts[:30])
+    assert distances == sorted(distances)
+    assert all(len(page) <= limit for page in pages)
+
+
+@pytest.mark.parametrize("limit", [1, 4, 7, 30])
+def test_recent_posts_are_paginated_without_gaps(posts, limit):
+    pages = get_all_pages(PostCollection(posts), "recent", limit)
+
+    documents = [d for page in pages for d in page]
+    assert sorted(d["_id"] for d in documents) == sorted(d["_id"] for d in posts[:30])
+    keys = [(d["created_at"], d["_id"]) for d in documents]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_radius_limits_posts(posts):
+    pages = get_all_pages(PostCollection(posts), "distance", 100, radius=300)
+    # Posts 0 to 5 are at most ~222 m away
+    assert sorted(d["_id"] for d in pages[0]) == sorted(f"posts:0:{i}" for i in range(6))
+
+
+def test_nearby_pipeline_pages_from_cursor():
+    after = {"sort": "distance", "distance": 12.5, "ids": ["posts:0:1"]}
+    pipeline = PostUtils.build_nearby_pipeline(40.7, -74.0, 1000, 20, after)
+
+    geo_near = pipeline[0]["$geoNear"]
+    assert geo_near["near"] == {"type": "Point", "coordinates": [-74.0, 40.7]}
+    assert geo_near["maxDistance"] == 1000 and geo_near["minDistance"] == 12.5
+    assert geo_near["query"] == {"_id": {"$nin": ["posts:0:1"]}}
+    assert pipeline[1:] == [{"$limit": 21}, {"$project": {"source": 0}}]
+
+
+def test_cursors_only_continue_their_search(posts):
+    collection = PostCollection(posts)
+    _, cursor = asyncio.run(AsyncPostUtils.get_nearby_posts(collection, 0.0, 0.0, 1000, "distance", 4))
+    assert PostUtils.decode_distance_cursor(PostUtils.get_nearby_scope(0.0, 0.0, 1000, "distance"), cursor)["distance"] > 0
+
+    for sort, radius in [("recent", 1000), ("distance", 2000)]:
+        with pytest.raises(InvalidCursorError):
+            asyncio.run(AsyncPostUtils.get_nearby_posts(collection, 0.0, 0.0, radius, sort, 4, cursor))
+
+
+def test_get_nearby_posts_endpoint(app, client: TestClient, posts, monkeypatch, mongo_env):
+    collection = PostCollection(posts)
+    monkeypatch.setattr(AsyncMongoUtils, "get_pooled_database", staticmethod(lambda: Database(collection)))
+    app.dependency_overrides[get_token_BearerAuth] = lambda: TokenModel(sub="token", claims={"user_id": "1", "typ": "access"})
+
+    response = client.get("/v1/posts/nearby", params={"lat": 0.0, "lng": 0.0, "radius": 300, "limit": 4})
+    assert response.status_code == 200
+    page = response.json()
+    assert sorted(p["post_id"] for p in page["posts"][:2]) == ["posts:0:0", "posts:0:1"]
+    assert page["posts"][0]["location"] == {"lat": 0.0, "lng": 0.0}
+    assert "source" not in page["posts"][0]
+    assert page["next_cursor"]
+
+    response = client.get("/v1/posts/nearby", params={"lat": 0.0, "lng": 0.0, "radius": 300, "limit": 4, "cursor": page["next_cursor"]})
+    assert response.status_code == 200
+    assert len(response.json()["posts"]) == 2
+    assert response.json()["next_cursor"] is None
+
+    response = client.get("/v1/posts/nearby", params={"lat": 0.0, "lng": 0.0, "cursor": "not a cursor"})
+    assert response.status_code == 400
+
+    response = client.get("/v1/posts/nearby", params={"lat": 91.0, "lng": 0.0})
+    assert response.status_code == 422
@@ -0,0 +1,117 @@
+# coding: utf-8
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from epa_api.api_implementation.utils.mongo import AsyncMongoUtils
+from epa_api.api_implementation.utils.pagination import AsyncPaginationUtils, InvalidCursorError, PaginationUtils
+from epa_api.models.extra_models import TokenModel
+from epa_api.security_api import get_token_BearerAuth
+from tests.test_nearby_posts import Database, PostCollection, post
+
+
+@pytest.fixture(autouse=True)
+def cursor_secret(monkeypatch):
+    monkeypatch.setenv("EPA_JWT_SECRET", "secret")
+    PaginationUtils.clear()
+    yield
+    PaginationUtils.clear()
+
+
+@pytest.fixture
+def posts():
+    now = datetime(2026, 1, 1, 12, 0, 0)
+    # Groups of 4 posts created at the same time, alternating categories
+    return [
+        {**post(i, 0.0, 0.0, now - timedelta(minutes=i // 4)), "category": ["traffic", "weather"][i % 2]}
+        for i in range(50)
+    ]
+
+
+def get_all_pages(collection, scope, query, limit):
+    async def main():
+        pages, cursor = [], None
+        while True:
+            documents, cursor = await AsyncPaginationUtils.find_page(collection, scope, query, limit, cursor)
+            pages.append(documents)
+            if cursor is None:
+                return pages
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("limit", [1, 3, 4, 20, 100])
+def test_keyset_pages_cover_every_document_once(posts, limit):
+    collection = PostCollection(posts)
+    pages = get_all_pages(collection, "posts", {}, limit)
+
+    documents = [d for page in pages for d in page]
+    keys = [(d["created_at"], d["_id"]) for d in documents]
+    assert len(documents) == len(posts)
+    assert keys == sorted(keys, reverse=True)
+    assert all(len(page) == limit for page in pages[:-1])
+    # Pages after the first one start from the sort key of their cursor instead of skipping documents
+    assert collection.queries[0] == {} and all("$or" in q for q in collection.queries[1:])
+
+
+def test_keyset_query_keeps_the_listing_filter(posts):
+    pages = get_all_pages(PostCollection(posts), "posts:traffic", {"category": "traffic"}, 4)
+
+    documents = [d for page in pages for d in page]
+    assert len(documents) == 25
+    assert all(d["category"] == "traffic" for d in documents)
+
+
+def test_cursor_is_signed_and_bound_to_its_scope():
+    cursor = PaginationUtils.sign_cursor("posts", {"created_at": "2026-01-01T12:00:00", "id": "posts:0:1"})
+    assert PaginationUtils.decode_keyset_cursor("posts", cursor) == (datetime(2026, 1, 1, 12, 0, 0), "posts:0:1")
+
+    # A cursor of another listing
+    with pytest.raises(InvalidCursorError):
+        PaginationUtils.verify_cursor("posts:traffic", cursor)
+
+    # A cursor edited by the client
+    forged = PaginationUtils.sign_cursor("posts", {"created_at": "2026-01-01T12:00:00", "id": "posts:0:2"})
+    with pytest.raises(InvalidCursorError):
+        PaginationUtils.verify_cursor("posts", forged[:22] + cursor[22:])
+
+    # A cursor signed with another secret
+    PaginationUtils._cursor_key = b"another key"
+    with pytest.raises(InvalidCursorError):
+        PaginationUtils.verify_cursor("posts", cursor)
+
+    for cursor in ["", "not a cursor", "****"]:
+        with pytest.raises(InvalidCursorError):
+            PaginationUtils.verify_cursor("posts", cursor)
+
+
+def test_page_size_is_bounded(monkeypatch):
+    monkeypatch.setenv("EPA_MAX_PAGE_SIZE", "50")
+    assert PaginationUtils.get_page_size(None) == PaginationUtils.DEFAULT_PAGE_SIZE
+    assert PaginationUtils.get_page_size(10) == 10
+    assert PaginationUtils.get_page_size(1000) == 50
+
+
+def test_list_posts_endpoint(app, client: TestClient, posts, monkeypatch, mongo_env):
+    collection = PostCollection(posts)
+    monkeypatch.setattr(AsyncMongoUtils, "get_pooled_database", staticmethod(lambda: Database(collection)))
+    app.dependency_overrides[get_token_BearerAuth] = lambda: TokenModel(sub="token", claims={"user_id": "1", "typ": "access"})
+
+    post_ids, cursor = [], None
+    while True:
+        params = {"category": "weather", "limit": 10} | ({"cursor": cursor} if cursor else {})
+        response = client.get("/v1/posts", params=params)
+        assert response.status_code == 200
+        post_ids += [p["post_id"] for p in response.json()["posts"]]
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            break
+    assert sorted(post_ids) == sorted(d["_id"] for d in posts if d["category"] == "weather")
+
+    # The cursor of a category does not continue another one
+    first_page = client.get("/v1/posts", params={"category": "weather", "limit": 10}).json()
+    response = client.get("/v1/posts", params={"category": "traffic", "cursor": first_page["next_cursor"]})
+    assert response.status_code == 400
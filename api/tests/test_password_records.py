@@ -0,0 +1,106 @@
+# coding: utf-8
+
+import asyncio
+from datetime import datetime
+
+import pytest
+from pydantic import SecretStr
+
+from epa_api.api_implementation.auth import AuthAPIImplementation
+from epa_api.api_implementation.utils.hashing import HashingUtils
+from epa_api.api_implementation.utils.settings import SettingsUtils
+from epa_api.api_implementation.utils.user import UserUtils
+from epa_api.models.login_request import LoginRequest
+
+PASSWORD = SecretStr("correct horse battery")
+
+
+class UserCollection:
+    """An async user collection holding a single user, enough to drive a login."""
+
+    def __init__(self, user):
+        self.user = user
+
+    async def find_one(self, query, *args, **kwargs):
+        if all(self.user.get(k) == v for k, v in query.items()):
+            return dict(self.user)
+        return None
+
+    async def update_one(self, query, update, *args, **kwargs):
+        class Result:
+            modified_count = 0
+
+        if all(self.user.get(k) == v for k, v in query.items()):
+            self.user.update(update.get("$set", {}))
+            for key in update.get("$unset", {}):
+                self.user.pop(key, None)
+            Result.modified_count = 1
+        return Result()
+
+
+class Database:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getitem__(self, name):
+        return self.collection
+
+
+def test_hash_record_is_self_describing(monkeypatch):
+    monkeypatch.setenv("EPA_PASSWORD_HASH_ITERATIONS", "1000")
+    record = UserUtils.hash_password(PASSWORD)
+    assert record["algorithm"] == "pbkdf2_sha256"
+    assert record["iterations"] == 1000
+    assert len(record["salt"]) == 32
+
+    # Verification follows the record, not the current policy
+    monkeypatch.setenv("EPA_PASSWORD_HASH_ITERATIONS", "2000")
+    monkeypatch.setenv("EPA_PASSWORD_HASH_ALGORITHM", "pbkdf2_sha512")
+    SettingsUtils.clear()
+    assert UserUtils.verify_password(PASSWORD, record)
+    assert not UserUtils.verify_password(SecretStr("wrong horse battery"), record)
+    assert UserUtils.needs_rehash(record)
+
+
+def test_legacy_password_is_converted():
+    legacy = UserUtils.hash_password(PASSWORD, "pbkdf2_sha256", UserUtils.LEGACY_PASSWORD_HASH_ITERATIONS)
+    user = {"user_id": "1", "password": legacy["hash"], "salt": legacy["salt"]}
+
+    record = UserUtils.get_password_record(user)
+    assert record == legacy
+    assert UserUtils.verify_password(PASSWORD, record)
+    assert not UserUtils.needs_rehash(record)
+    assert UserUtils.get_password_record({"user_id": "2", "google_id": "3"}) is None
+
+
+def test_invalid_policy(monkeypatch):
+    monkeypatch.setenv("EPA_PASSWORD_HASH_ALGORITHM", "md5")
+    with pytest.raises(ValueError):
+        UserUtils.get_password_hash_policy()
+
+
+def test_login_upgrades_outdated_hash(mongo_env, monkeypatch):
+    outdated = UserUtils.hash_password(PASSWORD, "pbkdf2_sha256", 1000)
+    collection = UserCollection({"user_id": "1", "email": "user@epa.local", "password": outdated})
+    implementation = AuthAPIImplementation(db=Database(collection))
+
+    async def fake_token(*args, **kwargs):
+        return "token"
+
+    monkeypatch.setattr("epa_api.api_implementation.auth.AsyncTokenUtils.generate_new_access_token", fake_token)
+    monkeypatch.setattr("epa_api.api_implementation.auth.AsyncTokenUtils.generate_new_session_token", fake_token)
+    monkeypatch.setattr("epa_api.api_implementation.auth.TokenUtils.get_expire_date", lambda token: datetime.now())
+    monkeypatch.setenv("EPA_PASSWORD_HASH_ITERATIONS", "2000")
+
+    async def main():
+        await implementation.login_with_password(LoginRequest(email="user@epa.local", password=PASSWORD))
+        await asyncio.gather(*AuthAPIImplementation._background_tasks)
+
+    try:
+        asyncio.run(main())
+    finally:
+        HashingUtils.shutdown_executor()
+
+    record = collection.user["password"]
+    assert record["iterations"] == 2000
+    assert UserUtils.verify_password(PASSWORD, record)
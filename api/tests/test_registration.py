@@ -0,0 +1,95 @@
+# coding: utf-8
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from pydantic import SecretStr
+from pymongo.errors import DuplicateKeyError
+
+from epa_api.api_implementation.auth import AuthAPIImplementation
+from epa_api.api_implementation.utils.user import UserUtils
+from epa_api.models.user_registration import UserRegistration
+
+
+class UniqueUserCollection:
+    """An async user collection enforcing unique email and username indexes."""
+
+    def __init__(self):
+        self.documents = []
+        self.round_trips = 0
+
+    async def insert_one(self, document):
+        self.round_trips += 1
+        # Let the other registrations run before this insert is applied
+        await asyncio.sleep(0)
+        for field in ["email", "username"]:
+            if any(d[field] == document[field] for d in self.documents):
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: epa_database.users index: {field}_1 dup key", 11000)
+        self.documents.append(document)
+
+    async def find_one(self, *args, **kwargs):
+        self.round_trips += 1
+        return None
+
+
+class Database:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getitem__(self, name):
+        return self.collection
+
+
+@pytest.fixture
+def fast_hashing(monkeypatch):
+    async def hash_password(password):
+        return {"algorithm": "pbkdf2_sha256", "iterations": 1, "salt": "", "hash": ""}
+
+    monkeypatch.setattr("epa_api.api_implementation.auth.HashingUtils.hash_password", hash_password)
+
+
+def registration(username: str, email: str) -> UserRegistration:
+    return UserRegistration(username=username, email=email, password=SecretStr("correct horse battery"))
+
+
+def test_taken_field():
+    assert UserUtils.get_taken_field(DuplicateKeyError("E11000", 11000, {"keyPattern": {"email": 1}})) == "email"
+    assert UserUtils.get_taken_field(DuplicateKeyError("E11000 index: username_1 dup key", 11000)) == "username"
+    assert UserUtils.get_taken_field(DuplicateKeyError("E11000", 11000)) == "user"
+
+
+def test_concurrent_registrations_create_one_user(mongo_env, fast_hashing):
+    collection = UniqueUserCollection()
+    api = AuthAPIImplementation(Database(collection))
+    registrations = 20
+
+    async def register(i: int):
+        try:
+            return await api.register_new_user(registration(f"username{i}", "same@epa.local"))
+        except HTTPException as e:
+            return e
+
+    async def register_many():
+        return await asyncio.gather(*[register(i) for i in range(registrations)])
+
+    results = asyncio.run(register_many())
+
+    conflicts = [r for r in results if isinstance(r, HTTPException)]
+    assert len(collection.documents) == 1
+    assert len(conflicts) == registrations - 1
+    assert all(c.status_code == 409 and c.detail == "Email already taken" for c in conflicts)
+
+    # A single insert per registration, no lookups beforehand
+    assert collection.round_trips == registrations
+
+
+def test_username_taken(mongo_env, fast_hashing):
+    collection = UniqueUserCollection()
+    api = AuthAPIImplementation(Database(collection))
+    asyncio.run(api.register_new_user(registration("username", "first@epa.local")))
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(api.register_new_user(registration("username", "second@epa.local")))
+    assert e.value.status_code == 409
+    assert e.value.detail == "Username already taken"
@@ -0,0 +1,164 @@
+# coding: utf-8
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from epa_api.api_implementation.auth import AuthAPIImplementation
+from epa_api.api_implementation.utils.context import current_token_data
+from epa_api.api_implementation.utils.revocation import BloomFilter, RevocationUtils
+from epa_api.api_implementation.utils.token import TokenUtils
+from epa_api.models.extra_models import TokenModel
+
+
+class RevokedTokenCollection:
+    """An async revoked token collection backed by a list."""
+
+    def __init__(self):
+        self.documents = []
+
+    async def update_one(self, query, update, upsert=False):
+        if not any(d["jti"] == query["jti"] for d in self.documents):
+            self.documents.append(dict(update["$setOnInsert"]))
+
+    def find(self, query, projection=None):
+        async def cursor():
+            for document in self.documents:
+                if "expires_at" in query and document["expires_at"] <= query["expires_at"]["$gt"]:
+                    continue
+                if "revoked_at" in query and document["revoked_at"] < query["revoked_at"]["$gte"]:
+                    continue
+                yield document
+
+        return cursor()
+
+
+@pytest.fixture(autouse=True)
+def revocations(monkeypatch):
+    monkeypatch.setenv("EPA_JWT_SECRET", "secret")
+    TokenUtils.load_jwt_secret()
+    RevocationUtils.clear()
+    yield
+    RevocationUtils.clear()
+    TokenUtils._jwt_secret = None
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000)
+    values = [f"jti-{i}" for i in range(1000)]
+    for value in values:
+        bloom.add(value)
+
+    assert all(value in bloom for value in values)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_revoke_and_refresh():
+    collection = RevokedTokenCollection()
+    exp = (datetime.now() + timedelta(minutes=5)).timestamp()
+
+    asyncio.run(RevocationUtils.revoke({"jti": "a", "exp": exp}, collection))
+    assert RevocationUtils.is_revoked("a")
+    assert not RevocationUtils.is_revoked("b")
+    # Tokens issued before token ids were added are accepted until they expire
+    assert not RevocationUtils.is_revoked(None)
+
+    # Another process only learns about the revocation on its next refresh
+    RevocationUtils.clear()
+    assert not RevocationUtils.is_revoked("a")
+    assert asyncio.run(RevocationUtils.refresh(collection)) == 1
+    assert RevocationUtils.is_revoked("a")
+
+    # Later refreshes only read new revocations
+    asyncio.run(RevocationUtils.revoke({"jti": "b", "exp": exp}, collection))
+    RevocationUtils._revoked.pop("b")
+    asyncio.run(RevocationUtils.refresh(collection))
+    assert RevocationUtils.is_revoked("b")
+
+
+def test_refresher_loads_the_revocations_before_it_starts():
+    collection = RevokedTokenCollection()
+    exp = datetime.now() + timedelta(minutes=5)
+    collection.documents.append({"jti": "a", "expires_at": exp, "revoked_at": datetime.now()})
+
+    async def start_and_stop():
+        await RevocationUtils.start_refresher(collection, interval=60)
+        revoked = RevocationUtils.is_revoked("a")
+        await RevocationUtils.stop_refresher()
+        return revoked
+
+    assert asyncio.run(start_and_stop())
+
+
+def test_refresher_does_not_start_when_the_first_load_fails():
+    class UnreachableCollection:
+        def find(self, query, projection=None):
+            raise ConnectionError("MongoDB is unreachable")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(RevocationUtils.start_refresher(UnreachableCollection(), interval=60))
+    assert RevocationUtils._refresher is None
+
+
+def test_bloom_filter_grows_and_prunes():
+    capacity = RevocationUtils._bloom.capacity
+    RevocationUtils._bloom = BloomFilter(4)
+    past = datetime.now() - timedelta(seconds=1)
+    for i in range(5):
+        RevocationUtils.add(f"jti-{i}", past if i < 3 else datetime.now() + timedelta(minutes=5))
+
+    assert RevocationUtils._bloom.capacity == 8
+    RevocationUtils.prune()
+    assert set(RevocationUtils._revoked) == {"jti-3", "jti-4"}
+    RevocationUtils._bloom = BloomFilter(capacity)
+
+
+def test_bearer_auth_rejects_revoked_token(client: TestClient):
+    token = TokenUtils.get_token({"user_id": "1", "typ": "access"}, exp_date=datetime.now() + timedelta(minutes=5))
+    RevocationUtils.add(TokenUtils.verify_token(token)["jti"], datetime.now() + timedelta(minutes=5))
+
+    response = client.post("/v1/auth/session", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+
+
+def test_session_renewal_requires_session_token(client: TestClient):
+    token = TokenUtils.get_token({"user_id": "1", "typ": "access"}, exp_date=datetime.now() + timedelta(minutes=5))
+
+    response = client.post("/v1/auth/session", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+
+
+def test_session_renewal_checks_the_session_store(mongo_env):
+    session = TokenUtils.get_token({"user_id": "1", "typ": "session"}, exp_date=datetime.now() + timedelta(days=1))
+
+    class Collection:
+        def __init__(self, *documents):
+            self.documents = list(documents)
+
+        async def find_one(self, query, projection=None):
+            return next((d for d in self.documents if all(d.get(k) == v for k, v in query.items())), None)
+
+        async def find_one_and_update(self, query, update, projection=None, return_document=None):
+            return None
+
+    collections = {"users": Collection({"user_id": "1"}), "session_tokens": Collection(), "revoked_tokens": RevokedTokenCollection()}
+
+    class Database:
+        def __getitem__(self, name):
+            return collections[name]
+
+    async def renew():
+        current_token_data.set(TokenModel(sub=session, claims=TokenUtils.verify_token(session)))
+        return await AuthAPIImplementation(Database()).renew_session_token()
+
+    # Logged out on another process, whose revocation this process has not refreshed yet
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(renew())
+    assert error.value.status_code == 403
+
+    collections["session_tokens"].documents.append({"user_id": "1", "sessions.session_token": session})
+    assert asyncio.run(renew()).session_token == session
@@ -0,0 +1,58 @@
+# coding: utf-8
+
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import SecretStr
+
+from epa_api.apis.authentication_api import router as AuthenticationApiRouter
+from epa_api.apis.posts_api import router as PostsApiRouter
+from epa_api.apis.system_api import router as SystemApiRouter
+from epa_api.apis.timeline_api import router as TimelineApiRouter
+from epa_api.models.auth_token import AuthToken
+from epa_api.models.hashing_metrics import HashingMetrics
+from epa_api.models.login_request import LoginRequest
+from epa_api.models.metrics import Metrics
+from epa_api.models.user_registration import UserRegistration
+
+
+def test_openapi_contract_is_unchanged(app: FastAPI, client: TestClient):
+    # The same routers served with the default JSONResponse
+    reference = FastAPI(title=app.title, description=app.description, version=app.version)
+    reference.include_router(AuthenticationApiRouter)
+    reference.include_router(PostsApiRouter)
+    reference.include_router(SystemApiRouter)
+    reference.include_router(TimelineApiRouter)
+
+    assert client.get("/openapi.json").content == TestClient(reference).get("/openapi.json").content
+    assert client.get("/v1/status").content == TestClient(reference).get("/v1/status").content
+
+
+def test_model_json_matches_dict():
+    token = AuthToken(access_token="access", session_token="session", token_type="Bearer", access_expires_in=1800)
+    assert json.loads(token.to_json()) == token.to_dict()
+    assert AuthToken.from_json(token.to_json()) == token
+
+    # Unset fields are left out, like to_dict() does
+    assert AuthToken(access_token="access").to_json() == '{"access_token":"access"}'
+
+    metrics = Metrics(password_hashing=HashingMetrics(workers=2, max_queue=8, in_flight=1, queue_depth=0, completed=3, rejected=0, latency_avg_ms=1.5, latency_p95_ms=2.0, latency_max_ms=2.5))
+    assert json.loads(metrics.to_json()) == metrics.to_dict()
+    assert Metrics.from_json(metrics.to_json()) == metrics
+
+    registration = UserRegistration.from_json('{"email": "user@epa.local", "password": "correct horse battery", "username": "username"}')
+    assert registration.password == SecretStr("correct horse battery")
+
+
+def test_passwords_are_masked_in_the_json():
+    registration = UserRegistration(email="user@epa.local", password="correct horse battery", username="username")
+    login = LoginRequest(email="user@epa.local", password="correct horse battery")
+
+    # to_json does not round trip the passwords, it never writes them
+    assert json.loads(registration.to_json())["password"] == "**********"
+    assert "correct horse battery" not in login.to_json()
+    assert LoginRequest.from_json(login.to_json()).password.get_secret_value() == "**********"
+    # to_dict keeps the SecretStr
+    assert login.to_dict()["password"] == SecretStr("correct horse battery")
+    assert "correct horse battery" not in login.to_str()
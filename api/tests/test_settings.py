@@ -0,0 +1,48 @@
+# coding: utf-8
+
+import asyncio
+import dataclasses
+
+import pytest
+
+from epa_api.api_implementation.utils.mongo import AsyncMongoUtils, MongoUtils
+from epa_api.api_implementation.utils.settings import MongoSettings, SettingsUtils
+
+
+def test_settings_are_loaded_once(mongo_env, monkeypatch):
+    monkeypatch.setenv("EPA_JWT_SECRET", "secret")
+    settings = SettingsUtils.load_settings()
+    assert settings.mongo.port == 27017
+    assert settings.mongo.revoked_token_collection == "revoked_tokens"
+    assert not settings.google.enabled
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        settings.mongo.user_collection = "other"
+
+    # Later changes to the environment are not seen by the running API
+    monkeypatch.setenv("EPA_MONGODB_USER_COLLECTION", "other")
+    assert SettingsUtils.get(MongoSettings) is settings.mongo
+
+
+def test_misconfiguration_fails_at_boot(mongo_env, monkeypatch):
+    monkeypatch.delenv("EPA_JWT_SECRET", raising=False)
+    monkeypatch.setenv("EPA_MONGODB_PORT", "mongo")
+    monkeypatch.setenv("EPA_GOOGLE_WEB_CLIENT_ID", "client")
+    with pytest.raises(ValueError) as e:
+        SettingsUtils.load_settings()
+
+    # Every invalid setting is reported at once
+    message = str(e.value)
+    assert "EPA_MONGODB_PORT" in message
+    assert "EPA_JWT_SECRET" in message
+    assert "EPA_GOOGLE_WEB_CLIENT_SECRET" in message
+
+
+def test_pooled_collections_are_reused(mongo_env):
+    db = AsyncMongoUtils.get_pooled_database()
+    assert AsyncMongoUtils.get_pooled_database() is db
+    assert AsyncMongoUtils.get_user_collection(db) is AsyncMongoUtils.get_user_collection(db)
+    assert AsyncMongoUtils.get_revoked_tokens_collection(db).name == "revoked_tokens"
+
+    sync_db = MongoUtils.get_pooled_database()
+    assert MongoUtils.get_session_tokens_collection(sync_db) is MongoUtils.get_session_tokens_collection(sync_db)
+    asyncio.run(AsyncMongoUtils.close_pooled_client())
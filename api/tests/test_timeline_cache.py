@@ -0,0 +1,255 @@
+# coding: utf-8
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import fakeredis
+import pytest
+import redis.asyncio as redis
+from fastapi.testclient import TestClient
+
+from epa_api.api_implementation.utils.mongo import AsyncMongoUtils
+from epa_api.api_implementation.utils.pagination import PaginationUtils
+from epa_api.api_implementation.utils.revocation import RevocationUtils
+from epa_api.api_implementation.utils.timeline import AsyncTimelineUtils, TimelineUtils
+from epa_api.api_implementation.utils.token import TokenUtils
+from tests.test_nearby_posts import PostCollection, post
+
+
+class UserCollection:
+    """An async user collection, optionally slow to answer."""
+
+    def __init__(self, users, delay: float = 0):
+        self.users = {user["user_id"]: user for user in users}
+        self.delay = delay
+
+    async def find_one(self, query, projection=None):
+        await asyncio.sleep(self.delay)
+        return self.users.get(query["user_id"])
+
+
+class CountingPostCollection(PostCollection):
+    def __init__(self, documents):
+        super().__init__(documents)
+        self.reads = 0
+
+    def find(self, query, projection=None):
+        self.reads += 1
+        return super().find(query, projection)
+
+
+class Database:
+    def __init__(self, user_collection, posts_collection):
+        self.collections = {"users": user_collection, "posts": posts_collection}
+
+    def __getitem__(self, name):
+        return self.collections[name]
+
+
+@pytest.fixture(autouse=True)
+def timeline_env(monkeypatch):
+    monkeypatch.setenv("EPA_JWT_SECRET", "secret")
+    monkeypatch.setenv("EPA_TIMELINE_MAX_LENGTH", "10")
+    PaginationUtils.clear()
+    AsyncTimelineUtils.clear()
+    yield
+    AsyncTimelineUtils.clear()
+    PaginationUtils.clear()
+
+
+@pytest.fixture
+def redis_client():
+    """The Redis of user_timeline_post_cache/ when EPA_TEST_REDIS_URL is set, an in-process fake otherwise."""
+
+    url = os.getenv("EPA_TEST_REDIS_URL")
+    client = redis.Redis.from_url(url) if url else fakeredis.FakeAsyncRedis()
+    AsyncTimelineUtils.open_client()
+    AsyncTimelineUtils._client = client
+    yield client
+
+    async def cleanup():
+        keys = [key async for key in client.scan_iter(match=TimelineUtils.KEY_PREFIX + "test-*")]
+        await client.delete(TimelineUtils.CELEBRITY_CATEGORIES_KEY, *keys)
+        await client.aclose()
+
+    asyncio.run(cleanup())
+
+
+@pytest.fixture
+def posts():
+    now = datetime(2026, 1, 1, 12, 0, 0)
+    # Pairs of posts created in the same millisecond, alternating categories
+    documents = [post(i, 0.0, 0.0, now - timedelta(minutes=i // 2)) for i in range(30)]
+    for i, document in enumerate(documents):
+        document["category"] = ["traffic", "weather", "fire"][i % 3]
+        document["tags"] = ["accident"] if i % 5 == 0 else []
+    return documents
+
+
+@pytest.fixture
+def users():
+    return [
+        {"user_id": "test-1", "subscriptions": [{"category": "traffic"}, {"category": "fire", "tags": ["accident"]}]},
+        {"user_id": "test-2", "subscriptions": []},
+    ]
+
+
+def get_expected(posts, user):
+    expected = [
+        d for d in posts
+        if any(d["category"] == s["category"] and (not s.get("tags") or set(d["tags"]) & set(s["tags"])) for s in user["subscriptions"])
+    ]
+    return [d["_id"] for d in sorted(expected, key=lambda d: (d["created_at"], d["_id"]), reverse=True)]
+
+
+def read_all_pages(user_id, limit, user_collection, posts_collection):
+    async def main():
+        post_ids, cursor = [], None
+        while True:
+            page, cursor = await AsyncTimelineUtils.get_timeline(user_id, limit, cursor, user_collection, posts_collection)
+            assert len(page) <= limit
+            post_ids += [p.post_id for p in page]
+            if cursor is None:
+                return post_ids
+
+    return asyncio.run(main())
+
+
+def test_miss_loads_timeline_then_hits(redis_client, posts, users):
+    user_collection, posts_collection = UserCollection(users), CountingPostCollection(posts)
+
+    async def main():
+        first, _ = await AsyncTimelineUtils.get_timeline("test-1", 5, None, user_collection, posts_collection)
+        second, _ = await AsyncTimelineUtils.get_timeline("test-1", 5, None, user_collection, posts_collection)
+        return first, second
+
+    first, second = asyncio.run(main())
+
+    assert [p.post_id for p in first] == [p.post_id for p in second] == get_expected(posts, users[0])[:5]
+    assert posts_collection.reads == 1
+    metrics = AsyncTimelineUtils.get_metrics()
+    assert (metrics["hits"], metrics["misses"], metrics["hit_ratio"]) == (1, 1, 0.5)
+
+    # The timeline is bounded, holds the subscriptions of the user and expires
+    key = TimelineUtils.get_key("test-1")
+    assert asyncio.run(redis_client.zcard(key)) == 10 + 1
+    lowest = asyncio.run(redis_client.zrange(key, 0, 0))
+    assert TimelineUtils.from_marker(lowest[0]) == users[0]["subscriptions"]
+    assert 0 < asyncio.run(redis_client.ttl(key)) <= 3600
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 20])
+def test_pages_continue_past_the_cached_posts(redis_client, posts, users, limit):
+    user_collection, posts_collection = UserCollection(users), CountingPostCollection(posts)
+
+    # The timeline has 14 posts, only the 10 most recent are cached
+    assert read_all_pages("test-1", limit, user_collection, posts_collection) == get_expected(posts, users[0])
+    # And a second reader gets the same pages, its cached pages from Redis
+    reads = posts_collection.reads
+    assert read_all_pages("test-1", limit, user_collection, posts_collection) == get_expected(posts, users[0])
+    assert posts_collection.reads - reads < reads
+
+
+def test_empty_timeline_is_cached(redis_client, posts, users):
+    user_collection, posts_collection = UserCollection(users), CountingPostCollection(posts)
+
+    assert read_all_pages("test-2", 5, user_collection, posts_collection) == []
+    assert read_all_pages("test-2", 5, user_collection, posts_collection) == []
+    assert AsyncTimelineUtils.get_metrics()["hits"] == 1
+
+
+def test_timeline_without_subscriptions_is_a_miss(redis_client, posts, users):
+    user_collection, posts_collection = UserCollection(users), CountingPostCollection(posts)
+    # A post added by the timeline loader while the timeline was expiring
+    asyncio.run(redis_client.zadd(TimelineUtils.get_key("test-1"), {b'{"post_id":"posts:0:99"}': 0}))
+
+    assert read_all_pages("test-1", 20, user_collection, posts_collection) == get_expected(posts, users[0])
+    assert AsyncTimelineUtils.get_metrics()["misses"] == 1
+
+
+@pytest.mark.parametrize("limit", [1, 3, 20])
+def test_celebrity_categories_are_read_from_the_posts_collection(redis_client, posts, users, limit):
+    user_collection, posts_collection = UserCollection(users), CountingPostCollection(posts)
+    read_all_pages("test-1", limit, user_collection, posts_collection)
+
+    # Traffic has too many subscribers, its new posts are not added to the cached timelines
+    asyncio.run(redis_client.zadd(TimelineUtils.CELEBRITY_CATEGORIES_KEY, {"traffic": float("inf"), "fire": 0}))
+    new_posts = [post(100 + i, 0.0, 0.0, datetime(2026, 1, 1, 12, 0, 0) - timedelta(minutes=m)) for i, m in enumerate([-1, 2, 20])]
+    posts_collection.documents.extend(new_posts)
+    hits = AsyncTimelineUtils.get_metrics()["hits"]
+
+    assert read_all_pages("test-1", limit, user_collection, posts_collection) == get_expected(posts_collection.documents, users[0])
+    assert AsyncTimelineUtils.get_metrics()["hits"] > hits
+
+
+def test_concurrent_misses_load_once(redis_client, posts, users):
+    user_collection, posts_collection = UserCollection(users, delay=0.05), CountingPostCollection(posts)
+    readers = 20
+
+    async def main():
+        return await asyncio.gather(*(AsyncTimelineUtils.get_timeline("test-1", 5, None, user_collection, posts_collection) for _ in range(readers)))
+
+    pages = asyncio.run(main())
+
+    assert all([p.post_id for p in page] == get_expected(posts, users[0])[:5] for page, _ in pages)
+    assert posts_collection.reads == 1
+    assert AsyncTimelineUtils.get_metrics()["coalesced_misses"] == readers - 1
+
+
+def test_redis_outage_falls_back_to_local_cache(posts, users):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    AsyncTimelineUtils.open_client()
+    AsyncTimelineUtils._client = fakeredis.FakeAsyncRedis(server=server)
+    user_collection, posts_collection = UserCollection(users), CountingPostCollection(posts)
+
+    assert read_all_pages("test-1", 20, user_collection, posts_collection) == get_expected(posts, users[0])
+    reads = posts_collection.reads
+    first_page = asyncio.run(AsyncTimelineUtils.get_timeline("test-1", 5, None, user_collection, posts_collection))[0]
+
+    assert [p.post_id for p in first_page] == get_expected(posts, users[0])[:5]
+    assert posts_collection.reads == reads
+    assert AsyncTimelineUtils.get_metrics()["redis_errors"] > 0
+
+
+def test_hit_ratio_and_latency(redis_client, posts):
+    users = [{"user_id": f"test-{i}", "subscriptions": [{"category": "traffic"}]} for i in range(10)]
+    user_collection, posts_collection = UserCollection(users), CountingPostCollection(posts)
+
+    async def main():
+        for i in range(200):
+            await AsyncTimelineUtils.get_timeline(f"test-{i % 10}", 5, None, user_collection, posts_collection)
+
+    asyncio.run(main())
+
+    metrics = AsyncTimelineUtils.get_metrics()
+    print(f"\ntimeline cache: hit ratio {metrics['hit_ratio']:.2%}, latency avg {metrics['latency_avg_ms']} ms, p95 {metrics['latency_p95_ms']} ms")
+    # One miss per user, every other read is a hit
+    assert metrics["misses"] == 10 and metrics["hit_ratio"] == 0.95
+
+
+def test_get_user_timeline_endpoint(client: TestClient, redis_client, posts, users, monkeypatch, mongo_env):
+    TokenUtils.load_jwt_secret()
+    RevocationUtils.clear()
+    database = Database(UserCollection(users), CountingPostCollection(posts))
+    monkeypatch.setattr(AsyncMongoUtils, "get_pooled_database", staticmethod(lambda: database))
+    token = TokenUtils.get_token({"user_id": "test-1", "typ": "access"}, exp_date=datetime.now() + timedelta(minutes=5))
+    headers = {"Authorization": f"Bearer {token}"}
+
+    try:
+        response = client.get("/v1/timeline", params={"limit": 5}, headers=headers)
+        assert response.status_code == 200
+        assert [p["post_id"] for p in response.json()["posts"]] == get_expected(posts, users[0])[:5]
+
+        response = client.get("/v1/timeline", params={"limit": 5, "cursor": response.json()["next_cursor"]}, headers=headers)
+        assert [p["post_id"] for p in response.json()["posts"]] == get_expected(posts, users[0])[5:10]
+
+        # The cursor of another user is refused
+        other = PaginationUtils.encode_keyset_cursor(TimelineUtils.get_scope("test-2"), {"created_at": datetime(2026, 1, 1), "_id": "posts:0:1"})
+        assert client.get("/v1/timeline", params={"cursor": other}, headers=headers).status_code == 400
+
+        metrics = client.get("/v1/metrics", headers=headers).json()["timeline_cache"]
+        assert metrics["hits"] == 1 and metrics["misses"] == 1
+    finally:
+        TokenUtils._jwt_secret = None
@@ -0,0 +1,90 @@
+# coding: utf-8
+
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+from fastapi.testclient import TestClient
+
+from epa_api.api_implementation.utils.token import TokenUtils
+from epa_api.api_implementation.utils.token_cache import VerifiedTokenCache
+
+
+@pytest.fixture
+def jwt_secret(monkeypatch):
+    monkeypatch.setenv("EPA_JWT_SECRET", "secret")
+    TokenUtils.load_jwt_secret()
+    yield "secret"
+    TokenUtils._jwt_secret = None
+    TokenUtils._token_cache.clear()
+
+
+def test_cache_is_bounded_lru():
+    cache = VerifiedTokenCache(max_size=2)
+    exp = (datetime.now() + timedelta(minutes=5)).timestamp()
+    cache.put("a", {"exp": exp})
+    cache.put("b", {"exp": exp})
+    assert cache.get("a") is not None
+    cache.put("c", {"exp": exp})
+
+    # "b" was the least recently used entry
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert len(cache) == 2
+
+
+def test_cached_claims_are_copied():
+    cache = VerifiedTokenCache()
+    claims = {"user_id": "1", "exp": (datetime.now() + timedelta(minutes=5)).timestamp()}
+    cache.put("a", claims)
+    claims["user_id"] = "2"
+
+    # A handler that changes the claims of its request does not change them for the next one
+    cache.get("a")["user_id"] = "3"
+    assert cache.get("a")["user_id"] == "1"
+
+
+def test_cache_entry_ends_with_token():
+    cache = VerifiedTokenCache(max_ttl=300)
+    cache.put("expired", {"exp": (datetime.now() - timedelta(seconds=1)).timestamp()})
+    assert cache.get("expired") is None
+
+    cache = VerifiedTokenCache(max_ttl=0)
+    cache.put("short", {"exp": (datetime.now() + timedelta(minutes=5)).timestamp()})
+    assert cache.get("short") is None
+
+
+def test_token_is_decoded_once(jwt_secret, monkeypatch):
+    token = jwt.encode({"user_id": "1", "exp": (datetime.now() + timedelta(minutes=5)).timestamp()}, jwt_secret, algorithm="HS256")
+    decodes = []
+    decode = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        decodes.append(args[0])
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(jwt, "decode", counting_decode)
+
+    assert TokenUtils.is_token_valid(token)
+    assert TokenUtils.get_user_id(token) == "1"
+    TokenUtils.get_expire_date(token)
+    assert len(decodes) == 1
+
+    # Tokens signed by this process are never decoded
+    issued = TokenUtils.get_token({"user_id": "2"}, exp_date=datetime.now() + timedelta(minutes=5))
+    assert TokenUtils.get_user_id(issued) == "2"
+    assert len(decodes) == 1
+
+
+def test_invalid_tokens(jwt_secret):
+    expired = jwt.encode({"user_id": "1", "exp": (datetime.now() - timedelta(minutes=5)).timestamp()}, jwt_secret, algorithm="HS256")
+    forged = jwt.encode({"user_id": "1", "exp": (datetime.now() + timedelta(minutes=5)).timestamp()}, "not-the-secret", algorithm="HS256")
+    assert TokenUtils.verify_token(expired) is None
+    assert TokenUtils.verify_token(forged) is None
+    assert TokenUtils.verify_token("not-a-jwt") is None
+
+
+def test_bearer_auth_rejects_invalid_token(client: TestClient, jwt_secret):
+    response = client.post("/v1/auth/session", headers={"Authorization": "Bearer not-a-jwt"})
+    assert response.status_code == 401
@@ -6,6 +6,36 @@ import pymongo
 import json
 import sys
 import os
+from datetime import datetime
+
+# MAX_SESSIONS_PER_USER of the API, see api/src/epa_api/api_implementation/utils/token.py
+MAX_SESSIONS_PER_USER = 5
+
+
+def migrate_session_tokens(collection):
+    """
+    Folds the session tokens stored one document per token ({"session_token", "user_id", "expires_at"}) into the
+    sessions array of one document per user, keeping the newest MAX_SESSIONS_PER_USER unexpired ones, so that
+    the unique user_id index can be built. Running it again does nothing.
+    """
+    now = datetime.now()
+    sessions_by_user = {}
+    for document in collection.find({"session_token": {"$exists": True}}):
+        if document["expires_at"] > now:
+            sessions_by_user.setdefault(document["user_id"], []).append(
+                {"session_token": document["session_token"], "expires_at": document["expires_at"]})
+    for user_id, sessions in sessions_by_user.items():
+        collection.update_one(
+            {"user_id": user_id, "session_token": {"$exists": False}},
+            {
+                "$push": {"sessions": {"$each": sessions, "$sort": {"expires_at": 1}, "$slice": -MAX_SESSIONS_PER_USER}},
+                "$max": {"expires_at": max(session["expires_at"] for session in sessions)}
+            },
+            upsert=True
+        )
+    collection.delete_many({"session_token": {"$exists": True}})
+    return len(sessions_by_user)
+
 
 hostname = os.getenv("MONGO_DB_HOSTNAME")
 username = os.getenv("MONGO_INITDB_ROOT_USERNAME")
@@ -25,14 +55,22 @@ try:
     client.admin.command('ping')
     
     db = client["epa_database"]
+    existing = db.list_collection_names()
     for collection in config_file.get("collections", []):
-        db.create_collection(collection.get("name", ""))
+        # Existing deployments are updated in place: their collections are kept and their indexes added
+        if collection.get("name", "") not in existing:
+            db.create_collection(collection.get("name", ""))
         new_collection = db[collection.get("name", "")]
+        if collection.get("name", "") == "session_tokens":
+            print(f"Migrated the session tokens of {migrate_session_tokens(new_collection)} users")
         for idx in collection.get("indexes", []):
-            if idx.get("expireAfterSeconds", None):
-                new_collection.create_index(idx.get("field", ""), unique=idx.get("unique", False), expireAfterSeconds=idx.get("expireAfterSeconds", 0))
-            else:
-                new_collection.create_index(idx.get("field", ""), unique=idx.get("unique", False))
+            # Sparse indexes skip documents without the field, e.g. a unique google_id only among Google users
+            options = {"unique": idx.get("unique", False), "sparse": idx.get("sparse", False)}
+            if idx.get("expireAfterSeconds", None) is not None:
+                options["expireAfterSeconds"] = idx.get("expireAfterSeconds", 0)
+            # Compound and geo indexes list their keys with a direction or type, e.g. [["location", "2dsphere"]]
+            keys = idx.get("fields") or [[idx.get("field", ""), pymongo.ASCENDING]]
+            new_collection.create_index([tuple(key) for key in keys], **options)
             
     print(f"MongoDB database at {hostname}:27017 initialized")
     
@@ -0,0 +1,102 @@
+import bisect
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_CHUNK_SIZE = 10
+DEFAULT_MAX_CHUNK_SIZE = 10000
+DEFAULT_TARGET_LATENCY_MS = 250
+ADDITIVE_INCREASE = 100
+MULTIPLICATIVE_DECREASE = 0.5
+STATS_LOG_SECONDS = 60
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# One batcher per container, warm invocations keep what it learned
+_batcher = None
+
+
+class LatencyHistogram:
+    """Counts of bulk write latencies per bucket, a bucket holds the latencies up to its bound."""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, latency_ms):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+
+    def snapshot(self):
+        """Returns {"5": <count>, "10": <count>, ..., "+Inf": <count>}"""
+        bounds = [str(bound) for bound in LATENCY_BUCKETS_MS] + ["+Inf"]
+        return dict(zip(bounds, self.counts))
+
+
+class AdaptiveBatcher:
+    """
+    Sizes the bulk writes of the posts with additive increase, multiplicative decrease (AIMD).
+
+    A write slower than the target latency or failing as a whole (e.g. a timeout) halves the chunk size,
+    a full chunk written within the target latency grows it by ADDITIVE_INCREASE posts.
+    The chunk size so converges to the largest writes the cluster absorbs within the target latency.
+    It is shared by the threads of the container (see consumer), so it is guarded by a lock.
+    """
+
+    def __init__(self, initial=1000, minimum=DEFAULT_MIN_CHUNK_SIZE, maximum=DEFAULT_MAX_CHUNK_SIZE, target_latency_ms=DEFAULT_TARGET_LATENCY_MS):
+        self.minimum = min(minimum, initial)
+        self.maximum = max(maximum, initial)
+        self.target_latency_ms = target_latency_ms
+        self._chunk_size = initial
+        self.histogram = LatencyHistogram()
+        self.writes = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.logged_at = time.monotonic()
+
+    @property
+    def chunk_size(self):
+        return self._chunk_size
+
+    def record(self, size, latency_ms, error=False):
+        """Adapts the chunk size to a bulk write of size posts, which took latency_ms."""
+        with self.lock:
+            self.writes += 1
+            self.histogram.observe(latency_ms)
+            if error or latency_ms > self.target_latency_ms:
+                self.errors += error
+                self._chunk_size = max(self.minimum, int(self._chunk_size * MULTIPLICATIVE_DECREASE))
+            elif size >= self._chunk_size:
+                # Only a full chunk shows the cluster can take more
+                self._chunk_size = min(self.maximum, self._chunk_size + ADDITIVE_INCREASE)
+
+            if time.monotonic() - self.logged_at >= STATS_LOG_SECONDS:
+                self.logged_at = time.monotonic()
+                logger.info("Bulk writes: %s", self.get_stats())
+
+    def get_stats(self):
+        """
+        Returns:
+          {"chunk_size": 1100, "writes": 12, "errors": 0, "latency_ms": {"5": 0, ..., "+Inf": 0}}
+        """
+        return {"chunk_size": self._chunk_size, "writes": self.writes, "errors": self.errors, "latency_ms": self.histogram.snapshot()}
+
+
+def get_batcher(env_vars):
+    """Returns the AdaptiveBatcher of the container, created on the first call from env_vars (see config.get_env_vars)."""
+    global _batcher
+    if _batcher is None:
+        _batcher = AdaptiveBatcher(
+            initial=env_vars["INGEST_CHUNK_SIZE"],
+            minimum=env_vars.get("INGEST_MIN_CHUNK_SIZE", DEFAULT_MIN_CHUNK_SIZE),
+            maximum=env_vars.get("INGEST_MAX_CHUNK_SIZE", DEFAULT_MAX_CHUNK_SIZE),
+            target_latency_ms=env_vars.get("INGEST_TARGET_LATENCY_MS", DEFAULT_TARGET_LATENCY_MS),
+        )
+    return _batcher
+
+
+def clear():
+    """Forget the batcher, the next call to get_batcher creates a new one."""
+    global _batcher
+    _batcher = None
@@ -0,0 +1,78 @@
+"""
+Harness for cold and warm invocations of the post ingestor
+
+Invokes lambda_handler with batches of synthetic posts against a local mongod and
+reports the latency of:
+    - cold invocations: the configuration and client of the container are dropped
+      before each invocation, as in a new container
+    - warm invocations: the container state is reused
+    - thawed invocations: the client is reused after MONGO_HEALTH_CHECK_SECONDS,
+      as after a freeze, so it is pinged first
+
+    MONGO_URI=mongodb://localhost:27017 MONGO_DB=epa_bench python benchmarks/bench_cold_warm.py --invocations 50
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import config
+import mongo
+from main import lambda_handler
+
+
+def get_event(invocation, size):
+    records = [
+        {"topic": "bench-cold-warm", "partition": 0, "offset": invocation * size + offset, "value": {"title": "post"}}
+        for offset in range(size)
+    ]
+    return {"event": "INGEST_POSTS", "records": records}
+
+
+def invoke(invocation, size):
+    start = time.perf_counter()
+    response = lambda_handler(get_event(invocation, size), None)
+    elapsed = time.perf_counter() - start
+    assert not response["body"]["failures"], response["body"]["failures"][:3]
+    return elapsed * 1000
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<8} median {statistics.median(latencies):8.2f} ms, p95 {p95:8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invocations", type=int, default=20)
+    parser.add_argument("--records", type=int, default=100)
+    args = parser.parse_args()
+    os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+    os.environ.setdefault("MONGO_COLLECTION", "bench_cold_warm")
+
+    invocation = 0
+    cold, warm, thawed = [], [], []
+    for _ in range(args.invocations):
+        config.clear()
+        mongo.close_client()
+        cold.append(invoke(invocation, args.records))
+        invocation += 1
+    for _ in range(args.invocations):
+        warm.append(invoke(invocation, args.records))
+        invocation += 1
+    for _ in range(args.invocations):
+        # Pretend the container was frozen for longer than the health check interval
+        mongo._last_used_at -= config.get_env_vars()["MONGO_HEALTH_CHECK_SECONDS"]
+        thawed.append(invoke(invocation, args.records))
+        invocation += 1
+
+    report("cold", cold)
+    report("warm", warm)
+    report("thawed", thawed)
+    env_vars = config.get_env_vars()
+    mongo.get_client(env_vars)[env_vars["MONGO_DB"]][env_vars["MONGO_COLLECTION"]].drop()
+    mongo.close_client()
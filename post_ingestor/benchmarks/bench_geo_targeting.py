@@ -0,0 +1,96 @@
+"""
+Benchmark for the geo targeting of the notifier
+
+Builds the subscription index (subscription_index.SubscriptionIndex) of synthetic users, --city-users living in a
+New York sized area and --other-users spread over the continental US, each with a home location and half of them with a
+current location, and reports its build time and number of cells. Then, for posts at random locations of the city,
+reports the latency of resolving the subscribers near the post (SubscriptionIndex.resolve_nearby) at each geohash precision,
+against resolving every subscriber of the category (SubscriptionIndex.resolve) then keeping those within the same
+distance (the naive scan). Everything runs in memory.
+
+    python benchmarks/bench_geo_targeting.py --city-users 1000000 --other-users 1000000 --queries 200
+"""
+
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from geohash import get_cell_size
+from subscription_index import GEO_PRECISIONS, LOCATION_FIELDS, SubscriptionIndex, get_point
+
+CATEGORIES = ["traffic", "weather", "crime", "fire", "event", "health", "outage", "protest", "transit", "school"]
+CITY = ((40.5, 40.9), (-74.25, -73.7))
+US = ((25.0, 49.0), (-124.0, -67.0))
+
+
+def get_users(city_users, other_users, tags_per_category):
+    tags = [f"tag-{i}" for i in range(tags_per_category)]
+    weights = [1 / (rank + 1) for rank in range(tags_per_category)]
+    for user in range(city_users + other_users):
+        (lats, lngs) = CITY if user < city_users else US
+        document = {"user_id": f"user-{user}", "subscriptions": []}
+        for category in random.sample(CATEGORIES, random.randint(1, 3)):
+            count = 0 if random.random() < 1 / 3 else random.randint(1, 5)
+            document["subscriptions"].append({"category": category, "tags": list(set(random.choices(tags, weights=weights, k=count)))})
+        for field in LOCATION_FIELDS[:1 if random.random() < 0.5 else 2]:
+            document[field] = {"type": "Point", "coordinates": [random.uniform(*lngs), random.uniform(*lats)]}
+        yield document
+
+
+def get_distance_m(lat, lng, other_lat, other_lng):
+    """Equirectangular approximation, accurate at city scale."""
+    x = math.radians(other_lng - lng) * math.cos(math.radians((lat + other_lat) / 2))
+    return math.hypot(x, math.radians(other_lat - lat)) * 6371000
+
+
+def percentiles(latencies):
+    cuts = statistics.quantiles(latencies, n=100)
+    return f"p50 {cuts[49]:8.3f} ms  p99 {cuts[98]:8.3f} ms"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--city-users", type=int, default=1000000)
+    parser.add_argument("--other-users", type=int, default=1000000)
+    parser.add_argument("--tags-per-category", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--tags", type=int, default=2)
+    args = parser.parse_args()
+    random.seed(1)
+
+    # Locations by ordinal, for the naive scan
+    points = []
+
+    def remember(users):
+        for user in users:
+            points.append([point for point in (get_point(user.get(field)) for field in LOCATION_FIELDS) if point])
+            yield user
+
+    start = time.perf_counter()
+    index = SubscriptionIndex.from_users(remember(get_users(args.city_users, args.other_users, args.tags_per_category)))
+    elapsed = time.perf_counter() - start
+    print(f"Indexed {len(index.user_ids)} users in {elapsed:.1f}s, {len(index.postings)} postings, {len(index.cells)} cells")
+
+    tags = [f"tag-{i}" for i in range(args.tags_per_category)]
+    queries = [(random.choice(CATEGORIES), random.sample(tags, args.tags), (random.uniform(*CITY[0]), random.uniform(*CITY[1])))
+               for _ in range(args.queries)]
+    for precision in GEO_PRECISIONS:
+        # The naive scan keeps the subscribers within the size of a cell, about the radius covered by the 9 cells
+        radius = get_cell_size(precision)[0] * 111320
+        nearby, naive, sizes = [], [], []
+        for category, post_tags, (lat, lng) in queries:
+            start = time.perf_counter()
+            sizes.append(len(index.get_user_ids(index.resolve_nearby(category, post_tags, (lat, lng), precision))))
+            nearby.append((time.perf_counter() - start) * 1000)
+            if len(naive) < 20:
+                start = time.perf_counter()
+                [ordinal for ordinal in index.resolve(category, post_tags)
+                 if any(get_distance_m(lat, lng, *point) <= radius for point in points[ordinal])]
+                naive.append((time.perf_counter() - start) * 1000)
+        print(f"precision {precision} (~{radius / 1000:.1f} km)  nearby {percentiles(nearby)}  naive scan {percentiles(naive)}  "
+              f"({statistics.mean(sizes):,.0f} recipients)")
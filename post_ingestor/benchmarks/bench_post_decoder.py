@@ -0,0 +1,98 @@
+"""
+Benchmark for the decoding of Lambda Kafka events
+
+Builds a synthetic Lambda Kafka event of about --payload-mb MB (base64 encoded
+JSON posts spread over --partitions partitions) and reports the time and the
+peak memory allocated (tracemalloc) by:
+    - materialized: every record decoded with json into a list of posts first,
+      then written by write_posts
+    - streaming: decode_kafka_event consumed by write_posts in chunks
+      of --chunk-size posts, written to a collection discarding them
+The memory of the event itself is not counted.
+
+    python benchmarks/bench_post_decoder.py --payload-mb 6
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import orjson
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from post_decoder import Post, decode_kafka_event
+from post_writer import write_posts
+
+
+class DiscardingCollection:
+    class Result:
+        def __init__(self, count):
+            self.bulk_api_result = {"nUpserted": count, "nMatched": 0}
+
+    def bulk_write(self, operations, ordered=True):
+        return DiscardingCollection.Result(len(operations))
+
+
+def get_event(payload_mb, partitions):
+    topic = "post-ingestor-consumer"
+    records = {f"{topic}-{partition}": [] for partition in range(partitions)}
+    size, offset = 0, 0
+    while size < payload_mb * 1024 * 1024:
+        post = {
+            "user_id": str(offset % 1000),
+            "title": f"Event {offset}",
+            "category": "traffic",
+            "description": "Road closed after an accident, use the other lane. " * 4,
+            "tags": ["accident", "road"],
+            "location": {"lat": 40.7, "lng": -74.0},
+            "created_at": "2026-01-01T12:00:00Z",
+        }
+        value = base64.b64encode(orjson.dumps(post)).decode()
+        partition = offset % partitions
+        records[f"{topic}-{partition}"].append({"topic": topic, "partition": partition, "offset": offset, "timestamp": 0, "value": value})
+        size += len(value) + 100
+        offset += 1
+    return {"eventSource": "aws:kafka", "records": records}, offset
+
+
+def materialized(event, chunk_size):
+    posts = [
+        Post.from_value(record["topic"], record["partition"], record["offset"], json.loads(base64.b64decode(record["value"])))
+        for partition_records in event["records"].values()
+        for record in partition_records
+    ]
+    return write_posts(DiscardingCollection(), posts, chunk_size)["inserted"]
+
+
+def streaming(event, chunk_size):
+    failures = []
+    result = write_posts(DiscardingCollection(), decode_kafka_event(event, failures), chunk_size, failures)
+    assert not result["failures"]
+    return result["inserted"]
+
+
+def measure(name, function, event, chunk_size):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = function(event, chunk_size)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<13} {count:8} records in {elapsed * 1000:8.1f} ms (under tracemalloc), peak {peak / 1024 / 1024:7.2f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payload-mb", type=float, default=6)
+    parser.add_argument("--partitions", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    event, count = get_event(args.payload_mb, args.partitions)
+    print(f"{count} records, {args.payload_mb} MB event")
+    measure("materialized", materialized, event, args.chunk_size)
+    measure("streaming", streaming, event, args.chunk_size)
@@ -0,0 +1,67 @@
+"""
+Benchmark for the batched posts writer
+
+Writes synthetic post records to a scratch collection of a local mongod with
+write_posts, for each chunk size, and reports the throughput in docs/s. Each
+batch is then written a second time, to measure redeliveries (all duplicates).
+The adaptive batcher (batcher.AdaptiveBatcher) is then run the same way, and
+its final chunk size and latency histogram are reported.
+The scratch collection is dropped afterwards.
+
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_post_writer.py --records 20000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from batcher import AdaptiveBatcher
+from post_decoder import decode_records
+from post_writer import write_posts
+
+
+def get_records(count, topic):
+    return [
+        {"topic": topic, "partition": offset % 4, "offset": offset, "value": {"user_id": "1", "title": f"post {offset}", "category": "traffic", "description": "x" * 200}}
+        for offset in range(count)
+    ]
+
+
+def run(collection, records, chunk_size, batcher=None):
+    start = time.perf_counter()
+    result = write_posts(collection, decode_records(records, []), chunk_size, batcher=batcher)
+    elapsed = time.perf_counter() - start
+    assert not result["failures"], result["failures"][:3]
+    return len(records) / elapsed, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+    parser.add_argument("--collection", default="bench_posts")
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    collection = client[os.getenv("MONGO_DB", "epa_bench")][args.collection]
+    collection.drop()
+    try:
+        for chunk_size in args.chunk_sizes:
+            records = get_records(args.records, f"bench-{chunk_size}")
+            first, result = run(collection, records, chunk_size)
+            redelivered, _ = run(collection, records, chunk_size)
+            print(f"chunk {chunk_size:>6}: {first:10,.0f} docs/s inserted ({result['inserted']}), {redelivered:10,.0f} docs/s redelivered")
+
+        batcher = AdaptiveBatcher(initial=args.chunk_sizes[0])
+        records = get_records(args.records, "bench-adaptive")
+        first, result = run(collection, records, None, batcher)
+        redelivered, _ = run(collection, records, None, batcher)
+        print(f"adaptive    : {first:10,.0f} docs/s inserted ({result['inserted']}), {redelivered:10,.0f} docs/s redelivered")
+        print(f"adaptive stats: {batcher.get_stats()}")
+    finally:
+        collection.drop()
+        client.close()
@@ -0,0 +1,48 @@
+"""
+Benchmark for the push dispatcher of the notifier
+
+Sends the notifications of --posts posts to --devices devices through the stub push server of the tests
+(tests/push_server.py), which takes --latency-ms per batch, and reports the notifications/s and events/s
+(a post for a device, coalesced into one notification per device) for several numbers of pooled connections.
+Everything runs locally, the rate limits of the providers are set above what the stub can take.
+
+    python benchmarks/bench_push_dispatcher.py --devices 100000 --posts 3 --latency-ms 20
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests"))
+from post_decoder import Post
+from push_dispatcher import Provider, PushDispatcher
+from push_server import PushServer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=100000)
+    parser.add_argument("--posts", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--latency-ms", type=int, default=20)
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    posts = [Post("posts", 0, offset, "author", f"Post {offset}", "traffic") for offset in range(args.posts)]
+    with PushServer(latency_ms=args.latency_ms) as server:
+        for connections in args.connections:
+            providers = [Provider(name, server.url(name), args.batch_size, rate=1e9) for name in ("fcm", "apns")]
+            dispatcher = PushDispatcher(providers, max_connections=connections)
+            start = time.perf_counter()
+            for i in range(args.devices):
+                device = {"provider": "fcm" if i % 2 else "apns", "token": f"token-{i}"}
+                for post in posts:
+                    dispatcher.submit(device, post)
+            result = dispatcher.dispatch()
+            elapsed = time.perf_counter() - start
+            dispatcher.close()
+            print(f"{connections:>3} connections  {result['notifications'] / elapsed:>9,.0f} notifications/s  "
+                  f"{args.devices * args.posts / elapsed:>9,.0f} events/s  ({result['batches']} batches in {elapsed:.2f}s, "
+                  f"{result['failed']} failed)")
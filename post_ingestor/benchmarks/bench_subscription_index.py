@@ -0,0 +1,77 @@
+"""
+Benchmark for the subscription index
+
+Builds the index (subscription_index.SubscriptionIndex) of synthetic users, 1M subscriptions by default, with tag
+popularity following a Zipf-like distribution, and reports its build time and serialized size. Then, for posts with
+1 to 20 tags, reports the latency of resolving the users who see the post (union, SubscriptionIndex.resolve), of the
+users subscribed to all of its tags (intersection, SubscriptionIndex.resolve_all), and of listing the user ids.
+Everything runs in memory.
+
+    python benchmarks/bench_subscription_index.py --subscriptions 1000000 --queries 200
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from subscription_index import SubscriptionIndex
+
+CATEGORIES = ["traffic", "weather", "crime", "fire", "event", "health", "outage", "protest", "transit", "school"]
+
+
+def get_users(subscriptions, tags_per_category):
+    tags = [f"tag-{i}" for i in range(tags_per_category)]
+    weights = [1 / (rank + 1) for rank in range(tags_per_category)]
+    user = 0
+    while subscriptions > 0:
+        user_subscriptions = []
+        for category in random.sample(CATEGORIES, min(subscriptions, random.randint(1, 3))):
+            # A third of the subscriptions cover the whole category
+            count = 0 if random.random() < 1 / 3 else random.randint(1, 5)
+            user_subscriptions.append({"category": category, "tags": list(set(random.choices(tags, weights=weights, k=count)))})
+        subscriptions -= len(user_subscriptions)
+        yield {"user_id": f"user-{user}", "subscriptions": user_subscriptions}
+        user += 1
+
+
+def percentiles(latencies):
+    cuts = statistics.quantiles(latencies, n=100)
+    return f"p50 {cuts[49]:7.3f} ms  p99 {cuts[98]:7.3f} ms"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscriptions", type=int, default=1000000)
+    parser.add_argument("--tags-per-category", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--tag-counts", type=int, nargs="+", default=[1, 2, 5, 10, 20])
+    args = parser.parse_args()
+    random.seed(1)
+
+    start = time.perf_counter()
+    index = SubscriptionIndex.from_users(get_users(args.subscriptions, args.tags_per_category))
+    elapsed = time.perf_counter() - start
+    size = sum(len(posting.to_bytes()) for posting in index.postings.values())
+    print(f"Indexed {args.subscriptions} subscriptions of {len(index.user_ids)} users in {elapsed:.1f}s, "
+          f"{len(index.postings)} postings, {size / 1e6:.1f} MB serialized")
+
+    tags = [f"tag-{i}" for i in range(args.tags_per_category)]
+    for tag_count in args.tag_counts:
+        union, intersection, listing, sizes = [], [], [], []
+        for _ in range(args.queries):
+            category, post_tags = random.choice(CATEGORIES), random.sample(tags, tag_count)
+            start = time.perf_counter()
+            subscribers = index.resolve(category, post_tags)
+            union.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            index.resolve_all(category, post_tags)
+            intersection.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            sizes.append(len(index.get_user_ids(subscribers)))
+            listing.append((time.perf_counter() - start) * 1000)
+        print(f"{tag_count:>2} tags  union {percentiles(union)}  intersection {percentiles(intersection)}  "
+              f"user ids {percentiles(listing)}  ({statistics.mean(sizes):,.0f} users)")
@@ -0,0 +1,85 @@
+"""
+Benchmark for the timeline loader
+
+For each number of subscribers per post, loads that many synthetic users subscribed to one category into a scratch
+users collection of a local mongod, caches their (empty) timelines in a local Redis, then adds a batch of posts of that
+category to them with load_timelines, for each pipeline chunk size. Reports the timeline writes/s (posts added to a
+timeline), subscriber resolution included. Chunks of 1 timeline (no pipelining) are only run up to 10000 subscribers.
+The scratch collection and timelines are deleted afterwards.
+
+    MONGO_URI=mongodb://localhost:27017 REDIS_URL=redis://localhost:6379/0 python benchmarks/bench_timeline_loader.py --posts 10
+"""
+
+from datetime import datetime, timezone
+import argparse
+import os
+import sys
+import time
+
+from pymongo import MongoClient
+import redis
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import subscribers
+from config import get_env_vars
+from post_decoder import Post
+from timeline_loader import load_timelines
+from timeline_writer import get_key
+
+# The lowest member of a timeline cached by the API
+MARKER = b"subscriptions:[]"
+
+
+def cache_timelines(client, user_ids, ttl_seconds):
+    for start in range(0, len(user_ids), 10000):
+        with client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids[start:start + 10000]:
+                pipe.zadd(get_key(user_id), {MARKER: float("-inf")})
+                pipe.expire(get_key(user_id), ttl_seconds)
+            pipe.execute()
+
+
+def delete_timelines(client, user_ids):
+    for start in range(0, len(user_ids), 10000):
+        client.delete(*[get_key(user_id) for user_id in user_ids[start:start + 10000]])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1, 10, 100, 1000, 10000, 100000])
+    parser.add_argument("--posts", type=int, default=10, help="Posts per batch")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[1, 100, 1000, 5000])
+    parser.add_argument("--collection", default="bench_users")
+    args = parser.parse_args()
+
+    mongo_client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    users = mongo_client[os.getenv("MONGO_DB", "epa_bench")][args.collection]
+    client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    env_vars = get_env_vars()
+    users.drop()
+    users.create_index("subscriptions.category")
+    try:
+        for count in args.subscribers:
+            category = f"bench-{count}"
+            user_ids = [f"bench-{count}-{i}" for i in range(count)]
+            for start in range(0, count, 10000):
+                users.insert_many([{"user_id": user_id, "subscriptions": [{"category": category}]} for user_id in user_ids[start:start + 10000]])
+            cache_timelines(client, user_ids, env_vars["TIMELINE_TTL_SECONDS"])
+
+            for chunk_size in args.chunk_sizes:
+                if chunk_size == 1 and count > 10000:
+                    continue
+                run_vars = {**env_vars, "TIMELINE_PIPELINE_CHUNK": chunk_size, "TIMELINE_CELEBRITY_THRESHOLD": count}
+                now = datetime.now(timezone.utc)
+                posts = [Post("bench", chunk_size, offset, "1", f"post {offset}", category, created_at=now) for offset in range(args.posts)]
+                subscribers.clear()
+                start = time.perf_counter()
+                result = load_timelines(posts, run_vars, users, client)
+                elapsed = time.perf_counter() - start
+                assert result["timelines"] == count, result
+                print(f"subscribers {count:>7}  chunk {chunk_size:>5}: {result['entries'] / elapsed:12,.0f} timeline writes/s  ({elapsed * 1000:9.1f} ms per batch)")
+            delete_timelines(client, user_ids)
+    finally:
+        users.drop()
+        client.close()
+        mongo_client.close()
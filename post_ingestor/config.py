@@ -0,0 +1,118 @@
+import os
+import orjson
+
+# The push providers of the notifier, see push_dispatcher.get_providers
+DEFAULT_PUSH_PROVIDERS = {
+    "fcm": {"url": "http://epa-push-gateway:8080/fcm/batch", "batch_size": 500, "rate": 1000},
+    "apns": {"url": "http://epa-push-gateway:8080/apns/batch", "batch_size": 100, "rate": 1000},
+}
+
+# Read once per container, warm invocations reuse it
+_env_vars = None
+
+
+def get_env_vars():
+    """
+    Returns the ingestor configuration, read from the environment on the first call.
+
+    env_vars = ["KAFKA_TOKEN", "MONGO_SECRET", "MONGO_URI", "MONGO_DB", "MONGO_COLLECTION",
+                "MONGO_ATTEMPTS_COLLECTION", "MONGO_DEAD_LETTER_COLLECTION", "INGEST_CHUNK_SIZE",
+                "INGEST_MIN_CHUNK_SIZE", "INGEST_MAX_CHUNK_SIZE", "INGEST_TARGET_LATENCY_MS", "INGEST_LINGER_MS",
+                "INGEST_MAX_ATTEMPTS", "MONGO_MAX_POOL_SIZE", "MONGO_HEALTH_CHECK_SECONDS",
+                "KAFKA_BOOTSTRAP_SERVERS", "KAFKA_TOPIC", "KAFKA_GROUP_ID", "KAFKA_BATCH_SIZE", "KAFKA_MAX_IN_FLIGHT_BATCHES",
+                "MONGO_USER_COLLECTION", "REDIS_URL", "REDIS_TIMEOUT_MS", "TIMELINE_MAX_LENGTH", "TIMELINE_TTL_SECONDS",
+                "TIMELINE_PIPELINE_CHUNK", "TIMELINE_CELEBRITY_THRESHOLD", "MONGO_SUBSCRIPTION_INDEX_COLLECTION",
+                "MONGO_SUBSCRIPTION_CHANGES_COLLECTION", "SUBSCRIPTION_REFRESH_SECONDS", "MONGO_DEVICE_COLLECTION",
+                "NOTIFY_KAFKA_TOPIC", "NOTIFY_KAFKA_GROUP_ID", "PUSH_PROVIDERS", "PUSH_COALESCE_MS", "PUSH_MAX_CONNECTIONS",
+                "PUSH_TIMEOUT_MS", "PUSH_MAX_ATTEMPTS", "NOTIFY_GEO_PRECISION"]
+    """
+    global _env_vars
+    if _env_vars is not None:
+        return _env_vars
+
+    # FILL WITH REAL VALUES LATER
+    env_vars = {}
+    env_vars["KAFKA_TOKEN"] = os.getenv("KAFKA_TOKEN", "KAFKA_TOKEN")
+    env_vars["MONGO_SECRET"] = os.getenv("MONGO_SECRET", "MONGO_SECRET")
+    env_vars["MONGO_URI"] = os.getenv("MONGO_URI", "MONGO_URI")
+    env_vars["MONGO_DB"] = os.getenv("MONGO_DB", "MONGO_DB")
+    env_vars["MONGO_COLLECTION"] = os.getenv("MONGO_COLLECTION", "posts")
+    env_vars["MONGO_ATTEMPTS_COLLECTION"] = os.getenv("MONGO_ATTEMPTS_COLLECTION", "ingest_attempts")
+    env_vars["MONGO_DEAD_LETTER_COLLECTION"] = os.getenv("MONGO_DEAD_LETTER_COLLECTION", "posts_dead_letter")
+    env_vars["INGEST_CHUNK_SIZE"] = get_int("INGEST_CHUNK_SIZE", 1000)
+    env_vars["INGEST_MIN_CHUNK_SIZE"] = get_int("INGEST_MIN_CHUNK_SIZE", 10)
+    env_vars["INGEST_MAX_CHUNK_SIZE"] = get_int("INGEST_MAX_CHUNK_SIZE", 10000)
+    env_vars["INGEST_TARGET_LATENCY_MS"] = get_int("INGEST_TARGET_LATENCY_MS", 250)
+    env_vars["INGEST_LINGER_MS"] = get_int("INGEST_LINGER_MS", 50, minimum=0)
+    env_vars["INGEST_MAX_ATTEMPTS"] = get_int("INGEST_MAX_ATTEMPTS", 3)
+    env_vars["MONGO_MAX_POOL_SIZE"] = get_int("MONGO_MAX_POOL_SIZE", 10)
+    env_vars["MONGO_HEALTH_CHECK_SECONDS"] = get_int("MONGO_HEALTH_CHECK_SECONDS", 60)
+
+    # Consumer mode only, see consumer
+    env_vars["KAFKA_BOOTSTRAP_SERVERS"] = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "epa-kafka-broker:9092")
+    env_vars["KAFKA_TOPIC"] = os.getenv("KAFKA_TOPIC", "post-ingestor-consumer")
+    env_vars["KAFKA_GROUP_ID"] = os.getenv("KAFKA_GROUP_ID", "post-ingestor")
+    env_vars["KAFKA_BATCH_SIZE"] = get_int("KAFKA_BATCH_SIZE", 500)
+    env_vars["KAFKA_MAX_IN_FLIGHT_BATCHES"] = get_int("KAFKA_MAX_IN_FLIGHT_BATCHES", 2)
+
+    # Timeline loader only, see timeline_loader
+    env_vars["REDIS_URL"] = os.getenv("REDIS_URL", "redis://redis:6379/0")
+    env_vars["REDIS_TIMEOUT_MS"] = get_int("REDIS_TIMEOUT_MS", 1000)
+    env_vars["TIMELINE_MAX_LENGTH"] = get_int("TIMELINE_MAX_LENGTH", 500)
+    env_vars["TIMELINE_TTL_SECONDS"] = get_int("TIMELINE_TTL_SECONDS", 3600)
+    env_vars["TIMELINE_PIPELINE_CHUNK"] = get_int("TIMELINE_PIPELINE_CHUNK", 1000)
+    env_vars["TIMELINE_CELEBRITY_THRESHOLD"] = get_int("TIMELINE_CELEBRITY_THRESHOLD", 10000, minimum=0)
+
+    # Subscription index, see subscription_index
+    env_vars["MONGO_USER_COLLECTION"] = os.getenv("MONGO_USER_COLLECTION", "users")
+    env_vars["MONGO_SUBSCRIPTION_INDEX_COLLECTION"] = os.getenv("MONGO_SUBSCRIPTION_INDEX_COLLECTION", "subscription_index")
+    env_vars["MONGO_SUBSCRIPTION_CHANGES_COLLECTION"] = os.getenv("MONGO_SUBSCRIPTION_CHANGES_COLLECTION", "subscription_changes")
+    env_vars["SUBSCRIPTION_REFRESH_SECONDS"] = get_int("SUBSCRIPTION_REFRESH_SECONDS", 30, minimum=0)
+
+    # Notifier only, see notifier
+    env_vars["MONGO_DEVICE_COLLECTION"] = os.getenv("MONGO_DEVICE_COLLECTION", "devices")
+    env_vars["NOTIFY_KAFKA_TOPIC"] = os.getenv("NOTIFY_KAFKA_TOPIC", "notify-service-consumer")
+    env_vars["NOTIFY_KAFKA_GROUP_ID"] = os.getenv("NOTIFY_KAFKA_GROUP_ID", "notifier")
+    env_vars["PUSH_PROVIDERS"] = get_json("PUSH_PROVIDERS", DEFAULT_PUSH_PROVIDERS)
+    env_vars["PUSH_COALESCE_MS"] = get_int("PUSH_COALESCE_MS", 2000, minimum=0)
+    env_vars["PUSH_MAX_CONNECTIONS"] = get_int("PUSH_MAX_CONNECTIONS", 20)
+    env_vars["PUSH_TIMEOUT_MS"] = get_int("PUSH_TIMEOUT_MS", 5000)
+    env_vars["PUSH_MAX_ATTEMPTS"] = get_int("PUSH_MAX_ATTEMPTS", 3)
+    # Checked against the precisions of the subscription index by notifier.get_geo_precision
+    env_vars["NOTIFY_GEO_PRECISION"] = get_int("NOTIFY_GEO_PRECISION", 5, minimum=0)
+
+    _env_vars = env_vars
+    return _env_vars
+
+
+def get_int(var, default, minimum=1):
+    value = os.getenv(var)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{var} must be an integer, got {value!r}")
+    if number < minimum:
+        raise ValueError(f"{var} must be at least {minimum}, got {number}")
+    return number
+
+
+def get_json(var, default):
+    """A JSON object variable, e.g. PUSH_PROVIDERS."""
+    value = os.getenv(var)
+    if value is None or value == "":
+        return default
+    try:
+        decoded = orjson.loads(value)
+    except orjson.JSONDecodeError as e:
+        raise ValueError(f"{var} must be JSON, got {value!r}: {e}")
+    if not isinstance(decoded, dict):
+        raise ValueError(f"{var} must be a JSON object, got {value!r}")
+    return decoded
+
+
+def clear():
+    """Forget the configuration, the next call to get_env_vars reads the environment again."""
+    global _env_vars
+    _env_vars = None
@@ -0,0 +1,159 @@
+import logging
+import queue
+import threading
+import time
+from confluent_kafka import Consumer, KafkaException, TopicPartition
+
+logger = logging.getLogger(__name__)
+
+RETRY_BACKOFF_SECONDS = 0.5
+MAX_RETRY_BACKOFF_SECONDS = 30
+
+
+def create_consumer(env_vars):
+    return Consumer({
+        "bootstrap.servers": env_vars["KAFKA_BOOTSTRAP_SERVERS"],
+        "group.id": env_vars["KAFKA_GROUP_ID"],
+        # Offsets are committed by the partition workers once their batch is written
+        "enable.auto.commit": False,
+        "auto.offset.reset": "earliest",
+    })
+
+
+class PartitionWorker(threading.Thread):
+    """
+    Ingests the batches of one partition in order, and commits the offset of a batch once all its records
+    are written or quarantined. Failed records are retried with an exponential backoff until then.
+    At most max_in_flight batches wait for the worker, see run_consumer.
+
+    With a target_size, consumed batches are coalesced for up to linger_seconds
+    until they hold target_size() messages, so small batches are written together.
+    """
+
+    def __init__(self, consumer, topic, partition, ingest, max_in_flight, target_size=None, linger_seconds=0):
+        super().__init__(name=f"{topic}-{partition}", daemon=True)
+        self.consumer = consumer
+        self.topic = topic
+        self.partition = partition
+        self.ingest = ingest
+        self.batches = queue.Queue(maxsize=max_in_flight)
+        self.stopping = threading.Event()
+        self.target_size = target_size
+        self.linger_seconds = linger_seconds
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                messages = self.coalesce(self.batches.get(timeout=0.2))
+            except queue.Empty:
+                continue
+            next_offset = messages[-1].offset() + 1
+            if not self.ingest_batch(messages):
+                # Stopped before the batch was written, it is consumed again from the committed offset
+                return
+            try:
+                self.consumer.commit(offsets=[TopicPartition(self.topic, self.partition, next_offset)], asynchronous=False)
+            except KafkaException:
+                # The next commit covers this batch, redelivered records are idempotent
+                logger.exception("Failed to commit offset %s of %s-%s", next_offset, self.topic, self.partition)
+
+    def coalesce(self, messages):
+        if self.target_size is None:
+            return messages
+        deadline = time.monotonic() + self.linger_seconds
+        while len(messages) < self.target_size():
+            remaining = deadline - time.monotonic()
+            try:
+                messages = messages + (self.batches.get(timeout=remaining) if remaining > 0 else self.batches.get_nowait())
+            except queue.Empty:
+                break
+        return messages
+
+    def ingest_batch(self, messages):
+        """Returns True once every message is written or quarantined, False if the worker is stopped first."""
+        backoff = RETRY_BACKOFF_SECONDS
+        while True:
+            try:
+                retried = self.ingest(messages)
+            except Exception:
+                logger.exception("Failed to ingest a batch of %s-%s", self.topic, self.partition)
+                retried = [{"offset": message.offset()} for message in messages]
+            if not retried:
+                return True
+
+            failed_offsets = {failure["offset"] for failure in retried}
+            messages = [message for message in messages if message.offset() in failed_offsets]
+            logger.warning("Retrying %d records of %s-%s in %.1fs", len(messages), self.topic, self.partition, backoff)
+            if self.stopping.wait(backoff):
+                return False
+            backoff = min(backoff * 2, MAX_RETRY_BACKOFF_SECONDS)
+
+    def stop(self):
+        """Waits for the batch being ingested, the batches still queued are dropped."""
+        self.stopping.set()
+        self.join()
+
+
+def run_consumer(env_vars, ingest, stop_event, consumer=None, poll_timeout=1.0, target_size=None):
+    """
+    Consumes KAFKA_TOPIC until stop_event is set, with one PartitionWorker per assigned partition
+    so partitions are ingested concurrently, each one in order.
+
+    ingest(messages) writes a batch of messages of one partition and returns the failures to retry.
+    A worker holds at most KAFKA_MAX_IN_FLIGHT_BATCHES batches, its partition is paused while they are all taken.
+    Batches are coalesced up to target_size() messages or INGEST_LINGER_MS, see PartitionWorker.
+    When partitions are revoked or the consumer stops, workers finish the batch they are ingesting
+    and commit it, uncommitted batches are consumed again by the next owner of the partition.
+    """
+    consumer = consumer or create_consumer(env_vars)
+    max_in_flight = env_vars["KAFKA_MAX_IN_FLIGHT_BATCHES"]
+    linger_seconds = env_vars.get("INGEST_LINGER_MS", 0) / 1000
+    workers = {}
+    # Batches of paused partitions, waiting for room in their worker
+    pending = {}
+
+    def stop_workers(keys):
+        for key in keys:
+            pending.pop(key, None)
+            worker = workers.pop(key, None)
+            if worker is not None:
+                worker.stop()
+
+    def on_revoke(consumer, partitions):
+        stop_workers([(partition.topic, partition.partition) for partition in partitions])
+
+    def dispatch(key, messages):
+        worker = workers.get(key)
+        if worker is None:
+            worker = workers[key] = PartitionWorker(consumer, key[0], key[1], ingest, max_in_flight, target_size, linger_seconds)
+            worker.start()
+        try:
+            worker.batches.put_nowait(messages)
+            return True
+        except queue.Full:
+            return False
+
+    consumer.subscribe([env_vars["KAFKA_TOPIC"]], on_revoke=on_revoke)
+    try:
+        while not stop_event.is_set():
+            for key, messages in list(pending.items()):
+                if dispatch(key, messages):
+                    del pending[key]
+                    consumer.resume([TopicPartition(*key)])
+
+            batches = {}
+            for message in consumer.consume(num_messages=env_vars["KAFKA_BATCH_SIZE"], timeout=poll_timeout):
+                if message.error():
+                    logger.warning("Kafka error: %s", message.error())
+                    continue
+                batches.setdefault((message.topic(), message.partition()), []).append(message)
+
+            for key, messages in batches.items():
+                if key in pending:
+                    pending[key].extend(messages)
+                elif not dispatch(key, messages):
+                    pending[key] = messages
+                    consumer.pause([TopicPartition(*key)])
+    finally:
+        stop_workers(list(workers))
+        consumer.close()
@@ -0,0 +1,51 @@
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+MAX_PRECISION = 12
+# Bits of longitude and of latitude of a cell of MAX_PRECISION characters
+AXIS_BITS = 5 * MAX_PRECISION // 2
+
+
+def encode(lat, lng, precision=MAX_PRECISION):
+    """
+    Returns the geohash of a location: the cell of precision characters holding it, each character halves the cell
+    5 times, alternating longitude and latitude. A cell is the prefix of the cells it contains:
+      encode(40.7128, -74.0060, 6) = "dr5reg", a cell of about 1.2 km x 0.6 km in "dr5re" (4.9 km x 4.9 km)
+    """
+    lat_bits = min(int((lat + 90) / 180 * (1 << AXIS_BITS)), (1 << AXIS_BITS) - 1)
+    lng_bits = min(int((lng + 180) / 360 * (1 << AXIS_BITS)), (1 << AXIS_BITS) - 1)
+    # Longitude takes the first bit, then they alternate
+    code = (spread(lng_bits) << 1) | spread(lat_bits)
+    shift = 5 * MAX_PRECISION
+    return "".join(BASE32[(code >> (shift - 5 * i)) & 31] for i in range(1, precision + 1))
+
+
+def spread(bits):
+    """Moves bit i of a 30-bit integer to bit 2i, so two of them interleave."""
+    bits = (bits | (bits << 16)) & 0x0000FFFF0000FFFF
+    bits = (bits | (bits << 8)) & 0x00FF00FF00FF00FF
+    bits = (bits | (bits << 4)) & 0x0F0F0F0F0F0F0F0F
+    bits = (bits | (bits << 2)) & 0x3333333333333333
+    return (bits | (bits << 1)) & 0x5555555555555555
+
+
+def get_cell_size(precision):
+    """Returns the (latitude, longitude) degrees of the cells of a precision."""
+    return 180 / (1 << (5 * precision // 2)), 360 / (1 << ((5 * precision + 1) // 2))
+
+
+def get_area(lat, lng, precision):
+    """
+    Returns the cell of a location and its 8 neighbours, the cells within one cell of it whichever side of its cell
+    the location is. Longitudes wrap around the antimeridian, there are no cells beyond the poles.
+    """
+    lat_size, lng_size = get_cell_size(precision)
+    cells = []
+    for lat_offset in (-1, 0, 1):
+        neighbour_lat = lat + lat_offset * lat_size
+        if not -90 <= neighbour_lat <= 90:
+            continue
+        for lng_offset in (-1, 0, 1):
+            neighbour_lng = (lng + lng_offset * lng_size + 180) % 360 - 180
+            cell = encode(neighbour_lat, neighbour_lng, precision)
+            if cell not in cells:
+                cells.append(cell)
+    return cells
@@ -1,54 +1,135 @@
-import os
+from itertools import chain
+import logging
+import signal
+import threading
+from pymongo.errors import PyMongoError
+from batcher import get_batcher
+from config import get_env_vars
+from mongo import get_collection, get_posts_collection
+from post_decoder import decode_kafka_event, decode_messages, decode_records, get_failure
+from post_writer import write_posts
+from quarantine import get_failure_id, quarantine_failures
+
+KAFKA_EVENT_SOURCES = ("aws:kafka", "SelfManagedKafka")
 
 def lambda_handler(event, context):
     """
-    Expects:
+    Expects a Lambda Kafka event (see post_decoder.decode_kafka_event):
+      event = {
+        "eventSource": "aws:kafka",
+        "records": {"<topic>-<partition>": [{"topic": "...", "partition": 0, "offset": 42, "value": "<base64 JSON post>"}, ...]}
+      }
+    or already decoded records:
       event = {
         "event": "INGEST_POSTS",
-        "records": [ {...}, {...} ]
+        "records": [ {"topic": "...", "partition": 0, "offset": 42, "value": {...post...}}, ... ]
+      }
+
+    Returns the records to retry as batchItemFailures, identified by their post id (<topic>:<partition>:<offset>),
+    the other records are acknowledged. Records that cannot succeed are quarantined instead (see quarantine).
+      {
+        "statusCode": 200,
+        "body": {"inserted": 2, "duplicates": 1, "failures": [...retried...], "quarantined": [...], "writes": {...batcher stats...}},
+        "batchItemFailures": [{"itemIdentifier": "posts:0:42"}]
       }
     """
-    # FILL WITH REAL VALUES LATER
-    env_vars = {}
-    env_vars["KAFKA_TOKEN"] =  os.getenv("KAFKA_TOKEN", "KAFKA_TOKEN")
-    env_vars["MONGO_SECRET"] =  os.getenv("MONGO_SECRET", "MONGO_SECRET")
-    env_vars["MONGO_URI"] =  os.getenv("MONGO_URI", "MONGO_URI")
-    env_vars["MONGO_DB"] =  os.getenv("MONGO_DB", "MONGO_DB")
-    env_vars["MONGO_COLLECTION"] =  os.getenv("MONGO_COLLECTION", "posts")
-
-    if event.get("event") != "INGEST_POSTS":
+    failures = []
+    if event.get("eventSource") in KAFKA_EVENT_SOURCES:
+        posts = decode_kafka_event(event, failures)
+    elif event.get("event") == "INGEST_POSTS":
+        posts = decode_records(event.get("records") or [], failures)
+    else:
         return {"statusCode": 400, "body": "Unsupported event type"}
 
-    records = event.get("records") or []
-    inserted = ingest_posts(records, env_vars)
+    env_vars = get_env_vars()
+    result = ingest_posts(posts, env_vars, failures=failures)
+    retried, quarantined = quarantine(result["failures"], env_vars)
 
-    return {"statusCode": 200, "body": {"inserted": inserted}}
+    return {
+        "statusCode": 200,
+        "body": {
+            "inserted": result["inserted"],
+            "duplicates": result["duplicates"],
+            "failures": [get_outcome(failure) for failure in retried],
+            "quarantined": [get_outcome(failure) for failure in quarantined],
+            "writes": get_batcher(env_vars).get_stats(),
+        },
+        "batchItemFailures": [{"itemIdentifier": get_failure_id(failure)} for failure in retried],
+    }
 
 
-def ingest_posts(records, env_vars):
+def ingest_posts(posts, env_vars, collection=None, failures=None):
     """
-    Takes list of post records and inserts them into MongoDB.
-    Skeleton only until env setup.
+    Takes posts (e.g. a post_decoder generator) and writes them into MongoDB, see post_writer.write_posts.
+    The bulk writes are sized by the adaptive batcher of the container (see batcher.get_batcher).
+    The collection can be given (e.g. for tests), otherwise the pooled client of the container is used (see mongo.get_client).
+    The client is only fetched once there is a post to write.
 
-    env_vars = ["KAFKA_TOKEN", "MONGO_SECRET", "MONGO_URI", "MONGO_DB", "MONGO_COLLECTION"]
-    
-    Example:
+    env_vars = see config.get_env_vars
 
-    env_vars[KAFKA_TOKEN] = "123456789"
-    print(env_vars[KAFKA_TOKEN]) = 123456789
-    
+    Returns:
+      {"inserted": 2, "duplicates": 1, "failures": [{"topic": ..., "partition": ..., "offset": ..., "error": "...", ...}]}
     """
 
-    if not records:
-        return 0
+    failures = failures if failures is not None else []
+    posts = iter(posts)
+    first = next(posts, None)
+    if first is None:
+        return {"inserted": 0, "duplicates": 0, "failures": failures}
+
+    posts = chain([first], posts)
+    if collection is None:
+        try:
+            collection = get_posts_collection(env_vars)
+        except PyMongoError as e:
+            failures.extend(get_failure(post.topic, post.partition, post.offset, e, record=post.to_document()) for post in posts)
+            return {"inserted": 0, "duplicates": 0, "failures": failures}
+    return write_posts(collection, posts, failures=failures, batcher=get_batcher(env_vars))
+
+
+def ingest_messages(messages, env_vars):
+    """
+    Ingests a batch of messages consumed from Kafka in consumer mode (see consumer.run_consumer).
+
+    Returns:
+      The failures to retry, the other records are written or quarantined
+    """
+    failures = []
+    result = ingest_posts(decode_messages(messages, failures), env_vars, failures=failures)
+    retried, _ = quarantine(result["failures"], env_vars)
+    return retried
+
+
+def quarantine(failures, env_vars):
+    if not failures:
+        return [], []
+    try:
+        attempts_collection = get_collection(env_vars, "MONGO_ATTEMPTS_COLLECTION")
+        dead_letter_collection = get_collection(env_vars, "MONGO_DEAD_LETTER_COLLECTION")
+    except PyMongoError:
+        return failures, []
+    return quarantine_failures(failures, attempts_collection, dead_letter_collection, env_vars["INGEST_MAX_ATTEMPTS"])
+
+
+def get_outcome(failure):
+    """The failure without its record, records are kept out of the response."""
+    return {"topic": failure["topic"], "partition": failure["partition"], "offset": failure["offset"], "error": failure["error"]}
+
+
+if __name__ == "__main__":
+    # Consumer mode, a long running process consuming KAFKA_TOPIC instead of Lambda invocations
+    from consumer import run_consumer
 
-    # --- MongoDB client placeholder ---
-    # Example (fill later):
-    # from pymongo import MongoClient
-    # client = MongoClient(MONGO_URI, tls=True, authMechanism="...")
-    # collection = client[MONGO_DB][MONGO_COLLECTION]
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(threadName)s %(message)s")
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
 
-    inserted = 0
-    for post in records:
-        inserted += 1
-    return inserted
+    env_vars = get_env_vars()
+    run_consumer(
+        env_vars,
+        lambda messages: ingest_messages(messages, env_vars),
+        stop_event,
+        # Coalesce small batches into chunks of the adaptive size
+        target_size=lambda: get_batcher(env_vars).chunk_size,
+    )
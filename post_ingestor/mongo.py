@@ -0,0 +1,59 @@
+import time
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+# One pooled client per container, created on the first invocation and reused by the warm ones
+_client = None
+_last_used_at = 0.0
+
+
+def get_client(env_vars):
+    """
+    Returns the pooled MongoClient of the container, creating it on the first call.
+
+    Lambda freezes the container between invocations and its connections may be closed while it is frozen.
+    When the client has not been used for MONGO_HEALTH_CHECK_SECONDS it is pinged first,
+    and replaced by a new client if the ping fails.
+    """
+    global _client, _last_used_at
+
+    # Wall clock time, the monotonic clock does not advance while the container is frozen
+    now = time.time()
+    if _client is not None and now - _last_used_at >= env_vars["MONGO_HEALTH_CHECK_SECONDS"]:
+        if not is_healthy(_client):
+            close_client()
+
+    if _client is None:
+        _client = MongoClient(
+            env_vars["MONGO_URI"],
+            maxPoolSize=env_vars["MONGO_MAX_POOL_SIZE"],
+            # Fail fast instead of holding the invocation for the 30s default
+            serverSelectionTimeoutMS=5000,
+        )
+
+    _last_used_at = now
+    return _client
+
+
+def get_posts_collection(env_vars):
+    return get_collection(env_vars, "MONGO_COLLECTION")
+
+
+def get_collection(env_vars, name_var):
+    """Returns the collection named by the name_var configuration variable, e.g. MONGO_DEAD_LETTER_COLLECTION."""
+    return get_client(env_vars)[env_vars["MONGO_DB"]][env_vars[name_var]]
+
+
+def is_healthy(client):
+    try:
+        client.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+
+
+def close_client():
+    global _client
+    if _client is not None:
+        _client.close()
+    _client = None
@@ -0,0 +1,212 @@
+import logging
+import signal
+import threading
+from pymongo.errors import PyMongoError
+from config import get_env_vars
+from main import KAFKA_EVENT_SOURCES, get_outcome
+from mongo import get_collection
+from post_decoder import decode_kafka_event, decode_messages, decode_records
+from push_dispatcher import get_dispatcher
+from subscriber_set import SubscriberSet
+from subscription_index import GEO_PRECISIONS, get_index
+
+logger = logging.getLogger(__name__)
+
+# User ids per devices query
+DEVICE_QUERY_CHUNK = 10000
+
+
+def lambda_handler(event, context):
+    """
+    The notifier, consuming the notify-service-consumer topic: sends a mobile notification of each post to the devices
+    of the users subscribed to its category and tags.
+
+    Expects the same events as the ingestor (see main.lambda_handler), a Lambda Kafka event or already decoded records:
+      event = {
+        "event": "NOTIFY_POSTS",
+        "records": [ {"topic": "...", "partition": 0, "offset": 42, "value": {...post...}}, ... ]
+      }
+
+    Posts with a location are only notified to the subscribers near them, see get_recipients.
+    The devices are looked up before anything is sent, so when MongoDB fails the whole batch is retried. Once sent,
+    a batch is acknowledged even if some notifications failed, retrying it would notify the other devices twice.
+    Records that cannot be decoded are skipped, the ingestor quarantines them.
+      {
+        "statusCode": 200,
+        "body": {"posts": 2, "recipients": 120, "events": 160, "notifications": 150, "batches": 1, "sent": 148,
+                 "invalid": 1, "failed": 1, "throttled": 0, "failures": [...not decoded...]},
+        "batchItemFailures": []
+      }
+    """
+    failures = []
+    if event.get("eventSource") in KAFKA_EVENT_SOURCES:
+        posts = decode_kafka_event(event, failures)
+    elif event.get("event") == "NOTIFY_POSTS":
+        posts = decode_records(event.get("records") or [], failures)
+    else:
+        return {"statusCode": 400, "body": "Unsupported event type"}
+
+    # Held in memory, the whole batch is reported when it fails
+    posts = list(posts)
+    try:
+        result = notify_posts(posts, get_env_vars())
+    except PyMongoError as e:
+        return {
+            "statusCode": 200,
+            "body": {"error": str(e), "failures": [get_outcome(failure) for failure in failures]},
+            "batchItemFailures": [{"itemIdentifier": post.id} for post in posts],
+        }
+    return {
+        "statusCode": 200,
+        "body": {**result, "failures": [get_outcome(failure) for failure in failures]},
+        "batchItemFailures": [],
+    }
+
+
+def notify_posts(posts, env_vars, index=None, devices_collection=None, dispatcher=None):
+    """
+    Sends the notifications of a batch of posts: queues them (see queue_notifications), sends them all,
+    then removes the devices whose token the provider reported as invalid.
+    The index, devices collection and dispatcher can be given (e.g. for tests), otherwise the ones of the container are used.
+
+    env_vars = see config.get_env_vars
+
+    Returns:
+      {"posts": 2, "recipients": 120, "events": 160, "notifications": 150, "batches": 1, "sent": 148, "invalid": 1,
+       "failed": 1, "throttled": 0}
+    """
+    if index is None:
+        index = get_index(env_vars)
+    if devices_collection is None:
+        devices_collection = get_collection(env_vars, "MONGO_DEVICE_COLLECTION")
+    if dispatcher is None:
+        dispatcher = get_dispatcher(env_vars)
+
+    result = queue_notifications(posts, index, devices_collection, dispatcher, get_geo_precision(env_vars))
+    sent = dispatcher.dispatch()
+    remove_invalid_tokens(devices_collection, sent.pop("invalid_tokens"))
+    return {**result, **sent}
+
+
+def queue_notifications(posts, index, devices_collection, dispatcher, precision=0):
+    """
+    Resolves the recipients of a batch of posts with the subscription index (see get_recipients), looks up
+    the devices of all of them at once, and queues a notification of each post to each of their devices.
+    The author of a post is not notified of it.
+
+    Returns:
+      {"posts": 2, "recipients": 120, "events": 160}
+    """
+    subscribers = [get_recipients(index, post, precision) for post in posts]
+    recipients = SubscriberSet.union(*subscribers)
+    devices = get_devices(devices_collection, index.get_user_ids(recipients))
+
+    events = 0
+    user_ids = index.user_ids
+    for post, post_subscribers in zip(posts, subscribers):
+        for ordinal in post_subscribers:
+            user_id = user_ids[ordinal]
+            if user_id == post.user_id:
+                continue
+            for device in devices.get(user_id, ()):
+                events += dispatcher.submit(device, post)
+    return {"posts": len(posts), "recipients": len(recipients), "events": events}
+
+
+def get_geo_precision(env_vars):
+    """
+    NOTIFY_GEO_PRECISION, 0 or one of the precisions the locations are indexed at (subscription_index.GEO_PRECISIONS).
+
+    Raises:
+      ValueError if the subscription index has no cells of that precision
+    """
+    precision = env_vars["NOTIFY_GEO_PRECISION"]
+    if precision and precision not in GEO_PRECISIONS:
+        raise ValueError(f"NOTIFY_GEO_PRECISION must be 0 or one of {GEO_PRECISIONS}, got {precision}")
+    return precision
+
+
+def get_recipients(index, post, precision):
+    """
+    The subscribers of a post (see SubscriptionIndex.resolve). With a precision (NOTIFY_GEO_PRECISION), a post with a location
+    is only sent to the subscribers whose home or current location is in its geohash cell of that precision or in one
+    of the neighbouring cells (see SubscriptionIndex.resolve_nearby). Posts without a location are sent to every subscriber.
+    """
+    if precision and post.location is not None:
+        return index.resolve_nearby(post.category, post.tags, post.location, precision)
+    return index.resolve(post.category, post.tags)
+
+
+def get_devices(collection, user_ids):
+    """Returns the devices of the users, {"<user_id>": [{"user_id": "...", "provider": "fcm", "token": "..."}, ...]}"""
+    devices = {}
+    for start in range(0, len(user_ids), DEVICE_QUERY_CHUNK):
+        query = {"user_id": {"$in": user_ids[start:start + DEVICE_QUERY_CHUNK]}}
+        for device in collection.find(query, {"_id": 0, "user_id": 1, "provider": 1, "token": 1}):
+            devices.setdefault(device["user_id"], []).append(device)
+    return devices
+
+
+def remove_invalid_tokens(collection, invalid_tokens):
+    """Deletes the devices whose token was rejected by their provider, a failure only leaves them for the next batch."""
+    if not invalid_tokens:
+        return
+    try:
+        for provider in {provider for provider, _ in invalid_tokens}:
+            tokens = [token for token_provider, token in invalid_tokens if token_provider == provider]
+            collection.delete_many({"provider": provider, "token": {"$in": tokens}})
+    except PyMongoError:
+        logger.exception("Failed to remove %d invalid device tokens", len(invalid_tokens))
+
+
+def notify_messages(messages, env_vars, index=None, devices_collection=None, dispatcher=None):
+    """
+    Queues the notifications of a batch of messages consumed from Kafka in consumer mode (see consumer.run_consumer),
+    and waits until the dispatcher thread has sent them once their window has passed (see PushDispatcher.start),
+    so the offsets of the batch are only committed once its notifications are sent.
+    Like the Lambda function, delivery is at least once: when the process dies before the commit, the notifications
+    already sent are sent again by the next owner of the partition.
+
+    Returns:
+      No failure to retry: records that cannot be decoded are skipped, and a MongoDB error raises so the batch is retried
+
+    Raises:
+      RuntimeError if the dispatcher stopped before the notifications were sent, the batch is not committed
+    """
+    failures = []
+    posts = list(decode_messages(messages, failures))
+    for failure in failures:
+        logger.warning("Skipped record %s-%s@%s: %s", failure["topic"], failure["partition"], failure["offset"], failure["error"])
+    dispatcher = dispatcher or get_dispatcher(env_vars)
+    queue_notifications(
+        posts,
+        index or get_index(env_vars),
+        devices_collection if devices_collection is not None else get_collection(env_vars, "MONGO_DEVICE_COLLECTION"),
+        dispatcher,
+        get_geo_precision(env_vars),
+    )
+    if not dispatcher.wait_sent(dispatcher.clock()):
+        raise RuntimeError("The push dispatcher stopped before the notifications were sent")
+    return []
+
+if __name__ == "__main__":
+    # Consumer mode, a long running process consuming NOTIFY_KAFKA_TOPIC instead of Lambda invocations
+    from consumer import run_consumer
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(threadName)s %(message)s")
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+
+    env_vars = get_env_vars()
+    # An invalid NOTIFY_GEO_PRECISION fails before anything is consumed
+    get_geo_precision(env_vars)
+    dispatcher = get_dispatcher(env_vars)
+    dispatcher.start(lambda result: remove_invalid_tokens(get_collection(env_vars, "MONGO_DEVICE_COLLECTION"), result["invalid_tokens"]))
+    run_consumer(
+        {**env_vars, "KAFKA_TOPIC": env_vars["NOTIFY_KAFKA_TOPIC"], "KAFKA_GROUP_ID": env_vars["NOTIFY_KAFKA_GROUP_ID"]},
+        lambda messages: notify_messages(messages, env_vars),
+        stop_event,
+    )
+    # Sends the notifications still queued
+    dispatcher.stop()
@@ -0,0 +1,220 @@
+import base64
+import binascii
+from datetime import datetime, timezone
+import orjson
+
+MAX_TITLE_LENGTH = 200
+MAX_DESCRIPTION_LENGTH = 5000
+MAX_TAGS = 20
+# confluent_kafka.TIMESTAMP_NOT_AVAILABLE, the type of the timestamp of a message without one
+TIMESTAMP_NOT_AVAILABLE = 0
+
+
+class PostDecodeError(ValueError):
+    pass
+
+
+def get_post_id(topic, partition, offset):
+    """
+    Deterministic post id from the Kafka coordinates of the record.
+    A redelivered record gets the same id, so writing it again is a no-op.
+    """
+    return f"{topic}:{partition}:{offset}"
+
+
+def get_failure(topic, partition, offset, error, retryable=True, record=None):
+    """
+    A record that could not be ingested.
+    A failure is not retryable when retrying it cannot succeed (e.g. the record cannot be decoded),
+    record is what is kept in the dead letter collection when the record is quarantined (see quarantine).
+    """
+    return {"topic": topic, "partition": partition, "offset": offset, "error": str(error), "retryable": retryable, "record": record}
+
+
+class Post:
+    """
+    A validated post and the Kafka coordinates it was read from.
+    Slots keep the posts of a chunk compact, they are the only decoded copies held in memory.
+
+    Post values are JSON objects:
+      {"user_id": "...", "title": "...", "category": "...", "description": "...", "tags": ["..."],
+       "location": {"lat": 40.7, "lng": -74.0}, "created_at": "2026-01-01T00:00:00Z"}
+    description, tags, location and created_at are optional. A post without created_at is dated with the timestamp of
+    its Kafka record, so every consumer of the record (ingestor, timeline loader, notifier) gives it the same date.
+    """
+
+    __slots__ = ("topic", "partition", "offset", "user_id", "title", "category", "description", "tags", "location", "created_at")
+
+    def __init__(self, topic, partition, offset, user_id, title, category, description=None, tags=(), location=None, created_at=None):
+        self.topic = topic
+        self.partition = partition
+        self.offset = offset
+        self.user_id = user_id
+        self.title = title
+        self.category = category
+        self.description = description
+        self.tags = tags
+        self.location = location
+        self.created_at = created_at
+
+    @property
+    def id(self):
+        return get_post_id(self.topic, self.partition, self.offset)
+
+    @classmethod
+    def from_value(cls, topic, partition, offset, value, timestamp=None):
+        """
+        Validates a decoded post value. timestamp is the timestamp of the Kafka record in milliseconds, when it has one.
+
+        Raises:
+          PostDecodeError if the value is not a valid post
+        """
+        for field, coordinate in (("topic", topic), ("partition", partition), ("offset", offset)):
+            if coordinate is None:
+                raise PostDecodeError(f"Record is missing its {field}")
+        if not isinstance(value, dict):
+            raise PostDecodeError("Record value is not a post object")
+
+        user_id = get_string(value, "user_id", 100)
+        title = get_string(value, "title", MAX_TITLE_LENGTH)
+        category = get_string(value, "category", 100)
+        description = get_string(value, "description", MAX_DESCRIPTION_LENGTH, required=False)
+
+        tags = value.get("tags") or []
+        if not isinstance(tags, list) or len(tags) > MAX_TAGS or not all(isinstance(tag, str) and tag for tag in tags):
+            raise PostDecodeError(f"Post tags must be a list of at most {MAX_TAGS} non-empty strings")
+
+        return cls(topic, partition, offset, user_id, title, category, description, tuple(tags), get_location(value),
+                   get_created_at(value) or get_record_date(timestamp))
+
+    def to_document(self):
+        """Returns the document stored in the posts collection."""
+        document = {
+            "_id": self.id,
+            "user_id": self.user_id,
+            "title": self.title,
+            "category": self.category,
+            "tags": list(self.tags),
+            "created_at": self.created_at,
+            "source": {"topic": self.topic, "partition": self.partition, "offset": self.offset},
+        }
+        if self.description is not None:
+            document["description"] = self.description
+        if self.location is not None:
+            # GeoJSON orders coordinates as longitude, latitude
+            document["location"] = {"type": "Point", "coordinates": [self.location[1], self.location[0]]}
+        return document
+
+
+def get_string(value, field, max_length, required=True):
+    string = value.get(field)
+    if string is None and not required:
+        return None
+    if not isinstance(string, str) or not string:
+        raise PostDecodeError(f"Post {field} must be a non-empty string")
+    if len(string) > max_length:
+        raise PostDecodeError(f"Post {field} is longer than {max_length} characters")
+    return string
+
+
+def get_location(value):
+    location = value.get("location")
+    if location is None:
+        return None
+    try:
+        lat, lng = float(location["lat"]), float(location["lng"])
+    except (TypeError, KeyError, ValueError):
+        raise PostDecodeError("Post location must be {\"lat\": <number>, \"lng\": <number>}")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise PostDecodeError("Post location is out of range")
+    return (lat, lng)
+
+
+def get_created_at(value):
+    created_at = value.get("created_at")
+    if created_at is None:
+        return None
+    try:
+        created_at = datetime.fromisoformat(created_at)
+    except (TypeError, ValueError):
+        raise PostDecodeError("Post created_at must be an ISO 8601 date")
+    if created_at.tzinfo is None:
+        return created_at.replace(tzinfo=timezone.utc)
+    return created_at.astimezone(timezone.utc)
+
+
+def get_record_date(timestamp):
+    """
+    The date of a Kafka record from its timestamp in milliseconds since the epoch. A record without a timestamp
+    (e.g. an already decoded record) is dated now.
+    """
+    if timestamp is None or timestamp < 0:
+        return datetime.now(timezone.utc)
+    return datetime.fromtimestamp(timestamp / 1000, timezone.utc)
+
+
+def decode_value(value):
+    """Decodes a base64 encoded JSON record value."""
+    if value is None:
+        raise PostDecodeError("Record has no value")
+    try:
+        return orjson.loads(base64.b64decode(value, validate=True))
+    except (binascii.Error, ValueError) as e:
+        # orjson.JSONDecodeError is a ValueError
+        raise PostDecodeError(f"Record value is not base64 encoded JSON: {e}")
+
+
+def decode_kafka_event(event, failures):
+    """
+    Lazily decodes the records of a Lambda Kafka event into posts, one record at a time.
+
+    event = {
+      "eventSource": "aws:kafka",
+      "records": {"<topic>-<partition>": [{"topic": "...", "partition": 0, "offset": 42, "timestamp": 1767268800000,
+                                           "value": "<base64 JSON>"}, ...]}
+    }
+
+    A record that cannot be decoded is appended to failures and skipped, the other records are still decoded.
+    """
+    for partition_records in event.get("records", {}).values():
+        for record in partition_records:
+            topic, partition, offset = record.get("topic"), record.get("partition"), record.get("offset")
+            try:
+                yield Post.from_value(topic, partition, offset, decode_value(record.get("value")), record.get("timestamp"))
+            except PostDecodeError as e:
+                failures.append(get_failure(topic, partition, offset, e, retryable=False, record=record.get("value")))
+
+
+def decode_records(records, failures):
+    """
+    Lazily validates records whose value is already decoded into posts, see decode_kafka_event.
+
+    records = [{"topic": "...", "partition": 0, "offset": 42, "timestamp": 1767268800000, "value": {...post...}}, ...]
+    timestamp is optional.
+    """
+    for record in records:
+        topic, partition, offset = record.get("topic"), record.get("partition"), record.get("offset")
+        try:
+            yield Post.from_value(topic, partition, offset, record.get("value"), record.get("timestamp"))
+        except PostDecodeError as e:
+            failures.append(get_failure(topic, partition, offset, e, retryable=False, record=record.get("value")))
+
+
+def decode_messages(messages, failures):
+    """
+    Lazily decodes messages consumed from Kafka (confluent_kafka.Message), whose values are JSON posts,
+    see decode_kafka_event.
+    """
+    for message in messages:
+        topic, partition, offset, value = message.topic(), message.partition(), message.offset(), message.value()
+        timestamp_type, timestamp = message.timestamp()
+        try:
+            if value is None:
+                raise PostDecodeError("Record has no value")
+            try:
+                post = orjson.loads(value)
+            except orjson.JSONDecodeError as e:
+                raise PostDecodeError(f"Record value is not JSON: {e}")
+            yield Post.from_value(topic, partition, offset, post, None if timestamp_type == TIMESTAMP_NOT_AVAILABLE else timestamp)
+        except PostDecodeError as e:
+            failures.append(get_failure(topic, partition, offset, e, retryable=False, record=value))
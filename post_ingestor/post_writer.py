@@ -0,0 +1,67 @@
+import time
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from post_decoder import get_failure
+
+DEFAULT_CHUNK_SIZE = 1000
+DUPLICATE_KEY_ERROR = 11000
+
+
+def write_posts(collection, posts, chunk_size=DEFAULT_CHUNK_SIZE, failures=None, batcher=None):
+    """
+    Writes posts to the posts collection with unordered bulk upserts of at most chunk_size posts.
+    With a batcher (see batcher.AdaptiveBatcher) the chunk size is the one of the batcher instead,
+    and the batcher adapts it to the latency of each bulk write.
+    posts can be a generator (see post_decoder), only one chunk of it is held in memory at a time.
+    Each post is inserted only if its id does not exist yet ($setOnInsert), so redelivered batches are idempotent.
+    A failing post does not stop the others, it is reported with its error.
+
+    Returns:
+      {
+        "inserted": <new posts>,
+        "duplicates": <posts that were already written>,
+        "failures": failures + [{"topic": ..., "partition": ..., "offset": ..., "error": "..."}]
+      }
+    """
+    result = {"inserted": 0, "duplicates": 0, "failures": failures if failures is not None else []}
+
+    chunk_posts, chunk_operations = [], []
+    for post in posts:
+        chunk_posts.append(post)
+        chunk_operations.append(UpdateOne({"_id": post.id}, {"$setOnInsert": post.to_document()}, upsert=True))
+        if len(chunk_operations) >= (batcher.chunk_size if batcher is not None else chunk_size):
+            write_chunk(collection, chunk_posts, chunk_operations, result, batcher)
+            chunk_posts, chunk_operations = [], []
+
+    if chunk_operations:
+        write_chunk(collection, chunk_posts, chunk_operations, result, batcher)
+    return result
+
+
+def write_chunk(collection, chunk_posts, chunk_operations, result, batcher=None):
+    start = time.perf_counter()
+    try:
+        details = collection.bulk_write(chunk_operations, ordered=False).bulk_api_result
+    except BulkWriteError as e:
+        # Unordered writes keep going after an error, only the reported indexes failed
+        details = e.details
+    except PyMongoError as e:
+        # The outcome of the chunk is unknown (e.g. the connection was lost), retrying it is safe
+        if batcher is not None:
+            batcher.record(len(chunk_operations), (time.perf_counter() - start) * 1000, error=True)
+        result["failures"].extend(get_failure(post.topic, post.partition, post.offset, e, record=post.to_document()) for post in chunk_posts)
+        return
+    if batcher is not None:
+        batcher.record(len(chunk_operations), (time.perf_counter() - start) * 1000)
+
+    for write_error in details.get("writeErrors", []):
+        if write_error.get("code") == DUPLICATE_KEY_ERROR:
+            # A concurrent delivery of the same record upserted it first
+            result["duplicates"] += 1
+            continue
+        post = chunk_posts[write_error["index"]]
+        error = write_error.get("errmsg", "write error")
+        result["failures"].append(get_failure(post.topic, post.partition, post.offset, error, record=post.to_document()))
+
+    result["inserted"] += details.get("nUpserted", 0)
+    result["duplicates"] += details.get("nMatched", 0)
@@ -0,0 +1,316 @@
+import asyncio
+import logging
+import threading
+import time
+import httpx
+import orjson
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_LENGTH = 200
+# Posts named in the body of a coalesced notification
+MAX_SUMMARY_TITLES = 3
+RETRY_BACKOFF_SECONDS = 0.5
+
+# One dispatcher per container, its pooled connections and rate limits are reused by the warm invocations
+_dispatcher = None
+
+
+class TokenBucket:
+    """
+    Rate limit of a push provider: rate tokens per second, with bursts of up to capacity tokens.
+    A batch takes one token per notification, so the limit is in notifications per second.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated_at = clock()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def take(self, tokens):
+        """Takes the tokens and returns 0 if they are available, otherwise the seconds to wait until they are."""
+        now = self.clock()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0
+        return (tokens - self.tokens) / self.rate
+
+    def block(self, seconds):
+        """Holds every batch for seconds, e.g. the Retry-After of a throttled request."""
+        self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+        # Refills from the end of the block
+        self.tokens, self.updated_at = 0, self.blocked_until
+
+    async def acquire(self, tokens):
+        """Waits until the tokens are available and takes them, batches are served in the order they ask."""
+        async with self._lock:
+            while (wait := self.take(tokens)) > 0:
+                await asyncio.sleep(wait)
+
+
+class Provider:
+    """
+    A push provider (e.g. a gateway in front of FCM or APNs) and its batch endpoint:
+      POST <url> {"notifications": [{"token": "...", "title": "...", "body": "...", "data": {...}}, ...]}
+      200 {"results": [{"token": "...", "status": "ok" | "invalid_token" | "error"}, ...]}
+    results are in the order of the notifications. A 429 response holds the provider for its Retry-After.
+    """
+
+    def __init__(self, name, url, batch_size=500, rate=1000, burst=None, clock=time.monotonic):
+        self.name = name
+        self.url = url
+        self.batch_size = batch_size
+        # A whole batch must fit in the bucket
+        self.bucket = TokenBucket(rate, max(burst or rate, batch_size), clock)
+
+
+def get_providers(env_vars, clock=time.monotonic):
+    """The providers of PUSH_PROVIDERS: {"fcm": {"url": "...", "batch_size": 500, "rate": 1000, "burst": 2000}, ...}"""
+    providers = []
+    for name, settings in env_vars["PUSH_PROVIDERS"].items():
+        if not isinstance(settings, dict) or not settings.get("url"):
+            raise ValueError(f"PUSH_PROVIDERS {name!r} must be an object with a url")
+        providers.append(Provider(name, settings["url"], int(settings.get("batch_size", 500)), float(settings.get("rate", 1000)),
+                                  settings.get("burst"), clock))
+    return providers
+
+
+def to_notification(token, posts):
+    """
+    The one notification sent to a device for the posts of its window: the post itself, or a summary of the posts.
+      {"token": "...", "title": "3 new posts", "body": "Road closed, Storm warning, Fire on 5th", "data": {"post_ids": [...], "categories": [...]}}
+    """
+    if len(posts) == 1:
+        title, body = posts[0].title, posts[0].description or posts[0].category
+    else:
+        titles = [post.title for post in posts[:MAX_SUMMARY_TITLES]]
+        title = f"{len(posts)} new posts"
+        body = ", ".join(titles) + (", ..." if len(posts) > MAX_SUMMARY_TITLES else "")
+    return {
+        "token": token,
+        "title": title,
+        "body": body[:MAX_BODY_LENGTH],
+        "data": {"post_ids": [post.id for post in posts], "categories": sorted({post.category for post in posts})},
+    }
+
+
+def get_retry_after(response, default=1.0):
+    try:
+        return max(float(response.headers.get("retry-after", default)), 0.0)
+    except ValueError:
+        return default
+
+
+def get_results(response):
+    try:
+        results = orjson.loads(response.content).get("results")
+    except (orjson.JSONDecodeError, AttributeError):
+        return None
+    return results if isinstance(results, list) else None
+
+
+class PushDispatcher:
+    """
+    Sends the notifications of posts to devices through the batch endpoints of their providers.
+
+    Events (a post for a device) are queued by submit and a device is sent one notification for all the posts queued
+    within coalesce_ms of its first one (see to_notification). Notifications are grouped by provider into batches
+    of its batch_size, sent concurrently with a pooled HTTP client, at most max_connections batches at a time,
+    each one waiting for the token bucket of its provider. Throttled (429), failed (5xx) and timed out batches are sent
+    again, up to max_attempts times.
+
+    The dispatcher owns its event loop: dispatch() sends everything queued (e.g. at the end of a Lambda invocation),
+    and start() runs the loop in a thread that sends the devices whose window has passed (consumer mode).
+    submit and wait_sent can be called from any thread.
+    """
+
+    def __init__(self, providers, coalesce_ms=0, max_connections=20, timeout_ms=5000, max_attempts=3, clock=time.monotonic):
+        self.providers = {provider.name: provider for provider in providers}
+        self.coalesce_seconds = coalesce_ms / 1000
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.loop = asyncio.new_event_loop()
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout_ms / 1000,
+        )
+        self._sending = asyncio.Semaphore(max_connections)
+        # (provider, token) -> (queued at, {post id: post})
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Events submitted up to _sent_until (see clock) were sent by a completed flush
+        self._sent = threading.Condition()
+        self._sent_until = float("-inf")
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def submit(self, device, post):
+        """Queues the notification of a post to a device, {"provider": "fcm", "token": "..."}. Returns False for an unknown provider."""
+        provider, token = device.get("provider"), device.get("token")
+        if provider not in self.providers or not token:
+            return False
+        key = (provider, token)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = (self.clock(), {post.id: post})
+            else:
+                pending[1][post.id] = post
+        return True
+
+    def take_due(self, force=False):
+        """Removes and returns the devices whose window has passed (every device when forced) and their posts."""
+        now = self.clock()
+        with self._lock:
+            due = [key for key, (queued_at, _) in self._pending.items() if force or now - queued_at >= self.coalesce_seconds]
+            return [(key, list(self._pending.pop(key)[1].values())) for key in due]
+
+    async def flush(self, force=False):
+        """
+        Sends the devices whose window has passed, or every queued device when forced.
+
+        Returns:
+          {"notifications": 150, "batches": 1, "sent": 148, "invalid": 1, "failed": 1, "throttled": 0,
+           "invalid_tokens": [("fcm", "..."), ...]}
+        """
+        result = {"notifications": 0, "batches": 0, "sent": 0, "invalid": 0, "failed": 0, "throttled": 0, "invalid_tokens": []}
+        taken_at = self.clock()
+        notifications = {}
+        for (provider, token), posts in self.take_due(force):
+            notifications.setdefault(provider, []).append(to_notification(token, posts))
+
+        batches = []
+        for name, provider_notifications in notifications.items():
+            provider = self.providers[name]
+            result["notifications"] += len(provider_notifications)
+            for start in range(0, len(provider_notifications), provider.batch_size):
+                batches.append(self.send_batch(provider, provider_notifications[start:start + provider.batch_size], result))
+        result["batches"] = len(batches)
+        await asyncio.gather(*batches)
+        with self._sent:
+            self._sent_until = max(self._sent_until, taken_at if force else taken_at - self.coalesce_seconds)
+            self._sent.notify_all()
+        return result
+
+    async def send_batch(self, provider, notifications, result):
+        content = orjson.dumps({"notifications": notifications})
+        for attempt in range(1, self.max_attempts + 1):
+            await provider.bucket.acquire(len(notifications))
+            try:
+                async with self._sending:
+                    response = await self.client.post(provider.url, content=content, headers={"Content-Type": "application/json"})
+            except httpx.HTTPError as e:
+                error, wait = repr(e), RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+            else:
+                if response.is_success:
+                    self.record_results(provider, notifications, get_results(response), result)
+                    return
+                error = f"HTTP {response.status_code}"
+                if response.status_code == 429:
+                    result["throttled"] += 1
+                    # Every batch of the provider waits, not only this one
+                    provider.bucket.block(get_retry_after(response))
+                    wait = 0
+                elif response.status_code >= 500:
+                    wait = RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+                else:
+                    break
+            if attempt < self.max_attempts and wait:
+                await asyncio.sleep(wait)
+        logger.warning("Failed to send %d notifications to %s: %s", len(notifications), provider.name, error)
+        result["failed"] += len(notifications)
+
+    def record_results(self, provider, notifications, results, result):
+        if results is None:
+            result["sent"] += len(notifications)
+            return
+        for notification, outcome in zip(notifications, results):
+            status = outcome.get("status") if isinstance(outcome, dict) else None
+            if status == "ok":
+                result["sent"] += 1
+            elif status == "invalid_token":
+                result["invalid"] += 1
+                result["invalid_tokens"].append((provider.name, notification["token"]))
+            else:
+                result["failed"] += 1
+        # Notifications without a result are not known to be delivered
+        result["failed"] += max(len(notifications) - len(results), 0)
+
+    def dispatch(self):
+        """Sends every queued notification and returns the result, see flush. Not to be called once started."""
+        return self.loop.run_until_complete(self.flush(force=True))
+
+    def start(self, on_flush):
+        """
+        Runs the event loop in a thread sending the devices whose window has passed, until stop().
+        on_flush(result) is called with the result of each flush that sent notifications, see flush.
+        """
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self.loop.run_until_complete, args=(self.run(on_flush),), name="push-dispatcher", daemon=True)
+        self._thread.start()
+
+    async def run(self, on_flush):
+        interval = max(self.coalesce_seconds / 4, 0.05)
+        while not self._stopping.is_set():
+            await asyncio.sleep(interval)
+            await self.report(await self.flush(), on_flush)
+        await self.report(await self.flush(force=True), on_flush)
+
+    async def report(self, result, on_flush):
+        if result["notifications"]:
+            try:
+                await asyncio.to_thread(on_flush, result)
+            except Exception:
+                logger.exception("Failed to handle the result of a flush")
+
+    def wait_sent(self, queued_at):
+        """
+        Waits until the events submitted up to queued_at (a time of clock) are sent, or failed for good, by the thread
+        of start(). Returns False if the thread is not running or stopped first.
+        """
+        with self._sent:
+            self._sent.wait_for(lambda: self._sent_until >= queued_at or self._thread is None)
+            return self._sent_until >= queued_at
+
+    def stop(self):
+        """Sends the notifications still queued, then stops the thread of start()."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            with self._sent:
+                self._thread = None
+                self._sent.notify_all()
+
+    def close(self):
+        self.stop()
+        self.loop.run_until_complete(self.client.aclose())
+        self.loop.close()
+
+
+def get_dispatcher(env_vars):
+    """Returns the dispatcher of the container, creating it on the first call."""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = PushDispatcher(
+            get_providers(env_vars),
+            coalesce_ms=env_vars["PUSH_COALESCE_MS"],
+            max_connections=env_vars["PUSH_MAX_CONNECTIONS"],
+            timeout_ms=env_vars["PUSH_TIMEOUT_MS"],
+            max_attempts=env_vars["PUSH_MAX_ATTEMPTS"],
+        )
+    return _dispatcher
+
+
+def close_dispatcher():
+    global _dispatcher
+    if _dispatcher is not None:
+        _dispatcher.close()
+    _dispatcher = None
@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from post_decoder import get_post_id
+
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def get_failure_id(failure):
+    return get_post_id(failure["topic"], failure["partition"], failure["offset"])
+
+
+def quarantine_failures(failures, attempts_collection, dead_letter_collection, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Decides which failed records are retried and which are quarantined in the dead letter collection.
+
+    Records that are not retryable (e.g. they cannot be decoded) are quarantined right away.
+    The attempts of the other records are counted in the attempts collection,
+    a record is quarantined when it failed max_attempts times.
+    Quarantined records are stored with their error, so they can be inspected and replayed.
+    If the database cannot be reached every failure is retried.
+
+    Returns:
+      (retried failures, quarantined failures)
+    """
+    if not failures:
+        return [], []
+
+    retried, quarantined = [], [failure for failure in failures if not failure["retryable"]]
+    now = datetime.now(timezone.utc)
+    try:
+        retryable = [failure for failure in failures if failure["retryable"]]
+        if retryable:
+            ids = [get_failure_id(failure) for failure in retryable]
+            attempts_collection.bulk_write(
+                [
+                    UpdateOne({"_id": failure_id}, {"$inc": {"attempts": 1}, "$set": {"error": failure["error"], "updated_at": now}}, upsert=True)
+                    for failure_id, failure in zip(ids, retryable)
+                ],
+                ordered=False,
+            )
+            attempts = {document["_id"]: document["attempts"] for document in attempts_collection.find({"_id": {"$in": ids}}, {"attempts": 1})}
+            for failure_id, failure in zip(ids, retryable):
+                if attempts.get(failure_id, 0) >= max_attempts:
+                    quarantined.append(failure)
+                else:
+                    retried.append(failure)
+
+        if quarantined:
+            ids = [get_failure_id(failure) for failure in quarantined]
+            dead_letter_collection.bulk_write(
+                [UpdateOne({"_id": failure_id}, {"$setOnInsert": get_dead_letter(failure_id, failure, now)}, upsert=True) for failure_id, failure in zip(ids, quarantined)],
+                ordered=False,
+            )
+            attempts_collection.delete_many({"_id": {"$in": ids}})
+    except PyMongoError:
+        return failures, []
+
+    return retried, quarantined
+
+
+def get_dead_letter(failure_id, failure, quarantined_at):
+    return {
+        "_id": failure_id,
+        "topic": failure["topic"],
+        "partition": failure["partition"],
+        "offset": failure["offset"],
+        "error": failure["error"],
+        "record": failure["record"],
+        "quarantined_at": quarantined_at,
+    }
@@ -0,0 +1,23 @@
+import redis
+
+# One pooled client per container, like the MongoDB client (see mongo.get_client)
+_client = None
+
+
+def get_client(env_vars):
+    """Returns the pooled Redis client of the container, creating it on the first call."""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            env_vars["REDIS_URL"],
+            socket_timeout=env_vars["REDIS_TIMEOUT_MS"] / 1000,
+            socket_connect_timeout=env_vars["REDIS_TIMEOUT_MS"] / 1000,
+        )
+    return _client
+
+
+def close_client():
+    global _client
+    if _client is not None:
+        _client.close()
+    _client = None
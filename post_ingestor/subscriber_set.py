@@ -0,0 +1,222 @@
+from array import array
+from bisect import bisect_left
+import struct
+import sys
+
+# Ordinals are split by their high 16 bits into containers of their low 16 bits
+CONTAINER_SIZE = 1 << 16
+BITMAP_BYTES = CONTAINER_SIZE // 8
+# Up to this many ordinals a container is a sorted array (2 bytes per ordinal), a bitmap (8 KB) above
+MAX_ARRAY_SIZE = 4096
+
+ARRAY, BITMAP = 0, 1
+HEADER = struct.Struct("<HBI")
+
+# The bits set in each byte value, to list the ordinals of a bitmap
+BYTE_BITS = tuple(tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256))
+
+
+class SubscriberSet:
+    """
+    A compressed set of user ordinals (non-negative integers below 2^32), laid out like a roaring bitmap.
+
+    Each container holds the ordinals sharing the same high 16 bits, as a sorted array("H") of their low 16 bits while
+    it is sparse and as a bitmap (an int) once it holds more than MAX_ARRAY_SIZE ordinals. A sparse set so takes 2 bytes
+    per ordinal and a dense one 1 bit. Union and intersection work container by container, on whole bitmaps at once
+    (int | and &) when the containers are dense. Containers are copied on write, so sets can share them.
+    """
+
+    __slots__ = ("containers",)
+
+    def __init__(self, containers=None):
+        # {high: array("H") | int}, containers are never empty
+        self.containers = containers if containers is not None else {}
+
+    @classmethod
+    def from_ordinals(cls, ordinals):
+        lows = {}
+        for ordinal in ordinals:
+            lows.setdefault(ordinal >> 16, []).append(ordinal & 0xFFFF)
+        return cls({high: normalize(array("H", sorted(set(values)))) for high, values in lows.items()})
+
+    @classmethod
+    def union(cls, *sets):
+        containers = {}
+        for subscriber_set in sets:
+            for high, container in subscriber_set.containers.items():
+                containers.setdefault(high, []).append(container)
+        return cls({high: union_containers(group) for high, group in containers.items()})
+
+    @classmethod
+    def intersection(cls, *sets):
+        if not sets:
+            return cls()
+        # Smallest first, so the result shrinks as early as possible
+        sets = sorted(sets, key=lambda subscriber_set: len(subscriber_set.containers))
+        containers = dict(sets[0].containers)
+        for subscriber_set in sets[1:]:
+            intersected = {}
+            for high, container in containers.items():
+                other = subscriber_set.containers.get(high)
+                if other is not None:
+                    container = intersect_containers(container, other)
+                    if container is not None:
+                        intersected[high] = container
+            containers = intersected
+            if not containers:
+                break
+        return cls(containers)
+
+    def __or__(self, other):
+        return SubscriberSet.union(self, other)
+
+    def __and__(self, other):
+        return SubscriberSet.intersection(self, other)
+
+    def __len__(self):
+        return sum(get_cardinality(container) for container in self.containers.values())
+
+    def __bool__(self):
+        return bool(self.containers)
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def to_list(self):
+        """The ordinals, in ascending order."""
+        ordinals = []
+        for high in sorted(self.containers):
+            ordinals.extend(get_ordinals(self.containers[high], high << 16))
+        return ordinals
+
+    def __contains__(self, ordinal):
+        container = self.containers.get(ordinal >> 16)
+        if container is None:
+            return False
+        low = ordinal & 0xFFFF
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        index = bisect_left(container, low)
+        return index < len(container) and container[index] == low
+
+    def add(self, ordinal):
+        high, low = ordinal >> 16, ordinal & 0xFFFF
+        container = self.containers.get(high)
+        if container is None:
+            self.containers[high] = array("H", [low])
+        elif isinstance(container, int):
+            self.containers[high] = container | 1 << low
+        else:
+            index = bisect_left(container, low)
+            if index == len(container) or container[index] != low:
+                container = array("H", container)
+                container.insert(index, low)
+                self.containers[high] = normalize(container)
+
+    def discard(self, ordinal):
+        high, low = ordinal >> 16, ordinal & 0xFFFF
+        container = self.containers.get(high)
+        if container is None:
+            return
+        if isinstance(container, int):
+            container = normalize(container & ~(1 << low))
+        else:
+            index = bisect_left(container, low)
+            if index < len(container) and container[index] == low:
+                container = array("H", container)
+                del container[index]
+            container = normalize(container)
+        if container is None:
+            del self.containers[high]
+        else:
+            self.containers[high] = container
+
+    def to_bytes(self):
+        """Serializes the set, each container as its header (high bits, kind, cardinality) and its array or bitmap."""
+        parts = []
+        for high in sorted(self.containers):
+            container = self.containers[high]
+            if isinstance(container, int):
+                parts.append(HEADER.pack(high, BITMAP, container.bit_count()))
+                parts.append(container.to_bytes(BITMAP_BYTES, "little"))
+            else:
+                parts.append(HEADER.pack(high, ARRAY, len(container)))
+                if sys.byteorder == "big":
+                    container = array("H", container)
+                    container.byteswap()
+                parts.append(container.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        containers = {}
+        offset = 0
+        while offset < len(data):
+            high, kind, cardinality = HEADER.unpack_from(data, offset)
+            offset += HEADER.size
+            if kind == BITMAP:
+                containers[high] = int.from_bytes(data[offset:offset + BITMAP_BYTES], "little")
+                offset += BITMAP_BYTES
+            else:
+                container = array("H")
+                container.frombytes(data[offset:offset + 2 * cardinality])
+                if sys.byteorder == "big":
+                    container.byteswap()
+                containers[high] = container
+                offset += 2 * cardinality
+        return cls(containers)
+
+
+def get_cardinality(container):
+    return container.bit_count() if isinstance(container, int) else len(container)
+
+
+def get_ordinals(container, base=0):
+    """The ordinals of a container, base being its high bits."""
+    if not isinstance(container, int):
+        return [base | low for low in container] if base else container.tolist()
+    data = container.to_bytes(BITMAP_BYTES, "little")
+    return [base | index << 3 | bit for index, byte in enumerate(data) if byte for bit in BYTE_BITS[byte]]
+
+
+def to_bitmap(container):
+    if isinstance(container, int):
+        return container
+    bits = bytearray(BITMAP_BYTES)
+    for low in container:
+        bits[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(bits, "little")
+
+
+def normalize(container):
+    """The container in its compact form, an array while it is sparse and a bitmap when dense, None when empty."""
+    cardinality = get_cardinality(container)
+    if cardinality == 0:
+        return None
+    if isinstance(container, int):
+        return array("H", get_ordinals(container)) if cardinality <= MAX_ARRAY_SIZE else container
+    return to_bitmap(container) if cardinality > MAX_ARRAY_SIZE else container
+
+
+def union_containers(containers):
+    if len(containers) == 1:
+        return containers[0]
+    if not any(isinstance(container, int) for container in containers) and sum(map(len, containers)) <= MAX_ARRAY_SIZE:
+        return array("H", sorted(set().union(*containers)))
+    bitmap = 0
+    for container in containers:
+        bitmap |= to_bitmap(container)
+    return normalize(bitmap)
+
+
+def intersect_containers(container, other):
+    if isinstance(container, int) and isinstance(other, int):
+        return normalize(container & other)
+    if isinstance(container, int):
+        container, other = other, container
+    if isinstance(other, int):
+        bits = other.to_bytes(BITMAP_BYTES, "little")
+        lows = array("H", (low for low in container if bits[low >> 3] >> (low & 7) & 1))
+    else:
+        lows = array("H", sorted(set(container).intersection(other)))
+    return lows or None
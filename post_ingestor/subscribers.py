@@ -0,0 +1,29 @@
+from timeline_writer import get_score, to_member
+
+
+def get_subscriber_counts(index, categories):
+    """Returns the number of users with a subscription to each category, {"traffic": 12000, ...}, see subscription_index."""
+    return {category: len(index.get_subscribers(category)) for category in categories}
+
+
+def get_timelines(index, posts):
+    """
+    Resolves the subscribers of a batch of posts with the subscription index and yields the posts to add to each of their
+    timelines. A subscription with tags only matches the posts with one of its tags (see SubscriptionIndex.resolve).
+
+    Yields:
+      ("<user_id>", {<member>: <score>, ...}), see timeline_writer.write_timelines
+    """
+    timelines = {}
+    for post in posts:
+        member, score = to_member(post), get_score(post)
+        for ordinal in index.resolve(post.category, post.tags):
+            members = timelines.get(ordinal)
+            if members is None:
+                timelines[ordinal] = {member: score}
+            else:
+                members[member] = score
+
+    user_ids = index.user_ids
+    for ordinal, members in timelines.items():
+        yield user_ids[ordinal], members
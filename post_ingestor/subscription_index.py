@@ -0,0 +1,374 @@
+from datetime import datetime, timezone
+import threading
+import time
+from bson import Binary
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from geohash import encode, get_area
+from mongo import get_collection
+from subscriber_set import SubscriberSet
+
+# The tag under which the subscriptions to a whole category are indexed
+WHOLE_CATEGORY = ""
+USERS_PART_SIZE = 50000
+# The locations of a user, GeoJSON points, and the geohash precisions at which they are indexed:
+# 4 (about 39 km x 20 km), 5 (4.9 km x 4.9 km) and 6 (1.2 km x 0.6 km)
+LOCATION_FIELDS = ("home_location", "current_location")
+GEO_PRECISIONS = (4, 5, 6)
+# The document numbering the generations of the saved index, and the reads of a generation before giving up on it
+GENERATION_COUNTER_ID = "generation_counter"
+LOAD_ATTEMPTS = 3
+
+# One index per container, loaded on the first call to get_index and refreshed by the warm invocations
+_index = None
+_refreshed_at = 0.0
+_lock = threading.Lock()
+
+
+class SubscriptionIndex:
+    """
+    An inverted index of the subscriptions of the users: (category, tag) -> the users subscribed to it.
+
+    Users are numbered with ordinals (their position in user_ids), and each (category, tag) maps to the SubscriberSet of
+    the ordinals of its subscribers. A subscription without tags covers every post of its category and is indexed under
+    (category, WHOLE_CATEGORY):
+      user = {"user_id": "1", "subscriptions": [{"category": "traffic"}, {"category": "fire", "tags": ["wildfire", "smoke"]}]}
+      -> ("traffic", ""), ("fire", "wildfire"), ("fire", "smoke")
+
+    The home and current locations of the users are indexed the same way, each geohash cell of GEO_PRECISIONS maps to the
+    users with a location in it (see get_cells), so the subscribers of a post can be narrowed to the users near it.
+
+    changes_through is the _id of the last subscription change applied, see refresh_index.
+    """
+
+    def __init__(self, user_ids=(), postings=None, changes_through=None, cells=None):
+        self.user_ids = list(user_ids)
+        self.ordinals = {user_id: ordinal for ordinal, user_id in enumerate(self.user_ids)}
+        self.postings = postings if postings is not None else {}
+        self.cells = cells if cells is not None else {}
+        self.changes_through = changes_through
+        self._tags = {}
+        for category, tag in self.postings:
+            self._tags.setdefault(category, set()).add(tag)
+
+    @classmethod
+    def from_users(cls, users, changes_through=None):
+        """Builds the index of user documents, e.g. the users collection."""
+        user_ids, ordinals, cell_ordinals = [], {}, {}
+        for user in users:
+            user_id = user.get("user_id")
+            if not user_id:
+                continue
+            ordinal = len(user_ids)
+            user_ids.append(user_id)
+            for key in get_keys(user.get("subscriptions")):
+                ordinals.setdefault(key, []).append(ordinal)
+            for cell in get_cells(user):
+                cell_ordinals.setdefault(cell, []).append(ordinal)
+        postings = {key: SubscriberSet.from_ordinals(key_ordinals) for key, key_ordinals in ordinals.items()}
+        cells = {cell: SubscriberSet.from_ordinals(ordinals) for cell, ordinals in cell_ordinals.items()}
+        return cls(user_ids, postings, changes_through, cells)
+
+    def get_ordinal(self, user_id):
+        """Returns the ordinal of a user, adding the user if it is not indexed yet."""
+        ordinal = self.ordinals.get(user_id)
+        if ordinal is None:
+            ordinal = self.ordinals[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+        return ordinal
+
+    def update(self, user_id, before, after):
+        """Replaces the subscriptions of a user, before by after, adding the user if it is not indexed yet."""
+        ordinal = self.get_ordinal(user_id)
+        before, after = set(get_keys(before)), set(get_keys(after))
+        for key in before - after:
+            posting = self.postings.get(key)
+            if posting is not None:
+                posting.discard(ordinal)
+                if not posting:
+                    del self.postings[key]
+                    self._tags[key[0]].discard(key[1])
+        for key in after - before:
+            if key not in self.postings:
+                self.postings[key] = SubscriberSet()
+                self._tags.setdefault(key[0], set()).add(key[1])
+            self.postings[key].add(ordinal)
+
+    def update_locations(self, user_id, before, after):
+        """Replaces the locations of a user, before by after ({"home_location": ..., "current_location": ...})."""
+        ordinal = self.get_ordinal(user_id)
+        before, after = get_cells(before or {}), get_cells(after or {})
+        for cell in before - after:
+            subscribers = self.cells.get(cell)
+            if subscribers is not None:
+                subscribers.discard(ordinal)
+                if not subscribers:
+                    del self.cells[cell]
+        for cell in after - before:
+            if cell not in self.cells:
+                self.cells[cell] = SubscriberSet()
+            self.cells[cell].add(ordinal)
+
+    def resolve(self, category, tags=()):
+        """
+        Returns the users who see a post of the category with the tags: the union of the subscribers to the whole category
+        and of the subscribers to any of the tags.
+        """
+        postings = [self.postings.get((category, tag)) for tag in (WHOLE_CATEGORY, *tags)]
+        return SubscriberSet.union(*(posting for posting in postings if posting is not None))
+
+    def resolve_nearby(self, category, tags, location, precision):
+        """
+        Returns the subscribers of a post (see resolve) with a home or current location near it: in the cell of precision
+        holding the location (lat, lng), or in one of its neighbours. Only the subscribers in those cells are evaluated,
+        each posting is intersected with them before the union.
+        """
+        nearby = [self.cells.get(cell) for cell in get_area(location[0], location[1], precision)]
+        nearby = SubscriberSet.union(*(subscribers for subscribers in nearby if subscribers is not None))
+        if not nearby:
+            return nearby
+        postings = [self.postings.get((category, tag)) for tag in (WHOLE_CATEGORY, *tags)]
+        return SubscriberSet.union(*(posting & nearby for posting in postings if posting is not None))
+
+    def resolve_all(self, category, tags):
+        """Returns the users subscribed to every one of the tags of the category, the intersection of their subscribers."""
+        postings = [self.postings.get((category, tag)) for tag in tags]
+        if not postings or None in postings:
+            return SubscriberSet()
+        return SubscriberSet.intersection(*postings)
+
+    def get_subscribers(self, category):
+        """Returns the users with any subscription to the category."""
+        return SubscriberSet.union(*(self.postings[(category, tag)] for tag in self._tags.get(category, ())))
+
+    def get_user_ids(self, subscribers):
+        return list(map(self.user_ids.__getitem__, subscribers.to_list()))
+
+
+def get_keys(subscriptions):
+    for subscription in subscriptions or []:
+        category = subscription.get("category")
+        if category:
+            for tag in subscription.get("tags") or [WHOLE_CATEGORY]:
+                yield category, tag
+
+
+def get_point(location):
+    """Returns the (lat, lng) of a GeoJSON point, {"type": "Point", "coordinates": [lng, lat]}, None if it is not one."""
+    if not isinstance(location, dict) or location.get("type") != "Point":
+        return None
+    coordinates = location.get("coordinates")
+    if not isinstance(coordinates, (list, tuple)) or len(coordinates) != 2:
+        return None
+    lng, lat = coordinates
+    if not isinstance(lat, (int, float)) or not isinstance(lng, (int, float)) or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+def get_cells(user):
+    """
+    Returns the cells of the locations of a user at each of GEO_PRECISIONS. A cell is the prefix of the cells it holds,
+    so the location is encoded once:
+      {"home_location": {"type": "Point", "coordinates": [-74.006, 40.7128]}} -> {"dr5r", "dr5re", "dr5reg"}
+    """
+    cells = set()
+    for field in LOCATION_FIELDS:
+        point = get_point(user.get(field))
+        if point is not None:
+            cell = encode(point[0], point[1], GEO_PRECISIONS[-1])
+            cells.update(cell[:precision] for precision in GEO_PRECISIONS)
+    return cells
+
+
+def save_index(index, collection):
+    """
+    Persists the index as a new generation of the index collection.
+    Each (category, tag) and each cell is a document holding its serialized SubscriberSet, the user ids are stored
+    USERS_PART_SIZE per document.
+    The meta document points to the current generation, so a reader never loads a generation being written. Generations
+    are numbered by a counter (see next_generation) and the meta document only moves to a newer one, so concurrent rebuilds
+    never share a generation and the last one written never replaces a newer one. The replaced generation is kept until
+    the next save, for the readers still loading it (see load_index), the older ones are dropped.
+    """
+    generation = next_generation(collection)
+
+    collection.insert_many(
+        [{"generation": generation, "kind": "users", "part": start // USERS_PART_SIZE, "user_ids": index.user_ids[start:start + USERS_PART_SIZE]}
+         for start in range(0, len(index.user_ids), USERS_PART_SIZE)] or [{"generation": generation, "kind": "users", "part": 0, "user_ids": []}]
+    )
+    postings = [{"generation": generation, "kind": "posting", "category": category, "tag": tag, "subscribers": Binary(posting.to_bytes())}
+                for (category, tag), posting in index.postings.items()]
+    postings.extend({"generation": generation, "kind": "cell", "cell": cell, "subscribers": Binary(subscribers.to_bytes())}
+                    for cell, subscribers in index.cells.items())
+    for start in range(0, len(postings), 1000):
+        collection.insert_many(postings[start:start + 1000])
+
+    try:
+        previous = collection.find_one_and_update(
+            {"_id": "meta", "generation": {"$lt": generation}},
+            {"$set": {"generation": generation, "changes_through": index.changes_through, "users": len(index.user_ids),
+                      "geo_precisions": list(GEO_PRECISIONS), "built_at": datetime.now(timezone.utc)}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+    except DuplicateKeyError:
+        # A concurrent rebuild saved a newer generation first
+        collection.delete_many({"generation": generation, "kind": {"$exists": True}})
+        return
+    if previous is not None:
+        collection.update_one({"_id": "meta"}, {"$set": {"previous_generation": previous["generation"]}})
+        collection.delete_many({"generation": {"$lt": previous["generation"]}, "kind": {"$exists": True}})
+
+
+def next_generation(collection):
+    """
+    Allocates the number of a new generation with an atomic increment of the counter document, seeded with the generation
+    of the meta document for an index saved before the counter existed.
+    """
+    meta = collection.find_one({"_id": "meta"}, {"generation": 1})
+    if meta is not None:
+        collection.update_one({"_id": GENERATION_COUNTER_ID}, {"$max": {"last_generation": meta["generation"]}}, upsert=True)
+    counter = collection.find_one_and_update(
+        {"_id": GENERATION_COUNTER_ID}, {"$inc": {"last_generation": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return counter["last_generation"]
+
+
+def load_index(collection, changes_collection):
+    """
+    Loads the current generation of the index and applies the subscription changes recorded since, None if the index was
+    never built or was built with other GEO_PRECISIONS.
+    A generation is only dropped by the second save after it, once the meta document no longer names it, so the meta
+    document is read again after the generation: if it names neither it as the current nor as the previous generation,
+    the generation may have been dropped during the read and the current one is read instead.
+    """
+    for _ in range(LOAD_ATTEMPTS):
+        meta = collection.find_one({"_id": "meta"})
+        if meta is None or meta.get("geo_precisions") != list(GEO_PRECISIONS):
+            return None
+        generation = meta["generation"]
+        user_ids = []
+        for part in collection.find({"generation": generation, "kind": "users"}).sort("part", ASCENDING):
+            user_ids.extend(part["user_ids"])
+        postings = {
+            (document["category"], document["tag"]): SubscriberSet.from_bytes(document["subscribers"])
+            for document in collection.find({"generation": generation, "kind": "posting"})
+        }
+        cells = {
+            document["cell"]: SubscriberSet.from_bytes(document["subscribers"])
+            for document in collection.find({"generation": generation, "kind": "cell"})
+        }
+        current = collection.find_one({"_id": "meta"}, {"generation": 1, "previous_generation": 1}) or {}
+        if generation in (current.get("generation"), current.get("previous_generation")):
+            index = SubscriptionIndex(user_ids, postings, meta.get("changes_through"), cells)
+            refresh_index(index, changes_collection)
+            return index
+    return None
+
+
+def refresh_index(index, changes_collection):
+    """
+    Applies the subscription changes recorded after index.changes_through, in the order of their _id.
+    A change whose _id was generated before, but inserted after, the last change applied is only picked up by the next rebuild.
+    """
+    query = {"_id": {"$gt": index.changes_through}} if index.changes_through is not None else {}
+    for change in changes_collection.find(query).sort("_id", ASCENDING):
+        if change.get("field") == "locations":
+            index.update_locations(change["user_id"], change.get("before"), change.get("after"))
+        else:
+            index.update(change["user_id"], change.get("before"), change.get("after"))
+        index.changes_through = change["_id"]
+
+
+def rebuild_index(users_collection, collection, changes_collection):
+    """
+    Builds the index from the users collection and saves it. The changes recorded during the scan are applied again
+    by the readers, which is harmless: a change sets the subscriptions of its user to their state after the change.
+    """
+    last_change = changes_collection.find_one({}, {"_id": 1}, sort=[("_id", DESCENDING)])
+    users = users_collection.find({}, {"_id": 0, "user_id": 1, "subscriptions": 1, **{field: 1 for field in LOCATION_FIELDS}})
+    index = SubscriptionIndex.from_users(users, last_change["_id"] if last_change else None)
+    save_index(index, collection)
+    return index
+
+
+def set_subscriptions(users_collection, changes_collection, user_id, subscriptions):
+    """
+    Sets the subscriptions of a user and records the change, so the loaded indexes pick it up when they are refreshed.
+    Every write of users.subscriptions should go through it (or record its change the same way).
+    """
+    before = users_collection.find_one_and_update(
+        {"user_id": user_id}, {"$set": {"subscriptions": subscriptions}}, {"subscriptions": 1}, return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        return False
+    changes_collection.insert_one({"user_id": user_id, "before": before.get("subscriptions") or [], "after": subscriptions,
+                                   "changed_at": datetime.now(timezone.utc)})
+    return True
+
+
+def set_locations(users_collection, changes_collection, user_id, locations):
+    """
+    Sets the home and/or current location of a user, GeoJSON points ({"current_location": {"type": "Point", ...}}),
+    and records the change when it moves the user to other cells. Every write of the locations of the users should go
+    through it, like set_subscriptions.
+    """
+    locations = {field: location for field, location in locations.items() if field in LOCATION_FIELDS}
+    before = users_collection.find_one_and_update(
+        {"user_id": user_id}, {"$set": locations}, {field: 1 for field in LOCATION_FIELDS}, return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        return False
+    before = {field: before.get(field) for field in LOCATION_FIELDS}
+    after = {**before, **locations}
+    # Most moves stay within the cells, e.g. the current location reported by a phone
+    if get_cells(before) != get_cells(after):
+        changes_collection.insert_one({"user_id": user_id, "field": "locations", "before": before, "after": after,
+                                       "changed_at": datetime.now(timezone.utc)})
+    return True
+
+
+def get_index(env_vars):
+    """
+    Returns the subscription index of the container, loaded from MONGO_SUBSCRIPTION_INDEX_COLLECTION on the first call
+    (and built from the users collection if it was never built), then refreshed with the recorded subscription changes
+    at most every SUBSCRIPTION_REFRESH_SECONDS.
+    """
+    global _index, _refreshed_at
+    with _lock:
+        now = time.monotonic()
+        if _index is not None and now - _refreshed_at < env_vars["SUBSCRIPTION_REFRESH_SECONDS"]:
+            return _index
+
+        collection = get_collection(env_vars, "MONGO_SUBSCRIPTION_INDEX_COLLECTION")
+        changes_collection = get_collection(env_vars, "MONGO_SUBSCRIPTION_CHANGES_COLLECTION")
+        if _index is not None:
+            refresh_index(_index, changes_collection)
+        else:
+            _index = load_index(collection, changes_collection)
+            if _index is None:
+                _index = rebuild_index(get_collection(env_vars, "MONGO_USER_COLLECTION"), collection, changes_collection)
+        _refreshed_at = now
+        return _index
+
+
+def clear():
+    """Forget the index, the next call to get_index loads it again."""
+    global _index, _refreshed_at
+    with _lock:
+        _index = None
+        _refreshed_at = 0.0
+
+
+if __name__ == "__main__":
+    # Rebuild, e.g. nightly: compacts the recorded changes into a new generation
+    from config import get_env_vars
+
+    env_vars = get_env_vars()
+    index = rebuild_index(
+        get_collection(env_vars, "MONGO_USER_COLLECTION"),
+        get_collection(env_vars, "MONGO_SUBSCRIPTION_INDEX_COLLECTION"),
+        get_collection(env_vars, "MONGO_SUBSCRIPTION_CHANGES_COLLECTION"),
+    )
+    print(f"Indexed {len(index.user_ids)} users, {len(index.postings)} (category, tag) postings, {len(index.cells)} cells")
@@ -0,0 +1,26 @@
+import pytest
+
+import batcher
+import config
+import mongo
+import push_dispatcher
+import redis_cache
+import subscription_index
+
+
+@pytest.fixture(autouse=True)
+def cold_container():
+    """Each test starts in a cold container, without configuration, clients, batcher, subscription index nor push dispatcher."""
+    config.clear()
+    mongo.close_client()
+    batcher.clear()
+    redis_cache.close_client()
+    subscription_index.clear()
+    push_dispatcher.close_dispatcher()
+    yield
+    config.clear()
+    mongo.close_client()
+    batcher.clear()
+    redis_cache.close_client()
+    subscription_index.clear()
+    push_dispatcher.close_dispatcher()
@@ -0,0 +1,81 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import orjson
+
+
+class PushServer:
+    """
+    A local stub of the batch endpoints of the push providers (see push_dispatcher.Provider), POST /<provider>/batch.
+    It records the batches it receives, rejects the invalid_tokens, answers the first throttle requests with a 429
+    and the next errors requests with a 503, and takes latency_ms per request.
+    """
+
+    def __init__(self, invalid_tokens=(), throttle=0, errors=0, retry_after=0.2, latency_ms=0):
+        self.invalid_tokens = set(invalid_tokens)
+        self.throttle = throttle
+        self.errors = errors
+        self.retry_after = retry_after
+        self.latency_ms = latency_ms
+        # (provider, received at, notifications)
+        self.batches = []
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.get_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, provider):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/{provider}/batch"
+
+    def notifications(self, provider=None):
+        return [notification for name, _, batch in self.batches if provider in (None, name) for notification in batch]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keeps the connections alive, so the dispatcher reuses its pooled connections
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                if server.latency_ms:
+                    time.sleep(server.latency_ms / 1000)
+                with server.lock:
+                    server.requests += 1
+                    if server.throttle:
+                        server.throttle -= 1
+                        return self.reply(429, {"error": "throttled"}, {"Retry-After": str(server.retry_after)})
+                    if server.errors:
+                        server.errors -= 1
+                        return self.reply(503, {"error": "unavailable"})
+                    notifications = orjson.loads(body)["notifications"]
+                    server.batches.append((self.path.strip("/").split("/")[0], time.monotonic(), notifications))
+                results = [{"token": n["token"], "status": "invalid_token" if n["token"] in server.invalid_tokens else "ok"}
+                           for n in notifications]
+                self.reply(200, {"results": results})
+
+            def reply(self, status, body, headers=None):
+                content = orjson.dumps(body)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
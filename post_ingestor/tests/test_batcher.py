@@ -0,0 +1,93 @@
+# coding: utf-8
+
+from pymongo.errors import AutoReconnect
+
+from batcher import ADDITIVE_INCREASE, AdaptiveBatcher, get_batcher
+from consumer import PartitionWorker
+from post_decoder import decode_records
+from post_writer import write_posts
+from tests.test_consumer import FakeConsumer, get_partitions, wait_for
+from tests.test_post_writer import PostCollection, get_records
+
+
+def test_full_chunks_written_in_time_grow_the_chunk_size():
+    batcher = AdaptiveBatcher(initial=100, maximum=250, target_latency_ms=100)
+
+    batcher.record(100, 20)
+    assert batcher.chunk_size == 100 + ADDITIVE_INCREASE
+    batcher.record(200, 20)
+    assert batcher.chunk_size == 250
+
+    # A partial chunk does not show the cluster could take more
+    batcher.record(10, 20)
+    assert batcher.chunk_size == 250
+
+
+def test_slow_or_failed_writes_halve_the_chunk_size():
+    batcher = AdaptiveBatcher(initial=1000, minimum=300, target_latency_ms=100)
+
+    batcher.record(1000, 150)
+    assert batcher.chunk_size == 500
+    batcher.record(500, 20, error=True)
+    assert batcher.chunk_size == 300
+
+    assert batcher.get_stats()["errors"] == 1
+    assert batcher.get_stats()["writes"] == 2
+
+
+def test_latencies_are_counted_per_bucket():
+    batcher = AdaptiveBatcher()
+
+    for latency_ms in [1, 5, 7, 300, 60000]:
+        batcher.record(1, latency_ms)
+
+    histogram = batcher.get_stats()["latency_ms"]
+    assert histogram["5"] == 2
+    assert histogram["10"] == 1
+    assert histogram["500"] == 1
+    assert histogram["+Inf"] == 1
+    assert sum(histogram.values()) == 5
+
+
+def test_write_posts_follows_the_batcher():
+    class FlakyCollection(PostCollection):
+        def bulk_write(self, operations, ordered=True):
+            if not self.chunk_sizes:
+                self.chunk_sizes.append(len(operations))
+                raise AutoReconnect("timed out")
+            return super().bulk_write(operations, ordered)
+
+    collection = FlakyCollection()
+    batcher = AdaptiveBatcher(initial=40, minimum=10)
+
+    result = write_posts(collection, decode_records(get_records(100), []), batcher=batcher)
+
+    # The failed chunk halves the size to 20, then each full chunk grows it
+    assert collection.chunk_sizes == [40, 20, 40]
+    assert result["inserted"] == 60
+    assert len(result["failures"]) == 40
+
+
+def test_batcher_is_kept_by_the_container():
+    env_vars = {"INGEST_CHUNK_SIZE": 50}
+
+    assert get_batcher(env_vars) is get_batcher(env_vars)
+    assert get_batcher(env_vars).chunk_size == 50
+
+
+def test_queued_batches_are_coalesced_up_to_the_target_size():
+    messages = get_partitions(1, 30)[("post-ingestor-consumer", 0)]
+    ingested = []
+    def ingest(batch):
+        ingested.append(len(batch))
+        return []
+
+    worker = PartitionWorker(FakeConsumer({}), "post-ingestor-consumer", 0, ingest, 10, target_size=lambda: 20, linger_seconds=0.05)
+    for start in range(0, 30, 5):
+        worker.batches.put(messages[start:start + 5])
+
+    worker.start()
+    wait_for(lambda: sum(ingested) == 30)
+    worker.stop()
+
+    assert ingested == [20, 10]
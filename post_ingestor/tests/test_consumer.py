@@ -0,0 +1,244 @@
+# coding: utf-8
+
+import os
+import threading
+import time
+import uuid
+
+import orjson
+import pytest
+
+import consumer
+from consumer import run_consumer
+from main import ingest_messages, ingest_posts
+from post_decoder import decode_messages
+from tests.test_post_writer import PostCollection
+
+
+class FakeMessage:
+    def __init__(self, topic, partition, offset, value, timestamp=1767268800000):
+        self._topic, self._partition, self._offset, self._value = topic, partition, offset, value
+        self._timestamp = timestamp
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def value(self):
+        return self._value
+
+    def timestamp(self):
+        # confluent_kafka.TIMESTAMP_CREATE_TIME
+        return (1, self._timestamp)
+
+    def error(self):
+        return None
+
+
+class FakeConsumer:
+    """A consumer of in-memory partitions, recording commits, pauses and resumes."""
+
+    def __init__(self, partitions):
+        self.partitions = partitions
+        self.positions = {key: 0 for key in partitions}
+        self.paused = set()
+        self.pauses = []
+        self.commits = {}
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def subscribe(self, topics, on_revoke=None):
+        self.on_revoke = on_revoke
+
+    def consume(self, num_messages=1, timeout=-1):
+        messages = []
+        for key, partition_messages in self.partitions.items():
+            if key in self.paused:
+                continue
+            batch = partition_messages[self.positions[key]:self.positions[key] + num_messages - len(messages)]
+            self.positions[key] += len(batch)
+            messages.extend(batch)
+        if not messages:
+            time.sleep(0.01)
+        return messages
+
+    def pause(self, partitions):
+        for partition in partitions:
+            self.paused.add((partition.topic, partition.partition))
+            self.pauses.append((partition.topic, partition.partition))
+
+    def resume(self, partitions):
+        for partition in partitions:
+            self.paused.discard((partition.topic, partition.partition))
+
+    def commit(self, offsets=None, asynchronous=True):
+        with self.lock:
+            for offset in offsets:
+                self.commits[(offset.topic, offset.partition)] = offset.offset
+
+    def close(self):
+        self.closed = True
+
+
+def get_partitions(partitions, count, topic="post-ingestor-consumer"):
+    return {
+        (topic, partition): [
+            FakeMessage(topic, partition, offset, orjson.dumps({"user_id": "1", "title": f"post {offset}", "category": "fire"}))
+            for offset in range(count)
+        ]
+        for partition in range(partitions)
+    }
+
+
+def get_env_vars(**overrides):
+    env_vars = {"KAFKA_TOPIC": "post-ingestor-consumer", "KAFKA_BATCH_SIZE": 10, "KAFKA_MAX_IN_FLIGHT_BATCHES": 2, "INGEST_CHUNK_SIZE": 100}
+    env_vars.update(overrides)
+    return env_vars
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def start(env_vars, ingest, fake_consumer):
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_consumer, args=(env_vars, ingest, stop_event, fake_consumer, 0.01), daemon=True)
+    thread.start()
+    return stop_event, thread
+
+
+def test_partitions_are_ingested_concurrently_and_committed():
+    fake_consumer = FakeConsumer(get_partitions(3, 25))
+    ingested = {}
+
+    def ingest(messages):
+        ingested.setdefault(messages[0].partition(), []).append((threading.current_thread().name, [message.offset() for message in messages]))
+        return []
+
+    stop_event, thread = start(get_env_vars(), ingest, fake_consumer)
+    wait_for(lambda: len(fake_consumer.commits) == 3 and all(offset == 25 for offset in fake_consumer.commits.values()))
+    stop_event.set()
+    thread.join()
+
+    assert fake_consumer.closed
+    for partition, batches in ingested.items():
+        assert {name for name, _ in batches} == {f"post-ingestor-consumer-{partition}"}
+        assert [offset for _, offsets in batches for offset in offsets] == list(range(25))
+
+
+def test_offsets_are_committed_once_failed_records_are_written(monkeypatch):
+    monkeypatch.setattr(consumer, "RETRY_BACKOFF_SECONDS", 0.01)
+    fake_consumer = FakeConsumer(get_partitions(1, 5))
+    attempts = []
+
+    def ingest(messages):
+        attempts.append([message.offset() for message in messages])
+        if len(attempts) < 3:
+            assert fake_consumer.commits == {}
+            return [{"offset": 2}]
+        return []
+
+    stop_event, thread = start(get_env_vars(), ingest, fake_consumer)
+    wait_for(lambda: fake_consumer.commits)
+    stop_event.set()
+    thread.join()
+
+    assert attempts == [[0, 1, 2, 3, 4], [2], [2]]
+    assert fake_consumer.commits == {("post-ingestor-consumer", 0): 5}
+
+
+def test_busy_partitions_are_paused():
+    fake_consumer = FakeConsumer(get_partitions(1, 50))
+    release = threading.Event()
+
+    def ingest(messages):
+        release.wait()
+        return []
+
+    stop_event, thread = start(get_env_vars(KAFKA_BATCH_SIZE=5, KAFKA_MAX_IN_FLIGHT_BATCHES=1), ingest, fake_consumer)
+    try:
+        # One batch is ingested, one is queued and one waits for room, nothing more is consumed while paused
+        wait_for(lambda: fake_consumer.positions[("post-ingestor-consumer", 0)] == 15)
+        time.sleep(0.05)
+        assert fake_consumer.positions[("post-ingestor-consumer", 0)] == 15
+        assert fake_consumer.paused == {("post-ingestor-consumer", 0)}
+    finally:
+        release.set()
+    wait_for(lambda: fake_consumer.commits.get(("post-ingestor-consumer", 0)) == 50)
+    stop_event.set()
+    thread.join()
+    assert fake_consumer.paused == set()
+
+
+def test_shutdown_commits_the_batch_in_flight():
+    fake_consumer = FakeConsumer(get_partitions(1, 5))
+    started, release = threading.Event(), threading.Event()
+
+    def ingest(messages):
+        started.set()
+        release.wait()
+        return []
+
+    stop_event, thread = start(get_env_vars(), ingest, fake_consumer)
+    started.wait()
+    stop_event.set()
+    time.sleep(0.05)
+    assert thread.is_alive()
+    release.set()
+    thread.join()
+
+    assert fake_consumer.commits == {("post-ingestor-consumer", 0): 5}
+    assert fake_consumer.closed
+
+
+def test_messages_are_decoded_and_written():
+    collection = PostCollection()
+    messages = get_partitions(1, 3)[("post-ingestor-consumer", 0)]
+    messages.append(FakeMessage("post-ingestor-consumer", 0, 3, b"{not json"))
+    failures = []
+
+    result = ingest_posts(decode_messages(messages, failures), get_env_vars(), collection=collection, failures=failures)
+
+    assert result["inserted"] == 3
+    assert [(failure["offset"], failure["retryable"]) for failure in result["failures"]] == [(3, False)]
+
+
+@pytest.mark.skipif(not os.getenv("KAFKA_TEST_BOOTSTRAP_SERVERS"), reason="KAFKA_TEST_BOOTSTRAP_SERVERS is not set")
+def test_consumer_against_kafka(monkeypatch):
+    """
+    Runs against the Kafka of post_queue/ (docker compose up in post_queue/):
+        KAFKA_TEST_BOOTSTRAP_SERVERS=localhost:9094 python -m pytest -q tests/test_consumer.py
+    """
+    from confluent_kafka import Producer
+    from confluent_kafka.admin import AdminClient, NewTopic
+
+    servers = os.getenv("KAFKA_TEST_BOOTSTRAP_SERVERS")
+    topic = f"post-ingestor-test-{uuid.uuid4().hex[:8]}"
+    admin = AdminClient({"bootstrap.servers": servers})
+    admin.create_topics([NewTopic(topic, num_partitions=3, replication_factor=1)])[topic].result()
+
+    producer = Producer({"bootstrap.servers": servers})
+    for offset in range(300):
+        producer.produce(topic, orjson.dumps({"user_id": "1", "title": f"post {offset}", "category": "fire"}), partition=offset % 3)
+    producer.flush()
+
+    collection = PostCollection()
+    monkeypatch.setattr("main.get_posts_collection", lambda env_vars: collection)
+    env_vars = get_env_vars(KAFKA_TOPIC=topic, KAFKA_BOOTSTRAP_SERVERS=servers, KAFKA_GROUP_ID=topic)
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_consumer, args=(env_vars, lambda messages: ingest_messages(messages, env_vars), stop_event))
+    thread.start()
+    try:
+        wait_for(lambda: len(collection.documents) == 300, timeout=60)
+    finally:
+        stop_event.set()
+        thread.join()
+        admin.delete_topics([topic])
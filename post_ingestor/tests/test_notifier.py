@@ -0,0 +1,277 @@
+# coding: utf-8
+
+import time
+
+import orjson
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+import config
+import notifier
+import push_dispatcher
+from notifier import get_geo_precision, lambda_handler, notify_messages, notify_posts
+from post_decoder import Post
+from push_dispatcher import Provider, PushDispatcher, TokenBucket
+from push_server import PushServer
+from subscription_index import SubscriptionIndex
+from tests.test_consumer import FakeMessage
+
+
+class FakeDevices:
+    """An in-memory devices collection supporting the queries of notifier."""
+
+    def __init__(self, devices=(), error=None):
+        self.devices = [dict(device) for device in devices]
+        self.error = error
+        self.finds = 0
+
+    def find(self, query, projection=None):
+        if self.error is not None:
+            raise self.error
+        self.finds += 1
+        user_ids = set(query["user_id"]["$in"])
+        return [dict(device) for device in self.devices if device["user_id"] in user_ids]
+
+    def delete_many(self, query):
+        tokens = set(query["token"]["$in"])
+        self.devices = [d for d in self.devices if not (d["provider"] == query["provider"] and d["token"] in tokens)]
+
+
+@pytest.fixture
+def server():
+    with PushServer() as server:
+        yield server
+
+
+def get_dispatcher(server, batch_sizes=None, rate=1000000, burst=None, **kwargs):
+    providers = [Provider(name, server.url(name), batch_size, rate, burst) for name, batch_size in (batch_sizes or {"fcm": 500, "apns": 100}).items()]
+    return PushDispatcher(providers, **kwargs)
+
+
+def get_post(offset, category="traffic", tags=(), user_id="author"):
+    return Post("posts", 0, offset, user_id, f"Post {offset}", category, tags=tuple(tags))
+
+
+def test_events_of_a_device_are_coalesced_into_one_notification(server):
+    now = [100.0]
+    dispatcher = get_dispatcher(server, coalesce_ms=1000, clock=lambda: now[0])
+    for offset in range(1, 5):
+        dispatcher.submit({"provider": "fcm", "token": "a"}, get_post(offset))
+    # A redelivered post is only notified once
+    dispatcher.submit({"provider": "fcm", "token": "a"}, get_post(1))
+    now[0] += 0.5
+    dispatcher.submit({"provider": "apns", "token": "b"}, get_post(1))
+
+    assert dispatcher.loop.run_until_complete(dispatcher.flush())["notifications"] == 0
+    now[0] += 0.5
+    result = dispatcher.loop.run_until_complete(dispatcher.flush())
+
+    # b waits for the end of its own window
+    assert (result["notifications"], result["sent"]) == (1, 1)
+    [notification] = server.notifications("fcm")
+    assert notification["title"] == "4 new posts"
+    assert notification["body"] == "Post 1, Post 2, Post 3, ..."
+    assert notification["data"] == {"post_ids": ["posts:0:1", "posts:0:2", "posts:0:3", "posts:0:4"], "categories": ["traffic"]}
+
+    assert dispatcher.dispatch()["sent"] == 1
+    assert server.notifications("apns") == [{"token": "b", "title": "Post 1", "body": "traffic",
+                                             "data": {"post_ids": ["posts:0:1"], "categories": ["traffic"]}}]
+    dispatcher.close()
+
+
+def test_notifications_are_sent_in_batches_of_their_provider(server):
+    dispatcher = get_dispatcher(server)
+    for i in range(1200):
+        dispatcher.submit({"provider": "fcm", "token": f"fcm-{i}"}, get_post(1))
+    for i in range(150):
+        dispatcher.submit({"provider": "apns", "token": f"apns-{i}"}, get_post(1))
+    assert not dispatcher.submit({"provider": "unknown", "token": "x"}, get_post(1))
+
+    result = dispatcher.dispatch()
+
+    assert sorted((provider, len(batch)) for provider, _, batch in server.batches) == [
+        ("apns", 50), ("apns", 100), ("fcm", 200), ("fcm", 500), ("fcm", 500)]
+    assert (result["notifications"], result["batches"], result["sent"]) == (1350, 5, 1350)
+    dispatcher.close()
+
+
+def test_token_bucket_waits_for_its_rate():
+    now = [0.0]
+    bucket = TokenBucket(rate=100, capacity=50, clock=lambda: now[0])
+
+    assert bucket.take(50) == 0
+    assert bucket.take(20) == pytest.approx(0.2)
+    now[0] += 0.2
+    assert bucket.take(20) == 0
+    bucket.block(1.5)
+    assert bucket.take(1) == pytest.approx(1.5)
+    now[0] += 1.5
+    assert bucket.take(1) == pytest.approx(0.01)
+
+
+def test_providers_are_rate_limited(server):
+    dispatcher = get_dispatcher(server, {"fcm": 100}, rate=2000, burst=100)
+    for i in range(1000):
+        dispatcher.submit({"provider": "fcm", "token": str(i)}, get_post(1))
+
+    assert dispatcher.dispatch()["sent"] == 1000
+
+    received = [received_at for _, received_at, _ in server.batches]
+    # The first 100 are a burst, the other 900 take 0.45s at 2000/s
+    assert max(received) - min(received) >= 0.4
+    dispatcher.close()
+
+
+def test_throttled_and_failed_batches_are_sent_again():
+    with PushServer(throttle=1, errors=1, retry_after=0.1) as server:
+        dispatcher = get_dispatcher(server, {"fcm": 500})
+        dispatcher.submit({"provider": "fcm", "token": "a"}, get_post(1))
+        start = time.monotonic()
+
+        result = dispatcher.dispatch()
+
+        assert (result["sent"], result["throttled"], result["failed"]) == (1, 1, 0)
+        assert server.requests == 3
+        # Retry-After, then the backoff of the failure
+        assert time.monotonic() - start >= 0.1 + push_dispatcher.RETRY_BACKOFF_SECONDS
+        dispatcher.close()
+
+    with PushServer(errors=5) as server:
+        dispatcher = get_dispatcher(server, {"fcm": 500}, max_attempts=2)
+        dispatcher.submit({"provider": "fcm", "token": "a"}, get_post(1))
+
+        assert dispatcher.dispatch()["failed"] == 1
+        assert server.requests == 2
+        dispatcher.close()
+
+
+@pytest.fixture
+def env_vars(monkeypatch, server):
+    monkeypatch.setenv("PUSH_PROVIDERS", f'{{"fcm": {{"url": "{server.url("fcm")}"}}, "apns": {{"url": "{server.url("apns")}", "batch_size": 2}}}}')
+    return config.get_env_vars()
+
+
+def test_handler_notifies_the_devices_of_the_subscribers(server, env_vars, monkeypatch):
+    index = SubscriptionIndex.from_users([
+        {"user_id": "1", "subscriptions": [{"category": "traffic"}]},
+        {"user_id": "2", "subscriptions": [{"category": "fire", "tags": ["wildfire"]}]},
+        {"user_id": "3", "subscriptions": [{"category": "traffic"}, {"category": "fire"}]},
+        {"user_id": "4", "subscriptions": [{"category": "weather"}]},
+    ])
+    devices = FakeDevices([
+        {"user_id": "1", "provider": "fcm", "token": "phone-1"},
+        {"user_id": "1", "provider": "apns", "token": "tablet-1"},
+        {"user_id": "2", "provider": "apns", "token": "phone-2"},
+        {"user_id": "3", "provider": "fcm", "token": "phone-3"},
+        {"user_id": "4", "provider": "fcm", "token": "phone-4"},
+    ])
+    monkeypatch.setattr(notifier, "get_index", lambda env_vars: index)
+    monkeypatch.setattr(notifier, "get_collection", lambda env_vars, name: devices)
+    server.invalid_tokens.add("tablet-1")
+    records = [
+        {"topic": "posts", "partition": 0, "offset": 1, "value": {"user_id": "3", "title": "Road closed", "category": "traffic"}},
+        {"topic": "posts", "partition": 0, "offset": 2, "value": {"user_id": "9", "title": "Fire", "category": "fire", "tags": ["wildfire"]}},
+        {"topic": "posts", "partition": 0, "offset": 3, "value": {"title": "No user"}},
+    ]
+
+    response = lambda_handler({"event": "NOTIFY_POSTS", "records": records}, None)
+
+    assert response["batchItemFailures"] == []
+    body = response["body"]
+    assert [failure["offset"] for failure in body["failures"]] == [3]
+    # The author of the traffic post (3) is not notified of it
+    assert {token: n["data"]["post_ids"] for token, n in ((n["token"], n) for n in server.notifications())} == {
+        "phone-1": ["posts:0:1"], "tablet-1": ["posts:0:1"], "phone-2": ["posts:0:2"], "phone-3": ["posts:0:2"]}
+    assert (body["recipients"], body["events"], body["notifications"], body["sent"], body["invalid"]) == (3, 4, 4, 3, 1)
+    # The devices of all the recipients are read at once, and the invalid token is removed
+    assert devices.finds == 1
+    assert "tablet-1" not in {device["token"] for device in devices.devices}
+
+
+def test_posts_with_a_location_are_only_sent_to_the_subscribers_near_them(server, env_vars, monkeypatch):
+    brooklyn, queens, boston = [-73.95, 40.65], [-73.80, 40.72], [-71.06, 42.36]
+    index = SubscriptionIndex.from_users([
+        {"user_id": "1", "subscriptions": [{"category": "traffic"}], "home_location": {"type": "Point", "coordinates": brooklyn}},
+        # Lives in Boston, but is in Brooklyn right now
+        {"user_id": "2", "subscriptions": [{"category": "traffic"}], "home_location": {"type": "Point", "coordinates": boston},
+         "current_location": {"type": "Point", "coordinates": brooklyn}},
+        {"user_id": "3", "subscriptions": [{"category": "traffic"}], "home_location": {"type": "Point", "coordinates": queens}},
+        {"user_id": "4", "subscriptions": [{"category": "traffic"}]},
+    ])
+    devices = FakeDevices([{"user_id": str(i), "provider": "fcm", "token": f"phone-{i}"} for i in range(1, 5)])
+    monkeypatch.setattr(notifier, "get_index", lambda env_vars: index)
+    monkeypatch.setattr(notifier, "get_collection", lambda env_vars, name: devices)
+    records = [
+        {"topic": "posts", "partition": 0, "offset": 1,
+         "value": {"user_id": "9", "title": "Road closed", "category": "traffic", "location": {"lat": 40.651, "lng": -73.949}}},
+        {"topic": "posts", "partition": 0, "offset": 2, "value": {"user_id": "9", "title": "Outage", "category": "traffic"}},
+    ]
+
+    response = lambda_handler({"event": "NOTIFY_POSTS", "records": records}, None)
+
+    assert response["body"]["sent"] == 4
+    # Queens is more than a cell of precision 5 away from the post, posts without a location reach every subscriber
+    assert {n["token"]: n["data"]["post_ids"] for n in server.notifications()} == {
+        "phone-1": ["posts:0:1", "posts:0:2"], "phone-2": ["posts:0:1", "posts:0:2"], "phone-3": ["posts:0:2"], "phone-4": ["posts:0:2"]}
+
+
+def test_geo_precision_must_be_indexed(monkeypatch):
+    monkeypatch.setenv("NOTIFY_GEO_PRECISION", "0")
+    assert get_geo_precision(config.get_env_vars()) == 0
+    config.clear()
+    monkeypatch.setenv("NOTIFY_GEO_PRECISION", "7")
+
+    with pytest.raises(ValueError, match="NOTIFY_GEO_PRECISION"):
+        notify_posts([get_post(1)], config.get_env_vars(), SubscriptionIndex(), FakeDevices(), object())
+
+
+def test_handler_retries_the_batch_when_mongo_fails(server, env_vars, monkeypatch):
+    index = SubscriptionIndex.from_users([{"user_id": "1", "subscriptions": [{"category": "traffic"}]}])
+    monkeypatch.setattr(notifier, "get_index", lambda env_vars: index)
+    monkeypatch.setattr(notifier, "get_collection", lambda env_vars, name: FakeDevices(error=ServerSelectionTimeoutError("down")))
+    records = [{"topic": "posts", "partition": 0, "offset": 1, "value": {"user_id": "2", "title": "Road closed", "category": "traffic"}}]
+
+    response = lambda_handler({"event": "NOTIFY_POSTS", "records": records}, None)
+
+    assert response["batchItemFailures"] == [{"itemIdentifier": "posts:0:1"}]
+    assert server.requests == 0
+
+
+def test_consumed_batch_returns_once_its_notifications_are_sent(server, env_vars):
+    index = SubscriptionIndex.from_users([{"user_id": "1", "subscriptions": [{"category": "traffic"}]}])
+    devices = FakeDevices([{"user_id": "1", "provider": "fcm", "token": "phone-1"}])
+    messages = [FakeMessage("posts", 0, 1, orjson.dumps({"user_id": "2", "title": "Road closed", "category": "traffic"}))]
+    dispatcher = get_dispatcher(server, coalesce_ms=200)
+    dispatcher.start(lambda result: None)
+
+    start = time.monotonic()
+    assert notify_messages(messages, env_vars, index, devices, dispatcher) == []
+
+    # The offsets are committed after this returns, the notification is already sent
+    assert time.monotonic() - start >= 0.2
+    assert [n["token"] for n in server.notifications("fcm")] == ["phone-1"]
+    dispatcher.close()
+
+    # A stopped dispatcher cannot send the batch, it is not committed
+    with pytest.raises(RuntimeError):
+        notify_messages(messages, env_vars, index, devices, dispatcher)
+
+
+def test_notifications_per_second():
+    users = 20000
+    index = SubscriptionIndex.from_users([{"user_id": str(i), "subscriptions": [{"category": "traffic"}]} for i in range(users)])
+    devices = FakeDevices([{"user_id": str(i), "provider": "fcm" if i % 2 else "apns", "token": f"token-{i}"} for i in range(users)])
+    posts = [get_post(offset) for offset in range(3)]
+
+    with PushServer(latency_ms=5) as server:
+        dispatcher = get_dispatcher(server, max_connections=20)
+        start = time.perf_counter()
+        result = notify_posts(posts, config.get_env_vars(), index, devices, dispatcher)
+        elapsed = time.perf_counter() - start
+        dispatcher.close()
+
+    # The 3 posts of each device are coalesced into one notification
+    assert (result["events"], result["notifications"], result["sent"]) == (3 * users, users, users)
+    assert len(server.notifications()) == users
+    print(f"\n{result['notifications'] / elapsed:,.0f} notifications/s ({result['events'] / elapsed:,.0f} events/s), "
+          f"{result['batches']} batches in {elapsed:.2f}s")
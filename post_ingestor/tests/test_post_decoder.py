@@ -0,0 +1,108 @@
+# coding: utf-8
+
+import base64
+from datetime import datetime, timezone
+
+import orjson
+import pytest
+
+from post_decoder import Post, PostDecodeError, decode_kafka_event, decode_messages, decode_records
+from tests.test_consumer import FakeMessage
+
+
+def encode(value):
+    return base64.b64encode(orjson.dumps(value)).decode()
+
+
+def get_event(values, topic="post-ingestor-consumer", partition=0):
+    return {
+        "eventSource": "aws:kafka",
+        "records": {
+            f"{topic}-{partition}": [
+                {"topic": topic, "partition": partition, "offset": offset, "timestamp": 0, "value": value}
+                for offset, value in enumerate(values)
+            ]
+        },
+    }
+
+
+POST = {
+    "user_id": "1",
+    "title": "Road closed",
+    "category": "traffic",
+    "tags": ["accident"],
+    "location": {"lat": 40.7, "lng": -74.0},
+    "created_at": "2026-01-01T12:00:00Z",
+}
+
+
+def test_kafka_records_are_decoded_into_posts():
+    failures = []
+
+    posts = list(decode_kafka_event(get_event([encode(POST)]), failures))
+
+    assert failures == []
+    document = posts[0].to_document()
+    assert document["_id"] == "post-ingestor-consumer:0:0"
+    assert document["tags"] == ["accident"]
+    assert document["location"] == {"type": "Point", "coordinates": [-74.0, 40.7]}
+    assert document["created_at"] == datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def test_undated_posts_are_dated_with_the_timestamp_of_their_record():
+    undated = {key: value for key, value in POST.items() if key != "created_at"}
+    event = get_event([encode(undated), encode(POST)])
+    for record in event["records"]["post-ingestor-consumer-0"]:
+        record["timestamp"] = 1767268800123
+
+    posts = list(decode_kafka_event(event, []))
+
+    # Every consumer of the record gives it the same date, a created_at of the post is kept
+    assert posts[0].created_at == datetime(2026, 1, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+    assert posts[0].to_document()["created_at"] == posts[0].created_at
+    assert posts[1].created_at == datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+    [post] = decode_messages([FakeMessage("posts", 0, 0, orjson.dumps(undated), 1767268800123)], [])
+    assert post.created_at == posts[0].created_at
+    # Records without a timestamp are dated when they are decoded
+    [post] = decode_records([{"topic": "posts", "partition": 0, "offset": 0, "value": undated}], [])
+    assert post.created_at is not None
+
+
+def test_records_are_decoded_lazily():
+    posts = decode_kafka_event(get_event([encode(POST)] * 3), [])
+
+    assert isinstance(next(posts), Post)
+    assert len(list(posts)) == 2
+
+
+def test_invalid_records_are_isolated():
+    failures = []
+    values = [encode(POST), "not base64!", base64.b64encode(b"{not json").decode(), encode({**POST, "title": ""}), None, encode(POST)]
+
+    posts = list(decode_kafka_event(get_event(values), failures))
+
+    assert [post.offset for post in posts] == [0, 5]
+    assert [failure["offset"] for failure in failures] == [1, 2, 3, 4]
+    assert failures[2]["error"] == "Post title must be a non-empty string"
+    assert failures[3]["error"] == "Record has no value"
+
+
+@pytest.mark.parametrize(
+    "change, error",
+    [
+        ({"tags": "accident"}, "tags"),
+        ({"location": {"lat": 91, "lng": 0}}, "out of range"),
+        ({"location": {"lat": "north"}}, "location"),
+        ({"created_at": "yesterday"}, "created_at"),
+        ({"category": None}, "category"),
+    ],
+)
+def test_invalid_posts_are_rejected(change, error):
+    with pytest.raises(PostDecodeError, match=error):
+        Post.from_value("posts", 0, 0, {**POST, **change})
+
+
+def test_posts_use_slots():
+    post = Post.from_value("posts", 0, 0, POST)
+
+    assert not hasattr(post, "__dict__")
@@ -0,0 +1,106 @@
+# coding: utf-8
+
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from main import ingest_posts
+from post_decoder import decode_records, get_post_id
+from post_writer import write_posts
+
+
+class PostCollection:
+    """A posts collection applying unordered bulk upserts, rejecting posts whose title is "invalid"."""
+
+    def __init__(self):
+        self.documents = {}
+        self.chunk_sizes = []
+
+    def bulk_write(self, operations, ordered=True):
+        assert ordered is False
+        self.chunk_sizes.append(len(operations))
+        details = {"nUpserted": 0, "nMatched": 0, "writeErrors": []}
+        for index, operation in enumerate(operations):
+            document = operation._doc["$setOnInsert"]
+            if document.get("title") == "invalid":
+                details["writeErrors"].append({"index": index, "code": 121, "errmsg": "Document failed validation"})
+            elif document["_id"] in self.documents:
+                details["nMatched"] += 1
+            else:
+                self.documents[document["_id"]] = document
+                details["nUpserted"] += 1
+        if details["writeErrors"]:
+            raise BulkWriteError(details)
+        return BulkResult(details)
+
+
+class BulkResult:
+    def __init__(self, details):
+        self.bulk_api_result = details
+
+
+def get_records(count, start=0):
+    return [
+        {"topic": "posts", "partition": 0, "offset": offset, "value": {"user_id": "1", "title": f"post {offset}", "category": "fire"}}
+        for offset in range(start, start + count)
+    ]
+
+
+def get_posts(records):
+    return decode_records(records, [])
+
+
+def test_posts_are_written_in_chunks():
+    collection = PostCollection()
+
+    result = write_posts(collection, get_posts(get_records(25)), chunk_size=10)
+
+    assert result == {"inserted": 25, "duplicates": 0, "failures": []}
+    assert collection.chunk_sizes == [10, 10, 5]
+    assert collection.documents[get_post_id("posts", 0, 3)]["title"] == "post 3"
+    assert collection.documents[get_post_id("posts", 0, 3)]["source"] == {"topic": "posts", "partition": 0, "offset": 3}
+
+
+def test_redelivered_records_are_not_written_twice():
+    collection = PostCollection()
+    write_posts(collection, get_posts(get_records(10)))
+
+    result = write_posts(collection, get_posts(get_records(15)))
+
+    assert result == {"inserted": 5, "duplicates": 10, "failures": []}
+    assert len(collection.documents) == 15
+
+
+def test_failing_records_do_not_stop_the_batch():
+    collection = PostCollection()
+    records = get_records(5)
+    records[1]["value"]["title"] = "invalid"
+    records[3]["value"] = "not a post"
+    failures = []
+
+    result = write_posts(collection, decode_records(records, failures), chunk_size=2, failures=failures)
+
+    assert result["inserted"] == 3
+    assert sorted((failure["offset"], failure["error"]) for failure in result["failures"]) == [
+        (1, "Document failed validation"),
+        (3, "Record value is not a post object"),
+    ]
+
+
+def test_unreachable_database_fails_the_whole_chunk():
+    class UnreachableCollection:
+        def bulk_write(self, operations, ordered=True):
+            raise AutoReconnect("connection closed")
+
+    result = write_posts(UnreachableCollection(), get_posts(get_records(3)))
+
+    assert result["inserted"] == 0
+    assert [failure["offset"] for failure in result["failures"]] == [0, 1, 2]
+
+
+def test_ingest_posts_starts_with_the_configured_chunk_size():
+    collection = PostCollection()
+
+    result = ingest_posts(get_posts(get_records(7)), {"INGEST_CHUNK_SIZE": 3}, collection=collection)
+
+    # The first chunk is written fast enough to grow the next ones, see test_batcher
+    assert result["inserted"] == 7
+    assert collection.chunk_sizes == [3, 4]
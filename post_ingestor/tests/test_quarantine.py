@@ -0,0 +1,162 @@
+# coding: utf-8
+
+import base64
+
+import orjson
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import mongo
+from main import lambda_handler
+
+
+class FakeCollection:
+    """An in-memory collection supporting the upserts, finds and deletes of the ingestor."""
+
+    def __init__(self):
+        self.documents = {}
+        self.reachable = True
+        self.rejected_titles = set()
+
+    def bulk_write(self, operations, ordered=True):
+        if not self.reachable:
+            raise AutoReconnect("connection closed")
+        details = {"nUpserted": 0, "nMatched": 0, "writeErrors": []}
+        for index, operation in enumerate(operations):
+            _id, update = operation._filter["_id"], operation._doc
+            if update.get("$setOnInsert", {}).get("title") in self.rejected_titles:
+                details["writeErrors"].append({"index": index, "code": 121, "errmsg": "Document failed validation"})
+                continue
+            if _id in self.documents:
+                details["nMatched"] += 1
+            else:
+                self.documents[_id] = {"_id": _id, **update.get("$setOnInsert", {})}
+                details["nUpserted"] += 1
+            document = self.documents[_id]
+            document.update(update.get("$set", {}))
+            for field, amount in update.get("$inc", {}).items():
+                document[field] = document.get(field, 0) + amount
+        if details["writeErrors"]:
+            raise BulkWriteError(details)
+        return BulkResult(details)
+
+    def find(self, query, projection=None):
+        return [self.documents[_id] for _id in query["_id"]["$in"] if _id in self.documents]
+
+    def delete_many(self, query):
+        for _id in query["_id"]["$in"]:
+            self.documents.pop(_id, None)
+
+
+class BulkResult:
+    def __init__(self, details):
+        self.bulk_api_result = details
+
+
+class FakeMongoClient:
+    """A client whose single database holds the shared collections."""
+
+    collections = {}
+
+    def __init__(self, uri, **options):
+        pass
+
+    def __getitem__(self, name):
+        return FakeDatabase()
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    def __getitem__(self, name):
+        return FakeMongoClient.collections.setdefault(name, FakeCollection())
+
+
+class FakeKafkaSource:
+    """A Kafka event source redelivering the records reported in batchItemFailures, as the Lambda event source mapping does."""
+
+    def __init__(self, values, topic="post-ingestor-consumer"):
+        self.records = [
+            {"topic": topic, "partition": 0, "offset": offset, "value": base64.b64encode(orjson.dumps(value)).decode() if isinstance(value, dict) else value}
+            for offset, value in enumerate(values)
+        ]
+        self.invocations = 0
+
+    def deliver(self):
+        self.invocations += 1
+        response = lambda_handler({"eventSource": "aws:kafka", "records": {"post-ingestor-consumer-0": self.records}}, None)
+        failed = {failure["itemIdentifier"] for failure in response["batchItemFailures"]}
+        self.records = [record for record in self.records if f"{record['topic']}:{record['partition']}:{record['offset']}" in failed]
+        return response
+
+
+@pytest.fixture
+def collections(monkeypatch):
+    FakeMongoClient.collections = {}
+    monkeypatch.setattr(mongo, "MongoClient", FakeMongoClient)
+    monkeypatch.setenv("INGEST_MAX_ATTEMPTS", "3")
+    return FakeMongoClient.collections
+
+
+def get_post(title):
+    return {"user_id": "1", "title": title, "category": "traffic"}
+
+
+def test_only_failed_records_are_retried(collections):
+    collections["posts"] = FakeCollection()
+    collections["posts"].rejected_titles.add("b")
+    source = FakeKafkaSource([get_post("a"), get_post("b"), get_post("c")])
+
+    response = source.deliver()
+
+    assert response["body"]["inserted"] == 2
+    assert response["batchItemFailures"] == [{"itemIdentifier": "post-ingestor-consumer:0:1"}]
+    assert collections["ingest_attempts"].documents["post-ingestor-consumer:0:1"]["attempts"] == 1
+
+    collections["posts"].rejected_titles.clear()
+    response = source.deliver()
+
+    assert response["body"]["inserted"] == 1
+    assert response["batchItemFailures"] == []
+
+
+def test_undecodable_records_are_quarantined_right_away(collections):
+    source = FakeKafkaSource([get_post("a"), "not base64!"])
+
+    response = source.deliver()
+
+    assert response["batchItemFailures"] == []
+    assert [failure["offset"] for failure in response["body"]["quarantined"]] == [1]
+    dead_letter = collections["posts_dead_letter"].documents["post-ingestor-consumer:0:1"]
+    assert dead_letter["record"] == "not base64!"
+    assert "base64" in dead_letter["error"]
+
+
+def test_repeatedly_failing_records_are_quarantined(collections):
+    collections["posts"] = FakeCollection()
+    collections["posts"].rejected_titles.add("poison")
+    source = FakeKafkaSource([get_post("a"), get_post("poison")])
+
+    responses = [source.deliver() for _ in range(3)]
+
+    assert [len(response["batchItemFailures"]) for response in responses] == [1, 1, 0]
+    assert [failure["offset"] for failure in responses[-1]["body"]["quarantined"]] == [1]
+    dead_letter = collections["posts_dead_letter"].documents["post-ingestor-consumer:0:1"]
+    assert dead_letter["error"] == "Document failed validation"
+    assert dead_letter["record"]["title"] == "poison"
+    assert collections["ingest_attempts"].documents == {}
+    assert source.records == []
+    assert len(collections["posts"].documents) == 1
+
+
+def test_everything_is_retried_when_the_database_is_unreachable(collections):
+    source = FakeKafkaSource([get_post("a"), get_post("b")])
+    for name in ["posts", "ingest_attempts", "posts_dead_letter"]:
+        collections[name] = FakeCollection()
+        collections[name].reachable = False
+
+    response = source.deliver()
+
+    assert len(response["batchItemFailures"]) == 2
+    assert response["body"]["quarantined"] == []
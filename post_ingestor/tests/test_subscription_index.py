@@ -0,0 +1,322 @@
+# coding: utf-8
+
+import random
+
+import pytest
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import config
+import geohash
+import subscription_index
+from subscriber_set import MAX_ARRAY_SIZE, SubscriberSet
+from subscription_index import (SubscriptionIndex, get_cells, get_index, load_index, rebuild_index, refresh_index, set_locations,
+                                set_subscriptions)
+
+
+class Cursor(list):
+    def sort(self, field, direction=1):
+        return Cursor(sorted(self, key=lambda document: document[field], reverse=direction < 0))
+
+
+class FakeCollection:
+    """An in-memory collection supporting the queries of subscription_index."""
+
+    def __init__(self, documents=()):
+        self.documents = [dict(document) for document in documents]
+        self.finds = 0
+
+    def matches(self, document, query):
+        for field, condition in query.items():
+            value = document.get(field)
+            if isinstance(condition, dict):
+                if "$gt" in condition and not (value is not None and value > condition["$gt"]):
+                    return False
+                if "$lt" in condition and not (value is not None and value < condition["$lt"]):
+                    return False
+                if "$exists" in condition and (field in document) != condition["$exists"]:
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    def find(self, query=None, projection=None):
+        self.finds += 1
+        return Cursor(document for document in self.documents if self.matches(document, query or {}))
+
+    def find_one(self, query, projection=None, sort=None):
+        documents = self.find(query)
+        if sort:
+            documents = documents.sort(*sort[0])
+        return documents[0] if documents else None
+
+    def insert_one(self, document):
+        self.documents.append({"_id": ObjectId(), **document})
+
+    def insert_many(self, documents):
+        for document in documents:
+            self.insert_one(document)
+
+    def update_one(self, query, update, upsert=False):
+        document = self.find_one(query)
+        if document is None:
+            document = self.upsert(query)
+        self.apply(document, update)
+
+    def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=None):
+        document = self.find_one(query)
+        before = dict(document) if document is not None else None
+        if document is None:
+            if not upsert:
+                return None
+            document = self.upsert(query)
+        self.apply(document, update)
+        return dict(document) if return_document == ReturnDocument.AFTER else before
+
+    def upsert(self, query):
+        document = {field: value for field, value in query.items() if not isinstance(value, dict)}
+        if any(d.get("_id") == document.get("_id") for d in self.documents):
+            raise DuplicateKeyError("E11000 duplicate key error")
+        self.documents.append(document)
+        return document
+
+    @staticmethod
+    def apply(document, update):
+        document.update(update.get("$set", {}))
+        for field, value in update.get("$inc", {}).items():
+            document[field] = document.get(field, 0) + value
+        for field, value in update.get("$max", {}).items():
+            document[field] = max(document.get(field, value), value)
+
+    def delete_many(self, query):
+        self.documents = [document for document in self.documents if not self.matches(document, query)]
+
+
+def get_users(count, seed=7):
+    random.seed(seed)
+    categories = ["traffic", "weather", "fire"]
+    tags = ["accident", "closure", "storm", "smoke", "flood"]
+    users = []
+    for i in range(count):
+        subscriptions = []
+        for category in random.sample(categories, random.randint(0, 2)):
+            subscriptions.append({"category": category, "tags": random.sample(tags, random.randint(0, 2))})
+        users.append({"user_id": f"user-{i}", "subscriptions": subscriptions})
+    return users
+
+
+def get_point(lat, lng):
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+def get_located_users(count, seed=11):
+    """Users of get_users living and moving around New York, a tenth of them without a location."""
+    users = get_users(count, seed)
+    for user in users:
+        if random.random() < 0.9:
+            user["home_location"] = get_point(random.uniform(40.5, 40.9), random.uniform(-74.2, -73.7))
+        if random.random() < 0.5:
+            user["current_location"] = get_point(random.uniform(40.5, 40.9), random.uniform(-74.2, -73.7))
+    return users
+
+
+def get_expected(users, category, tags):
+    return {
+        user["user_id"] for user in users
+        if any(s["category"] == category and (not s["tags"] or set(s["tags"]) & set(tags)) for s in user["subscriptions"])
+    }
+
+
+@pytest.mark.parametrize("sizes", [(0, 10), (100, 3000), (MAX_ARRAY_SIZE, MAX_ARRAY_SIZE + 1), (50000, 200000), (300000, 5)])
+def test_subscriber_sets_match_python_sets(sizes):
+    random.seed(sum(sizes))
+    first, second = (set(random.sample(range(400000), size)) for size in sizes)
+    a, b = SubscriberSet.from_ordinals(first), SubscriberSet.from_ordinals(second)
+
+    assert list(a | b) == sorted(first | second)
+    assert list(a & b) == sorted(first & second)
+    assert len(a) == len(first)
+    assert list(SubscriberSet.from_bytes(a.to_bytes())) == sorted(first)
+
+    for ordinal in random.sample(range(400000), 100):
+        a.add(ordinal)
+        first.add(ordinal)
+    for ordinal in random.sample(sorted(first), min(100, len(first))):
+        a.discard(ordinal)
+        first.discard(ordinal)
+    assert list(a) == sorted(first)
+    assert all((ordinal in a) == (ordinal in first) for ordinal in range(0, 400000, 997))
+
+
+def test_union_does_not_change_its_operands():
+    a, b = SubscriberSet.from_ordinals([1, 2]), SubscriberSet.from_ordinals([70000])
+    union = a | b
+    union.add(3)
+    union.discard(70000)
+
+    assert (list(a), list(b), list(union)) == ([1, 2], [70000], [1, 2, 3])
+
+
+def test_resolve_matches_the_subscriptions():
+    users = get_users(2000)
+    index = SubscriptionIndex.from_users(users)
+
+    for category, tags in [("traffic", []), ("traffic", ["accident"]), ("fire", ["smoke", "flood", "unknown"]), ("unknown", ["storm"])]:
+        assert set(index.get_user_ids(index.resolve(category, tags))) == get_expected(users, category, tags)
+
+    subscribed = {u["user_id"] for u in users if any(s["category"] == "weather" for s in u["subscriptions"])}
+    assert set(index.get_user_ids(index.get_subscribers("weather"))) == subscribed
+    both = {u["user_id"] for u in users if any(s["category"] == "fire" and {"smoke", "flood"} <= set(s["tags"]) for s in u["subscriptions"])}
+    assert set(index.get_user_ids(index.resolve_all("fire", ["smoke", "flood"]))) == both
+
+
+def test_index_is_saved_and_loaded_with_the_changes_since():
+    users = get_users(500)
+    users_collection, collection, changes = FakeCollection(users), FakeCollection(), FakeCollection()
+
+    rebuild_index(users_collection, collection, changes)
+    set_subscriptions(users_collection, changes, "user-1", [{"category": "traffic", "tags": ["closure"]}])
+    users_collection.insert_one({"user_id": "user-new", "subscriptions": []})
+    set_subscriptions(users_collection, changes, "user-new", [{"category": "traffic", "tags": []}])
+    index = load_index(collection, changes)
+
+    current = users_collection.find()
+    for tags in [[], ["closure"], ["accident", "storm"]]:
+        assert set(index.get_user_ids(index.resolve("traffic", tags))) == get_expected(current, "traffic", tags)
+
+    # A rebuild replaces the previous generation, kept until the next one, and only the changes made after it are applied
+    rebuild_index(users_collection, collection, changes)
+    rebuild_index(users_collection, collection, changes)
+    assert sorted(d["generation"] for d in collection.documents if d.get("kind") == "users") == [2, 3]
+    index = load_index(collection, changes)
+    assert index.changes_through == changes.documents[-1]["_id"]
+    assert set(index.get_user_ids(index.resolve("traffic", []))) == get_expected(current, "traffic", [])
+
+
+def test_concurrent_rebuilds_save_distinct_generations(monkeypatch):
+    users_collection, collection, changes = FakeCollection(get_users(100)), FakeCollection(), FakeCollection()
+    first, second = SubscriptionIndex.from_users(get_users(100)), SubscriptionIndex.from_users(get_users(50))
+    generations = [subscription_index.next_generation(collection) for _ in range(2)]
+    assert generations == [1, 2]
+
+    # The second rebuild saves its generation first, the first one is then dropped instead of replacing it
+    with monkeypatch.context() as patch:
+        patch.setattr(subscription_index, "next_generation", lambda collection: generations.pop())
+        subscription_index.save_index(second, collection)
+        subscription_index.save_index(first, collection)
+
+    assert collection.find_one({"_id": "meta"})["generation"] == 2
+    assert {d["generation"] for d in collection.documents if d.get("kind")} == {2}
+    assert len(load_index(collection, changes).user_ids) == 50
+    rebuild_index(users_collection, collection, changes)
+    assert collection.find_one({"_id": "meta"})["generation"] == 3
+
+
+def test_load_reads_the_current_generation_again_when_its_generation_is_dropped(monkeypatch):
+    users_collection, collection, changes = FakeCollection(get_users(100)), FakeCollection(), FakeCollection()
+    rebuild_index(users_collection, collection, changes)
+    find = collection.find
+    rebuilds = []
+
+    def find_during_rebuilds(query=None, projection=None):
+        # Two rebuilds finish while the first generation is being read, the second one drops it
+        if query and query.get("kind") == "cell" and not rebuilds:
+            rebuilds.append(query["generation"])
+            users_collection.insert_one({"user_id": "user-new", "subscriptions": [{"category": "fire", "tags": []}]})
+            rebuild_index(users_collection, collection, changes)
+            rebuild_index(users_collection, collection, changes)
+        return find(query, projection)
+
+    monkeypatch.setattr(collection, "find", find_during_rebuilds)
+    index = load_index(collection, changes)
+
+    assert rebuilds == [1]
+    assert len(index.user_ids) == 101
+    assert "user-new" in index.get_user_ids(index.get_subscribers("fire"))
+
+
+def test_refresh_applies_only_new_changes():
+    users = get_users(100)
+    users_collection, changes = FakeCollection(users), FakeCollection()
+    index = SubscriptionIndex.from_users(users)
+
+    set_subscriptions(users_collection, changes, "user-2", [{"category": "weather", "tags": ["storm"]}])
+    refresh_index(index, changes)
+    set_subscriptions(users_collection, changes, "user-2", [])
+    refresh_index(index, changes)
+    refresh_index(index, changes)
+
+    assert "user-2" not in index.get_user_ids(index.get_subscribers("weather"))
+    assert index.changes_through == changes.documents[-1]["_id"]
+
+
+def test_container_builds_the_index_once_then_refreshes_it(monkeypatch):
+    monkeypatch.setenv("SUBSCRIPTION_REFRESH_SECONDS", "30")
+    users = get_users(50)
+    collections = {"users": FakeCollection(users), "subscription_index": FakeCollection(), "subscription_changes": FakeCollection()}
+    monkeypatch.setattr(subscription_index, "get_collection", lambda env_vars, name: collections[env_vars[name]])
+    now = [100.0]
+    monkeypatch.setattr(subscription_index.time, "monotonic", lambda: now[0])
+    env_vars = config.get_env_vars()
+
+    index = get_index(env_vars)
+    assert collections["subscription_index"].find_one({"_id": "meta"})["users"] == 50
+    set_subscriptions(collections["users"], collections["subscription_changes"], "user-3", [{"category": "fire", "tags": []}])
+    scans = collections["users"].finds
+
+    assert get_index(env_vars) is index
+    assert "user-3" not in index.get_user_ids(index.get_subscribers("fire"))
+    now[0] += 30
+    assert "user-3" in get_index(env_vars).get_user_ids(index.get_subscribers("fire"))
+    # The users collection is only scanned for the first build
+    assert collections["users"].finds == scans
+
+
+def test_geohash_cells_and_their_neighbours():
+    assert geohash.encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash.encode(40.7128, -74.0060, 6) == "dr5reg"
+    assert geohash.get_area(40.7128, -74.0060, 5) == ["dr5r6", "dr5r7", "dr5rk", "dr5rd", "dr5re", "dr5rs", "dr5rf", "dr5rg", "dr5ru"]
+    # Across the antimeridian, and without cells beyond the pole
+    assert {"zzz", "bpb", "zzy", "bp8"} <= set(geohash.get_area(89.99, 179.99, 3))
+    assert len(geohash.get_area(89.99, 179.99, 3)) == 6
+
+
+def test_resolve_nearby_only_returns_the_subscribers_near_the_post():
+    users = get_located_users(3000)
+    index = SubscriptionIndex.from_users(users)
+
+    for precision in subscription_index.GEO_PRECISIONS:
+        lat_size, lng_size = geohash.get_cell_size(precision)
+        for lat, lng in [(40.7128, -74.0060), (40.6, -73.9), (35.0, -80.0)]:
+            area = set(geohash.get_area(lat, lng, precision))
+            nearby = [user for user in users if any(cell[:precision] in area for cell in get_cells(user))]
+            for category, tags in [("traffic", []), ("fire", ["smoke", "flood"])]:
+                subscribers = set(index.get_user_ids(index.resolve_nearby(category, tags, (lat, lng), precision)))
+                assert subscribers == get_expected(nearby, category, tags)
+                # Every subscriber within a cell of the post is found, whichever cells they fall in
+                close = [user for user in users if any(
+                    abs(point[0] - lat) < lat_size and abs(point[1] - lng) < lng_size
+                    for point in (subscription_index.get_point(user.get(field)) for field in subscription_index.LOCATION_FIELDS) if point)]
+                assert get_expected(close, category, tags) <= subscribers
+
+
+def test_locations_are_saved_loaded_and_refreshed():
+    users = get_located_users(300)
+    users_collection, collection, changes = FakeCollection(users), FakeCollection(), FakeCollection()
+    rebuild_index(users_collection, collection, changes)
+
+    # Moving within the same cells is not a change
+    home = subscription_index.get_point(users_collection.find_one({"user_id": "user-1"}).get("home_location")) or (40.7, -74.0)
+    set_locations(users_collection, changes, "user-1", {"home_location": get_point(*home)})
+    set_locations(users_collection, changes, "user-2", {"home_location": get_point(34.05, -118.24), "current_location": None})
+    assert [change["user_id"] for change in changes.documents] == ["user-2"]
+    index = load_index(collection, changes)
+
+    expected = SubscriptionIndex.from_users(users_collection.find()).cells
+    assert {cell: list(subscribers) for cell, subscribers in index.cells.items()} == {cell: list(subscribers) for cell, subscribers in expected.items()}
+    assert index.get_user_ids(index.cells[geohash.encode(34.05, -118.24, 6)]) == ["user-2"]
+
+    # An index saved with other precisions is rebuilt
+    collection.update_one({"_id": "meta"}, {"$set": {"geo_precisions": [5]}})
+    assert load_index(collection, changes) is None
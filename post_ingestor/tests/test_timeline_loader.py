@@ -0,0 +1,181 @@
+# coding: utf-8
+
+from datetime import datetime, timezone
+
+import fakeredis
+import orjson
+import pytest
+from redis.exceptions import RedisError
+
+import config
+import redis_cache
+import timeline_loader
+import timeline_writer
+from post_decoder import Post
+from subscription_index import SubscriptionIndex
+from timeline_loader import lambda_handler, load_timelines
+from timeline_writer import CELEBRITY_CATEGORIES_KEY, get_key
+
+# The lowest member of a timeline cached by the API
+MARKER = b"subscriptions:[]"
+
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture
+def env_vars(monkeypatch):
+    monkeypatch.setenv("TIMELINE_MAX_LENGTH", "3")
+    monkeypatch.setenv("TIMELINE_CELEBRITY_THRESHOLD", "2")
+    return config.get_env_vars()
+
+
+def get_post(offset, category="traffic", tags=(), minute=0):
+    return Post("posts", 0, offset, "author", f"Post {offset}", category, tags=tuple(tags),
+                created_at=datetime(2026, 1, 1, 12, minute, 0, 123456, tzinfo=timezone.utc))
+
+
+def cache_timelines(client, *user_ids):
+    for user_id in user_ids:
+        client.zadd(get_key(user_id), {MARKER: float("-inf")})
+        client.expire(get_key(user_id), 3600)
+
+
+def get_timeline(client, user_id):
+    return [orjson.loads(member)["post_id"] for member in client.zrevrange(get_key(user_id), 0, -1) if member != MARKER]
+
+
+def test_posts_are_added_to_the_cached_timelines_of_their_subscribers(client, env_vars):
+    index = SubscriptionIndex.from_users([
+        {"user_id": "1", "subscriptions": [{"category": "traffic"}]},
+        {"user_id": "2", "subscriptions": [{"category": "fire", "tags": ["wildfire"]}]},
+        {"user_id": "3", "subscriptions": [{"category": "traffic"}]},
+    ])
+    cache_timelines(client, "1", "2")
+    posts = [get_post(1, minute=1), get_post(2, "fire", ["wildfire"], minute=2), get_post(3, "fire", ["smoke"], minute=3)]
+
+    result = load_timelines(posts, env_vars, index, client)
+
+    assert get_timeline(client, "1") == ["posts:0:1"]
+    assert get_timeline(client, "2") == ["posts:0:2"]
+    # Timelines that are not cached are left to the API
+    assert not client.exists(get_key("3"))
+    assert (result["timelines"], result["not_cached"], result["entries"]) == (2, 1, 2)
+
+
+def test_timelines_keep_their_most_recent_posts(client, env_vars):
+    index = SubscriptionIndex.from_users([{"user_id": "1", "subscriptions": [{"category": "traffic"}]}])
+    cache_timelines(client, "1")
+
+    load_timelines([get_post(i, minute=i) for i in range(5)], env_vars, index, client)
+    # A redelivered batch is not added twice
+    load_timelines([get_post(i, minute=i) for i in range(5)], env_vars, index, client)
+
+    assert get_timeline(client, "1") == ["posts:0:4", "posts:0:3", "posts:0:2"]
+    assert client.zrange(get_key("1"), 0, 0) == [MARKER]
+    assert 0 < client.ttl(get_key("1")) <= 3600
+
+
+def test_members_are_the_posts_read_by_the_api(client, env_vars):
+    post = Post("posts", 0, 7, "author", "Road closed", "traffic", "Closed until noon", ("accident",), (40.7, -74.0),
+                datetime(2026, 1, 1, 12, 0, 0, 123456, tzinfo=timezone.utc))
+
+    assert timeline_writer.to_member(post) == (
+        b'{"post_id":"posts:0:7","user_id":"author","title":"Road closed","description":"Closed until noon",'
+        b'"category":"traffic","tags":["accident"],"location":{"lat":40.7,"lng":-74.0},"created_at":"2026-01-01T12:00:00.123000"}'
+    )
+    assert timeline_writer.get_score(post) == 1767268800123
+
+
+def test_timelines_are_written_in_chunks(client, env_vars, monkeypatch):
+    monkeypatch.setenv("TIMELINE_CELEBRITY_THRESHOLD", "100")
+    monkeypatch.setenv("TIMELINE_PIPELINE_CHUNK", "2")
+    config.clear()
+    env_vars = config.get_env_vars()
+    index = SubscriptionIndex.from_users([{"user_id": str(i), "subscriptions": [{"category": "traffic"}]} for i in range(5)])
+    cache_timelines(client, *[str(i) for i in range(5)])
+    chunks = []
+    write_chunk = timeline_writer.write_chunk
+    monkeypatch.setattr(timeline_writer, "write_chunk", lambda client, chunk, *args: chunks.append(len(chunk)) or write_chunk(client, chunk, *args))
+
+    load_timelines([get_post(1)], env_vars, index, client)
+
+    assert chunks == [2, 2, 1]
+    assert all(get_timeline(client, str(i)) == ["posts:0:1"] for i in range(5))
+
+
+def test_celebrity_categories_are_read_by_the_api(client, env_vars, monkeypatch):
+    users = [{"user_id": str(i), "subscriptions": [{"category": "traffic"}, {"category": "fire"}]} for i in range(3)]
+    index = SubscriptionIndex.from_users(users + [{"user_id": "3", "subscriptions": [{"category": "weather"}]}])
+    cache_timelines(client, "0", "3")
+
+    result = load_timelines([get_post(1), get_post(2, "weather")], env_vars, index, client)
+
+    # traffic has 3 subscribers, more than the threshold of 2
+    assert get_timeline(client, "0") == []
+    assert get_timeline(client, "3") == ["posts:0:2"]
+    assert (result["fanned_out"], result["fan_out_on_read"]) == (1, 1)
+    assert client.zrange(CELEBRITY_CATEGORIES_KEY, 0, -1, withscores=True) == [(b"traffic", float("inf"))]
+
+    # Once traffic has few subscribers again its posts are added, and read by the API until the timelines expire
+    for user_id in ["1", "2"]:
+        index.update(user_id, [{"category": "traffic"}, {"category": "fire"}], [{"category": "fire"}])
+    monkeypatch.setattr(timeline_writer.time, "time", lambda: 1000.0)
+    load_timelines([get_post(3)], env_vars, index, client)
+
+    assert get_timeline(client, "0") == ["posts:0:3"]
+    assert client.zrange(CELEBRITY_CATEGORIES_KEY, 0, -1, withscores=True) == [(b"traffic", 1000.0 + 3600)]
+
+
+def test_handler_retries_the_batch_when_redis_fails(env_vars, monkeypatch):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    redis_cache._client = fakeredis.FakeRedis(server=server)
+    index = SubscriptionIndex.from_users([{"user_id": "1", "subscriptions": [{"category": "traffic"}]}])
+    monkeypatch.setattr(timeline_loader, "get_index", lambda env_vars: index)
+    records = [
+        {"topic": "posts", "partition": 0, "offset": 1, "value": {"user_id": "1", "title": "Road closed", "category": "traffic",
+                                                                  "created_at": "2026-01-01T12:00:00Z"}},
+        {"topic": "posts", "partition": 0, "offset": 2, "value": {"title": "No user"}},
+    ]
+
+    response = lambda_handler({"event": "LOAD_TIMELINES", "records": records}, None)
+
+    assert response["batchItemFailures"] == [{"itemIdentifier": "posts:0:1"}]
+    assert [failure["offset"] for failure in response["body"]["failures"]] == [2]
+
+    server.connected = True
+    client = redis_cache._client
+    cache_timelines(client, "1")
+    response = lambda_handler({"event": "LOAD_TIMELINES", "records": records}, None)
+
+    assert response["batchItemFailures"] == []
+    assert response["body"]["timelines"] == 1
+    assert get_timeline(client, "1") == ["posts:0:1"]
+
+
+def test_undated_posts_are_loaded_with_the_date_of_their_record(env_vars, client, monkeypatch):
+    index = SubscriptionIndex.from_users([{"user_id": "1", "subscriptions": [{"category": "traffic"}]}])
+    monkeypatch.setattr(timeline_loader, "get_index", lambda env_vars: index)
+    monkeypatch.setattr(timeline_loader, "get_client", lambda env_vars: client)
+    cache_timelines(client, "1")
+    records = [{"topic": "posts", "partition": 0, "offset": 1, "timestamp": 1767268800123,
+                "value": {"user_id": "author", "title": "Road closed", "category": "traffic"}}]
+
+    response = lambda_handler({"event": "LOAD_TIMELINES", "records": records}, None)
+
+    assert response["body"]["timelines"] == 1
+    [member] = [orjson.loads(member) for member in client.zrange(get_key("1"), 0, -1) if member != MARKER]
+    # The date the ingestor writes for the same record
+    assert (member["post_id"], member["created_at"]) == ("posts:0:1", "2026-01-01T12:00:00.123000")
+
+
+def test_redis_errors_are_raised(env_vars):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    index = SubscriptionIndex.from_users([{"user_id": "1", "subscriptions": [{"category": "traffic"}]}])
+
+    with pytest.raises(RedisError):
+        load_timelines([get_post(1)], env_vars, index, fakeredis.FakeRedis(server=server))
@@ -0,0 +1,115 @@
+# coding: utf-8
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+import config
+import mongo
+from main import lambda_handler
+
+
+class FakeMongoClient:
+    """A MongoClient recording how often it is created, pinged and closed."""
+
+    created = []
+
+    def __init__(self, uri, **options):
+        self.uri = uri
+        self.options = options
+        self.pings = 0
+        self.closed = False
+        self.reachable = True
+        FakeMongoClient.created.append(self)
+
+    def __getitem__(self, name):
+        return self
+
+    def command(self, name):
+        self.pings += 1
+        if not self.reachable:
+            raise AutoReconnect("connection closed")
+        return {"ok": 1}
+
+    @property
+    def admin(self):
+        return self
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def client(monkeypatch):
+    FakeMongoClient.created = []
+    monkeypatch.setattr(mongo, "MongoClient", FakeMongoClient)
+    monkeypatch.setenv("MONGO_URI", "mongodb://mongo:27017")
+    monkeypatch.setenv("MONGO_HEALTH_CHECK_SECONDS", "60")
+    return FakeMongoClient
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(mongo.time, "time", lambda: now[0])
+    return now
+
+
+def test_configuration_is_read_once(monkeypatch):
+    monkeypatch.setenv("INGEST_CHUNK_SIZE", "50")
+    env_vars = config.get_env_vars()
+
+    monkeypatch.setenv("INGEST_CHUNK_SIZE", "10")
+
+    assert config.get_env_vars() is env_vars
+    assert env_vars["INGEST_CHUNK_SIZE"] == 50
+
+
+def test_invalid_configuration_is_reported(monkeypatch):
+    monkeypatch.setenv("INGEST_CHUNK_SIZE", "many")
+
+    with pytest.raises(ValueError, match="INGEST_CHUNK_SIZE must be an integer"):
+        config.get_env_vars()
+
+
+def test_warm_invocations_reuse_the_client(client, clock):
+    env_vars = config.get_env_vars()
+    first = mongo.get_client(env_vars)
+    clock[0] += 5
+
+    assert mongo.get_client(env_vars) is first
+    assert len(client.created) == 1
+    assert first.pings == 0
+    assert first.uri == "mongodb://mongo:27017"
+
+
+def test_thawed_client_is_pinged_and_kept_when_healthy(client, clock):
+    env_vars = config.get_env_vars()
+    first = mongo.get_client(env_vars)
+    clock[0] += 120
+
+    assert mongo.get_client(env_vars) is first
+    assert first.pings == 1
+
+
+def test_thawed_client_is_replaced_when_unhealthy(client, clock):
+    env_vars = config.get_env_vars()
+    first = mongo.get_client(env_vars)
+    first.reachable = False
+    clock[0] += 120
+
+    second = mongo.get_client(env_vars)
+
+    assert second is not first
+    assert first.closed
+    assert len(client.created) == 2
+
+
+def test_handler_only_connects_for_records(client):
+    event = {"event": "INGEST_POSTS", "records": []}
+
+    response = lambda_handler(event, None)
+
+    assert response["statusCode"] == 200
+    assert response["body"]["inserted"] == 0
+    assert response["batchItemFailures"] == []
+    assert client.created == []
@@ -0,0 +1,90 @@
+from pymongo.errors import PyMongoError
+from redis.exceptions import RedisError
+from config import get_env_vars
+from main import KAFKA_EVENT_SOURCES, get_outcome
+from post_decoder import decode_kafka_event, decode_records
+from redis_cache import get_client
+from subscribers import get_subscriber_counts, get_timelines
+from subscription_index import get_index
+from timeline_writer import publish_celebrity_categories, write_timelines
+
+
+def lambda_handler(event, context):
+    """
+    The timeline loader, consuming the cache-loader-consumer topic: adds each post to the cached timelines
+    of the users subscribed to its category and tags (fan-out-on-write).
+
+    Expects the same events as the ingestor (see main.lambda_handler), a Lambda Kafka event or already decoded records:
+      event = {
+        "event": "LOAD_TIMELINES",
+        "records": [ {"topic": "...", "partition": 0, "offset": 42, "value": {...post...}}, ... ]
+      }
+
+    Adding a post to a timeline again is a no-op, so when MongoDB or Redis fails the whole batch is retried.
+    Records that cannot be decoded are skipped, the ingestor quarantines them.
+      {
+        "statusCode": 200,
+        "body": {"posts": 3, "fanned_out": 2, "fan_out_on_read": 1, "timelines": 120, "not_cached": 880, "entries": 130,
+                 "failures": [...not decoded...]},
+        "batchItemFailures": []
+      }
+    """
+    failures = []
+    if event.get("eventSource") in KAFKA_EVENT_SOURCES:
+        posts = decode_kafka_event(event, failures)
+    elif event.get("event") == "LOAD_TIMELINES":
+        posts = decode_records(event.get("records") or [], failures)
+    else:
+        return {"statusCode": 400, "body": "Unsupported event type"}
+
+    # Held in memory, the whole batch is reported when it fails
+    posts = list(posts)
+    try:
+        result = load_timelines(posts, get_env_vars())
+    except (PyMongoError, RedisError) as e:
+        return {
+            "statusCode": 200,
+            "body": {"error": str(e), "failures": [get_outcome(failure) for failure in failures]},
+            "batchItemFailures": [{"itemIdentifier": post.id} for post in posts],
+        }
+    return {
+        "statusCode": 200,
+        "body": {**result, "failures": [get_outcome(failure) for failure in failures]},
+        "batchItemFailures": [],
+    }
+
+
+def load_timelines(posts, env_vars, index=None, client=None):
+    """
+    Adds a batch of posts to the cached timelines of their subscribers.
+
+    The posts of the categories with more than TIMELINE_CELEBRITY_THRESHOLD subscribers are not added, they would be
+    written to too many timelines, the API reads them from MongoDB instead (see timeline_writer.publish_celebrity_categories).
+    Subscribers are resolved with the subscription index of the container (see subscription_index.get_index).
+    The index and client can be given (e.g. for tests), otherwise the ones of the container are used.
+
+    env_vars = see config.get_env_vars
+
+    Returns:
+      {"posts": 3, "fanned_out": 2, "fan_out_on_read": 1, "timelines": 120, "not_cached": 880, "entries": 130}
+    """
+    result = {"posts": len(posts), "fanned_out": 0, "fan_out_on_read": 0, "timelines": 0, "not_cached": 0, "entries": 0}
+    if not posts:
+        return result
+
+    if index is None:
+        index = get_index(env_vars)
+    if client is None:
+        client = get_client(env_vars)
+
+    threshold = env_vars["TIMELINE_CELEBRITY_THRESHOLD"]
+    counts = get_subscriber_counts(index, {post.category for post in posts})
+    # Published before the posts are skipped, so the API reads them from MongoDB as soon as they are not added
+    publish_celebrity_categories(client, counts, threshold, env_vars["TIMELINE_TTL_SECONDS"])
+    fanned_out = [post for post in posts if counts[post.category] <= threshold]
+    result["fanned_out"], result["fan_out_on_read"] = len(fanned_out), len(posts) - len(fanned_out)
+
+    timelines = get_timelines(index, fanned_out)
+    result.update(write_timelines(client, timelines, env_vars["TIMELINE_MAX_LENGTH"], env_vars["TIMELINE_TTL_SECONDS"],
+                                  env_vars["TIMELINE_PIPELINE_CHUNK"]))
+    return result
@@ -0,0 +1,108 @@
+from datetime import timezone
+import time
+import orjson
+
+DEFAULT_PIPELINE_CHUNK = 1000
+
+# The layout of the timelines cached by the API, see TimelineUtils in api/.../utils/timeline.py
+KEY_PREFIX = "timeline:"
+CELEBRITY_CATEGORIES_KEY = "timeline_celebrity_categories"
+
+
+def get_key(user_id):
+    return KEY_PREFIX + user_id
+
+
+def get_created_at(post):
+    """The created_at of the post as stored by MongoDB, naive UTC with millisecond precision."""
+    created_at = post.created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return created_at.replace(microsecond=created_at.microsecond // 1000 * 1000)
+
+
+def get_score(post):
+    return round(get_created_at(post).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def to_member(post):
+    """
+    The member of the post in a timeline, the same bytes as the post read from MongoDB by the API (Post.to_json),
+    so a post added by the loader and loaded by the API is a single member.
+    """
+    member = {"post_id": post.id, "user_id": post.user_id, "title": post.title}
+    if post.description is not None:
+        member["description"] = post.description
+    member["category"] = post.category
+    member["tags"] = list(post.tags)
+    if post.location is not None:
+        member["location"] = {"lat": post.location[0], "lng": post.location[1]}
+    member["created_at"] = get_created_at(post).isoformat()
+    return orjson.dumps(member)
+
+
+def write_timelines(client, timelines, max_length, ttl_seconds, chunk_size=DEFAULT_PIPELINE_CHUNK):
+    """
+    Adds posts to the cached timelines of their subscribers, chunk_size timelines per pipeline.
+
+    Only the timelines cached by the API are written, the others are loaded from MongoDB when they are read.
+    Each chunk takes two round trips: a pipeline of EXISTS, then a pipeline of ZADD and ZREMRANGEBYRANK for the
+    cached timelines, which keeps them to their max_length most recent posts. The rank 0 of a cached timeline holds the
+    subscriptions of its user and is kept. A timeline expiring between the two round trips is written without it,
+    the API reads such a set as a miss, and EXPIRE NX bounds its life to ttl_seconds.
+    Adding the same posts again is a no-op, so a failed batch can be retried.
+
+    timelines = iterable of ("<user_id>", {<member>: <score>, ...}), see subscribers.get_timelines
+
+    Returns:
+      {"timelines": 120, "not_cached": 880, "entries": 130}
+    """
+    stats = {"timelines": 0, "not_cached": 0, "entries": 0}
+    chunk = []
+    for timeline in timelines:
+        chunk.append(timeline)
+        if len(chunk) >= chunk_size:
+            write_chunk(client, chunk, max_length, ttl_seconds, stats)
+            chunk = []
+    if chunk:
+        write_chunk(client, chunk, max_length, ttl_seconds, stats)
+    return stats
+
+
+def write_chunk(client, chunk, max_length, ttl_seconds, stats):
+    keys = [get_key(user_id) for user_id, _ in chunk]
+    with client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.exists(key)
+        cached = pipe.execute()
+
+    with client.pipeline(transaction=False) as pipe:
+        for key, (_, members), is_cached in zip(keys, chunk, cached):
+            if not is_cached:
+                stats["not_cached"] += 1
+                continue
+            pipe.zadd(key, members)
+            pipe.zremrangebyrank(key, 1, -(max_length + 1))
+            pipe.expire(key, ttl_seconds, nx=True)
+            stats["timelines"] += 1
+            stats["entries"] += len(members)
+        if len(pipe):
+            pipe.execute()
+
+
+def publish_celebrity_categories(client, counts, threshold, ttl_seconds):
+    """
+    Publishes the categories whose posts are not added to the timelines (more than threshold subscribers),
+    the API reads their posts from MongoDB instead (fan-out-on-read).
+
+    The categories are kept in a sorted set scored by the time until which the API reads them: +inf while they have
+    too many subscribers, then ttl_seconds more, once every timeline cached meanwhile (without their posts) has expired.
+    """
+    now = time.time()
+    with client.pipeline(transaction=False) as pipe:
+        for category, count in counts.items():
+            if count > threshold:
+                pipe.zadd(CELEBRITY_CATEGORIES_KEY, {category: float("inf")}, gt=True)
+            else:
+                # Only lowers +inf, the categories that were not read from MongoDB are not added
+                pipe.zadd(CELEBRITY_CATEGORIES_KEY, {category: now + ttl_seconds}, xx=True, lt=True)
+        pipe.zremrangebyscore(CELEBRITY_CATEGORIES_KEY, "-inf", now)
+        pipe.execute()